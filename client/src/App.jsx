@@ -33,6 +33,7 @@ import AdminDashboard from './pages/admin/AdminDashboard';
 import { requestNotificationPermission } from './utils/notifications';
 import { API_BASE } from './config';
 import { useCollabSocket } from './hooks/useCollabSocket';
+import { useUserSocket } from './hooks/useUserSocket';
 
 import TermsOfUse from './components/legal/TermsOfUse';
 import PlatformBalanceTerms from './components/legal/PlatformBalanceTerms';
@@ -516,6 +517,28 @@ function App() {
     handleCollabHistoryRefresh
   );
 
+  // Summary, title and persona arrive after `done`, on the user's own socket room
+  const handleHistoryEnriched = useCallback((data) => {
+    if (!data.history_id && !data.conversation_id) return;
+    if (data.history_id) {
+      setChatHistory(prev => prev.map(item =>
+        item.id === data.history_id ? {
+          ...item,
+          summary: data.summary !== undefined ? data.summary : item.summary,
+          persona: data.persona || item.persona,
+          memory_learning: data.memory_learning || item.memory_learning,
+        } : item
+      ));
+    }
+    if (data.conversation_id && data.title) {
+      setConversations(prev => prev.map(conv =>
+        conv.id === data.conversation_id ? { ...conv, title: data.title } : conv
+      ));
+    }
+  }, []);
+
+  useUserSocket(token, handleHistoryEnriched);
+
   // Optimistically add incoming collab questions to the chat history
   useEffect(() => {
     if (socketLastQuestion && isCollabView) {
@@ -9,6 +9,7 @@ import { SOCKET_BASE } from '../config';
  *  - collab_question    → Oda'ya yeni soru geldi (kim sordu)
  *  - collab_stream_chunk → AI'dan gelen her token parçası
  *  - collab_stream_done  → AI yanıtı tamamlandı
+ *  - history_enriched    → Yanıtın özeti/başlığı arka planda hazır oldu
  *  - user_joined / user_left → Katılan / ayrılan kullanıcı
  *
  * @param {string|null} token - Collaboration room token
@@ -114,6 +115,13 @@ export function useCollabSocket(token, userName = 'Guest', onHistoryRefresh = nu
       }
     });
 
+    // Özet/başlık `done` sonrasında üretilir; paylaşılan odada da history'yi yenile
+    socket.on('history_enriched', () => {
+      if (typeof onHistoryRefresh === 'function') {
+        onHistoryRefresh();
+      }
+    });
+
     // Kullanıcı katıldı
     socket.on('user_joined', (data) => {
       if (data.token !== token) return;
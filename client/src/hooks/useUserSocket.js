@@ -0,0 +1,44 @@
+import { useEffect, useRef } from 'react';
+import { io } from 'socket.io-client';
+import { SOCKET_BASE } from '../config';
+
+/**
+ * useUserSocket — Kişisel oda (user:<id>) bağlantısı
+ *
+ * Oturum açmış kullanıcıyı kendi odasına katar ve şu olayı dinler:
+ *  - history_enriched → /api/ask `done` sonrası arka planda üretilen
+ *    summary / title / persona / memory_learning
+ *
+ * @param {string|null} authToken - JWT (yoksa bağlanmaz)
+ * @param {Function} onHistoryEnriched - history_enriched payload'ı ile çağrılır
+ */
+export function useUserSocket(authToken, onHistoryEnriched) {
+  const handlerRef = useRef(onHistoryEnriched);
+  handlerRef.current = onHistoryEnriched;
+
+  useEffect(() => {
+    if (!authToken) return;
+
+    const socket = io(SOCKET_BASE, {
+      transports: ['websocket', 'polling'],
+      reconnectionAttempts: 10,
+      reconnectionDelay: 1500,
+      timeout: 20000,
+    });
+
+    // Yeniden bağlanınca oda üyeliği kaybolur; her connect'te tekrar katıl
+    socket.on('connect', () => {
+      socket.emit('join_user_room', { token: authToken });
+    });
+
+    socket.on('history_enriched', (data) => {
+      if (typeof handlerRef.current === 'function') {
+        handlerRef.current(data || {});
+      }
+    });
+
+    return () => {
+      socket.disconnect();
+    };
+  }, [authToken]);
+}
@@ -17,12 +17,15 @@ import re
 import io
 import json
 import time
+import threading
+import atexit
 import random
 import datetime
 import math
 import smtplib
 import traceback
 import resend
+import numpy as np
 from types import SimpleNamespace
 
 # Compatibility shim for libraries that incorrectly call datetime.utcnow() on the module.
@@ -32,22 +35,23 @@ if not hasattr(datetime, 'utcnow'):
 
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import text as sql_text
+from sqlalchemy.orm.attributes import flag_modified
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import timedelta
 from dotenv import load_dotenv, dotenv_values
-from flask import Flask, request, jsonify, Response, stream_with_context, redirect
+from flask import Flask, request, jsonify, Response, stream_with_context, redirect, g, has_request_context
 from flask_cors import CORS
 from flask_socketio import SocketIO, join_room, leave_room, emit as socket_emit
 from werkzeug.exceptions import HTTPException
 from flask_jwt_extended import (
-    JWTManager, create_access_token, get_jwt_identity, jwt_required, verify_jwt_in_request
+    JWTManager, create_access_token, decode_token, get_jwt_identity, jwt_required, verify_jwt_in_request
 )
 
 from passlib.hash import pbkdf2_sha256
 from google import genai as google_genai
 from google.genai import types as google_genai_types
-from models import db, History, Answer, User, Conversation, ConversationSummary, MemoryItem, MemoryNode, MemoryEdge, Snippet, PasswordResetToken, UserFollow, Notification, Favorite, Project, ProjectFile, UserBadge, SharedSession, XPEvent, CollaborationReview, CollaborationComment, TokenBalance, TokenTransaction, TokenPackage, TokenPurchase, ApiKey, VSCodeLoginState, VSCodeOTP, PostLike, AnswerLike, NotificationRead, NotificationHidden, Feedback, FeedbackDetail, UserTheme, UserExternalApiKey, SecurityAuditLog, LegalConsentLog
+from models import db, History, Answer, User, Conversation, ConversationSummary, MemoryItem, MemoryEmbedding, MemoryNode, MemoryEdge, Snippet, PasswordResetToken, UserFollow, Notification, Favorite, Project, ProjectFile, ProjectChunkEmbedding, UserBadge, SharedSession, XPEvent, CollaborationReview, CollaborationComment, TokenBalance, TokenTransaction, TokenPackage, TokenPurchase, ApiKey, VSCodeLoginState, VSCodeOTP, PostLike, AnswerLike, NotificationRead, NotificationHidden, Feedback, FeedbackDetail, UserTheme, UserExternalApiKey, SecurityAuditLog, LegalConsentLog, UsageCounter, TokenReservation, HistoryMemoryCache
 from utils.crypto_utils import encrypt_key, decrypt_key, mask_key
 from backend.adapters.resolver import ProviderResolver
 from anthropic import Anthropic, APIError
@@ -55,17 +59,20 @@ from openai import OpenAI
 import stripe
 import iyzipay
 from utils.language_detector import LanguageDetector
+from utils.intent_classifier import RoutingClassifier
+from utils.history_fts import ensure_history_fts, search_history
 from utils.model_router import ModelRouter
 from utils.standardizer import CodeStandardizer
 from utils.github_parser import GitHubParser
-from utils.concurrency import env_float, provider_slot
+from utils.concurrency import env_float, env_int
+from utils.provider_governor import QueueNotice, get_provider_governor, iter_as_provider_user
 from utils.timeout_utils import to_gemini_timeout
-
-# Global registry for cancelled requests
-CANCELLED_REQUESTS = {}
-
-def is_request_cancelled(request_id):
-    return CANCELLED_REQUESTS.get(request_id, False)
+from utils.socket_fanout import ChunkCoalescer, socketio_queue_options
+from utils.run_state import get_run_state, is_request_cancelled
+from utils.api_key_cache import ApiKeyCache, LastUsedBuffer
+from utils.document_extract import DocumentExtractor
+from utils.db_metrics import DbMetrics, engine_pool_options
+from utils.preflight import Preflight
 
 
 TEXT_FILE_EXTENSIONS = {
@@ -76,40 +83,9 @@ TEXT_FILE_EXTENSIONS = {
 }
 
 
-def _extract_docx_text(source, limit=10000):
-    from docx import Document
-
-    doc = Document(source)
-    parts = [p.text for p in doc.paragraphs if p.text and p.text.strip()]
-
-    for table in doc.tables:
-        for row in table.rows:
-            cells = [cell.text.strip() for cell in row.cells if cell.text and cell.text.strip()]
-            if cells:
-                parts.append('\t'.join(cells))
-
-    text = '\n'.join(parts).replace('\x00', '')
-    return text[:limit] if limit and len(text) > limit else text
-
-
-def _extract_pdf_text(source, limit=10000):
-    from pypdf import PdfReader
-
-    reader = PdfReader(source)
-    parts = []
-    total_chars = 0
-    for page in reader.pages:
-        txt = (page.extract_text() or '').replace('\x00', '')
-        if not txt:
-            continue
-        if limit:
-            remaining = limit - total_chars
-            if remaining <= 0:
-                break
-            txt = txt[:remaining]
-        parts.append(txt)
-        total_chars += len(txt)
-    return '\n'.join(parts)
+# PDF/DOCX metni karakter bütçesinde durur, ayrı süreçte (timeout ile) çıkarılır
+# ve içerik hash'ine göre önbelleğe alınır.
+_document_extractor = DocumentExtractor()
 
 
 def _read_uploaded_document_text(path, limit=10000):
@@ -118,15 +94,15 @@ def _read_uploaded_document_text(path, limit=10000):
 
     if file_ext in TEXT_FILE_EXTENSIONS:
         with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-            text = f.read().replace('\x00', '')
+            text = (f.read(limit) if limit else f.read()).replace('\x00', '')
         label = 'File'
         instruction = "Analyze the uploaded file content and answer the user's question about it."
     elif file_ext == '.pdf':
-        text = _extract_pdf_text(path, limit=limit)
+        text = _document_extractor.extract('pdf', path, limit=limit)
         label = 'PDF'
         instruction = "Analyze the uploaded PDF content and answer the user's question about it."
     elif file_ext == '.docx':
-        text = _extract_docx_text(path, limit=limit)
+        text = _document_extractor.extract('docx', path, limit=limit)
         label = 'Word Document'
         instruction = "Analyze the uploaded Word document content and answer the user's question about it."
     else:
@@ -152,9 +128,12 @@ from utils.memory_utils import (
     build_memory_retrieval_plan,
     build_structured_memory_capsule,
     detect_memory_conflicts,
+    embed_memory_text,
     extract_memory_candidates,
+    memory_text_hash,
+    MEMORY_EXTRACTION_VERSION,
 )
-from services.lifecycle_orchestrator import start_worker, LifecycleOrchestrator
+from services.lifecycle_orchestrator import start_worker, enqueue_task, enqueue_job, job_queue_metrics, LifecycleOrchestrator
 from services.agent_runtime import AgentToolRuntime, run_agent_turn, stream_text_chunks, AgentAbortException
 
 
@@ -475,6 +454,22 @@ class _GeminiCompat:
             raise RuntimeError('Gemini client is not configured')
         return _GeminiCompatModel(self._client, model_name)
 
+    def embed_contents(self, model, contents, task_type=None):
+        """Batch variant: one request for many texts, one vector per input (in order)."""
+        if not self._client:
+            raise RuntimeError('Gemini client is not configured')
+
+        config = {'task_type': task_type} if task_type else None
+        response = self._client.models.embed_content(
+            model=_normalize_gemini_model_name(model),
+            contents=list(contents),
+            config=config,
+        )
+        return [
+            getattr(item, 'values', None) or getattr(item, 'embedding', None) or []
+            for item in (getattr(response, 'embeddings', None) or [])
+        ]
+
     def embed_content(self, model, content, task_type=None):
         if not self._client:
             raise RuntimeError('Gemini client is not configured')
@@ -504,8 +499,17 @@ health_narrative_cache = {}
 CACHE_TTL = 3600  # 1 saat cache
 
 # Project embedding cache (RAG-lite for project chat)
+# Chunk vectors are persisted in ProjectChunkEmbedding; this per-worker dict only
+# memoizes the assembled float32 matrices until the project signature changes.
 project_embedding_cache = {}
 PROJECT_EMBED_CACHE_TTL = 1800  # 30 minutes
+PROJECT_FILE_EMBED_CHAR_LIMIT = 12000  # hard limit per file for cost control
+PROJECT_CHUNK_SIZE = 1200
+PROJECT_CHUNK_OVERLAP = 200
+PROJECT_EMBED_BATCH_SIZE = env_int('PROJECT_EMBED_BATCH_SIZE', 64, minimum=1, maximum=100)  # API cap is 100 texts/request
+PROJECT_EMBED_BATCH_WORKERS = env_int('PROJECT_EMBED_BATCH_WORKERS', 3, minimum=1, maximum=8)
+PROJECT_EMBED_INLINE_LIMIT = 24  # chunks a chat turn may embed inline; more goes to the background indexer
+project_index_status = {}  # pid -> {'state', 'done', 'total', 'updated_at'} (per worker)
 
 PLAN_LIMITS = {
     'free': {
@@ -603,29 +607,20 @@ DEFAULT_TOKEN_PACKAGES = [
 ]
 
 
-def _cosine_similarity(v1, v2):
-    """Compute cosine similarity without extra dependencies."""
-    if not v1 or not v2 or len(v1) != len(v2):
-        return -1.0
-    dot = 0.0
-    n1 = 0.0
-    n2 = 0.0
-    for a, b in zip(v1, v2):
-        dot += a * b
-        n1 += a * a
-        n2 += b * b
-    if n1 <= 0.0 or n2 <= 0.0:
-        return -1.0
-    return dot / (math.sqrt(n1) * math.sqrt(n2))
+def _project_file_content_hash(content):
+    """Hash the chunked file content; chunking params are folded in so changing them re-embeds."""
+    payload = f"{PROJECT_CHUNK_SIZE}:{PROJECT_CHUNK_OVERLAP}:{content or ''}"
+    return hashlib.sha256(payload.encode('utf-8', errors='ignore')).hexdigest()
+
+
+def _project_file_signature(pf):
+    updated = pf.updated_at.isoformat() if pf.updated_at else ''
+    return f"{pf.id}:{pf.name}:{updated}:{len(pf.content or '')}"
 
 
 def _project_signature(project_files):
     """Return a stable signature for cache invalidation when files change."""
-    sig_parts = []
-    for pf in project_files:
-        updated = pf.updated_at.isoformat() if pf.updated_at else ''
-        sig_parts.append(f"{pf.id}:{pf.name}:{updated}:{len(pf.content or '')}")
-    return '|'.join(sig_parts)
+    return '|'.join(_project_file_signature(pf) for pf in project_files)
 
 
 def _chunk_text(text, chunk_size=1200, overlap=200):
@@ -680,11 +675,13 @@ def _extract_embedding_values(resp):
     return None
 
 
-def _embed_text_with_fallback(text, task_type='RETRIEVAL_DOCUMENT'):
-    """Embed text via Gemini with model fallback for compatibility."""
-    if not text or not GEMINI_API_KEY:
-        return None, None
+# The embedding model that last succeeded in this process; tried first so we
+# don't walk the whole fallback list on every call.
+_working_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
 
+def _embedding_model_candidates():
     candidates = []
     env_model = os.getenv('EMBEDDING_MODEL_NAME', 'models/gemini-embedding-2-preview')
     candidates.append(env_model)
@@ -695,6 +692,10 @@ def _embed_text_with_fallback(text, task_type='RETRIEVAL_DOCUMENT'):
         'gemini-embedding-001',
     ])
 
+    working = _working_embedding_model
+    if working:
+        candidates.insert(0, working)
+
     # Dedupe while preserving order
     seen = set()
     unique_candidates = []
@@ -702,8 +703,35 @@ def _embed_text_with_fallback(text, task_type='RETRIEVAL_DOCUMENT'):
         if c and c not in seen:
             seen.add(c)
             unique_candidates.append(c)
+    return unique_candidates
+
+
+def _remember_embedding_model(model_name, ok=True):
+    global _working_embedding_model
+    with _embedding_model_lock:
+        if ok:
+            _working_embedding_model = model_name
+        elif _working_embedding_model == model_name:
+            _working_embedding_model = None
+
+
+def _is_embedding_rate_limited(error):
+    text = str(error)
+    return '429' in text or 'RESOURCE_EXHAUSTED' in text or 'quota' in text.lower()
+
 
-    for model_name in unique_candidates:
+def _is_embedding_model_error(error):
+    text = str(error)
+    lowered = text.lower()
+    return '404' in text or 'not found' in lowered or 'not supported' in lowered
+
+
+def _embed_text_with_fallback(text, task_type='RETRIEVAL_DOCUMENT'):
+    """Embed text via Gemini with model fallback for compatibility."""
+    if not text or not GEMINI_API_KEY:
+        return None, None
+
+    for model_name in _embedding_model_candidates():
         try:
             resp = genai.embed_content(
                 model=model_name,
@@ -712,16 +740,125 @@ def _embed_text_with_fallback(text, task_type='RETRIEVAL_DOCUMENT'):
             )
             values = _extract_embedding_values(resp)
             if values:
+                _remember_embedding_model(model_name)
                 return values, model_name
         except Exception as e:
             print(f"Embedding call failed for {model_name}: {e}")
+            if not _is_embedding_model_error(e):
+                # Throttling, auth or network: another model name won't fare better.
+                break
+            _remember_embedding_model(model_name, ok=False)
             continue
 
     return None, None
 
 
-def _build_project_embedding_index(project_or_id):
-    """Build or reuse cached embedding index for project files."""
+def _embed_index_batch(texts, indices, task_type, results):
+    """Embed texts[indices] in one request, splitting the batch only on a short/partial response.
+
+    Rate-limited requests are retried with backoff and then the whole batch is
+    left unembedded (the background indexer retries it later); a model error
+    moves to the next model name; auth, network and other errors give up on
+    the batch. Only a response that came back with missing vectors is halved,
+    and single texts finally go through the per-text fallback path.
+    """
+    vectors = None
+    model_used = None
+    for model_name in _embedding_model_candidates():
+        error = None
+        for attempt in range(3):
+            try:
+                vectors = genai.embed_contents(model_name, [texts[i] for i in indices], task_type=task_type)
+                model_used = model_name
+            except Exception as e:
+                error = e
+                if _is_embedding_rate_limited(e) and attempt < 2:
+                    time.sleep(1.5 * (attempt + 1))
+                    continue
+                print(f"Batch embedding failed for {model_name} ({len(indices)} texts): {e}")
+            break
+        if model_used:
+            break
+        if not _is_embedding_model_error(error):
+            return
+        _remember_embedding_model(model_name, ok=False)
+
+    if not model_used or vectors is None:
+        return
+
+    _remember_embedding_model(model_used)
+    if len(vectors) == len(indices):
+        missing = []
+        for i, values in zip(indices, vectors):
+            if values:
+                results[i] = (values, model_used)
+            else:
+                missing.append(i)
+    else:
+        missing = list(indices)
+
+    if not missing:
+        return
+    if len(missing) > 1:
+        mid = len(missing) // 2
+        _embed_index_batch(texts, missing[:mid], task_type, results)
+        _embed_index_batch(texts, missing[mid:], task_type, results)
+        return
+
+    values, model_name = _embed_text_with_fallback(texts[missing[0]], task_type=task_type)
+    if values:
+        results[missing[0]] = (values, model_name)
+
+
+def _embed_texts_batched(texts, task_type='RETRIEVAL_DOCUMENT', on_progress=None):
+    """Embed many texts with batched requests. Returns [(values, model) | None] aligned with texts."""
+    results = [None] * len(texts)
+    if not texts or not GEMINI_API_KEY:
+        return results
+
+    batches = [
+        list(range(start, min(start + PROJECT_EMBED_BATCH_SIZE, len(texts))))
+        for start in range(0, len(texts), PROJECT_EMBED_BATCH_SIZE)
+    ]
+    progress = {'done': 0}
+    progress_lock = threading.Lock()
+
+    def _run(indices):
+        _embed_index_batch(texts, indices, task_type, results)
+        if on_progress:
+            with progress_lock:
+                progress['done'] += len(indices)
+                done = progress['done']
+            try:
+                on_progress(done, len(texts))
+            except Exception as e:
+                print(f"WARN: Embedding progress callback failed: {e}")
+
+    if len(batches) == 1:
+        _run(batches[0])
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=PROJECT_EMBED_BATCH_WORKERS) as executor:
+            list(executor.map(_run, batches))
+    return results
+
+
+def _build_project_embedding_index(project_or_id, inline_limit=None, on_progress=None):
+    """Build or reuse the embedding index for project files.
+
+    Chunk vectors are persisted in ProjectChunkEmbedding keyed by
+    (file id, content hash, chunk index, embedding model), so only chunks of
+    new or changed files are sent to the embedding API, in batched requests.
+    The assembled index holds one contiguous, L2-normalised float32 matrix per
+    embedding model.
+
+    The warm index keeps per-file entries: when the project changes, only the
+    touched files are re-chunked and looked up, deleted files are dropped, and
+    every other file's vectors are reused as-is.
+
+    With `inline_limit`, a caller on the request path embeds at most that many
+    missing chunks itself; larger backlogs are handed to the background indexer
+    and a partial (uncached) index over the stored vectors is returned.
+    """
     with app.app_context():
         # Force re-fetch to ensure we are in a session
         pid = project_or_id if isinstance(project_or_id, (int, str)) else getattr(project_or_id, 'id', None)
@@ -731,6 +868,7 @@ def _build_project_embedding_index(project_or_id):
         project = db.session.get(Project, int(pid))
         if not project:
             return None
+        pid = project.id
             
         files = project.files.order_by(ProjectFile.name).all()
         if not files:
@@ -740,55 +878,227 @@ def _build_project_embedding_index(project_or_id):
         now = time.time()
 
         cached = project_embedding_cache.get(pid)
-        if cached and cached.get('signature') == signature and (now - cached.get('timestamp', 0) < PROJECT_EMBED_CACHE_TTL):
+        if cached and (now - cached.get('timestamp', 0) >= PROJECT_EMBED_CACHE_TTL):
+            cached = None
+        if cached and cached.get('signature') == signature:
             return cached
 
-        raw_items = []
+        # Reuse the warm entries of files whose signature is unchanged.
+        cached_files = cached.get('files', {}) if cached else {}
+        file_entries = {}
+        file_chunks = {}
         for pf in files:
-            content = (pf.content or '')[:12000]  # hard limit per file for cost control
-            for idx, chunk in enumerate(_chunk_text(content, chunk_size=1200, overlap=200)):
-                raw_items.append({
-                    'pf_name': pf.name,
-                    'pf_lang': pf.language or 'plaintext',
-                    'text': chunk,
-                    'chunk_index': idx
-                })
+            file_sig = _project_file_signature(pf)
+            entry = cached_files.get(pf.id)
+            if entry and entry['signature'] == file_sig:
+                entry['name'] = pf.name
+                entry['language'] = pf.language or 'plaintext'
+                file_entries[pf.id] = entry
+                continue
+            content = (pf.content or '')[:PROJECT_FILE_EMBED_CHAR_LIMIT]
+            chunks = _chunk_text(content, chunk_size=PROJECT_CHUNK_SIZE, overlap=PROJECT_CHUNK_OVERLAP)
+            if chunks:
+                file_chunks[pf.id] = (pf, _project_file_content_hash(content), chunks, file_sig)
 
-        if not raw_items:
+        if not file_entries and not file_chunks:
             return None
 
-        def _embed_task(item):
-            emb, model_used = _embed_text_with_fallback(item['text'], task_type='RETRIEVAL_DOCUMENT')
-            if not emb:
-                return None
-            return {
-                'file': item['pf_name'],
-                'language': item['pf_lang'],
-                'text': item['text'],
-                'embedding': emb,
-                'chunk_index': item['chunk_index'],
-                'model_used': model_used,
-            }
+        # Reuse persisted vectors whose content hash still matches the file.
+        stored = {}
+        stale_ids = []
+        if file_chunks:
+            rows = ProjectChunkEmbedding.query.filter(
+                ProjectChunkEmbedding.project_id == pid,
+                ProjectChunkEmbedding.file_id.in_(list(file_chunks)),
+            ).all()
+            for row in rows:
+                entry = file_chunks.get(row.file_id)
+                if not entry or row.content_hash != entry[1]:
+                    stale_ids.append(row.id)
+                    continue
+                stored.setdefault((row.file_id, row.chunk_index), (row.embedding_model, row.vector))
 
-        chunks = []
-        # Use max_workers=10 for fast parallel embedding. Most API quotas allow this.
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            results = list(executor.map(_embed_task, raw_items))
-        
-        chunks = [r for r in results if r]
+        raw_items = []
+        for file_id, (pf, content_hash, chunks, _file_sig) in file_chunks.items():
+            for idx, chunk in enumerate(chunks):
+                if (file_id, idx) not in stored:
+                    raw_items.append({
+                        'file_id': file_id,
+                        'content_hash': content_hash,
+                        'text': chunk,
+                        'chunk_index': idx,
+                    })
+
+        partial = False
+        if inline_limit is not None and len(raw_items) > inline_limit:
+            _schedule_project_indexing(pid, project.user_id)
+            raw_items = []
+            partial = True
+
+        new_rows = []
+        if raw_items:
+            results = _embed_texts_batched(
+                [item['text'] for item in raw_items],
+                task_type='RETRIEVAL_DOCUMENT',
+                on_progress=on_progress,
+            )
+
+            if inline_limit is not None and not all(results):
+                # Throttled or failed batches are left to the background indexer.
+                _schedule_project_indexing(pid, project.user_id)
+                partial = True
 
-        if not chunks:
+            for item, result in zip(raw_items, results):
+                if not result:
+                    continue
+                vector = np.asarray(result[0], dtype=np.float32)
+                model_used = _normalize_gemini_model_name(result[1])
+                vector_bytes = vector.tobytes()
+                stored[(item['file_id'], item['chunk_index'])] = (model_used, vector_bytes)
+                new_rows.append(ProjectChunkEmbedding(
+                    project_id=pid,
+                    file_id=item['file_id'],
+                    content_hash=item['content_hash'],
+                    chunk_index=item['chunk_index'],
+                    embedding_model=model_used,
+                    dim=int(vector.shape[0]),
+                    vector=vector_bytes,
+                ))
+
+        if stale_ids or new_rows:
+            try:
+                if stale_ids:
+                    ProjectChunkEmbedding.query.filter(
+                        ProjectChunkEmbedding.id.in_(stale_ids)
+                    ).delete(synchronize_session=False)
+                db.session.add_all(new_rows)
+                db.session.commit()
+            except IntegrityError:
+                # Another worker persisted the same chunks first; the in-memory vectors are still valid.
+                db.session.rollback()
+            except Exception as e:
+                db.session.rollback()
+                print(f"WARN: Could not persist project chunk embeddings for project {pid}: {e}")
+
+        for file_id, (pf, _content_hash, chunks, file_sig) in file_chunks.items():
+            entry = {
+                'signature': file_sig,
+                'name': pf.name,
+                'language': pf.language or 'plaintext',
+                'complete': True,
+                'chunks': [],
+            }
+            for idx, chunk in enumerate(chunks):
+                hit = stored.get((file_id, idx))
+                if not hit:
+                    entry['complete'] = False
+                    continue
+                model_used, vector_bytes = hit
+                entry['chunks'].append((idx, chunk, model_used, np.frombuffer(vector_bytes, dtype=np.float32)))
+            file_entries[file_id] = entry
+
+        all_chunks, matrices = _assemble_project_index(file_entries, [pf.id for pf in files])
+        if not all_chunks:
             return None
 
         index_data = {
             'signature': signature,
-            'timestamp': now,
-            'chunks': chunks,
+            'timestamp': cached['timestamp'] if cached else now,
+            'files': {fid: entry for fid, entry in file_entries.items() if entry['complete']},
+            'chunks': all_chunks,
+            'matrices': matrices,
+            'embedded_now': len(new_rows),
+            'reindexed_files': len(file_chunks),
+            'partial': partial,
+            'complete': all(entry['complete'] for entry in file_entries.values()),
         }
-        project_embedding_cache[pid] = index_data
+        # Files that failed to embed are left out of 'files' so the next call retries them.
+        if not partial and index_data['complete']:
+            project_embedding_cache[pid] = index_data
         return index_data
 
 
+def _assemble_project_index(file_entries, file_order):
+    """Stack per-file chunk vectors into one L2-normalised matrix per (model, dim)."""
+    groups = {}
+    all_chunks = []
+    for file_id in file_order:
+        entry = file_entries.get(file_id)
+        if not entry:
+            continue
+        for idx, chunk, model_used, vector in entry['chunks']:
+            meta = {
+                'file': entry['name'],
+                'language': entry['language'],
+                'text': chunk,
+                'chunk_index': idx,
+                'model_used': model_used,
+            }
+            group = groups.setdefault((model_used, vector.shape[0]), {'vectors': [], 'chunks': []})
+            group['vectors'].append(vector)
+            group['chunks'].append(meta)
+            all_chunks.append(meta)
+
+    matrices = []
+    for (model_used, dim), group in groups.items():
+        matrix = np.ascontiguousarray(np.vstack(group['vectors']), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        matrix /= norms
+        matrices.append({
+            'model': model_used,
+            'dim': dim,
+            'matrix': matrix,
+            'chunks': group['chunks'],
+        })
+    return all_chunks, matrices
+
+
+def _emit_project_index_progress(user_id, project_id, status):
+    project_index_status[project_id] = status
+    if not user_id:
+        return
+    try:
+        socketio.emit('project_index_progress', {'project_id': project_id, **status}, room=_user_socket_room(user_id))
+    except Exception as e:
+        print(f"WARN: project_index_progress emit failed for project {project_id}: {e}")
+
+
+def index_project_embeddings(project_id, user_id=None):
+    """Lifecycle job: embed every missing chunk of a project, streaming progress to the owner."""
+    try:
+        def _progress(done, total):
+            _emit_project_index_progress(user_id, project_id, {
+                'state': 'indexing', 'done': done, 'total': total, 'updated_at': time.time(),
+            })
+
+        _emit_project_index_progress(user_id, project_id, {
+            'state': 'indexing', 'done': 0, 'total': None, 'updated_at': time.time(),
+        })
+        index_data = _build_project_embedding_index(project_id, on_progress=_progress)
+        if index_data and not index_data['complete']:
+            # Throttled/failed batches: let the job queue retry with backoff.
+            raise RuntimeError('some chunks could not be embedded')
+        total = len(index_data['chunks']) if index_data else 0
+        _emit_project_index_progress(user_id, project_id, {
+            'state': 'ready', 'done': total, 'total': total, 'updated_at': time.time(),
+        })
+    except Exception as e:
+        print(f"WARN: Background indexing failed for project {project_id}: {e}")
+        _emit_project_index_progress(user_id, project_id, {
+            'state': 'failed', 'error': str(e), 'updated_at': time.time(),
+        })
+        raise
+    finally:
+        db.session.remove()
+
+
+def _schedule_project_indexing(project_id, user_id=None):
+    """Queue background indexing. The job key folds repeated writes into one pending run,
+    and a write that lands while a run is in progress queues exactly one follow-up."""
+    return enqueue_job(index_project_embeddings, (project_id, user_id), key=f"project-index:{project_id}")
+
+
 def build_project_context_for_question(project_or_id, question, top_k=6):
     """Return concise, relevance-ranked project context for a user question."""
     with app.app_context():
@@ -834,7 +1144,7 @@ def build_project_context_for_question(project_or_id, question, top_k=6):
 
 def get_project_semantic_hits(project_or_id, question, top_k=6):
     """Return top semantic hits for a question within project files."""
-    index_data = _build_project_embedding_index(project_or_id)
+    index_data = _build_project_embedding_index(project_or_id, inline_limit=PROJECT_EMBED_INLINE_LIMIT)
     if not index_data:
         return None
 
@@ -842,22 +1152,34 @@ def get_project_semantic_hits(project_or_id, question, top_k=6):
     if not query_emb:
         return None
 
-    scored = []
-    for item in index_data['chunks']:
-        score = _cosine_similarity(query_emb, item['embedding'])
-        if score > 0:
-            scored.append((score, item))
+    query_vec = np.asarray(query_emb, dtype=np.float32)
+    query_norm = float(np.linalg.norm(query_vec))
+    if query_norm <= 0.0:
+        return None
+    query_vec /= query_norm
+
+    # Score against the matrix built with the same embedding model; fall back to any
+    # matrix with a matching dimension (e.g. older rows stored under an alias).
+    query_model_key = _normalize_gemini_model_name(query_model)
+    candidates = [m for m in index_data.get('matrices', []) if m['dim'] == query_vec.shape[0]]
+    candidates.sort(key=lambda m: m['model'] != query_model_key)
+    if not candidates:
+        return None
+    group = candidates[0]
 
-    if not scored:
+    # One matrix-vector product over the contiguous float32 index.
+    scores = group['matrix'] @ query_vec
+    positive = np.flatnonzero(scores > 0)
+    if positive.size == 0:
         return None
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    selected = scored[:top_k]
+    selected = positive[np.argsort(-scores[positive], kind='stable')][:top_k]
 
     hits = []
-    for score, item in selected:
+    for pos in selected:
+        item = group['chunks'][int(pos)]
         hits.append({
-            'score': round(float(score), 4),
+            'score': round(float(scores[pos]), 4),
             'file': item['file'],
             'language': item['language'],
             'chunk_index': item['chunk_index'],
@@ -872,12 +1194,21 @@ def get_project_semantic_hits(project_or_id, question, top_k=6):
     }
 
 
-def invalidate_project_embedding_cache(project_id):
+def invalidate_project_embedding_cache(project_id, file_id=None):
+    """Refresh the project index after a file write or delete.
+
+    With `file_id`, the warm index is kept and only that file is re-indexed in
+    the background; without it the whole cached index is dropped.
+    """
     try:
         pid = int(project_id)
     except Exception:
         return
-    project_embedding_cache.pop(pid, None)
+    if file_id is None:
+        project_embedding_cache.pop(pid, None)
+        return
+    project = db.session.get(Project, pid)
+    _schedule_project_indexing(pid, project.user_id if project else None)
 
 
 def _agent_project_search(project_id, query, top_k=6):
@@ -1045,8 +1376,8 @@ def _clip_agent_metadata(trace, changed_files, max_trace=10, max_changed=20):
     }
 
 
-# Lightweight in-memory state for external tool conversations (VS Code extension, API clients).
-_external_conversation_state = {}
+# External tool conversation state (VS Code extension, API clients) lives in the
+# shared run-state store with a TTL; see utils/run_state.py.
 # VS Code login state is now database-backed via VSCodeLoginState model
 VSCODE_LOGIN_STATE_TTL_SECONDS = 600
 
@@ -1147,8 +1478,6 @@ if any(not os.getenv(key) for key in required_env_keys):
 static_folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
 app = Flask(__name__, static_folder=static_folder_path, static_url_path='')
 
-# SaaS-Grade Lifecycle Orchestration (Start Async Worker)
-start_worker(app)
 basedir = os.path.abspath(os.path.dirname(__file__))
 # Veritabanı dosyasını instance klasöründe tutuyoruz (Flask standardı)
 instance_path = os.path.join(basedir, 'instance')
@@ -1165,13 +1494,10 @@ if database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-# Pool Optimization for Concurrency
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_size': 50,
-    'max_overflow': 150,
-    'pool_recycle': 1800,
-    'pool_pre_ping': True
-}
+# Pool sized per worker from WEB_CONCURRENCY / ASYNC_EXECUTOR_WORKERS / DB_MAX_CONNECTIONS
+# (see utils/db_metrics.py); checkouts, waits and per-route queries feed /metrics.
+_db_metrics = DbMetrics()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_pool_options(_db_metrics)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # JWT Security: Require strong secret key in production
 _jwt_secret = os.getenv('JWT_SECRET_KEY')
@@ -1204,6 +1530,34 @@ CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 db.init_app(app)
 jwt = JWTManager(app)
 
+with app.app_context():
+    _db_metrics.instrument(db.engine)
+
+
+@app.before_request
+def _begin_db_metrics():
+    _db_metrics.begin_request()
+
+
+@app.teardown_request
+def _end_db_metrics(exc):
+    # Runs after a stream_with_context body finishes, so streams report their full duration.
+    rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    _db_metrics.end_request(request.method, rule, failed=exc is not None)
+
+
+def release_request_session():
+    """Commit the request session so its connection goes back to the pool.
+
+    Called before long model streams; the session transparently checks out a
+    connection again on next use (stream tails save in their own app context).
+    """
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"WARN: could not release request session before stream: {e}")
+
 
 @app.before_request
 def sanitize_auth_headers():
@@ -1278,6 +1632,7 @@ def sanitize_auth_headers():
 
 
 # SocketIO async mode is pinned to threading for cross-platform stability.
+# SOCKETIO_MESSAGE_QUEUE (e.g. redis://...) makes rooms span all uvicorn workers.
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
@@ -1286,7 +1641,10 @@ socketio = SocketIO(
     engineio_logger=False,
     ping_timeout=60,
     ping_interval=25,
+    **socketio_queue_options(),
 )
+# Model deltas for collaboration rooms are sent as ~40ms frames instead of one emit per chunk.
+collab_chunks = ChunkCoalescer(socketio)
 
 # --- SOCKETIO EVENT HANDLERS ---
 @socketio.on('join_room')
@@ -1322,6 +1680,20 @@ with app.app_context():
         db.create_all()
         print("Database tables initialized successfully.")
 
+        # --- Schema patch: create_all mevcut tablolara kolon eklemez ---
+        try:
+            history_columns = {c['name'] for c in db.inspect(db.engine).get_columns('history')}
+            if 'is_comparison' not in history_columns:
+                db.session.execute(sql_text("ALTER TABLE history ADD COLUMN is_comparison BOOLEAN"))
+                db.session.commit()
+                print("Added history.is_comparison column.")
+        except Exception as schema_err:
+            print(f"Warning: Could not add history.is_comparison: {schema_err}")
+            db.session.rollback()
+
+        # Cross-conversation recall index (FTS5 / tsvector); no-op elsewhere.
+        ensure_history_fts(db.engine)
+
         # --- Startup Seeding: Ensure token packages match defaults ---
         try:
             current_count = TokenPackage.query.count()
@@ -1370,6 +1742,9 @@ with app.app_context():
 
 # Database initialization handled above.
 
+# SaaS-Grade Lifecycle Orchestration (Start Async Workers once the job table exists)
+start_worker(app)
+
 @jwt.invalid_token_loader
 def invalid_token_callback(error):
     error_str = str(error)
@@ -1596,7 +1971,12 @@ else:
 # --- MODEL FONKSİYONLARI ---
 
 # Initialize Utils
-language_detector = LanguageDetector(os.getenv('GEMINI_API_KEY'))
+# The decision log (raw questions) stays off unless ROUTING_DECISIONS_LOG is set.
+routing_classifier = RoutingClassifier(
+    model_path=os.getenv('ROUTING_CLASSIFIER_MODEL') or os.path.join(instance_path, 'routing_classifier.npz'),
+)
+routing_classifier.warm_up()
+language_detector = LanguageDetector(os.getenv('GEMINI_API_KEY'), classifier=routing_classifier)
 model_router = ModelRouter()
 
 
@@ -1996,7 +2376,10 @@ def generate_gemini_answer(question: str, code: str, history_context: list = Non
             if not user_contents:
                 user_contents = [question or "Hello"]
 
-            with provider_slot("gemini"):
+            reservation = get_provider_governor().reserve("gemini", model=model_name)
+            for queue_status in reservation.wait():
+                yield QueueNotice(queue_status)
+            with reservation:
                 response_iter = model.generate_content(
                     user_contents,
                     stream=True,
@@ -2181,7 +2564,10 @@ def generate_claude_answer(question: str, code: str, history_context: list = Non
         messages.append({"role": "user", "content": user_message})
 
     try:
-        with provider_slot("anthropic"):
+        reservation = get_provider_governor().reserve("anthropic", model=target_model)
+        for queue_status in reservation.wait():
+            yield QueueNotice(queue_status)
+        with reservation:
             with claude_client.messages.stream(
                 model=target_model,
                 max_tokens=4096,
@@ -2353,7 +2739,10 @@ def generate_gpt_answer(question: str, code: str, history_context: list = None,
         messages.append({"role": "user", "content": user_message})
 
     try:
-        with provider_slot("openai"):
+        reservation = get_provider_governor().reserve("openai", model=target_model)
+        for queue_status in reservation.wait():
+            yield QueueNotice(queue_status)
+        with reservation:
             stream = openai_client.chat.completions.create(
                 model=target_model,
                 messages=messages,
@@ -2565,31 +2954,57 @@ def _load_recent_chat_recall(user, question, conversation=None, limit=3):
     if not query_tokens:
         return {'text': '', 'hit_count': 0, 'hits': []}
 
-    history_query = (
-        History.query
-        .join(Conversation, History.conversation_id == Conversation.id)
-        .filter(Conversation.user_id == user.id, History.is_deleted == False)  # noqa: E712
-    )
-    if conversation and conversation.id:
-        history_query = history_query.filter(History.conversation_id != conversation.id)
+    exclude_conversation_id = conversation.id if conversation and conversation.id else None
+    ranked_ids = None
+    try:
+        # Savepoint: a failed FTS query must not abort the caller's transaction on Postgres.
+        with db.session.begin_nested():
+            ranked_ids = search_history(
+                db.session, user.id, query_tokens,
+                exclude_conversation_id=exclude_conversation_id,
+                limit=max(limit * 4, 12),
+            )
+    except Exception as fts_err:
+        print(f"WARN: History FTS recall failed, scanning recent turns: {fts_err}")
+
+    if ranked_ids is not None:
+        # Index order is the ranking; overlap only filters and reports a 0..1 score.
+        ids = [history_id for history_id, _rank in ranked_ids]
+        rows_by_id = {row.id: row for row in History.query.filter(History.id.in_(ids))} if ids else {}
+        scored_rows = []
+        for history_id in ids:
+            row = rows_by_id.get(history_id)
+            if row is None:
+                continue
+            score = _recall_token_overlap(query_tokens, _recall_query_tokens(f"{row.user_question or ''}\n{row.ai_response or ''}"))
+            if score > 0:
+                scored_rows.append((score, row))
+    else:
+        history_query = (
+            History.query
+            .join(Conversation, History.conversation_id == Conversation.id)
+            .filter(Conversation.user_id == user.id, History.is_deleted == False)  # noqa: E712
+        )
+        if exclude_conversation_id:
+            history_query = history_query.filter(History.conversation_id != exclude_conversation_id)
 
-    rows = (
-        history_query
-        .order_by(History.timestamp.desc())
-        .limit(120)
-        .all()
-    )
+        rows = (
+            history_query
+            .order_by(History.timestamp.desc())
+            .limit(120)
+            .all()
+        )
 
-    scored_rows = []
-    for row in rows:
-        candidate_text = f"{row.user_question or ''}\n{row.ai_response or ''}"
-        candidate_tokens = _recall_query_tokens(candidate_text)
-        score = _recall_token_overlap(query_tokens, candidate_tokens)
-        if score <= 0:
-            continue
-        scored_rows.append((score, row))
+        scored_rows = []
+        for row in rows:
+            candidate_text = f"{row.user_question or ''}\n{row.ai_response or ''}"
+            candidate_tokens = _recall_query_tokens(candidate_text)
+            score = _recall_token_overlap(query_tokens, candidate_tokens)
+            if score <= 0:
+                continue
+            scored_rows.append((score, row))
 
-    scored_rows.sort(key=lambda item: (item[0], item[1].timestamp), reverse=True)
+        scored_rows.sort(key=lambda item: (item[0], item[1].timestamp), reverse=True)
     selected_rows = scored_rows[:limit]
     if not selected_rows:
         return {'text': '', 'hit_count': 0, 'hits': []}
@@ -2712,6 +3127,60 @@ def _check_context_health(history_context, question, conversation_id):
                            "message": message}, ensure_ascii=False)
     return f"data: {payload}\n\n"
 
+def _cache_history_memory_candidates(history_id, candidates):
+    """Store extract_memory_candidates() output for a History row (caller commits)."""
+    db.session.merge(HistoryMemoryCache(
+        history_id=history_id,
+        rules_version=MEMORY_EXTRACTION_VERSION,
+        candidates_json=json.dumps(candidates, ensure_ascii=False),
+    ))
+
+
+def _history_memory_candidates(history_ids):
+    """history_id -> memory candidates, extracting (and caching) only rows never seen before.
+
+    Rows are normally cached by the post-answer pipeline; older rows and rows from a
+    previous MEMORY_EXTRACTION_VERSION are extracted here once and written back.
+    """
+    if not history_ids:
+        return {}
+
+    result = {}
+    for history_id, candidates_json in db.session.query(HistoryMemoryCache.history_id, HistoryMemoryCache.candidates_json).filter(
+        HistoryMemoryCache.history_id.in_(history_ids),
+        HistoryMemoryCache.rules_version == MEMORY_EXTRACTION_VERSION,
+    ):
+        try:
+            result[history_id] = json.loads(candidates_json or '[]')
+        except ValueError:
+            continue
+
+    missing_ids = [history_id for history_id in history_ids if history_id not in result]
+    if not missing_ids:
+        return result
+
+    fresh = {}
+    for row in db.session.query(History.id, History.user_question, History.ai_response).filter(History.id.in_(missing_ids)):
+        fresh[row.id] = extract_memory_candidates(row.user_question or '', row.ai_response or '')
+    result.update(fresh)
+
+    try:
+        # Savepoint: a concurrent writer caching the same row only loses this write-back.
+        with db.session.begin_nested():
+            HistoryMemoryCache.query.filter(HistoryMemoryCache.history_id.in_(list(fresh))).delete(synchronize_session=False)
+            db.session.add_all([
+                HistoryMemoryCache(
+                    history_id=history_id,
+                    rules_version=MEMORY_EXTRACTION_VERSION,
+                    candidates_json=json.dumps(candidates, ensure_ascii=False),
+                )
+                for history_id, candidates in fresh.items()
+            ])
+    except Exception as cache_err:
+        print(f"[MEMORY] History candidate cache write skipped: {cache_err}")
+    return result
+
+
 def _load_previous_memory_context(user, question, conversation=None, include_previous_modules=False):
     if not user or not include_previous_modules:
         return {'text': '', 'hit_count': 0, 'hits': []}
@@ -2750,14 +3219,16 @@ def _load_previous_memory_context(user, question, conversation=None, include_pre
 
         recent_history_rows = (
             recent_history_query
+            .with_entities(History.id, History.timestamp)
             .order_by(History.timestamp.desc())
             .limit(80)
             .all()
         )
+        cached_candidates = _history_memory_candidates([row.id for row in recent_history_rows])
 
         seen_history_candidates = set()
         for history_row in recent_history_rows:
-            for item in extract_memory_candidates(history_row.user_question or '', history_row.ai_response or ''):
+            for item in cached_candidates.get(history_row.id, []):
                 content = (item.get('content') or '').strip()
                 module_key = item.get('module_key') or 'general'
                 key = (module_key, content.lower())
@@ -2789,6 +3260,8 @@ def _load_previous_memory_context(user, question, conversation=None, include_pre
         .all()
     )
 
+    stored_embeddings = _load_memory_embeddings(user.id, memory_rows, summary_rows)
+
     memory_context = build_minimum_continuation_capsule(
         question,
         memory_sources,
@@ -2796,6 +3269,7 @@ def _load_previous_memory_context(user, question, conversation=None, include_pre
         char_budget=420,
         max_lines=5,
         min_confidence=0.42,
+        embeddings=stored_embeddings,
     )
 
     conflict_result = detect_memory_conflicts(question, memory_context.get('hits', []))
@@ -2825,6 +3299,7 @@ def _load_previous_memory_context(user, question, conversation=None, include_pre
         summary_rows,
         top_k=5,
         min_confidence=0.42,
+        embeddings=stored_embeddings,
     )
     if retrieval_plan.get('text'):
         memory_context['text'] = retrieval_plan.get('text', '')
@@ -2860,6 +3335,121 @@ def _load_previous_memory_context(user, question, conversation=None, include_pre
     return memory_context
 
 
+_MEMORY_EMBED_BACKFILL_PENDING = {}  # (source_type, source_id) -> monotonic time it was queued
+MEMORY_EMBED_BACKFILL_RETRY_SEC = 600
+_MEMORY_EMBED_BACKFILL_LOCK = threading.Lock()
+MEMORY_EMBED_BACKFILL_BATCH = 20
+
+
+def _upsert_memory_embeddings(user_id, sources):
+    """Embed (source_type, source_id, text) rows whose stored vector is missing or stale.
+
+    Called at write time (post-answer pipeline) so retrieval only embeds the query.
+    """
+    sources = [(kind, sid, text) for kind, sid, text in sources if sid and (text or '').strip()]
+    if not sources:
+        return 0
+
+    existing = {}
+    for kind in {kind for kind, _, _ in sources}:
+        ids = [sid for k, sid, _ in sources if k == kind]
+        for row in MemoryEmbedding.query.filter(
+            MemoryEmbedding.source_type == kind,
+            MemoryEmbedding.source_id.in_(ids),
+        ).all():
+            existing[(row.source_type, row.source_id)] = row
+
+    written = 0
+    for kind, sid, text in sources:
+        content_hash = memory_text_hash(text)
+        row = existing.get((kind, sid))
+        if row and row.content_hash == content_hash:
+            continue
+
+        values, model_name = embed_memory_text(text)
+        if not values:
+            continue
+
+        vector = np.asarray(values, dtype=np.float32)
+        if row is None:
+            row = MemoryEmbedding(user_id=user_id, source_type=kind, source_id=sid)
+            db.session.add(row)
+            existing[(kind, sid)] = row
+        row.user_id = user_id
+        row.content_hash = content_hash
+        row.embedding_model = (model_name or '')[:100]
+        row.dim = int(vector.shape[0])
+        row.vector = vector.tobytes()
+        written += 1
+
+    return written
+
+
+def _load_memory_embeddings(user_id, memory_rows, summary_rows):
+    """Bulk-load stored vectors for ranking; queue a backfill for rows that have none."""
+    wanted = [('memory', row.id) for row in memory_rows if getattr(row, 'id', None)]
+    wanted += [('summary', row.id) for row in summary_rows if getattr(row, 'id', None)]
+    if not wanted:
+        return {}
+
+    embeddings = {}
+    for kind in {kind for kind, _ in wanted}:
+        ids = [sid for k, sid in wanted if k == kind]
+        rows = (
+            db.session.query(
+                MemoryEmbedding.source_type,
+                MemoryEmbedding.source_id,
+                MemoryEmbedding.embedding_model,
+                MemoryEmbedding.dim,
+                MemoryEmbedding.vector,
+            )
+            .filter(MemoryEmbedding.source_type == kind, MemoryEmbedding.source_id.in_(ids))
+            .all()
+        )
+        for source_type, source_id, model_name, dim, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if vector.shape[0] == dim:
+                embeddings[(source_type, source_id)] = (vector, model_name)
+
+    missing = [key for key in wanted if key not in embeddings]
+    if missing:
+        # The job may run in another worker, so pending keys expire instead of being cleared by it.
+        now = time.monotonic()
+        with _MEMORY_EMBED_BACKFILL_LOCK:
+            for key, queued_at in list(_MEMORY_EMBED_BACKFILL_PENDING.items()):
+                if now - queued_at > MEMORY_EMBED_BACKFILL_RETRY_SEC:
+                    del _MEMORY_EMBED_BACKFILL_PENDING[key]
+            missing = [key for key in missing if key not in _MEMORY_EMBED_BACKFILL_PENDING][:MEMORY_EMBED_BACKFILL_BATCH]
+            _MEMORY_EMBED_BACKFILL_PENDING.update((key, now) for key in missing)
+        if missing:
+            enqueue_task(backfill_memory_embeddings, user_id, [list(key) for key in missing])
+
+    return embeddings
+
+
+def backfill_memory_embeddings(user_id, keys):
+    """Lifecycle job: embed memory/summary rows written before embeddings were stored."""
+    keys = [tuple(key) for key in keys]
+    try:
+        memory_ids = [sid for kind, sid in keys if kind == 'memory']
+        summary_ids = [sid for kind, sid in keys if kind == 'summary']
+        sources = []
+        if memory_ids:
+            sources += [('memory', row.id, row.content) for row in MemoryItem.query.filter(MemoryItem.id.in_(memory_ids)).all()]
+        if summary_ids:
+            sources += [
+                ('summary', row.id, row.summary_text)
+                for row in ConversationSummary.query.filter(ConversationSummary.id.in_(summary_ids)).all()
+            ]
+        _upsert_memory_embeddings(user_id, sources)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"WARN: Memory embedding backfill failed for user {user_id}: {e}")
+    finally:
+        db.session.remove()
+
+
 def _upsert_conversation_summary(current_conv, history_id, user_id, summary_text, extracted_memory_items):
     module_keys = sorted({item.get('module_key') for item in extracted_memory_items if item.get('module_key')})
     summary_row = ConversationSummary.query.filter_by(conversation_id=current_conv.id).first()
@@ -2883,6 +3473,9 @@ def _upsert_conversation_summary(current_conv, history_id, user_id, summary_text
     summary_row.last_history_id = history_id
     summary_row.updated_at = _utcnow()
 
+    db.session.flush()
+    _upsert_memory_embeddings(user_id, [('summary', summary_row.id, summary_text)])
+
     return summary_row
 
 
@@ -2925,6 +3518,10 @@ def _store_memory_items(user_id, conversation_id, extracted_memory_items):
         db.session.add(memory_item)
         stored_items.append(memory_item)
 
+    if stored_items:
+        db.session.flush()
+        _upsert_memory_embeddings(user_id, [('memory', item.id, item.content) for item in stored_items])
+
     return stored_items
 
 
@@ -3174,6 +3771,79 @@ def _write_back_memory_graph(user_id, conversation_id, history_id, memory_contex
     }
 
 
+def _user_socket_room(user_id):
+    return f"user:{int(user_id)}"
+
+
+def _emit_post_answer_update(user_id, conversation_id, payload):
+    """Push post-answer results to the owner's room and any live collaboration rooms."""
+    rooms = []
+    if user_id:
+        rooms.append(_user_socket_room(user_id))
+    if conversation_id:
+        shares = SharedSession.query.filter_by(conversation_id=conversation_id, is_active=True, is_deleted=False).all()
+        rooms.extend(share.share_token for share in shares)
+
+    for room in rooms:
+        try:
+            socketio.emit('history_enriched', payload, room=room)
+        except Exception as e:
+            print(f"WARN: history_enriched emit failed for room {room}: {e}")
+
+
+def run_post_answer_pipeline(history_id, user_id, question, answer, model, is_first_turn, memory_context=None):
+    """Fill in summary, title, persona and memory write-back after /api/ask has emitted `done`.
+
+    Runs on the lifecycle worker. `history_id` is None for no_save turns, which
+    only update the taste profile. Results are pushed to the client as a
+    `history_enriched` Socket.IO event.
+    """
+    try:
+        payload = {'history_id': history_id, 'conversation_id': None}
+        history = db.session.get(History, history_id) if history_id else None
+
+        if history:
+            conversation = history.conversation
+            payload['conversation_id'] = conversation.id
+            try:
+                summary = history.summary or summarize_answer(answer)
+                history.summary = summary
+                payload['summary'] = summary
+
+                if is_first_turn:
+                    conversation.title = generate_conversation_title(question, answer)
+                    payload['title'] = conversation.title
+
+                if user_id:
+                    extracted_memory_items = extract_memory_candidates(question, answer)
+                    _cache_history_memory_candidates(history.id, extracted_memory_items)
+                    _upsert_conversation_summary(conversation, history.id, user_id, summary, extracted_memory_items)
+                    _store_memory_items(user_id, conversation.id, extracted_memory_items)
+                    payload['memory_learning'] = _write_back_memory_graph(user_id, conversation.id, history.id, memory_context or {})
+
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"WARN: Post-answer save failed for history {history_id}: {e}")
+                payload['warning'] = 'post_answer_partial'
+
+        if user_id and answer and answer.strip():
+            try:
+                user = db.session.get(User, user_id)
+                # AI Taste Profile Güncelle (Öğrenme + Persona Analizi)
+                update_user_taste(user, model, answer, question)
+                payload['persona'] = get_user_preferences(user).get('persona', 'General User')
+            except Exception as e:
+                db.session.rollback()
+                print(f"WARN: Taste update failed for history {history_id}: {e}")
+
+        if history or user_id:
+            _emit_post_answer_update(user_id, payload['conversation_id'], payload)
+    finally:
+        # The lifecycle worker keeps one app context alive; drop the identity map between jobs.
+        db.session.remove()
+
+
 # --- GAMIFICATION SYSTEM ---
 
 BADGES = {
@@ -3560,32 +4230,54 @@ def sync_gamification():
     
     return jsonify(result)
 
-def get_user_preferences(user):
-    """Kullanıcının AI Taste Profile bilgilerini JSON olarak döner."""
-    if not user or not user.preferences:
-        return {
-            "preferred_model": "auto",
-            "response_style": "balanced",
-            "fav_language": "natural",
-            "usage_stats": {"claude": 0, "gemini": 0, "gpt": 0},
-            "subscription_plan": "free",
-            "persona": "General User",
-            "expertise": "Mid-level",
-            "interests": []
-        }
+def _default_user_preferences():
+    return {
+        "preferred_model": "auto",
+        "response_style": "balanced",
+        "fav_language": "natural",
+        "usage_stats": {"claude": 0, "gemini": 0, "gpt": 0},
+        "subscription_plan": "free",
+        "persona": "General User",
+        "expertise": "Mid-level",
+        "interests": []
+    }
+
+
+def _parse_user_preferences(raw):
+    if not raw:
+        return _default_user_preferences()
     try:
-        return json.loads(user.preferences)
+        prefs = json.loads(raw)
     except:
-        return {
-            "preferred_model": "auto",
-            "response_style": "balanced",
-            "fav_language": "natural",
-            "usage_stats": {"claude": 0, "gemini": 0, "gpt": 0},
-            "subscription_plan": "free",
-            "persona": "General User",
-            "expertise": "Mid-level",
-            "interests": []
-        }
+        return _default_user_preferences()
+    return prefs if isinstance(prefs, dict) else _default_user_preferences()
+
+
+def get_user_preferences(user):
+    """Kullanıcının AI Taste Profile bilgilerini JSON olarak döner.
+
+    İstek içindeki kullanıcı için RequestIdentity'nin paylaşılan sözlüğü döner
+    (bir kez parse edilir); değişiklikler `update_user_preferences` ile yazılmalı.
+    """
+    identity = _request_identity_for(user)
+    if identity is not None:
+        return identity.prefs
+    return _parse_user_preferences(user.preferences if user else None)
+
+
+def update_user_preferences(user, changes: dict) -> dict:
+    """Merge `changes` into the user's preferences.
+
+    For the request's own user the JSON is serialized once, at the next flush
+    (see `_write_back_request_identity`); otherwise it is written immediately.
+    """
+    identity = _request_identity_for(user)
+    if identity is not None:
+        return identity.update_prefs(changes)
+    prefs = _parse_user_preferences(user.preferences)
+    prefs.update(changes)
+    user.preferences = json.dumps(prefs)
+    return prefs
 
 
 def _normalize_subscription_plan(raw_plan):
@@ -3613,33 +4305,129 @@ def _build_usage_payload(plan, daily_count, month_tokens):
     }
 
 
-def _get_or_init_usage_counters(user):
-    prefs = get_user_preferences(user)
-    plan = _normalize_subscription_plan(prefs.get('subscription_plan', 'free'))
+USAGE_CACHE_TTL_SEC = env_float('USAGE_CACHE_TTL_SEC', 5.0, minimum=0.0, maximum=300.0)
+_usage_cache = {}  # user_id -> (expires_at, day_key, month_key, daily_requests, monthly_tokens)
+_usage_cache_lock = threading.Lock()
 
-    usage_limits = prefs.get('usage_limits') or {}
-    today = _utcnow().date().isoformat()
-    month_key = _utcnow().strftime('%Y-%m')
 
-    daily = usage_limits.get('daily') or {}
-    monthly = usage_limits.get('monthly') or {}
+def _usage_period_keys():
+    now = _utcnow()
+    return now.date().isoformat(), now.strftime('%Y-%m')
 
-    if daily.get('date') != today:
-        daily = {'date': today, 'count': 0}
 
-    if monthly.get('month') != month_key:
-        monthly = {'month': month_key, 'tokens': 0}
+def _user_plan(user):
+    return _normalize_subscription_plan(get_user_preferences(user).get('subscription_plan', 'free'))
 
-    usage_limits['daily'] = daily
-    usage_limits['monthly'] = monthly
-    prefs['usage_limits'] = usage_limits
-    prefs['subscription_plan'] = plan
 
-    return prefs, plan, usage_limits
+def _insert_usage_rows_ignore(rows):
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        db.session.execute(dialect_insert(UsageCounter).values(rows).on_conflict_do_nothing())
+        return
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.add(UsageCounter(**row))
+        except IntegrityError:
+            pass
+
+
+def _ensure_usage_rows(user, day_key, month_key):
+    """Create this period's counter rows, carrying over counts from the legacy preferences blob."""
+    present = {
+        period for (period,) in db.session.query(UsageCounter.period).filter(
+            UsageCounter.user_id == user.id,
+            db.or_(
+                db.and_(UsageCounter.period == 'day', UsageCounter.period_key == day_key),
+                db.and_(UsageCounter.period == 'month', UsageCounter.period_key == month_key),
+            ),
+        ).all()
+    }
+    if len(present) == 2:
+        return
+
+    legacy = get_user_preferences(user).get('usage_limits') or {}
+    legacy_daily = legacy.get('daily') or {}
+    legacy_monthly = legacy.get('monthly') or {}
+    rows = []
+    if 'day' not in present:
+        carried = int(legacy_daily.get('count', 0) or 0) if legacy_daily.get('date') == day_key else 0
+        rows.append({'user_id': user.id, 'period': 'day', 'period_key': day_key, 'requests': carried, 'tokens': 0})
+    if 'month' not in present:
+        carried = int(legacy_monthly.get('tokens', 0) or 0) if legacy_monthly.get('month') == month_key else 0
+        rows.append({'user_id': user.id, 'period': 'month', 'period_key': month_key, 'requests': 0, 'tokens': carried})
+    _insert_usage_rows_ignore(rows)
+
+
+def _read_usage_counters(user, use_cache=True):
+    """Return (daily_requests, monthly_tokens) for the current period."""
+    day_key, month_key = _usage_period_keys()
+    if use_cache and USAGE_CACHE_TTL_SEC > 0:
+        with _usage_cache_lock:
+            cached = _usage_cache.get(user.id)
+        if cached and cached[0] > time.monotonic() and cached[1] == day_key and cached[2] == month_key:
+            return cached[3], cached[4]
+
+    rows = db.session.query(UsageCounter.period, UsageCounter.requests, UsageCounter.tokens).filter(
+        UsageCounter.user_id == user.id,
+        db.or_(
+            db.and_(UsageCounter.period == 'day', UsageCounter.period_key == day_key),
+            db.and_(UsageCounter.period == 'month', UsageCounter.period_key == month_key),
+        ),
+    ).all()
+    counts = {period: (requests, tokens) for period, requests, tokens in rows}
+    if len(counts) < 2:
+        # First touch this period: fall back to the legacy blob until a write creates the rows.
+        legacy = get_user_preferences(user).get('usage_limits') or {}
+        if 'day' not in counts and (legacy.get('daily') or {}).get('date') == day_key:
+            counts['day'] = (int(legacy['daily'].get('count', 0) or 0), 0)
+        if 'month' not in counts and (legacy.get('monthly') or {}).get('month') == month_key:
+            counts['month'] = (0, int(legacy['monthly'].get('tokens', 0) or 0))
+    daily_count = counts.get('day', (0, 0))[0]
+    month_tokens = counts.get('month', (0, 0))[1]
+    _cache_usage_counters(user.id, day_key, month_key, daily_count, month_tokens)
+    return daily_count, month_tokens
+
+
+def _cache_usage_counters(user_id, day_key, month_key, daily_count, month_tokens):
+    if USAGE_CACHE_TTL_SEC <= 0:
+        return
+    with _usage_cache_lock:
+        _usage_cache[user_id] = (time.monotonic() + USAGE_CACHE_TTL_SEC, day_key, month_key, daily_count, month_tokens)
+        if len(_usage_cache) > 10000:
+            now = time.monotonic()
+            for key in [k for k, v in _usage_cache.items() if v[0] <= now]:
+                _usage_cache.pop(key, None)
+
+
+def _increment_usage(user_id, period, period_key, requests, tokens, cap_column=None, cap=None):
+    """`UPDATE ... SET n = n + :delta` guarded by the cap; returns False when the cap would be exceeded."""
+    stmt = db.update(UsageCounter).where(
+        UsageCounter.user_id == user_id,
+        UsageCounter.period == period,
+        UsageCounter.period_key == period_key,
+    )
+    if cap_column is not None:
+        delta = requests if cap_column == 'requests' else tokens
+        stmt = stmt.where(getattr(UsageCounter, cap_column) + delta <= cap)
+    stmt = stmt.values(
+        requests=UsageCounter.requests + requests,
+        tokens=UsageCounter.tokens + tokens,
+        updated_at=_utcnow(),
+    ).execution_options(synchronize_session=False)
+    return db.session.execute(stmt).rowcount == 1
 
 
 def consume_plan_quota(user, estimated_tokens, request_weight=1):
-    """Consume request/token quota for authenticated users."""
+    """Consume request/token quota for authenticated users.
+
+    Both counters are bumped with conditional UPDATEs, so concurrent requests
+    from the same user can neither lose an increment nor overshoot a limit.
+    """
     if not user:
         return {
             'allowed': True,
@@ -3649,42 +4437,43 @@ def consume_plan_quota(user, estimated_tokens, request_weight=1):
             'reason': None,
         }
 
-    prefs, plan, usage_limits = _get_or_init_usage_counters(user)
+    plan = _user_plan(user)
     limits = PLAN_LIMITS.get(plan, PLAN_LIMITS['free'])
+    weight = max(1, int(request_weight or 1))
+    tokens = max(1, int(estimated_tokens or 1))
+    day_key, month_key = _usage_period_keys()
 
-    daily_count = int(usage_limits['daily'].get('count', 0) or 0)
-    month_tokens = int(usage_limits['monthly'].get('tokens', 0) or 0)
-
-    projected_daily = daily_count + max(1, int(request_weight or 1))
-    projected_monthly_tokens = month_tokens + max(1, int(estimated_tokens or 1))
-
-    if projected_daily > limits['daily_requests']:
+    def _rejected(reason):
+        db.session.commit()
+        daily_count, month_tokens = _read_usage_counters(user, use_cache=False)
         payload = _build_usage_payload(plan, daily_count, month_tokens)
         return {
             'allowed': False,
             'plan': plan,
             'limits': limits,
             'usage': payload['usage'],
-            'reason': 'daily_requests_exceeded',
+            'reason': reason,
         }
 
-    if projected_monthly_tokens > limits['monthly_tokens']:
-        payload = _build_usage_payload(plan, daily_count, month_tokens)
-        return {
-            'allowed': False,
-            'plan': plan,
-            'limits': limits,
-            'usage': payload['usage'],
-            'reason': 'monthly_tokens_exceeded',
-        }
+    day_ok = _increment_usage(user.id, 'day', day_key, weight, tokens, 'requests', limits['daily_requests'])
+    if not day_ok:
+        _ensure_usage_rows(user, day_key, month_key)
+        day_ok = _increment_usage(user.id, 'day', day_key, weight, tokens, 'requests', limits['daily_requests'])
+    if not day_ok:
+        return _rejected('daily_requests_exceeded')
+
+    month_ok = _increment_usage(user.id, 'month', month_key, weight, tokens, 'tokens', limits['monthly_tokens'])
+    if not month_ok:
+        _ensure_usage_rows(user, day_key, month_key)
+        month_ok = _increment_usage(user.id, 'month', month_key, weight, tokens, 'tokens', limits['monthly_tokens'])
+    if not month_ok:
+        # Give back the daily request that was just counted.
+        _increment_usage(user.id, 'day', day_key, -weight, -tokens)
+        return _rejected('monthly_tokens_exceeded')
 
-    usage_limits['daily']['count'] = projected_daily
-    usage_limits['monthly']['tokens'] = projected_monthly_tokens
-    prefs['usage_limits'] = usage_limits
-    user.preferences = json.dumps(prefs)
     db.session.commit()
-
-    payload = _build_usage_payload(plan, projected_daily, projected_monthly_tokens)
+    daily_count, month_tokens = _read_usage_counters(user, use_cache=False)
+    payload = _build_usage_payload(plan, daily_count, month_tokens)
     return {
         'allowed': True,
         'plan': plan,
@@ -3701,13 +4490,8 @@ def get_billing_usage():
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    prefs, plan, usage_limits = _get_or_init_usage_counters(user)
-    daily_count = int(usage_limits['daily'].get('count', 0) or 0)
-    month_tokens = int(usage_limits['monthly'].get('tokens', 0) or 0)
-    user.preferences = json.dumps(prefs)
-    db.session.commit()
-
-    payload = _build_usage_payload(plan, daily_count, month_tokens)
+    daily_count, month_tokens = _read_usage_counters(user)
+    payload = _build_usage_payload(_user_plan(user), daily_count, month_tokens)
     return jsonify(payload)
 
 
@@ -3721,13 +4505,10 @@ def update_billing_plan():
     data = request.json or {}
     requested_plan = _normalize_subscription_plan(data.get('plan', 'free'))
 
-    prefs, plan, usage_limits = _get_or_init_usage_counters(user)
-    prefs['subscription_plan'] = requested_plan
-    user.preferences = json.dumps(prefs)
+    update_user_preferences(user, {'subscription_plan': requested_plan})
     db.session.commit()
 
-    daily_count = int(usage_limits['daily'].get('count', 0) or 0)
-    month_tokens = int(usage_limits['monthly'].get('tokens', 0) or 0)
+    daily_count, month_tokens = _read_usage_counters(user)
     payload = _build_usage_payload(requested_plan, daily_count, month_tokens)
     payload['message'] = f"Plan updated to {requested_plan}."
     return jsonify(payload)
@@ -3811,7 +4592,7 @@ def update_user_taste(user, model_used, answer_text, user_question=""):
         except Exception as e:
             print(f"Persona analizi hatası: {e}")
 
-    user.preferences = json.dumps(prefs)
+    update_user_preferences(user, prefs)
     db.session.commit()
 
 def post_process_response(text: str) -> str:
@@ -3847,9 +4628,15 @@ def post_process_response(text: str) -> str:
 def detect_intent(question: str, code: str = "") -> str:
     """
     Detects the user's intent from their question to route to the right model.
-    
+
+    The local classifier answers confident cases; the rest go to the LLM path.
     Returns one of: simple | simple_code | debug | explain | architecture | creative | general | image_generation
     """
+    return routing_classifier.intent(question, code, escalate=_detect_intent_with_llm)
+
+
+def _detect_intent_with_llm(question: str, code: str = ""):
+    """LLM intent classification; None when no provider produced a valid label."""
     intent_prompt = f"""Analyze the user's question and classify it into EXACTLY ONE intent category.
 
 Categories (pick the BEST match):
@@ -3926,9 +4713,9 @@ Respond with ONLY the category name (one word, no punctuation):"""
                     return intent
             except: pass
             
-        return "general"
+        return None
     except:
-        return "general"
+        return None
 
 
 
@@ -3952,17 +4739,41 @@ def _serialize_profile_image(image_value):
         return f'data:{mime_type};base64,{encoded}'
     return f"/api/files/{os.path.basename(image_str)}"
 
-def serialize_history(item: History) -> dict:
+# Feed sorguları için: conversation + yazar tek JOIN ile gelsin (satır başı lazy load yok).
+_HISTORY_FEED_OPTIONS = (db.joinedload(History.conversation).joinedload(Conversation.user),)
+
+
+def _history_answer_counts(history_ids) -> dict:
+    """history_id -> cevap sayısı, tek GROUP BY sorgusu ile."""
+    if not history_ids:
+        return {}
+    rows = db.session.query(Answer.history_id, db.func.count(Answer.id))\
+        .filter(Answer.history_id.in_(history_ids))\
+        .group_by(Answer.history_id)\
+        .all()
+    return dict(rows)
+
+
+def serialize_history(item: History, answer_count: int | None = None, author_images: dict | None = None) -> dict:
     # Kullanıcı bilgisini conversation üzerinden al
     author_name = None
     author_id = None
     author_image = None
-    if item.conversation and item.conversation.user:
-        author_name = item.conversation.user.display_name
-        author_id = item.conversation.user.id
-        if item.conversation.user.profile_image:
-            author_image = _serialize_profile_image(item.conversation.user.profile_image)
-    
+    author = item.conversation.user if item.conversation else None
+    if author:
+        author_name = author.display_name
+        author_id = author.id
+        if author.profile_image:
+            if author_images is None:
+                author_image = _serialize_profile_image(author.profile_image)
+            else:
+                if author.id not in author_images:
+                    author_images[author.id] = _serialize_profile_image(author.profile_image)
+                author_image = author_images[author.id]
+
+    if answer_count is None:
+        answer_count = item.answers.count()
+
     data = {
         'id': item.id,
         'conversation_id': item.conversation_id,
@@ -3972,7 +4783,7 @@ def serialize_history(item: History) -> dict:
         'timestamp': item.timestamp.strftime('%Y-%m-%d %H:%M'),
         'summary': item.summary or "",
         'likes': item.likes or 0,
-        'answer_count': item.answers.count() if hasattr(item, 'answers') else 0,
+        'answer_count': answer_count,
         'image_url': f"/api/files/{os.path.basename(item.image_path)}" if item.image_path else None,
         'author_name': author_name,
         'author_id': author_id,
@@ -3982,22 +4793,38 @@ def serialize_history(item: History) -> dict:
         'persona': item.persona or ""
     }
 
-    # Eğer ai_response bir JSON string ise ve isComparison içeriyorsa
-    try:
-        import json
-        if item.ai_response and item.ai_response.strip().startswith('{'):
+    # Karşılaştırma yanıtları ai_response içinde JSON olarak saklanır; sadece bayraklı
+    # (veya bayrağı henüz olmayan eski) kayıtlarda parse et.
+    maybe_comparison = item.is_comparison
+    if maybe_comparison is None:
+        maybe_comparison = bool(item.ai_response and item.ai_response.lstrip().startswith('{'))
+    if maybe_comparison:
+        try:
             parsed = json.loads(item.ai_response)
             if parsed.get('isComparison'):
+                # Frontend isComparison: true görünce response1/response2 kullanır.
                 data.update(parsed)
-                # ai_response'u override et ki frontend tek kolonda json görmesin (geriye uyumluluk)
-                # data['ai_response'] = parsed.get('ai_response', item.ai_response) 
-                # Üstteki satır yerine parsed içindeki ai_response zaten doğru metni taşıyorsa onu kullanırız
-                # Ancak frontend isComparison: true görünce zaten response1/response2 kullanacak.
-    except:
-        pass
-        
+        except (TypeError, ValueError, AttributeError):
+            pass
+
     return data
 
+
+def serialize_history_batch(items) -> list[dict]:
+    """Bir sayfa History'yi sabit sayıda sorgu ile serialize eder.
+
+    Sorgu `_HISTORY_FEED_OPTIONS` ile yüklenmeli; cevap sayıları tek GROUP BY ile
+    gelir ve yazar avatarları sayfa içinde bir kez çözülür.
+    """
+    items = list(items)
+    counts = _history_answer_counts([h.id for h in items])
+    author_images = {}
+    return [
+        serialize_history(h, answer_count=counts.get(h.id, 0), author_images=author_images)
+        for h in items
+    ]
+
+
 def serialize_conversation(conv: Conversation) -> dict:
     return {
         'id': conv.id,
@@ -4191,6 +5018,125 @@ def _get_safe_jwt_identity():
         return None
 
 
+class RequestIdentity:
+    """The authenticated user as seen by one request.
+
+    Loaded once (user row, wallet and active BYOK providers in a single query)
+    and kept on `g`, so get_current_user, get_user_preferences, check_tokens,
+    consume_plan_quota and friends share it instead of re-querying and
+    re-parsing. Preference edits are collected and serialized once per flush.
+    """
+
+    __slots__ = ('user_id', 'user', 'wallet', 'external_providers', '_prefs', '_prefs_raw', 'prefs_dirty')
+
+    def __init__(self, user, wallet, external_providers):
+        self.user_id = user.id
+        self.user = user
+        self.wallet = wallet
+        self.external_providers = frozenset(external_providers)
+        self._prefs = None
+        self._prefs_raw = None
+        self.prefs_dirty = False
+
+    @property
+    def prefs(self) -> dict:
+        raw = self.user.preferences
+        if self._prefs is None or (not self.prefs_dirty and raw != self._prefs_raw):
+            # Re-parse only if someone assigned user.preferences directly.
+            self._prefs = _parse_user_preferences(raw)
+            self._prefs_raw = raw
+        return self._prefs
+
+    def update_prefs(self, changes: dict) -> dict:
+        prefs = self.prefs
+        prefs.update(changes)
+        if not self.prefs_dirty:
+            # Marks the row dirty so the next commit flushes (and serializes) it.
+            flag_modified(self.user, 'preferences')
+            self.prefs_dirty = True
+        return prefs
+
+    def write_back(self) -> bool:
+        if not self.prefs_dirty:
+            return False
+        self._prefs_raw = self.user.preferences = json.dumps(self._prefs)
+        self.prefs_dirty = False
+        return True
+
+    def discard_prefs(self):
+        """Drop unsaved edits (after a rollback); the next read re-parses the row."""
+        self._prefs = None
+        self._prefs_raw = None
+        self.prefs_dirty = False
+
+
+def _load_request_identity(user_id):
+    rows = db.session.query(User, TokenBalance, UserExternalApiKey.provider)\
+        .outerjoin(TokenBalance, TokenBalance.user_id == User.id)\
+        .outerjoin(UserExternalApiKey, db.and_(
+            UserExternalApiKey.user_id == User.id,
+            UserExternalApiKey.is_active == True,
+        ))\
+        .filter(User.id == user_id)\
+        .all()
+    if not rows:
+        return None
+    user, wallet, _provider = rows[0]
+    return RequestIdentity(user, wallet, (provider for _u, _w, provider in rows if provider))
+
+
+def get_request_identity(user_id):
+    """RequestIdentity for `user_id`, loaded once per request (uncached outside requests)."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    if not has_request_context():
+        return _load_request_identity(user_id)
+    identity = g.get('_request_identity')
+    if identity is None or identity.user_id != user_id:
+        identity = _load_request_identity(user_id)
+        g._request_identity = identity
+    return identity
+
+
+def _request_identity_for(user):
+    """The request's identity if `user` is its user object, else None."""
+    if user is None or not has_request_context():
+        return None
+    identity = g.get('_request_identity')
+    if identity is not None and identity.user is user:
+        return identity
+    return None
+
+
+@db.event.listens_for(db.session, 'before_flush')
+def _write_back_request_identity(session, flush_context, instances):
+    if not has_request_context():
+        return
+    identity = g.get('_request_identity')
+    if identity is not None and identity.prefs_dirty and identity.user in session:
+        identity.write_back()
+
+
+@app.after_request
+def _flush_request_identity(response):
+    # Endpoints that never commit still get their preference edits persisted once,
+    # but only on success: an error response must not commit what the handler left pending.
+    identity = g.get('_request_identity')
+    if identity is not None and identity.prefs_dirty:
+        if response.status_code >= 400:
+            db.session.rollback()
+            identity.discard_prefs()
+            return response
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"WARN: Preference write-back failed for user {identity.user_id}: {e}")
+    return response
+
+
 def get_current_user():
     """
     Get current authenticated user.
@@ -4200,8 +5146,8 @@ def get_current_user():
     try:
         identity = _get_safe_jwt_identity()
         if identity:
-            user = db.session.get(User, identity)
-            return user
+            request_identity = get_request_identity(identity)
+            return request_identity.user if request_identity else None
         return None
     except Exception as e:
         error_msg = str(e)
@@ -4228,7 +5174,12 @@ def get_or_create_token_balance(user: User) -> TokenBalance:
             description=f'Yeni kullanıcı hoş geldin bonusu — {SIGNUP_GRANT_TOKENS} token',
         )
         db.session.add(grant_tx)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Paralel ilk istek cüzdanı önce oluşturdu; grant bir kez yazılır.
+            db.session.rollback()
+            wallet = TokenBalance.query.filter_by(user_id=user.id).first()
     # Not: Aylık otomatik grant artık yoktur. Sadece paket satın alma sırasında renewal yapılır.
     return wallet
 
@@ -4592,6 +5543,53 @@ def _resolve_token_cost(model_name: str) -> int:
     return TOKEN_COSTS['default']
 
 
+TOKEN_RESERVATION_TTL_SEC = env_int('TOKEN_RESERVATION_TTL_SEC', 900, minimum=60)
+
+
+def _has_active_external_key(user_id: int, provider: str) -> bool:
+    """BYOK lookup; answered from the RequestIdentity when it is the request's user."""
+    if not provider:
+        return False
+    identity = g.get('_request_identity') if has_request_context() else None
+    if identity is not None and identity.user_id == user_id:
+        return provider in identity.external_providers
+    return db.session.query(
+        db.exists().where(
+            UserExternalApiKey.user_id == user_id,
+            UserExternalApiKey.provider == provider,
+            UserExternalApiKey.is_active == True,
+        )
+    ).scalar()
+
+
+def _token_cost_for(user: User, model_name: str) -> int:
+    """0 for admins and users paying with their own provider key, else the model's token cost."""
+    if user.is_admin:
+        return 0
+    provider, _ = _resolve_agent_provider_model(model_name)
+    if _has_active_external_key(user.id, provider):
+        return 0
+    return _resolve_token_cost(model_name)
+
+
+def _wallet_balance(user: User) -> int:
+    identity = _request_identity_for(user)
+    if identity is not None:
+        if identity.wallet is None:
+            identity.wallet = get_or_create_token_balance(user)
+        # Ledger writes commit before balances are read, and commit expires the
+        # loaded wallet, so this is either the fresh row or one PK reload.
+        return identity.wallet.balance
+    return _wallet_balance_for_id(user.id)
+
+
+def _wallet_balance_for_id(user_id: int) -> int:
+    balance = db.session.query(TokenBalance.balance).filter_by(user_id=user_id).scalar()
+    if balance is None:
+        balance = get_or_create_token_balance(db.session.get(User, user_id)).balance
+    return balance
+
+
 def check_tokens(user: User, model_name: str = 'default') -> tuple[bool, int, int]:
     """Kullanıcının belirtilen model için yeterli token'ı var mı kontrol eder.
     Aktif bir harici API anahtarı varsa her zaman True döner ve maliyet 0'dır.
@@ -4599,79 +5597,170 @@ def check_tokens(user: User, model_name: str = 'default') -> tuple[bool, int, in
     Returns:
         (yeterli_mi: bool, mevcut_bakiye: int, gerekli_token: int)
     """
-    if user and user.is_admin:
-        wallet = get_or_create_token_balance(user)
-        print(f"[TOKEN] Admin bypass for {user.email}. Cost: 0")
-        return True, wallet.balance, 0
+    cost = _token_cost_for(user, model_name)
+    balance = _wallet_balance(user)
+    return cost == 0 or balance >= cost, balance, cost
+
+
+def _release_stale_reservations(user_id: int) -> None:
+    """Refund holds left behind by turns that never settled (client disconnect, crash)."""
+    cutoff = _utcnow() - timedelta(seconds=TOKEN_RESERVATION_TTL_SEC)
+    stale = db.session.query(TokenReservation.id).filter(
+        TokenReservation.user_id == user_id,
+        TokenReservation.status == 'reserved',
+        TokenReservation.created_at < cutoff,
+    ).all()
+    for (reservation_id,) in stale:
+        refund_token_reservation(reservation_id, commit=False)
 
 
-    # Harici anahtar kontrolü
-    provider, _ = _resolve_agent_provider_model(model_name)
-    if provider:
-        ext_key = UserExternalApiKey.query.filter_by(user_id=user.id, provider=provider, is_active=True).first()
-        if ext_key:
-            wallet = get_or_create_token_balance(user)
-            print(f"[TOKEN] External key bypass for {user.email} (Provider: {provider}). Cost: 0")
-            return True, wallet.balance, 0
-
-    cost = _resolve_token_cost(model_name)
-    wallet = get_or_create_token_balance(user)
-    return wallet.balance >= cost, wallet.balance, cost
+def reserve_tokens(user: User, model_name: str = 'default') -> tuple[bool, int, int, int | None]:
+    """Atomically hold the turn's cost from the balance.
+
+    The hold is a single `UPDATE ... SET balance = balance - :cost WHERE
+    balance >= :cost`, so parallel turns can't both spend the same tokens.
+
+    Returns:
+        (yeterli_mi: bool, bakiye: int, gerekli_token: int, reservation_id)
+    """
+    cost = _token_cost_for(user, model_name)
+    if cost == 0:
+        return True, _wallet_balance(user), 0, None
+
+    _release_stale_reservations(user.id)
+
+    def _hold():
+        return db.session.execute(
+            db.update(TokenBalance)
+            .where(TokenBalance.user_id == user.id, TokenBalance.balance >= cost)
+            .values(balance=TokenBalance.balance - cost)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    held = _hold()
+    if not held and db.session.query(TokenBalance.id).filter_by(user_id=user.id).first() is None:
+        get_or_create_token_balance(user)
+        held = _hold()
+    if not held:
+        db.session.commit()
+        return False, _wallet_balance(user), cost, None
+
+    reservation = TokenReservation(user_id=user.id, amount=cost, model=str(model_name or '')[:100])
+    db.session.add(reservation)
+    db.session.commit()
+    return True, _wallet_balance(user), cost, reservation.id
+
+
+def settle_token_reservation(reservation_id: int, description: str = None, reference_id=None) -> int | None:
+    """Turn a hold into a spend. Does not commit: callers commit together with the History row.
+
+    Returns the settled amount, or None if the reservation was already resolved.
+    """
+    settled = db.session.execute(
+        db.update(TokenReservation)
+        .where(TokenReservation.id == reservation_id, TokenReservation.status == 'reserved')
+        .values(status='settled', resolved_at=_utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not settled:
+        return None
+    reservation = db.session.query(TokenReservation.user_id, TokenReservation.amount, TokenReservation.model)\
+        .filter_by(id=reservation_id).one()
+    db.session.execute(
+        db.update(TokenBalance)
+        .where(TokenBalance.user_id == reservation.user_id)
+        .values(total_spent=TokenBalance.total_spent + reservation.amount)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.add(TokenTransaction(
+        user_id=reservation.user_id,
+        amount=-reservation.amount,  # negatif = harcama
+        type='usage',
+        description=description or f"AI sorgu — {reservation.model}",
+        reference_id=str(reference_id) if reference_id else None,
+    ))
+    return reservation.amount
+
+
+def refund_token_reservation(reservation_id: int, commit: bool = True) -> bool:
+    """Give a hold back to the balance (empty/failed answer). Idempotent."""
+    refunded = db.session.execute(
+        db.update(TokenReservation)
+        .where(TokenReservation.id == reservation_id, TokenReservation.status == 'reserved')
+        .values(status='refunded', resolved_at=_utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if refunded:
+        reservation = db.session.query(TokenReservation.user_id, TokenReservation.amount)\
+            .filter_by(id=reservation_id).one()
+        db.session.execute(
+            db.update(TokenBalance)
+            .where(TokenBalance.user_id == reservation.user_id)
+            .values(balance=TokenBalance.balance + reservation.amount)
+            .execution_options(synchronize_session=False)
+        )
+    if commit:
+        db.session.commit()
+    return bool(refunded)
+
+
+def refund_unsettled_on_close(stream, reservation_id: int | None):
+    """Yield from ``stream``; refund the hold if it ends before settling.
+
+    Covers client disconnects (GeneratorExit from close()), early returns and
+    errors mid-stream. A settled hold is left alone since the refund is idempotent.
+    """
+    try:
+        yield from stream
+    finally:
+        if reservation_id:
+            try:
+                refund_token_reservation(reservation_id)
+            except Exception as refund_err:
+                db.session.rollback()
+                print(f"WARN: Token hold refund failed for reservation {reservation_id}: {refund_err}")
 
 
 def deduct_tokens(user: User, model_name: str = "default", description: str = None, reference_id: str = None) -> tuple[bool, int]:
     """Kullanıcının platform bakiyesinden token düşer ve işlemi loglar.
     Aktif bir harici API anahtarı varsa düşüm yapmaz.
+
+    The deduction is one atomic UPDATE committed with its TokenTransaction, so
+    concurrent turns can't overwrite each other's balance.
     
     Returns:
         (başarılı_mı: bool, yeni_bakiye: int)
     """
-    if user and user.is_admin:
-        wallet = get_or_create_token_balance(user)
-        print(f"[TOKEN] Admin bypass for {user.email}. Deduction skipped.")
-        return True, wallet.balance
-
+    cost = _token_cost_for(user, model_name)
+    if cost == 0:
+        return True, _wallet_balance(user)
 
-    # Harici anahtar kontrolü
-    provider, _ = _resolve_agent_provider_model(model_name)
-    if provider:
-        ext_key = UserExternalApiKey.query.filter_by(user_id=user.id, provider=provider, is_active=True).first()
-        if ext_key:
-            wallet = get_or_create_token_balance(user)
-            print(f"[TOKEN] SKIPPING deduction for {user.email} (Provider: {provider}) due to external key.")
-            return True, wallet.balance
-
-    cost = _resolve_token_cost(model_name)
-    wallet = get_or_create_token_balance(user)
-
-    print(f"[TOKEN] Deduction attempt for user {user.id} ({user.email}). Current: {wallet.balance}, Cost: {cost}, Model: {model_name}")
+    if db.session.query(TokenBalance.id).filter_by(user_id=user.id).first() is None:
+        get_or_create_token_balance(user)
 
-    # Note: We allow balance to go negative if authorized at the start of request, 
+    # Note: We allow balance to go negative if authorized at the start of request,
     # to ensure the user is correctly penalized and blocked on the next turn.
-    if wallet.balance < cost:
-        print(f"[TOKEN] Deduction notice: Insufficient balance for user {user.id}. Required: {cost}, Found: {wallet.balance}. Allowing debt to prevent bypass loop.")
-
-    wallet.balance -= cost
-    wallet.total_spent += cost
-
-    tx = TokenTransaction(
-        user_id=user.id,
-        amount=-cost,      # negatif = harcama
-        type="usage",
-        description=description or f"AI sorgu — {model_name}",
-        reference_id=str(reference_id) if reference_id else None,
-    )
-    db.session.add(tx)
     try:
+        db.session.execute(
+            db.update(TokenBalance)
+            .where(TokenBalance.user_id == user.id)
+            .values(balance=TokenBalance.balance - cost, total_spent=TokenBalance.total_spent + cost)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.add(TokenTransaction(
+            user_id=user.id,
+            amount=-cost,      # negatif = harcama
+            type="usage",
+            description=description or f"AI sorgu — {model_name}",
+            reference_id=str(reference_id) if reference_id else None,
+        ))
         db.session.commit()
-        print(f"[TOKEN] SUCCESS: User {user.email} -{cost} tokens. Final Balance: {wallet.balance}")
-        print(f"[TOKEN] Deduction success for user {user.id}. New balance: {wallet.balance}")
     except Exception as e:
         db.session.rollback()
         print(f"[TOKEN] DATABASE ERROR during deduction for user {user.id}: {e}")
-        return False, wallet.balance + cost # Balance might be inconsistent here, but rollback should help
+        return False, _wallet_balance(user)
 
-    return True, wallet.balance
+    return True, _wallet_balance(user)
 
 
 
@@ -4783,22 +5872,17 @@ def update_preferences_api():
         return jsonify({'error': 'User not found'}), 404
     
     data = request.json or {}
-    current_prefs = get_user_preferences(user)
+    changes = {}
     
     # Allow manual override for specific fields
-    if 'preferred_model' in data:
-        current_prefs['preferred_model'] = data['preferred_model']
-    if 'response_style' in data:
-        current_prefs['response_style'] = data['response_style']
-    if 'persona' in data:
-        current_prefs['persona'] = data['persona']
-    if 'expertise' in data:
-        current_prefs['expertise'] = data['expertise']
-    if 'interests' in data:
+    for field in ('preferred_model', 'response_style', 'persona', 'expertise'):
+        if field in data:
+            changes[field] = data[field]
+    if 'interests' in data and isinstance(data['interests'], list):
         # Expected list of strings
-        current_prefs['interests'] = data['interests'] if isinstance(data['interests'], list) else current_prefs.get('interests', [])
+        changes['interests'] = data['interests']
         
-    user.preferences = json.dumps(current_prefs)
+    current_prefs = update_user_preferences(user, changes)
     db.session.commit()
     
     return jsonify({'message': 'Preferences updated successfully', 'preferences': current_prefs})
@@ -4826,15 +5910,8 @@ def update_profile():
         user.display_name = new_display_name
 
     # Bio güncelleme (preferences JSON içinde saklanır)
-    try:
-        prefs = json.loads(user.preferences) if user.preferences else {}
-        if not isinstance(prefs, dict):
-            prefs = {}
-    except Exception:
-        prefs = {}
     if has_bio_field:
-        prefs['bio'] = new_bio[:500]
-        user.preferences = json.dumps(prefs)
+        update_user_preferences(user, {'bio': new_bio[:500]})
     
     # Şifre güncelleme
     if new_password:
@@ -4950,6 +6027,8 @@ def analyze_profile():
     {conversation_text}
     """
     
+    release_request_session()
+
     # 3. Call Gemini for Analysis
     try:
         # Strategy: Gemini 2.5 Flash Lite (10 RPM) -> Gemini 2.5 Flash (5 RPM)
@@ -5056,6 +6135,7 @@ def delete_account():
         Snippet.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         PasswordResetToken.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         ApiKey.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        _api_key_cache.invalidate(user_id=user.id)
         VSCodeLoginState.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         VSCodeOTP.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         XPEvent.query.filter_by(user_id=user.id).delete(synchronize_session=False)
@@ -5064,6 +6144,9 @@ def delete_account():
         MemoryEdge.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         MemoryNode.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         MemoryItem.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        MemoryEmbedding.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        UserExternalApiKey.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        ProviderResolver.invalidate_user_key(user.id)
         SecurityAuditLog.query.filter(db.or_(SecurityAuditLog.user_id == user.id, SecurityAuditLog.target_user_id == user.id)).delete(synchronize_session=False)
         LegalConsentLog.query.filter_by(user_id=user.id).delete(synchronize_session=False)
 
@@ -5082,6 +6165,7 @@ def delete_account():
             FeedbackDetail.query.filter(FeedbackDetail.history_id.in_(history_ids)).delete(synchronize_session=False)
             ConversationSummary.query.filter(ConversationSummary.last_history_id.in_(history_ids)).delete(synchronize_session=False)
             PostLike.query.filter(PostLike.history_id.in_(history_ids)).delete(synchronize_session=False)
+            HistoryMemoryCache.query.filter(HistoryMemoryCache.history_id.in_(history_ids)).delete(synchronize_session=False)
             
             answers = Answer.query.filter(Answer.history_id.in_(history_ids)).all()
             ans_ids = [a.id for a in answers]
@@ -5133,6 +6217,8 @@ def delete_account():
         TokenBalance.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         TokenTransaction.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         TokenPurchase.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        TokenReservation.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        UsageCounter.query.filter_by(user_id=user.id).delete(synchronize_session=False)
 
         if user.profile_image and os.path.exists(user.profile_image):
             try: os.remove(user.profile_image)
@@ -5597,6 +6683,7 @@ def audit_github_pr():
     for f in file_changes:
         audit_prompt += f"\n--- File: {f.get('path')} ---\n{f.get('content')}\n"
         
+    release_request_session()
     try:
         model = genai.GenerativeModel('models/gemini-2.5-flash')
         response = model.generate_content(audit_prompt)
@@ -5689,6 +6776,79 @@ def bulk_refactor():
         'instructions_received': instructions
     })
 
+def _preflight_github_context(repo, branch, question):
+    """Repository tree plus diff / Magic Fix instructions for a linked GitHub repo."""
+    parser = GitHubParser()
+    tree = parser.get_repo_tree(repo, branch)
+    if not tree:
+        return ''
+    tree_str = parser.format_tree_for_prompt(tree)
+    github_context = f"\n\n[System: This conversation is linked to GitHub repository '{repo}' (branch '{branch}').\nRepository Structure:\n{tree_str[:3000]}\n]"
+    print(f"Injected GitHub context for {repo}")
+
+    # Diff Formatting Instruction for UI 
+    diff_instruction = "\n\n[CRITICAL SYSTEM INSTRUCTION: For EVERY code change you propose, you MUST use the Side-by-Side Diff format. DO NOT use standard `-` or `+` lines. You MUST follow this EXACT structure for EACH file change:\n\nFile: `path/to/file` (Relative to project root)\n```diff\n<<<OLD>>>\n[Insert the EXACT block of old code being replaced - must be a perfect match for the original file code]\n<<<NEW>>>\n[Insert the full new code block that replaces the OLD section]\n```\n\nFAILURE TO USE THIS EXACT <<<OLD>>> / <<<NEW>>> FORMAT WILL BREAK THE USER'S INTERFACE. DO NOT SKIP THIS.]"
+
+    # Check for Magic Fix intent based on common error trace keywords
+    error_pattern = re.compile(r'(Traceback \(most recent call last\):|Error:|Exception:|TypeError|ValueError|ReferenceError|SyntaxError|IndexError|KeyError|ModuleNotFoundError)\b', re.IGNORECASE)
+    if error_pattern.search(question):
+        print("Magic Fix triggered based on error pattern.")
+        magic_fix_prompt = "\n\n[System Magic Fix Instruction: The user has provided an error trace. Analyze the error based on the linked repository context and provide a direct, root-cause solution. Output the required file changes.]"
+        github_context += magic_fix_prompt
+
+    # Always append diff instruction if linked to repo
+    return github_context + diff_instruction
+
+
+def _preflight_project_context(project_id, question):
+    """Relevance-ranked project context, falling back to the first project files."""
+    proj = db.session.get(Project, project_id)
+    if not proj:
+        return ''
+    # Prefer relevance-ranked embedding context. Fallback to static context if embeddings fail.
+    project_context = build_project_context_for_question(proj, question)
+
+    if not project_context:
+        files = proj.files.order_by(ProjectFile.name).all()
+        if files:
+            ctx_parts = [f"[System: Bu sohbet '{proj.name}' projesine aittir. Aşağıdaki proje dosyaları bağlam olarak sağlanmıştır:"]
+            if proj.description:
+                ctx_parts.append(f"Proje açıklaması: {proj.description}")
+            total_chars = 0
+            for pf in files:
+                file_content = pf.content[:3000]  # her dosya max 3000 karakter
+                total_chars += len(file_content)
+                if total_chars > 12000:
+                    break
+                ctx_parts.append(f"\n## Dosya: {pf.name} ({pf.language})\n```{pf.language}\n{file_content}\n```")
+            ctx_parts.append("]")
+            project_context = '\n'.join(ctx_parts)
+
+    if project_context:
+        print(f"Injected project context for project {proj.id} (embedding-aware)")
+    return project_context or ''
+
+
+def _preflight_memory_context(user_id, question, conversation_id):
+    user = db.session.get(User, user_id)
+    if not user:
+        return {'text': '', 'hit_count': 0, 'hits': []}
+    conversation = db.session.get(Conversation, conversation_id) if conversation_id else None
+    print(f"[MEMORY] Loading previous context for user {user.id}")
+    memory_context = _load_previous_memory_context(user, question, conversation, include_previous_modules=True)
+    # This stage has its own session: keep the last_used_at / extraction-cache writes.
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"WARN: memory pre-flight writes not saved: {e}")
+    if memory_context.get('text'):
+        print(f"[MEMORY] Successfully retrieved {memory_context.get('hit_count', 0)} memory hits ({len(memory_context['text'])} chars)")
+    else:
+        print("[MEMORY] No relevant memory context found for this query")
+    return memory_context
+
+
 @app.route('/api/ask', methods=['POST'])
 def ask():
     # Debug logging
@@ -5743,6 +6903,8 @@ def ask():
         image_path = None
 
     no_save = _parse_bool(payload.get('no_save'))
+    # Client-generated id; /api/cancel on any worker flags it in the shared run-state store.
+    request_id = str(payload.get('request_id') or '').strip() or None
     
     # Kullanıcı tespiti
     user = get_current_user()
@@ -5790,6 +6952,7 @@ def ask():
     github_context = ""
     resolved_agent_project = None
     agent_project_source = None
+    preflight = Preflight(context=app.app_context)
 
     if not no_save:
         if conversation_id:
@@ -5832,34 +6995,10 @@ def ask():
             db.session.add(conversation)
             db.session.commit()
 
-        # Check for linked GitHub repo to inject context
+        # Slow context (GitHub tree, project RAG, memory) runs as concurrent pre-flight
+        # stages; generate_stream joins them after the meta event, within the deadline.
         if conversation.linked_repo:
-            repo = conversation.linked_repo
-            branch = conversation.repo_branch
-            parser = GitHubParser()
-            
-            tree = parser.get_repo_tree(repo, branch)
-            if tree:
-                tree_str = parser.format_tree_for_prompt(tree)
-                github_context = f"\n\n[System: This conversation is linked to GitHub repository '{repo}' (branch '{branch}').\nRepository Structure:\n{tree_str[:3000]}\n]"
-                print(f"Injected GitHub context for {repo}")
-                
-                # Diff Formatting Instruction for UI 
-                diff_instruction = "\n\n[CRITICAL SYSTEM INSTRUCTION: For EVERY code change you propose, you MUST use the Side-by-Side Diff format. DO NOT use standard `-` or `+` lines. You MUST follow this EXACT structure for EACH file change:\n\nFile: `path/to/file` (Relative to project root)\n```diff\n<<<OLD>>>\n[Insert the EXACT block of old code being replaced - must be a perfect match for the original file code]\n<<<NEW>>>\n[Insert the full new code block that replaces the OLD section]\n```\n\nFAILURE TO USE THIS EXACT <<<OLD>>> / <<<NEW>>> FORMAT WILL BREAK THE USER'S INTERFACE. DO NOT SKIP THIS.]"
-
-                # Check for Magic Fix intent based on common error trace keywords
-                error_pattern = re.compile(r'(Traceback \(most recent call last\):|Error:|Exception:|TypeError|ValueError|ReferenceError|SyntaxError|IndexError|KeyError|ModuleNotFoundError)\b', re.IGNORECASE)
-                if error_pattern.search(question):
-                    print("Magic Fix triggered based on error pattern.")
-                    magic_fix_prompt = "\n\n[System Magic Fix Instruction: The user has provided an error trace. Analyze the error based on the linked repository context and provide a direct, root-cause solution. Output the required file changes.]"
-                    github_context += magic_fix_prompt
-
-                # Always append diff instruction if linked to repo
-                github_context += diff_instruction
-
-                # REMOVED: question = f"{question}{github_context}"
-                # Instead, we pass github_context separately to the generation functions
-                pass
+            preflight.submit('github_tree', _preflight_github_context, conversation.linked_repo, conversation.repo_branch, question)
 
         print(f"Model İsteği: {model}, ConvID: {conversation.id}, Image: {image_path}")
 
@@ -5868,28 +7007,7 @@ def ask():
             proj = resolved_agent_project or db.session.get(Project, conversation.project_id)
             if proj:
                 resolved_agent_project = proj
-                # Prefer relevance-ranked embedding context. Fallback to static context if embeddings fail.
-                project_context = build_project_context_for_question(proj, question)
-
-                if not project_context:
-                    files = proj.files.order_by(ProjectFile.name).all()
-                    if files:
-                        ctx_parts = [f"[System: Bu sohbet '{proj.name}' projesine aittir. Aşağıdaki proje dosyaları bağlam olarak sağlanmıştır:"]
-                        if proj.description:
-                            ctx_parts.append(f"Proje açıklaması: {proj.description}")
-                        total_chars = 0
-                        for pf in files:
-                            file_content = pf.content[:3000]  # her dosya max 3000 karakter
-                            total_chars += len(file_content)
-                            if total_chars > 12000:
-                                break
-                            ctx_parts.append(f"\n## Dosya: {pf.name} ({pf.language})\n```{pf.language}\n{file_content}\n```")
-                        ctx_parts.append("]")
-                        project_context = '\n'.join(ctx_parts)
-
-                if project_context:
-                    github_context = project_context + "\n" + github_context
-                    print(f"Injected project context for project {proj.id} (embedding-aware)")
+                preflight.submit('project_context', _preflight_project_context, proj.id, question)
 
     else:
         print(f"Model İsteği (no_save): {model}, Image: {image_path}")
@@ -5921,13 +7039,7 @@ def ask():
 
     memory_context = {'text': '', 'hit_count': 0, 'hits': []}
     if include_previous_modules and user:
-        print(f"[MEMORY] Loading previous context for user {user.id}")
-        memory_context = _load_previous_memory_context(user, question, conversation, include_previous_modules=True)
-        if memory_context.get('text'):
-            print(f"[MEMORY] Successfully retrieved {memory_context.get('hit_count', 0)} memory hits ({len(memory_context['text'])} chars)")
-            github_context = f"{memory_context['text']}\n\n{github_context}".strip() if github_context else memory_context['text']
-        else:
-            print("[MEMORY] No relevant memory context found for this query")
+        preflight.submit('memory', _preflight_memory_context, user.id, question, conversation.id if conversation else None)
 
     # --- Akıllı Model Routing (Smart Routing) ---
     original_model = model
@@ -6012,8 +7124,12 @@ def ask():
         sys.stdout.flush()
 
     elif model == 'auto':
-        intent = detect_intent(question, code)
-        detected_lang = language_detector.detect(question, code)
+        # Both are local unless the classifier is unsure; they run alongside the context
+        # stages and fall back to 'general' / 'unknown' if they miss the pre-flight deadline.
+        preflight.submit('intent', detect_intent, question, code)
+        preflight.submit('language', language_detector.detect, question, code)
+        intent = preflight.result('intent', 'general')
+        detected_lang = preflight.result('language', 'unknown')
         detected_intent = intent
         
         # Upgrade intent if linked to GitHub
@@ -6045,8 +7161,10 @@ def ask():
     # (routing_reason stays None for explicit user selections)
 
     # Auto-routing sonrası model değişebildiği için nihai modele göre tekrar doğrula.
+    # The final model's cost is held now and settled together with the History row.
+    token_reservation_id = None
     if user:
-        allowed_final, balance_final, req_cost_final = check_tokens(user, model)
+        allowed_final, balance_final, req_cost_final, token_reservation_id = reserve_tokens(user, model)
         if not allowed_final:
             return jsonify({
                 'error': f'Yetersiz Token! Bu işlem için {req_cost_final} token gerekiyor, mevcut bakiyeniz: {balance_final}.',
@@ -6103,7 +7221,9 @@ def ask():
     def generate_stream(u_id, c_id, p_id, source):
         nonlocal answer # Outer scope answer variable updating
         nonlocal agent_trace, agent_changed_files, agent_tool_capable, agent_provider, agent_effective_model
+        nonlocal github_context, memory_context
         full_answer = ""
+        cancelled = False
 
         # Send routing metadata as an early event so UI can show model/language even if stream ends early.
         early_meta = {
@@ -6127,6 +7247,15 @@ def ask():
                 'step': 0,
             }
             yield f"data: {json.dumps(placeholder)}\n\n"
+
+        # Pre-flight context that made the deadline: memory, then project, then repo tree.
+        github_context = preflight.result('github_tree', '')
+        project_context = preflight.result('project_context', '')
+        if project_context:
+            github_context = project_context + "\n" + github_context
+        memory_context = preflight.result('memory', memory_context)
+        if memory_context.get('text'):
+            github_context = f"{memory_context['text']}\n\n{github_context}".strip() if github_context else memory_context['text']
         
         generator = None
         
@@ -6196,6 +7325,7 @@ def ask():
                         search_project_callback=_agent_project_search,
                         db_read_callback=_agent_db_read,
                         invalidate_project_cache=invalidate_project_embedding_cache,
+                        request_id=request_id,
                     ):
                         yield chunk_sse
 
@@ -6225,7 +7355,8 @@ def ask():
                                 pass
 
                     agent_executed = True
-                    if not full_answer.strip():
+                    cancelled = is_request_cancelled(request_id, u_id)
+                    if not full_answer.strip() and not cancelled:
                         full_answer = "Agent Mode finished without producing a response."
                     full_answer = post_process_response(full_answer)
 
@@ -6241,7 +7372,15 @@ def ask():
         # Ortak Generator Döngüsü
         if generator and not agent_executed:
             try:
-                for chunk in generator:
+                for chunk in iter_as_provider_user(generator, u_id):
+                    if is_request_cancelled(request_id, u_id):
+                        # Closing the provider generator drops the upstream stream and its slot.
+                        cancelled = True
+                        generator.close()
+                        break
+                    if isinstance(chunk, QueueNotice):
+                        yield f"data: {json.dumps({'type': 'queue', **chunk.status.to_dict()})}\n\n"
+                        continue
                     if chunk:
                         full_answer += chunk
                         json_data = json.dumps({'chunk': chunk})
@@ -6266,8 +7405,12 @@ def ask():
         with app.app_context():
             clipped_agent_meta = _clip_agent_metadata(agent_trace, agent_changed_files)
             # Keep these available even if DB save fails; client can still close stream cleanly.
+            if cancelled:
+                get_run_state().clear_cancel(request_id, u_id)
+                print(f"[CANCEL-WEB] Request {request_id} stopped after {len(full_answer)} chars.")
             final_data = {
                 'done': True,
+                'cancelled': cancelled,
                 'answer': full_answer,
                 'routing_reason': routing_reason,
                 'selected_model': model,
@@ -6286,16 +7429,21 @@ def ask():
                 'agent_trace_truncated': clipped_agent_meta['trace_truncated'],
                 'agent_changed_truncated': clipped_agent_meta['changed_truncated'],
                 'persona': prefs.get('persona', 'General User') if u_id else 'General User',
+                'preflight': preflight.timings(),
                 'memory_used': bool(memory_context.get('text')),
                 'memory_hits': int(memory_context.get('hit_count') or 0),
                 'carryover': include_previous_modules,
                 'memory_capsules': memory_context.get('hits', []),
             }
             
-            # Resolve current_user early for token deduction
-            current_user = db.session.get(User, u_id) if u_id else None
-            
+            # Only ids are needed here: this app context has its own session, and
+            # the request's RequestIdentity already answered everything else.
             # Only save to database if not a no_save request
+            history = None
+            token_settled = False
+            settled_amount = None
+            is_compare = _parse_bool(payload.get('is_compare'))
+            token_desc = f"Compare: {question[:30]}..." if (is_compare or no_save) else f"Chat: {question[:30]}..."
             if not no_save and c_id:
                 try:
                     # Session'a conversation'ı tekrar bağla/getir
@@ -6307,100 +7455,100 @@ def ask():
                         current_conv = Conversation(id=c_id, user_id=u_id, title=question[:50], source=source)
                         db.session.add(current_conv)
 
-                    # Özetleme ve kalıcı hafıza çıkarımı
-                    summary = summarize_answer(full_answer)
-                    extracted_memory_items = extract_memory_candidates(question, full_answer) if current_user else []
-
-                    # Başlık güncelleme (ilk mesajsa) - kısa ve öz başlık üret
-                    if not history_context:
-                        current_conv.title = generate_conversation_title(question, full_answer)
-                        db.session.add(current_conv)
-
+                    # Summary, title, persona and memory write-back are filled in by
+                    # run_post_answer_pipeline after `done` has been sent.
                     history = History(
                         conversation_id=current_conv.id,
                         user_question=question,
                         code_snippet=code,
                         ai_response=full_answer,
                         selected_model=model,
-                        summary=summary,
+                        summary=None,
                         image_path=image_path,
                         routing_reason=routing_reason,
-                        persona=prefs.get('persona', 'General User') if current_user else 'General User'
+                        persona=prefs.get('persona', 'General User') if u_id else 'General User'
                     )
                     db.session.add(history)
-
-                    # Flush first so the new history id can be attached to summary rows.
-                    db.session.flush()
-
-                    if current_user:
-                        _upsert_conversation_summary(current_conv, history.id, current_user.id, summary, extracted_memory_items)
-                        _store_memory_items(current_user.id, current_conv.id, extracted_memory_items)
-                        learning_snapshot = _write_back_memory_graph(current_user.id, current_conv.id, history.id, memory_context)
-                        final_data['memory_learning'] = learning_snapshot
-
+                    if token_reservation_id and full_answer.strip():
+                        db.session.flush()
+                        settled_amount = settle_token_reservation(
+                            token_reservation_id,
+                            description=token_desc,
+                            reference_id=history.id,
+                        )
                     db.session.commit()
+                    token_settled = settled_amount is not None
 
                     # 4. Update final_data for frontend (only when saved)
                     final_data.update({
                         'history_id': history.id,
                         'conversation_id': current_conv.id,
-                        'summary': summary,
+                        'summary': None,
                         'persona': history.persona
                     })
+
                 except Exception as save_err:
                     db.session.rollback()
+                    history = None
                     print(f"WARN: Final save failed in /api/ask stream: {save_err}")
                     sys.stdout.flush()
                     # Keep stream contract stable so frontend does not append generic error.
                     final_data['warning'] = 'response_saved_with_warning'
 
-            # 3. Handle Token Deduction & Taste Profile (Always if user exists)
-            if current_user:
+            if history or (u_id and full_answer.strip()):
+                enqueue_job(
+                    run_post_answer_pipeline,
+                    (
+                        history.id if history else None,
+                        u_id,
+                        question,
+                        full_answer,
+                        model,
+                        not history_context,
+                        memory_context,
+                    ),
+                    key=f"post-answer:{history.id}" if history else None,
+                )
+                final_data['post_answer_pending'] = True
+
+            # 3. Handle Token Deduction (Always if user exists)
+            if u_id:
                 try:
-                    # 💰 TOKEN EKONOMİSİ — Harcamayı düş (Sadece başarılı yanıtlarda)
+                    # 💰 TOKEN EKONOMİSİ — Harcamayı kesinleştir (Sadece başarılı yanıtlarda)
                     if full_answer and len(full_answer.strip()) > 0:
-                        # AI Taste Profile Güncelle (Öğrenme + Persona Analizi)
-                        update_user_taste(current_user, model, full_answer, question)
-
-                        is_compare = _parse_bool(payload.get('is_compare'))
-                        if is_compare or no_save:
-                            token_desc = f"Compare: {question[:30]}..."
-                        else:
-                            token_desc = f"Chat: {question[:30]}..."
-
-                        # Reference ID is only available if we saved to history
-                        ref_id = None
-                        if 'history' in locals() and history:
-                            ref_id = history.id
-
-                        success, new_bal = deduct_tokens(
-                            current_user,
-                            model,
-                            description=token_desc,
-                            reference_id=ref_id
-                        )
-                        final_data['new_token_balance'] = new_bal
-                        if not success:
-                            final_data['token_warning'] = 'Token düşümü yapılamadı. Bakiye yetersiz olabilir.'
+                        if token_reservation_id and not token_settled:
+                            # no_save turns or a failed History save settle on their own.
+                            settle_token_reservation(
+                                token_reservation_id,
+                                description=token_desc,
+                                reference_id=history.id if history else None,
+                            )
+                            db.session.commit()
+                        final_data['new_token_balance'] = _wallet_balance_for_id(u_id)
                     else:
-                        print(f"DEBUG: Skipping token deduction for empty/failed response (User: {current_user.id})")
+                        if token_reservation_id:
+                            refund_token_reservation(token_reservation_id)
+                        print(f"DEBUG: Skipping token deduction for empty/failed response (User: {u_id})")
 
                     # Soru sorma XP ödülü (sadece yeni geçmiş oluşturuluyorsa veya karşılaştırma ise)
                     # Karşılaştırma için yarım XP verelim? Ya da tam verelim.
                     if not no_save:
-                        xp_result = award_xp(current_user.id, XP_REWARDS['ask_question'], "Asking a Question", source='ask_question')
+                        xp_result = award_xp(u_id, XP_REWARDS['ask_question'], "Asking a Question", source='ask_question')
                         if xp_result:
                             final_data['xp_awarded'] = xp_result
                 except Exception as token_err:
-                    print(f"WARN: Token deduction/Taste update failed: {token_err}")
+                    print(f"WARN: Token deduction failed: {token_err}")
 
             yield f"data: {json.dumps(final_data)}\n\n"
 
+    release_request_session()
     if source_header == 'mobile':
         # Mobil için stream yerine senkron yanıt döndür
         def generate_full_answer():
             full_text = ""
-            for chunk_sse in generate_stream(final_user_id, final_conv_id, final_proj_id, source_header):
+            stream = refund_unsettled_on_close(
+                generate_stream(final_user_id, final_conv_id, final_proj_id, source_header), token_reservation_id)
+            for chunk_sse in stream:
                 if chunk_sse.startswith("data: "):
                     try:
                         data = json.loads(chunk_sse[6:].strip())
@@ -6409,6 +7557,7 @@ def ask():
                         elif "answer" in data:
                             full_text = data["answer"]
                             # Bitiş verisini de ekleyelim (yeni bakiye vs.)
+                            stream.close()
                             return jsonify(data)
                     except:
                         pass
@@ -6416,7 +7565,9 @@ def ask():
         
         return generate_full_answer()
 
-    return Response(stream_with_context(generate_stream(final_user_id, final_conv_id, final_proj_id, source_header)), mimetype='text/event-stream')
+    stream = refund_unsettled_on_close(
+        generate_stream(final_user_id, final_conv_id, final_proj_id, source_header), token_reservation_id)
+    return Response(stream_with_context(stream), mimetype='text/event-stream')
 
 
 # ==========================================
@@ -6425,20 +7576,24 @@ def ask():
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def fetch_model_response_sync(model: str, question: str, code: str = '', prefs = None):
-    """Tek bir modelden senkron yanıt al (thread içinde kullanılır)."""
+def fetch_model_response_sync(model: str, question: str, code: str = '', prefs = None, user_id=None):
+    """Tek bir modelden senkron yanıt al (thread içinde kullanılır).
+
+    `user_id` is the provider governor's fairness key for this call.
+    """
     full_response = ""
     # prefs is passed directly now, no need to call get_user_preferences here
     
     try:
+        generator = None
         if 'claude' in model:
-            for chunk in generate_claude_answer(question=question, code=code, history_context=[], requested_model=model, prefs=prefs):
-                full_response += chunk
+            generator = generate_claude_answer(question=question, code=code, history_context=[], requested_model=model, prefs=prefs)
         elif 'gpt' in model:
-            for chunk in generate_gpt_answer(question=question, code=code, history_context=[], requested_model=model, prefs=prefs):
-                full_response += chunk
+            generator = generate_gpt_answer(question=question, code=code, history_context=[], requested_model=model, prefs=prefs)
         elif 'gemini' in model or 'gemma' in model:
-            for chunk in generate_gemini_answer(question=question, code=code, history_context=[], requested_model=model, prefs=prefs):
+            generator = generate_gemini_answer(question=question, code=code, history_context=[], requested_model=model, prefs=prefs)
+        if generator:
+            for chunk in iter_as_provider_user(generator, user_id):
                 full_response += chunk
     except Exception as e:
         full_response = f"[{model} Error]: {str(e)}"
@@ -6520,7 +7675,12 @@ def blend_models():
     else:
         conversation = None
         conversation_id = None
+    user_id = user.id if user else None
     
+    # Model çağrıları onlarca saniye sürer; akış yalnızca primitive'lerle çalışsın
+    # ki bağlantı havuza dönsün (kayıt sonunda bağlantıyı yeniden alır).
+    release_request_session()
+
     def generate_blend_stream():
         model_responses = {}
         xp_result = None
@@ -6532,7 +7692,7 @@ def blend_models():
         
         with ThreadPoolExecutor(max_workers=4) as executor:
             futures = {
-                executor.submit(fetch_model_response_sync, model, question, code, prefs): model 
+                executor.submit(fetch_model_response_sync, model, question, code, prefs, user_id): model 
                 for model in models
             }
             
@@ -6604,7 +7764,7 @@ Analyze these responses and combine the best parts of all of them to create a si
                 error_in_stream = False
                 
                 if generator:
-                    for chunk in generator:
+                    for chunk in iter_as_provider_user(generator, user_id):
                         # Kota hatası kontrolü (Gemini için)
                         if "[Error]: Quota limit exceeded" in chunk:
                             error_in_stream = True
@@ -6668,10 +7828,10 @@ Provide a clear reasoning/justification for why this blended response was chosen
                 referee_reasoning = f"Referee failed: {str(ref_err)}"
         
         # 3. Save to database if user is logged in
-        if user and conversation and blended_response:
+        if user_id and conversation_id and blended_response:
             try:
                 history_entry = History(
-                    conversation_id=conversation.id,
+                    conversation_id=conversation_id,
                     user_question=question,
                     ai_response=blended_response,
                     code_snippet=code if code else None,
@@ -6686,7 +7846,7 @@ Provide a clear reasoning/justification for why this blended response was chosen
                 print(f"DEBUG: Saved Blend History item {history_entry.id}")
                 
                 # Update Taste Profile
-                charge_user = db.session.get(User, user.id)
+                charge_user = db.session.get(User, user_id)
                 update_user_taste(charge_user, "blend", blended_response, question)
 
                 # Blend modu için token düşümü
@@ -6699,10 +7859,10 @@ Provide a clear reasoning/justification for why this blended response was chosen
                 if success:
                     new_token_balance = new_bal
                 else:
-                    print(f"WARN: Token deduction failed for blend user_id={user.id}, balance={new_bal}")
+                    print(f"WARN: Token deduction failed for blend user_id={user_id}, balance={new_bal}")
 
                 # Keep blend and ask flows consistent for gamification rewards.
-                xp_result = award_xp(user.id, XP_REWARDS['ask_question'], "Asking a Question", source='ask_question')
+                xp_result = award_xp(user_id, XP_REWARDS['ask_question'], "Asking a Question", source='ask_question')
             except Exception as db_err:
                 print(f"Database save error (blend): {db_err}")
         
@@ -6887,12 +8047,13 @@ def get_user_posts():
     user = get_current_user()
     # Kullanıcının 'Community' olarak işaretlenmiş, silinmemiş postlarını getir
     items = History.query.join(Conversation)\
+        .options(*_HISTORY_FEED_OPTIONS)\
         .filter(Conversation.user_id == user.id)\
         .filter(History.selected_model == 'Community')\
         .filter(History.is_deleted == False)\
         .order_by(History.timestamp.desc())\
         .all()
-    return jsonify({'posts': [serialize_history(h) for h in items]})
+    return jsonify({'posts': serialize_history_batch(items)})
 
 
 @app.route('/api/conversations/<int:conversation_id>', methods=['GET'])
@@ -6903,10 +8064,12 @@ def get_conversation(conversation_id):
     if conversation.user_id and (not user or (user.id != conversation.user_id and not user.is_admin)):
          return jsonify({'error': 'Unauthorized access'}), 403
 
-    items = History.query.filter_by(conversation_id=conversation_id, is_deleted=False).order_by(History.timestamp.asc()).all()
+    items = History.query.options(*_HISTORY_FEED_OPTIONS)\
+        .filter_by(conversation_id=conversation_id, is_deleted=False)\
+        .order_by(History.timestamp.asc()).all()
     return jsonify({
         'conversation': serialize_conversation(conversation),
-        'history': [serialize_history(h) for h in items]
+        'history': serialize_history_batch(items)
     })
 
 
@@ -7016,7 +8179,8 @@ def edit_post(post_id):
         history.user_question = new_question
         if new_summary:
             history.summary = new_summary
-        
+        HistoryMemoryCache.query.filter_by(history_id=history.id).delete(synchronize_session=False)
+
         db.session.commit()
         
         return jsonify({
@@ -7030,151 +8194,202 @@ def edit_post(post_id):
         return jsonify({'error': 'An error occurred while editing the post.'}), 500
 
 
-@app.route('/api/notifications', methods=['GET'])
-def get_notifications():
-    user = get_current_user()
-    if not user:
-        return jsonify({'error': 'Unauthorized access'}), 401
+NOTIFICATION_PAGE_SIZE = 50
+NOTIFICATION_UNREAD_CAP = 99
 
-    results = []
 
-    # 1. Yorum Bildirimleri (Answer)
-    # Kullanıcının sorularına (History) gelen cevaplar - Community postları hariç
-    answers = db.session.query(Answer, History, Conversation)\
-        .join(History, Answer.history_id == History.id)\
-        .join(Conversation, History.conversation_id == Conversation.id)\
-        .filter(Conversation.user_id == user.id)\
-        .filter(Answer.author_id != user.id)\
-        .filter(History.selected_model != 'Community')\
-        .order_by(Answer.created_at.desc())\
-        .limit(20)\
-        .all()
+def _notification_feed(user_id, limit, before=None, unread_only=False):
+    """UNION ALL of every notification source for a user, newest first.
 
-    for answer, history, conversation in answers:
-        results.append({
-            'id': f"ans-{answer.id}",
-            'type': 'comment',
-            'author': answer.author,
-            'message': f"{answer.author} added a solution to your question!",
-            'question_title': conversation.title,
-            'created_at': answer.created_at.strftime('%Y-%m-%d %H:%M'),
-            'timestamp_obj': answer.created_at,
-            'conversation_id': conversation.id,
-            'history_id': history.id
-        })
+    Each branch is filtered (hidden/read, keyset cursor) and limited in SQL
+    before the union, so a poll touches at most `limit` rows per source no
+    matter how much history the user has. Rows are ordered by
+    (created_at, source, source_id), and `before` is that same tuple, so the
+    keyset cursor compares the integer ids rather than the string nids.
+    """
+    def _nid(prefix, column):
+        return db.literal(prefix, type_=db.String) + db.cast(column, db.String)
+
+    def _visible(nid):
+        conditions = [~db.exists().where(
+            NotificationHidden.user_id == user_id,
+            NotificationHidden.notification_id == nid,
+        )]
+        if unread_only:
+            conditions.append(~db.exists().where(
+                NotificationRead.user_id == user_id,
+                NotificationRead.notification_id == nid,
+            ))
+        return conditions
 
-    # 2. Beğeni Bildirimleri (PostLike)
-    # Kullanıcının sorularına (History) gelen beğeniler - Community postları hariç
-    post_likes = db.session.query(PostLike, User, History, Conversation)\
-        .join(User, PostLike.user_id == User.id)\
+    def _page(created_at, source, source_id):
+        # `source` is constant within a branch, so its part of the tuple comparison is settled here.
+        if not before:
+            return []
+        before_ts, before_source, before_id = before
+        if source < before_source:
+            return [created_at <= before_ts]
+        if source > before_source:
+            return [created_at < before_ts]
+        return [db.or_(created_at < before_ts, db.and_(created_at == before_ts, source_id < before_id))]
+
+    null_int = db.cast(db.null(), db.Integer)
+    liker = db.aliased(User)
+    related = db.aliased(User)
+
+    # 1. Yorum Bildirimleri (Answer) - Community postları hariç
+    ans_nid = _nid('ans-', Answer.id)
+    answers = db.select(
+        ans_nid.label('nid'), db.literal('ans').label('source'), Answer.id.label('source_id'),
+        db.literal('comment').label('kind'), Answer.author.label('author'),
+        db.cast(db.null(), db.String).label('message'), Conversation.title.label('question_title'),
+        Answer.created_at.label('created_at'), Conversation.id.label('conversation_id'),
+        History.id.label('history_id'), null_int.label('answer_id'),
+        null_int.label('real_id'), null_int.label('related_user_id'),
+    ).select_from(Answer)\
+        .join(History, Answer.history_id == History.id)\
+        .join(Conversation, History.conversation_id == Conversation.id)\
+        .where(Conversation.user_id == user_id, Answer.author_id != user_id, History.selected_model != 'Community',
+               *_visible(ans_nid), *_page(Answer.created_at, 'ans', Answer.id))\
+        .order_by(Answer.created_at.desc(), Answer.id.desc()).limit(limit)
+
+    # 2. Beğeni Bildirimleri (PostLike) - Community postları hariç
+    plike_nid = _nid('plike-', PostLike.id)
+    post_likes = db.select(
+        plike_nid.label('nid'), db.literal('plike').label('source'), PostLike.id.label('source_id'),
+        db.literal('like').label('kind'), liker.display_name.label('author'),
+        db.cast(db.null(), db.String).label('message'), Conversation.title.label('question_title'),
+        PostLike.timestamp.label('created_at'), Conversation.id.label('conversation_id'),
+        History.id.label('history_id'), null_int.label('answer_id'),
+        null_int.label('real_id'), null_int.label('related_user_id'),
+    ).select_from(PostLike)\
+        .join(liker, PostLike.user_id == liker.id)\
         .join(History, PostLike.history_id == History.id)\
         .join(Conversation, History.conversation_id == Conversation.id)\
-        .filter(Conversation.user_id == user.id)\
-        .filter(PostLike.user_id != user.id)\
-        .filter(History.selected_model != 'Community')\
-        .order_by(PostLike.timestamp.desc())\
-        .limit(20)\
-        .all()
-
-    for like, liker, history, conversation in post_likes:
-        results.append({
-            'id': f"plike-{like.id}",
-            'type': 'like',
-            'author': liker.display_name,
-            'message': f"{liker.display_name} liked your post!",
-            'question_title': conversation.title,
-            'created_at': like.timestamp.strftime('%Y-%m-%d %H:%M'),
-            'timestamp_obj': like.timestamp,
-            'conversation_id': conversation.id,
-            'history_id': history.id
-        })
+        .where(Conversation.user_id == user_id, PostLike.user_id != user_id, History.selected_model != 'Community',
+               *_visible(plike_nid), *_page(PostLike.timestamp, 'plike', PostLike.id))\
+        .order_by(PostLike.timestamp.desc(), PostLike.id.desc()).limit(limit)
 
     # 3. Yorum Beğeni Bildirimleri (AnswerLike)
-    # Kullanıcının cevaplarına (Answer) gelen beğeniler
-    answer_likes = db.session.query(AnswerLike, User, Answer, History, Conversation)\
-        .join(User, AnswerLike.user_id == User.id)\
+    alike_nid = _nid('alike-', AnswerLike.id)
+    answer_likes = db.select(
+        alike_nid.label('nid'), db.literal('alike').label('source'), AnswerLike.id.label('source_id'),
+        db.literal('like').label('kind'), liker.display_name.label('author'),
+        db.cast(db.null(), db.String).label('message'), Conversation.title.label('question_title'),
+        AnswerLike.timestamp.label('created_at'), Conversation.id.label('conversation_id'),
+        History.id.label('history_id'), Answer.id.label('answer_id'),
+        null_int.label('real_id'), null_int.label('related_user_id'),
+    ).select_from(AnswerLike)\
+        .join(liker, AnswerLike.user_id == liker.id)\
         .join(Answer, AnswerLike.answer_id == Answer.id)\
         .join(History, Answer.history_id == History.id)\
         .join(Conversation, History.conversation_id == Conversation.id)\
-        .filter(Answer.author_id == user.id)\
-        .filter(AnswerLike.user_id != user.id)\
-        .order_by(AnswerLike.timestamp.desc())\
-        .limit(20)\
-        .all()
+        .where(Answer.author_id == user_id, AnswerLike.user_id != user_id,
+               *_visible(alike_nid), *_page(AnswerLike.timestamp, 'alike', AnswerLike.id))\
+        .order_by(AnswerLike.timestamp.desc(), AnswerLike.id.desc()).limit(limit)
+
+    # 4. Notification tablosu (follow, like, comment)
+    notif_nid = _nid('notif-', Notification.id)
+    system = db.select(
+        notif_nid.label('nid'), db.literal('notif').label('source'), Notification.id.label('source_id'),
+        Notification.type.label('kind'),
+        db.func.coalesce(related.display_name, 'Birisi').label('author'),
+        Notification.message.label('message'), db.literal('').label('question_title'),
+        Notification.created_at.label('created_at'), null_int.label('conversation_id'),
+        Notification.related_post_id.label('history_id'), null_int.label('answer_id'),
+        Notification.id.label('real_id'), Notification.related_user_id.label('related_user_id'),
+    ).select_from(Notification)\
+        .outerjoin(related, Notification.related_user_id == related.id)\
+        .where(Notification.user_id == user_id, *_visible(notif_nid), *_page(Notification.created_at, 'notif', Notification.id))\
+        .order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit)
+
+    branches = [db.select(branch.subquery()) for branch in (answers, post_likes, answer_likes, system)]
+    return db.union_all(*branches).subquery('notification_feed')
+
+
+def _decode_notification_cursor(raw):
+    """'<created_at iso>|<source>-<id>' -> (created_at, source, id) as ordered by _notification_feed."""
+    try:
+        ts, nid = str(raw).split('|', 1)
+        source, source_id = nid.split('-', 1)
+        return datetime.datetime.fromisoformat(ts), source, int(source_id)
+    except (TypeError, ValueError):
+        return None
 
-    for like, liker, answer, history, conversation in answer_likes:
-        results.append({
-            'id': f"alike-{like.id}",
-            'type': 'like',
-            'author': liker.display_name,
-            'message': f"{liker.display_name} liked your comment!",
-            'question_title': conversation.title,
-            'created_at': like.timestamp.strftime('%Y-%m-%d %H:%M'),
-            'timestamp_obj': like.timestamp,
-            'conversation_id': conversation.id,
-            'answer_id': answer.id,
-            'history_id': history.id
-        })
 
-    # 4. Notification tablosundan tüm bildirimler (follow, like, comment)
-    all_notifications = Notification.query.filter_by(user_id=user.id)\
-        .order_by(Notification.created_at.desc())\
-        .limit(30)\
-        .all()
-        
-    for n in all_notifications:
-        # Related user name bul
-        related_user = db.session.get(User, n.related_user_id) if n.related_user_id else None
-        author_name = related_user.display_name if related_user else "Birisi"
-        
-        # Emoji seç
-        emoji = '🔔'
-        if n.type == 'follow':
-            emoji = '👥'
-        elif n.type == 'like':
-            emoji = '❤️'
-        elif n.type == 'comment':
-            emoji = '💬'
-        
-        results.append({
-            'id': f"notif-{n.id}",
-            'real_id': n.id,
-            'type': n.type,
-            'author': author_name,
-            'message': n.message,
-            'related_user_id': n.related_user_id,
-            'question_title': '',
-            'created_at': n.created_at.strftime('%Y-%m-%d %H:%M'),
-            'timestamp_obj': n.created_at,
-            'conversation_id': None,
-            'history_id': n.related_post_id,
-            'is_new_system': True
-        })
+def count_unread_notifications(user_id):
+    """Unread, non-hidden notifications; capped so the count stays O(cap)."""
+    feed = _notification_feed(user_id, NOTIFICATION_UNREAD_CAP + 1, unread_only=True)
+    return db.session.execute(db.select(db.func.count()).select_from(feed)).scalar() or 0
 
-    # Okunmuş bildirimleri al
-    read_notifications = {n.notification_id for n in NotificationRead.query.filter_by(user_id=user.id).all()}
-    # Silinmiş bildirimleri al
-    hidden_notifications = {n.notification_id for n in NotificationHidden.query.filter_by(user_id=user.id).all()}
 
-    # Tarihe göre sırala (En yeni en üstte)
-    results.sort(key=lambda x: x['timestamp_obj'], reverse=True)
-    
+@app.route('/api/notifications', methods=['GET'])
+def get_notifications():
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized access'}), 401
+
+    limit = max(1, min(request.args.get('limit', NOTIFICATION_PAGE_SIZE, type=int) or NOTIFICATION_PAGE_SIZE, 100))
+    before = _decode_notification_cursor(request.args['before']) if request.args.get('before') else None
+
+    feed = _notification_feed(user.id, limit, before=before)
+    read_exists = db.exists().where(
+        NotificationRead.user_id == user.id,
+        NotificationRead.notification_id == feed.c.nid,
+    )
+    rows = db.session.execute(
+        db.select(feed, read_exists.label('is_read'))
+        .order_by(feed.c.created_at.desc(), feed.c.source.desc(), feed.c.source_id.desc())
+        .limit(limit)
+    ).all()
+
     final_results = []
-    # Timestamp objesini JSON için kaldır ve is_read ekle
-    for r in results:
-        # Gizlenmiş bildirimleri atla
-        if r['id'] in hidden_notifications:
-            continue
-            
-        # Tüm bildirimler için NotificationRead tablosunu kullan
-        r['is_read'] = r['id'] in read_notifications
-              
-        if 'timestamp_obj' in r:
-            del r['timestamp_obj']
-            
-        final_results.append(r)
+    for row in rows:
+        source = row.source
+        item = {
+            'id': row.nid,
+            'type': row.kind,
+            'author': row.author,
+            'question_title': row.question_title,
+            'created_at': row.created_at.strftime('%Y-%m-%d %H:%M') if row.created_at else '',
+            'conversation_id': row.conversation_id,
+            'history_id': row.history_id,
+            'is_read': bool(row.is_read),
+        }
+        if source == 'ans':
+            item['message'] = f"{row.author} added a solution to your question!"
+        elif source == 'plike':
+            item['message'] = f"{row.author} liked your post!"
+        elif source == 'alike':
+            item['message'] = f"{row.author} liked your comment!"
+            item['answer_id'] = row.answer_id
+        else:
+            item.update({
+                'message': row.message,
+                'real_id': row.real_id,
+                'related_user_id': row.related_user_id,
+                'is_new_system': True,
+            })
+        final_results.append(item)
+
+    response = jsonify(final_results)
+    if len(rows) == limit and rows[-1].created_at:
+        response.headers['X-Next-Cursor'] = f"{rows[-1].created_at.isoformat()}|{rows[-1].nid}"
+    if not before:
+        response.headers['X-Unread-Count'] = str(count_unread_notifications(user.id))
+    return response
 
-    return jsonify(final_results)
+
+@app.route('/api/notifications/unread-count', methods=['GET'])
+def get_unread_notification_count():
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized access'}), 401
+    count = count_unread_notifications(user.id)
+    return jsonify({
+        'unread': min(count, NOTIFICATION_UNREAD_CAP),
+        'capped': count > NOTIFICATION_UNREAD_CAP,
+    })
 
 
 @app.route('/api/notifications/read', methods=['POST'])
@@ -7217,16 +8432,18 @@ def delete_notification():
     return jsonify({'status': 'deleted'})
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    items = History.query.filter_by(is_deleted=False).order_by(History.timestamp.desc()).limit(20).all()
-    return jsonify({'history':[serialize_history(h) for h in items]})
+    items = History.query.options(*_HISTORY_FEED_OPTIONS)\
+        .filter_by(is_deleted=False).order_by(History.timestamp.desc()).limit(20).all()
+    return jsonify({'history': serialize_history_batch(items)})
 
 
 @app.route('/api/popular', methods=['GET'])
 def get_popular():
-    items = History.query.filter_by(is_deleted=False)\
+    items = History.query.options(*_HISTORY_FEED_OPTIONS)\
+        .filter_by(is_deleted=False)\
         .order_by(History.likes.desc(), History.timestamp.desc())\
         .limit(5).all()
-    return jsonify({'popular':[serialize_history(h) for h in items]})
+    return jsonify({'popular': serialize_history_batch(items)})
 
 
 @app.route('/api/stats/model-usage', methods=['GET'])
@@ -8006,7 +9223,8 @@ def create_community_post():
 @app.route('/api/community/feed', methods=['GET'])
 def get_community_feed():
     # Sadece 'Community' olarak işaretlenmiş, silinmemiş postları getir
-    items = History.query.filter_by(selected_model='Community', is_deleted=False)\
+    items = History.query.options(*_HISTORY_FEED_OPTIONS)\
+        .filter_by(selected_model='Community', is_deleted=False)\
         .order_by(History.timestamp.desc())\
         .limit(50)\
         .all()
@@ -8021,15 +9239,18 @@ def get_community_feed():
         if identity:
             user_id = int(identity)
             # Takip edilenleri al
-            followed_ids = {f.following_id for f in UserFollow.query.filter_by(follower_id=user_id).all()}
-            # Beğenilen postları al
-            liked_post_ids = {l.history_id for l in PostLike.query.filter_by(user_id=user_id).all()}
+            followed_ids = {row[0] for row in db.session.query(UserFollow.following_id).filter_by(follower_id=user_id)}
+            # Beğenilen postları al (sadece bu sayfadakiler)
+            page_ids = [h.id for h in items]
+            if page_ids:
+                liked_post_ids = {row[0] for row in db.session.query(PostLike.history_id).filter(
+                    PostLike.user_id == user_id, PostLike.history_id.in_(page_ids)
+                )}
     except Exception:
         pass
 
     feed_data = []
-    for h in items:
-        data = serialize_history(h)
+    for h, data in zip(items, serialize_history_batch(items)):
         # Takip durumu ekle
         if data['author_id'] and user_id and data['author_id'] != user_id:
              data['is_following'] = data['author_id'] in followed_ids
@@ -8258,7 +9479,7 @@ def get_user_profile(user_id):
         ).first() is not None
     
     # Kullanıcının gönderileri (Sadece Community postları)
-    posts = History.query.join(Conversation).filter(
+    posts = History.query.join(Conversation).options(*_HISTORY_FEED_OPTIONS).filter(
         Conversation.user_id == user_id,
         History.selected_model == 'Community'  # Sadece topluluk gönderileri
     ).order_by(History.timestamp.desc()).limit(10).all()
@@ -8273,7 +9494,7 @@ def get_user_profile(user_id):
     
     return jsonify({
         'user': user_data,
-        'posts': [serialize_history(h) for h in posts]
+        'posts': serialize_history_batch(posts)
     })
 
 
@@ -8333,6 +9554,7 @@ def admin_delete_user(target_user_id):
         Snippet.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         PasswordResetToken.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         ApiKey.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        _api_key_cache.invalidate(user_id=user.id)
         VSCodeLoginState.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         VSCodeOTP.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         XPEvent.query.filter_by(user_id=user.id).delete(synchronize_session=False)
@@ -8341,7 +9563,9 @@ def admin_delete_user(target_user_id):
         MemoryEdge.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         MemoryNode.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         MemoryItem.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        MemoryEmbedding.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         UserExternalApiKey.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        ProviderResolver.invalidate_user_key(user.id)
 
         # 2. Sohbetler
         conversations = Conversation.query.filter_by(user_id=user.id).all()
@@ -8358,6 +9582,7 @@ def admin_delete_user(target_user_id):
             FeedbackDetail.query.filter(FeedbackDetail.history_id.in_(history_ids)).delete(synchronize_session=False)
             ConversationSummary.query.filter(ConversationSummary.last_history_id.in_(history_ids)).delete(synchronize_session=False)
             PostLike.query.filter(PostLike.history_id.in_(history_ids)).delete(synchronize_session=False)
+            HistoryMemoryCache.query.filter(HistoryMemoryCache.history_id.in_(history_ids)).delete(synchronize_session=False)
             
             answers = Answer.query.filter(Answer.history_id.in_(history_ids)).all()
             ans_ids = [a.id for a in answers]
@@ -8409,6 +9634,8 @@ def admin_delete_user(target_user_id):
         TokenBalance.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         TokenTransaction.query.filter_by(user_id=user.id).delete(synchronize_session=False)
         TokenPurchase.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        TokenReservation.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        UsageCounter.query.filter_by(user_id=user.id).delete(synchronize_session=False)
 
         if user.profile_image and os.path.exists(user.profile_image):
             try: 
@@ -8438,6 +9665,38 @@ def admin_delete_user(target_user_id):
         sys.stderr.write(f'[ADMIN] Error deleting user {target_user_id}: {str(e)}\n')
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/admin/jobs/metrics', methods=['GET'])
+@admin_required
+def admin_job_metrics():
+    """Background job throughput, queue depth and lag."""
+    return jsonify(job_queue_metrics())
+
+
+@app.route('/api/admin/db/metrics', methods=['GET'])
+@admin_required
+def admin_db_metrics():
+    """This worker's connection pool, slow queries and per-route query counts."""
+    return jsonify(_db_metrics.snapshot())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint (this worker only).
+
+    Requires an `X-Metrics-Token: $METRICS_TOKEN` header when METRICS_TOKEN is
+    set (sanitize_auth_headers drops non-JWT bearer tokens); otherwise only
+    loopback clients are answered.
+    """
+    expected = os.getenv('METRICS_TOKEN')
+    if expected:
+        provided = (request.headers.get('X-Metrics-Token') or '').strip()
+        if not secrets.compare_digest(provided, expected):
+            return jsonify({'error': 'Unauthorized'}), 401
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(_db_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def admin_get_users():
@@ -8540,6 +9799,7 @@ def admin_upsert_user_key(user_id):
     db.session.add(audit)
     
     db.session.commit()
+    ProviderResolver.invalidate_user_key(user_id, provider)
     return jsonify({'message': f'{provider} key saved successfully', 'mask': mask})
 
 @app.route('/api/admin/users/<int:user_id>/keys/<provider>', methods=['DELETE'])
@@ -8563,6 +9823,7 @@ def admin_delete_user_key(user_id, provider):
     db.session.add(audit)
     
     db.session.commit()
+    ProviderResolver.invalidate_user_key(user_id, provider)
     return jsonify({'message': f'{provider} key deleted successfully'})
 
 @app.route('/api/admin/audit-logs', methods=['GET'])
@@ -8599,27 +9860,28 @@ def get_following_feed():
     
     # Takip edilenlerin gönderileri
     # Sadece 'Community' olarak işaretlenmiş (paylaşılmış) gönderileri getir
-    posts = History.query.join(Conversation).filter(
+    posts = History.query.join(Conversation).options(*_HISTORY_FEED_OPTIONS).filter(
         Conversation.user_id.in_(following_ids)
     ).filter(
         History.selected_model == 'Community'
     ).order_by(History.timestamp.desc()).limit(50).all()
-    
+
+    posts = [h for h in posts if h.conversation and h.conversation.user]
+    liked_ids = set()
+    if posts:
+        liked_ids = {row[0] for row in db.session.query(PostLike.history_id).filter(
+            PostLike.user_id == current_user.id, PostLike.history_id.in_([h.id for h in posts])
+        )}
+
     feed_data = []
-    for h in posts:
-        if h.conversation and h.conversation.user:
-            item_data = serialize_history(h)
-            is_liked = False
-            if current_user:
-                like_check = PostLike.query.filter_by(user_id=current_user.id, history_id=h.id).first()
-                if like_check: is_liked = True
-            item_data['is_liked'] = is_liked
-            item_data['author'] = {
-                'id': h.conversation.user.id,
-                'display_name': h.conversation.user.display_name,
-                'profile_image': f"/uploads/{os.path.basename(h.conversation.user.profile_image)}" if h.conversation.user.profile_image else None
-            }
-            feed_data.append(item_data)
+    for h, item_data in zip(posts, serialize_history_batch(posts)):
+        item_data['is_liked'] = h.id in liked_ids
+        item_data['author'] = {
+            'id': h.conversation.user.id,
+            'display_name': h.conversation.user.display_name,
+            'profile_image': f"/uploads/{os.path.basename(h.conversation.user.profile_image)}" if h.conversation.user.profile_image else None
+        }
+        feed_data.append(item_data)
     return jsonify({'feed': feed_data})
 
     # Legacy code (unreachable)
@@ -9009,21 +10271,7 @@ def add_project_file(project_id):
 
         if is_pdf:
             try:
-                from pypdf import PdfReader
-                reader = PdfReader(io.BytesIO(binary_data))
-                parts = []
-                total_chars = 0
-                for page in reader.pages:
-                    txt = page.extract_text() or ''
-                    if not txt:
-                        continue
-                    remaining = 20000 - total_chars
-                    if remaining <= 0:
-                        break
-                    segment = txt[:remaining]
-                    parts.append(segment)
-                    total_chars += len(segment)
-                content = '\n'.join(parts).replace('\x00', '')
+                content = _document_extractor.extract('pdf', binary_data, limit=20000)
             except Exception:
                 return jsonify({'error': 'PDF text extraction failed'}), 400
 
@@ -9031,7 +10279,7 @@ def add_project_file(project_id):
                 return jsonify({'error': 'No readable text found in PDF'}), 400
         elif is_docx:
             try:
-                content = _extract_docx_text(io.BytesIO(binary_data), limit=20000)
+                content = _document_extractor.extract('docx', binary_data, limit=20000)
             except Exception:
                 return jsonify({'error': 'DOCX text extraction failed'}), 400
 
@@ -9057,6 +10305,8 @@ def add_project_file(project_id):
     )
     db.session.add(pf)
     db.session.commit()
+    # Index in the background so the first question on a fresh upload doesn't wait for embeddings.
+    _schedule_project_indexing(project.id, user_id)
     return jsonify({'id': pf.id, 'name': pf.name}), 201
 
 
@@ -9070,6 +10320,7 @@ def delete_project_file(project_id, file_id):
     pf = ProjectFile.query.filter_by(id=file_id, project_id=project.id).first_or_404()
     db.session.delete(pf)
     db.session.commit()
+    invalidate_project_embedding_cache(project.id, file_id)
     return jsonify({'message': 'File deleted'})
 
 @app.route('/api/projects/<int:project_id>', methods=['DELETE'])
@@ -9422,11 +10673,7 @@ def send_to_session(token):
                         for chunk in stream:
                             if chunk.text:
                                 full_response += chunk.text
-                                socketio.emit('collab_stream_chunk', {
-                                    'chunk': chunk.text,
-                                    'history_id': history_id,
-                                    'token': token
-                                }, room=token)
+                                collab_chunks.push('collab_stream_chunk', token, chunk.text, key=history_id, history_id=history_id, token=token)
                     except Exception as e:
                         print(f'Gemini stream error in collab: {e}')
                         # Fallback to non-streaming
@@ -9434,11 +10681,7 @@ def send_to_session(token):
                             model_obj = genai.GenerativeModel('gemini-2.5-flash-lite')
                             resp = model_obj.generate_content(question)
                             full_response = resp.text or 'Yanıt üretilemedi'
-                            socketio.emit('collab_stream_chunk', {
-                                'chunk': full_response,
-                                'history_id': history_id,
-                                'token': token
-                            }, room=token)
+                            collab_chunks.push('collab_stream_chunk', token, full_response, key=history_id, history_id=history_id, token=token)
                         except Exception as e2:
                             full_response = f'Hata: {str(e2)}'
 
@@ -9455,11 +10698,7 @@ def send_to_session(token):
                             delta = chunk.choices[0].delta.content if chunk.choices else None
                             if delta:
                                 full_response += delta
-                                socketio.emit('collab_stream_chunk', {
-                                    'chunk': delta,
-                                    'history_id': history_id,
-                                    'token': token
-                                }, room=token)
+                                collab_chunks.push('collab_stream_chunk', token, delta, key=history_id, history_id=history_id, token=token)
                     except Exception as e:
                         full_response = f'OpenAI Hata: {str(e)}'
 
@@ -9474,11 +10713,7 @@ def send_to_session(token):
                         ) as stream:
                             for text_chunk in stream.text_stream:
                                 full_response += text_chunk
-                                socketio.emit('collab_stream_chunk', {
-                                    'chunk': text_chunk,
-                                    'history_id': history_id,
-                                    'token': token
-                                }, room=token)
+                                collab_chunks.push('collab_stream_chunk', token, text_chunk, key=history_id, history_id=history_id, token=token)
                     except Exception as e:
                         full_response = f'Claude Hata: {str(e)}'
 
@@ -9490,9 +10725,11 @@ def send_to_session(token):
                 h = History.query.get(history_id)
                 if h:
                     h.ai_response = full_response
+                    HistoryMemoryCache.query.filter_by(history_id=h.id).delete(synchronize_session=False)
                     db.session.commit()
 
                 # Stream tamamlandı sinyali
+                collab_chunks.flush('collab_stream_chunk', token, key=history_id)
                 socketio.emit('collab_stream_done', {
                     'history_id': history_id,
                     'full_response': full_response,
@@ -9501,6 +10738,7 @@ def send_to_session(token):
 
         except Exception as ex:
             print(f'Collab stream thread error: {ex}')
+            collab_chunks.flush('collab_stream_chunk', token, key=history_id)
             socketio.emit('collab_stream_done', {
                 'history_id': history_id,
                 'full_response': f'Hata oluştu: {str(ex)}',
@@ -10201,6 +11439,8 @@ def get_quota_status_endpoint():
         quota_data = get_quota_status(user.id)
         if quota_data:
             quota_data['unlimited'] = bool(user.is_admin)
+            daily_count, month_tokens = _read_usage_counters(user)
+            quota_data['plan_usage'] = _build_usage_payload(_user_plan(user), daily_count, month_tokens)
             return jsonify(quota_data), 200
         else:
             return jsonify({'error': 'Could not get quota data'}), 500
@@ -10537,16 +11777,53 @@ def _preview_api_key(stored_key: str) -> str:
     return f"{stored_key[:7]}***{stored_key[-4:]}" if len(stored_key) > 11 else "***"
 
 
+def _write_api_key_last_used(stamps):
+    table = ApiKey.__table__
+    with app.app_context():
+        try:
+            db.session.execute(
+                table.update()
+                .where(table.c.id == db.bindparam('b_id'))
+                .values(last_used_at=db.bindparam('b_used_at')),
+                [{'b_id': key_id, 'b_used_at': used_at} for key_id, used_at in stamps.items()],
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+# Hashed key -> snapshot, so repeated /v1 calls skip the lookup; last_used_at is
+# written behind in batches instead of a commit per request.
+_api_key_cache = ApiKeyCache()
+_api_key_last_used = LastUsedBuffer(_write_api_key_last_used)
+atexit.register(_api_key_last_used.flush)
+
+
+def _touch_api_key(key_record) -> None:
+    _api_key_last_used.touch(key_record.id, _utcnow())
+
+
+def _api_key_last_used_iso(key_record):
+    # Include a stamp still waiting in the buffer so the list never looks stale.
+    used_at = _api_key_last_used.pending(key_record.id) or key_record.last_used_at
+    return used_at.isoformat() if used_at else None
+
+
 def _find_api_key_record(raw_key: str):
+    """Active key for `raw_key` as a CachedApiKey snapshot (id, user_id, key, client, is_active)."""
     token = (raw_key or '').strip()
     if not token:
         return None
 
     stored_candidate = _build_stored_api_key(token)
     if stored_candidate:
+        cached = _api_key_cache.get(stored_candidate)
+        if cached is not None:
+            return cached
         record = ApiKey.query.filter_by(key=stored_candidate, is_active=True).first()
         if record:
-            return record
+            return _api_key_cache.put(record, _detect_api_key_client(record.key))
 
     # Backward compatibility for legacy plaintext records.
     record = ApiKey.query.filter_by(key=token, is_active=True).first()
@@ -10556,7 +11833,9 @@ def _find_api_key_record(raw_key: str):
             db.session.commit()
         except Exception:
             db.session.rollback()
-    return record
+    if record is None:
+        return None
+    return _api_key_cache.put(record, _detect_api_key_client(record.key))
 
 
 def _migrate_plaintext_api_keys_to_hash() -> int:
@@ -10596,9 +11875,8 @@ def requires_api_key(f):
         if not key_record or not key_record.is_active:
             return jsonify({'error': 'Invalid or revoked API Key'}), 401
         
-        # Security: ensure last_used_at is updated
-        key_record.last_used_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
-        db.session.commit()
+        # Security: ensure last_used_at is updated (flushed in batches)
+        _touch_api_key(key_record)
             
         user = User.query.get(key_record.user_id)
         if not user:
@@ -10638,7 +11916,7 @@ def _resolve_authenticated_user(preferred_api_key_client: str | None = None, all
     if not key_record:
         return None, None, None, {'error': 'Invalid or revoked API Key'}, 401
 
-    client_type = _detect_api_key_client(key_record.key)
+    client_type = key_record.client
     if preferred_api_key_client and client_type not in (preferred_api_key_client, 'legacy'):
         return None, None, None, {
             'error': f'This endpoint requires a {preferred_api_key_client} API key.',
@@ -10650,8 +11928,7 @@ def _resolve_authenticated_user(preferred_api_key_client: str | None = None, all
     if not user:
         return None, None, None, {'error': 'User not found for API key'}, 404
 
-    key_record.last_used_at = _utcnow()
-    db.session.commit()
+    _touch_api_key(key_record)
     return user, 'api_key', key_record, None, None
 
 @app.route('/api/keys', methods=['GET'])
@@ -10668,7 +11945,7 @@ def get_api_keys():
                 'client': _detect_api_key_client(k.key),
                 'key_preview': _preview_api_key(k.key),
                 'created_at': k.created_at.isoformat(),
-                'last_used_at': k.last_used_at.isoformat() if k.last_used_at else None
+                'last_used_at': _api_key_last_used_iso(k)
             } for k in keys
         ]
     })
@@ -10984,16 +12261,24 @@ def revoke_api_key(key_id):
     # Soft delete - Veritabanı tutarlılığı için satırı silmiyoruz
     key_record.is_active = False
     db.session.commit()
+    _api_key_cache.invalidate(key_record.key, key_id=key_record.id)
     return jsonify({'message': 'Key revoked successfully'})
 
 
 @app.route('/v1/cancel', methods=['POST'])
 def cancel_request():
-    """Signals that a specific request should be aborted."""
+    """Signals that a specific request of the API key's owner should be aborted."""
+    api_key_header = _extract_api_key_from_request()
+    if not api_key_header:
+        return jsonify({'error': 'X-API-Key header is missing'}), 401
+    key_record = _find_api_key_record(api_key_header)
+    if not key_record:
+        return jsonify({'error': 'Invalid or revoked API Key'}), 401
+
     data = request.get_json(silent=True) or {}
     request_id = data.get('request_id')
     if request_id:
-        CANCELLED_REQUESTS[request_id] = True
+        get_run_state().cancel(request_id, key_record.user_id)
         print(f"[CANCEL] Request {request_id} has been marked for cancellation.")
         return jsonify({'status': 'ok'})
     return jsonify({'error': 'request_id missing'}), 400
@@ -11006,7 +12291,7 @@ def web_cancel_request():
     data = request.get_json(silent=True) or {}
     request_id = data.get('request_id')
     if request_id:
-        CANCELLED_REQUESTS[request_id] = True
+        get_run_state().cancel(request_id, get_jwt_identity())
         print(f"[CANCEL-WEB] Request {request_id} marked for cancellation.")
         return jsonify({'status': 'ok'})
     return jsonify({'error': 'request_id missing'}), 400
@@ -11029,13 +12314,12 @@ def external_ask():
     if not key_record:
         return jsonify({'error': 'Invalid or revoked API Key'}), 401
 
-    key_client = _detect_api_key_client(key_record.key)
+    key_client = key_record.client
     if key_client == 'web':
         return jsonify({'error': 'Web API keys cannot be used for /v1 endpoints. Use a vscode API key.'}), 403
     
-    # Son kullanım tarihini güncelle
-    key_record.last_used_at = _utcnow()
-    db.session.commit()
+    # Son kullanım tarihini güncelle (toplu olarak yazılır)
+    _touch_api_key(key_record)
 
 
     # Tolerate invalid/missing JSON to avoid generic 400 from Werkzeug
@@ -11068,8 +12352,9 @@ def external_ask():
         return jsonify({'error': 'Either question or code must be provided'}), 400
         
     user_id = key_record.user_id
-    user = User.query.get(user_id)
-    prefs = json.loads(user.preferences) if user and user.preferences else {}
+    request_identity = get_request_identity(user_id)
+    user = request_identity.user if request_identity else None
+    prefs = get_user_preferences(user) if user and user.preferences else {}
 
     # 📜 CONVERSATION LOOKUP — Handle numeric ID or Title fallback (Deprecated)
     _conv = None
@@ -11116,7 +12401,7 @@ def external_ask():
     # 🔄 SESSION STATE — Isolate per-request vs per-session
     # Persistent session state (shared across requests in same chat)
     session_state_key = _conversation_state_key(user_id, _conv.id)
-    session_state = _external_conversation_state.get(session_state_key, {})
+    session_state = get_run_state().get_session(session_state_key)
     
     # Transient request state (isolated to this specific rid)
     request_state = {
@@ -11175,7 +12460,7 @@ def external_ask():
         }), 400
 
     # ── 💰 Token Balance Check (STRICT & ACCURATE) ──────────────────
-    _vsc_user = User.query.get(key_record.user_id)
+    _vsc_user = user
     if not _vsc_user:
         return jsonify({'error': 'İstek için yetkili kullanıcı bulunamadı.'}), 401
     
@@ -11293,7 +12578,10 @@ def external_ask():
                 http_options=_gt.HttpOptions(timeout=to_gemini_timeout(env_float("GEMINI_TIMEOUT_SEC", 60.0, minimum=10.0, maximum=300.0))),
             )
             try:
-                with provider_slot("gemini"):
+                reservation = get_provider_governor().reserve("gemini", model=provider_model, user_id=user_id)
+                for queue_status in reservation.wait():
+                    yield QueueNotice(queue_status)
+                with reservation:
                     for item in gc.models.generate_content_stream(
                         model=provider_model, contents=_contents, config=_cfg
                     ):
@@ -11309,7 +12597,10 @@ def external_ask():
                 yield 'Error: Anthropic client not configured.'
                 return
             try:
-                with claude_client.messages.stream(
+                reservation = get_provider_governor().reserve("anthropic", model=provider_model, user_id=user_id)
+                for queue_status in reservation.wait():
+                    yield QueueNotice(queue_status)
+                with reservation, claude_client.messages.stream(
                     model=provider_model,
                     max_tokens=2048,
                     system=sys_prompt,
@@ -11327,18 +12618,22 @@ def external_ask():
                 return
             try:
                 all_msgs = [{'role': 'system', 'content': sys_prompt}] + msgs
-                resp = openai_client.chat.completions.create(
-                    model=provider_model,
-                    messages=all_msgs,
-                    temperature=0.2,
-                    max_completion_tokens=2048,
-                    stream=True,
-                )
-                for chunk in resp:
-                    delta = chunk.choices[0].delta if chunk.choices else None
-                    t = getattr(delta, 'content', None) or ''
-                    if t:
-                        yield t
+                reservation = get_provider_governor().reserve("openai", model=provider_model, user_id=user_id)
+                for queue_status in reservation.wait():
+                    yield QueueNotice(queue_status)
+                with reservation:
+                    resp = openai_client.chat.completions.create(
+                        model=provider_model,
+                        messages=all_msgs,
+                        temperature=0.2,
+                        max_completion_tokens=2048,
+                        stream=True,
+                    )
+                    for chunk in resp:
+                        delta = chunk.choices[0].delta if chunk.choices else None
+                        t = getattr(delta, 'content', None) or ''
+                        if t:
+                            yield t
             except Exception as exc:
                 yield f'\n[OpenAI error: {exc}]'
 
@@ -11378,13 +12673,29 @@ def external_ask():
             yield f"data: {json.dumps(meta)}\n\n"
 
             full_text = ''
+            cancelled = False
+            chunk_iter = _get_chunk_generator(sys_prompt, msgs)
             try:
-                for chunk in _get_chunk_generator(sys_prompt, msgs):
+                for chunk in chunk_iter:
+                    if is_request_cancelled(request_id, user_id):
+                        cancelled = True
+                        break
+                    if isinstance(chunk, QueueNotice):
+                        yield f"data: {json.dumps({'type': 'queue', **chunk.status.to_dict()})}\n\n"
+                        continue
                     if chunk:
                         full_text += chunk
                         yield f"data: {json.dumps({'text': chunk})}\n\n"
             except Exception as exc:
                 yield f"data: {json.dumps({'text': f'[Stream error: {exc}]'})}\n\n"
+            finally:
+                # Closing the provider generator releases its slot and drops the upstream stream.
+                close = getattr(chunk_iter, 'close', None)
+                if close:
+                    close()
+            if cancelled:
+                get_run_state().clear_cancel(request_id, user_id)
+                print(f"[CANCEL] Request {request_id} stopped after {len(full_text)} chars.")
 
             # Persist history after stream completes
             try:
@@ -11404,9 +12715,10 @@ def external_ask():
             except Exception as _he:
                 print(f'[HISTORY] Stream save error: {_he}')
 
-            yield f"data: {json.dumps({'done': True, 'steps': 0, 'agent_trace': [], 'agent_changed_files': []})}\n\n"
+            yield f"data: {json.dumps({'done': True, 'cancelled': cancelled, 'steps': 0, 'agent_trace': [], 'agent_changed_files': []})}\n\n"
             yield 'data: [DONE]\n\n'
 
+        release_request_session()
         return Response(stream_with_context(generate_stream_native()), mimetype='text/event-stream')
 
     # ── Agent path (or non-streaming fallback) ─────────────────────────────
@@ -11425,12 +12737,13 @@ def external_ask():
             anthropic_client=claude_client,
             gemini_client=getattr(genai, '_client', None),
             request_id=request_id,
+            user_id=user_id,
             on_event=on_event,
             on_first_llm_success=trigger_token_deduction
         )
     except AgentAbortException:
         print(f"[ASK] Request {request_id} ABORTED by user. Ensuring final balance sync.")
-        CANCELLED_REQUESTS.pop(request_id, None)
+        get_run_state().clear_cancel(request_id, user_id)
         db.session.rollback()
         _fresh_user = db.session.get(User, user_id)
         current_balance = get_or_create_token_balance(_fresh_user).balance if _fresh_user else _vsc_balance
@@ -11460,7 +12773,7 @@ def external_ask():
             session_state['last_action'] = 'patch_generated'
 
     session_state['updated_at'] = _utcnow().isoformat()
-    _external_conversation_state[session_state_key] = session_state
+    get_run_state().put_session(session_state_key, session_state)
 
     # 💰 TOKEN — Final sync
     if not deduction_occurred and _vsc_user:
@@ -11472,7 +12785,7 @@ def external_ask():
                 description=f"VSC Agent: {question[:30]}...",
                 reference_id=None
             )
-            CANCELLED_REQUESTS.pop(request_id, None)
+            get_run_state().clear_cancel(request_id, user_id)
 
     # Capture primitive IDs for session-safe access in generators
     final_conv_id = _conv.id if _conv else None
@@ -11651,7 +12964,7 @@ def external_status():
     if not key_record:
         return jsonify({'status': 'unauthorized', 'error': 'Invalid or revoked API Key'}), 401
 
-    key_client = _detect_api_key_client(key_record.key)
+    key_client = key_record.client
     if key_client == 'web':
         return jsonify({'status': 'unauthorized', 'error': 'Web API keys cannot be used for /v1 endpoints.'}), 403
     
@@ -12175,6 +13488,18 @@ def handle_leave_room(data):
         print(f'[Socket] {user_name} left room {token[:8]}...')
 
 
+@socketio.on('join_user_room')
+def handle_join_user_room(data):
+    """Oturum açmış kullanıcı kendi odasına katılır (history_enriched vb. olaylar için)."""
+    token = (data or {}).get('token', '')
+    try:
+        user_id = int(decode_token(token).get('sub'))
+    except Exception:
+        socket_emit('error', {'message': 'Geçersiz oturum'})
+        return
+    join_room(_user_socket_room(user_id))
+
+
 @socketio.on('connect')
 def handle_connect():
     print(f'[Socket] Client connected: {request.sid}')
@@ -12267,6 +13592,7 @@ def save_self_key(current_user):
     )
     db.session.add(log)
     db.session.commit()
+    ProviderResolver.invalidate_user_key(current_user.id, provider)
 
     return jsonify({"success": True, "mask": mask})
 
@@ -12289,6 +13615,7 @@ def delete_self_key(current_user, provider):
     )
     db.session.add(log)
     db.session.commit()
+    ProviderResolver.invalidate_user_key(current_user.id, provider)
 
     return jsonify({"success": True})
 
@@ -8,10 +8,22 @@ Usage:
 """
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
-from typing import Dict, Optional
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 
 from .base import BaseAdapter
+from utils.concurrency import env_float, env_int
+
+
+def key_fingerprint(key: str) -> str:
+    """Stable, non-reversible identifier for an API key (pool keys never hold the raw key)."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
 
 
 class AdapterDispatcher:
@@ -20,6 +32,12 @@ class AdapterDispatcher:
 
     Adapters are initialised lazily on first use so that missing
     API keys only fail at call time, not at import time.
+
+    Adapters for user-owned (BYOK) keys are pooled per event loop in an LRU
+    keyed by (provider, key fingerprint), so a user's turns reuse one client and
+    its keep-alive connections. At most ``BYOK_CLIENT_POOL_SIZE`` (default 256)
+    are kept per loop; ones idle for ``BYOK_CLIENT_IDLE_SEC`` (default 600) are
+    dropped.
     """
 
     PROVIDER_ALIASES: Dict[str, str] = {
@@ -44,7 +62,14 @@ class AdapterDispatcher:
             "anthropic": anthropic_key or os.getenv("ANTHROPIC_API_KEY", ""),
             "gemini":    gemini_key    or os.getenv("GEMINI_API_KEY", ""),
         }
-        self._cache: Dict[str, BaseAdapter] = {}
+        # Adapters wrap async HTTP clients whose connection pools belong to the
+        # loop that first used them, so cached instances are kept per loop.
+        self._cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._loopless_cache: Dict[str, BaseAdapter] = {}
+        self._cache_lock = threading.Lock()
+        self._byok_pools: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._byok_max = env_int("BYOK_CLIENT_POOL_SIZE", 256, minimum=0)
+        self._byok_idle_sec = env_float("BYOK_CLIENT_IDLE_SEC", 600.0, minimum=1.0)
 
     # ── Public API ────────────────────────────────────────────────────────
 
@@ -53,8 +78,8 @@ class AdapterDispatcher:
         Return the adapter for *provider*.
 
         Resolves aliases (e.g. 'claude' → 'anthropic') and caches
-        the instance. If override_key is provided, it bypasses the cache
-        and uses the provided key directly.
+        the instance per event loop. An override_key (user-owned key) is served
+        from the BYOK pool instead of the shared cache.
 
         Raises:
             ValueError – if the provider is unknown.
@@ -62,13 +87,25 @@ class AdapterDispatcher:
         """
         canonical = self._resolve(provider)
         
-        if override_key:
-            # Bypass cache for user-owned keys for security/privacy
-            return self._build(canonical, key=override_key)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
 
-        if canonical not in self._cache:
-            self._cache[canonical] = self._build(canonical)
-        return self._cache[canonical]
+        if override_key:
+            return self._get_byok(canonical, override_key, loop)
+
+        with self._cache_lock:
+            if loop is None:
+                cache = self._loopless_cache
+            else:
+                cache = self._cache.get(loop)
+                if cache is None:
+                    cache = {}
+                    self._cache[loop] = cache
+            if canonical not in cache:
+                cache[canonical] = self._build(canonical)
+            return cache[canonical]
 
     def infer_provider(self, model: str) -> str:
         """
@@ -92,8 +129,40 @@ class AdapterDispatcher:
         """Return which providers have API keys configured."""
         return {name: bool(key) for name, key in self._keys.items()}
 
+    def byok_pool_size(self) -> int:
+        with self._cache_lock:
+            return sum(len(pool) for pool in self._byok_pools.values())
+
     # ── Private helpers ───────────────────────────────────────────────────
 
+    def _get_byok(self, canonical: str, key: str, loop) -> BaseAdapter:
+        # Without a running loop there is nothing to keep connections alive for.
+        if loop is None or self._byok_max == 0:
+            return self._build(canonical, key=key)
+
+        pool_key = (canonical, key_fingerprint(key))
+        now = time.monotonic()
+        with self._cache_lock:
+            pool: "Optional[OrderedDict[Tuple[str, str], list]]" = self._byok_pools.get(loop)
+            if pool is None:
+                pool = OrderedDict()
+                self._byok_pools[loop] = pool
+            # Oldest first: stop at the first entry that is still fresh. Evicted
+            # adapters are not closed – a stream may still be using one – and are
+            # released with their last reference.
+            while pool and now - next(iter(pool.values()))[1] >= self._byok_idle_sec:
+                pool.popitem(last=False)
+            entry = pool.get(pool_key)
+            if entry is not None:
+                entry[1] = now
+                pool.move_to_end(pool_key)
+            else:
+                entry = pool[pool_key] = [self._build(canonical, key=key), now]
+                while len(pool) > self._byok_max:
+                    pool.popitem(last=False)
+            adapter = entry[0]
+        return adapter
+
     def _resolve(self, provider: str) -> str:
         canonical = self.PROVIDER_ALIASES.get(provider.lower())
         if not canonical:
@@ -1,23 +1,119 @@
 from __future__ import annotations
+import asyncio
 import os
-from typing import Optional, Dict, Tuple
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 import httpx
+
+from utils.concurrency import env_float, env_int
 # NOTE: models and crypto_utils are imported lazily inside get_user_key()
 # to avoid Flask application-context errors at module import time.
 
+_MISSING = object()
+
+
+class _UserKeyCache:
+    """
+    Decrypted user keys (and "no key" answers) per (user_id, provider), kept for
+    ``BYOK_KEY_CACHE_TTL_SEC`` (default 60), at most ``BYOK_KEY_CACHE_MAX_ENTRIES``
+    (default 10000) of them. The key routes invalidate the entry in this
+    process; other workers pick the change up within the TTL.
+
+    Loads take a :meth:`generation` before querying and hand it to :meth:`put`,
+    which drops the answer if an invalidation happened in between, so a load
+    racing a key deletion cannot cache the revoked key.
+    """
+
+    def __init__(self) -> None:
+        self.ttl_sec = env_float("BYOK_KEY_CACHE_TTL_SEC", 60.0, minimum=0.0, maximum=3600.0)
+        self.max_entries = env_int("BYOK_KEY_CACHE_MAX_ENTRIES", 10000, minimum=1)
+        self._lock = threading.Lock()
+        # (user_id, provider) -> (expires_at, key); insertion order is expiry order.
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, Optional[str]]]" = OrderedDict()
+        self._generation = 0
+
+    def get(self, user_id: int, provider: str):
+        with self._lock:
+            entry = self._entries.get((user_id, provider))
+            if entry is None:
+                return _MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[(user_id, provider)]
+                return _MISSING
+            return entry[1]
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, user_id: int, provider: str, key: Optional[str], generation: int) -> None:
+        if self.ttl_sec <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            now = time.monotonic()
+            self._entries.pop((user_id, provider), None)
+            self._entries[(user_id, provider)] = (now + self.ttl_sec, key)
+            while self._entries:
+                cached, (expires_at, _key) = next(iter(self._entries.items()))
+                if expires_at > now and len(self._entries) <= self.max_entries:
+                    break
+                del self._entries[cached]
+
+    def invalidate(self, user_id: int, provider: Optional[str] = None) -> None:
+        with self._lock:
+            self._generation += 1
+            if provider is not None:
+                self._entries.pop((user_id, provider.lower()), None)
+                return
+            for cached in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[cached]
+
+
+_user_keys = _UserKeyCache()
+
+
 class ProviderResolver:
     """
     Central resolver for AI provider keys and validation.
     """
-    
+
     @staticmethod
     def get_user_key(user_id: int, provider: str) -> Optional[str]:
-        """Fetches and decrypts a user's API key for a specific provider.
+        """Fetches and decrypts a user's API key for a specific provider (cached)."""
+        provider = provider.lower()
+        cached = _user_keys.get(user_id, provider)
+        if cached is not _MISSING:
+            return cached
+        return ProviderResolver._load_user_key(user_id, provider)
+
+    @staticmethod
+    async def get_user_key_async(user_id: int, provider: str) -> Optional[str]:
+        """:meth:`get_user_key` for the event loop: the DB query and decrypt run in a thread."""
+        provider = provider.lower()
+        cached = _user_keys.get(user_id, provider)
+        if cached is not _MISSING:
+            return cached
+        return await asyncio.to_thread(ProviderResolver._load_user_key, user_id, provider)
+
+    @staticmethod
+    def invalidate_user_key(user_id: int, provider: Optional[str] = None) -> None:
+        """Drop cached keys after a user's keys change (all providers if none given)."""
+        _user_keys.invalidate(user_id, provider)
+
+    @staticmethod
+    def _load_user_key(user_id: int, provider: str) -> Optional[str]:
+        """Query and decrypt the key, caching the answer.
 
         This method is called from the async AgentRuntime (FastAPI context)
         which does not have a Flask application context active. We therefore
         push one explicitly so that SQLAlchemy / Flask-SQLAlchemy can operate.
+        Lookup and decryption failures are not cached.
         """
+        generation = _user_keys.generation()
         try:
             # Import lazily to avoid circular imports at module load time.
             from app import app as flask_app  # noqa: F401
@@ -27,17 +123,23 @@ class ProviderResolver:
             with flask_app.app_context():
                 record = UserExternalApiKey.query.filter_by(
                     user_id=user_id,
-                    provider=provider.lower(),
+                    provider=provider,
                     is_active=True
                 ).first()
 
-                if record:
-                    try:
-                        return decrypt_key(record.encrypted_key)
-                    except Exception as e:
-                        print(f"[ProviderResolver] Decryption failed for user {user_id}, "
-                              f"provider {provider}: {e}")
-                        return None
+                if not record:
+                    _user_keys.put(user_id, provider, None, generation)
+                    return None
+                try:
+                    key = decrypt_key(record.encrypted_key)
+                except Exception as e:
+                    # Not cached: a rotated ENCRYPTION_KEY or a bad row should not
+                    # hide the user's key for the whole TTL once it is fixed.
+                    print(f"[ProviderResolver] Decryption failed for user {user_id}, "
+                          f"provider {provider}: {e}")
+                    return None
+                _user_keys.put(user_id, provider, key, generation)
+                return key
         except Exception as e:
             print(f"[ProviderResolver] get_user_key failed for user {user_id}, "
                   f"provider {provider}: {e}")
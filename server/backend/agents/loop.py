@@ -26,6 +26,7 @@ from ..agents.base import (
 )
 from ..tools.registry import ToolRegistry
 from ..runtime.limits import ContextCompressor, TokenBudget
+from utils.run_state import is_request_cancelled
 
 
 _SENTINEL = object()   # signals the queue is exhausted
@@ -49,15 +50,15 @@ class AgentLoop:
         compressor: Optional[ContextCompressor] = None,
         *,
         provider: Optional[str] = None,
-        provider_semaphores: Optional[Dict[str, asyncio.Semaphore]] = None,
-        model_queue_timeout: float = 8.0,
+        provider_governor: Optional[Any] = None,
+        model_queue_timeout: float = 120.0,
     ) -> None:
         self._adapter = adapter
         self._registry = tool_registry
         self._compressor = compressor or ContextCompressor()
         self._provider = (provider or "").lower()
-        self._provider_semaphores = provider_semaphores or {}
-        self._model_queue_timeout = max(0.1, float(model_queue_timeout or 8.0))
+        self._provider_governor = provider_governor
+        self._model_queue_timeout = max(0.1, float(model_queue_timeout or 120.0))
 
     # ── Public entry point ────────────────────────────────────────────────
 
@@ -151,6 +152,15 @@ class AgentLoop:
         )
 
         for step in range(ctx.max_tool_calls + 1):
+            # The user's cancel for this run_id (from any worker) stops before the next model call.
+            if is_request_cancelled(ctx.run_id, ctx.user_id):
+                print(f"[AgentLoop] Run {ctx.run_id} cancelled before step {step}.")
+                await self._emit_done(
+                    ctx, queue, trace, finish_reason="cancelled",
+                    total_steps=step, budget=budget,
+                )
+                return
+
             if not budget.can_spend(1, reserve=min_token_reserve):
                 await queue.put(AgentEvent(
                     type=AgentEventType.MESSAGE,
@@ -212,6 +222,8 @@ class AgentLoop:
                 system_prompt=ctx.system_prompt,
                 on_chunk=(lambda c: asyncio.run_coroutine_threadsafe(_on_chunk(c), loop)) if stream_callbacks_enabled else None,
                 on_reasoning=(lambda c: asyncio.run_coroutine_threadsafe(_on_reasoning(c), loop)) if stream_callbacks_enabled else None,
+                queue=queue,
+                user_id=getattr(ctx, "user_id", None),
             )
 
             # Guard: adapter may return None on unexpected errors
@@ -326,9 +338,10 @@ class AgentLoop:
         system_prompt: str,
         on_chunk: Optional[callable],
         on_reasoning: Optional[callable],
+        queue: Optional[asyncio.Queue] = None,
+        user_id: Any = None,
     ) -> AdapterResponse:
-        semaphore = self._provider_semaphores.get(self._provider)
-        if semaphore is None:
+        if self._provider_governor is None or not self._provider_governor.governs(self._provider):
             return await self._adapter.generate(
                 messages=messages,
                 tools=tools,
@@ -338,14 +351,20 @@ class AgentLoop:
                 on_reasoning=on_reasoning,
             )
 
-        try:
-            await asyncio.wait_for(semaphore.acquire(), timeout=self._model_queue_timeout)
-        except asyncio.TimeoutError as exc:
-            raise TimeoutError(
-                f"{self._provider or 'model'} provider is busy. "
-                "Please retry shortly."
-            ) from exc
+        async def _on_wait(status) -> None:
+            if queue is None:
+                return
+            eta = f" (~{status.eta_seconds} sn)" if status.eta_seconds else ""
+            await queue.put(AgentEvent(
+                type=AgentEventType.STATUS,
+                payload={
+                    "message": f"⏳ Sıradasınız: {status.position}.{eta}",
+                    "queue": status.to_dict(),
+                },
+            ))
 
+        reservation = self._provider_governor.reserve(self._provider, model=config.model, user_id=user_id)
+        await reservation.acquire_async(max_wait=self._model_queue_timeout, on_wait=_on_wait)
         try:
             return await self._adapter.generate(
                 messages=messages,
@@ -356,7 +375,7 @@ class AgentLoop:
                 on_reasoning=on_reasoning,
             )
         finally:
-            semaphore.release()
+            await asyncio.get_running_loop().run_in_executor(None, reservation.release)
 
     # ── Tool dispatch ─────────────────────────────────────────────────────
 
@@ -1,4 +1,4 @@
-from .optimizer import optimize_prompt
+from .optimizer import optimize_prompt, optimize_prompt_async
 from .intent_classifier import HybridIntentClassifier, RuleBasedIntentClassifier, Intent
 
-__all__ = ["optimize_prompt", "HybridIntentClassifier", "RuleBasedIntentClassifier", "Intent"]
+__all__ = ["optimize_prompt", "optimize_prompt_async", "HybridIntentClassifier", "RuleBasedIntentClassifier", "Intent"]
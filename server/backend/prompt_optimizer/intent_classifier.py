@@ -1,3 +1,4 @@
+import asyncio
 import os
 from enum import Enum
 from typing import Protocol, List, Dict, Pattern, TypedDict, Any, Optional, Tuple
@@ -147,6 +148,7 @@ class HybridIntentClassifier:
         rule_confidence_threshold: Optional[float] = None,
         confidence_gap_threshold: Optional[float] = None,
         llm_min_confidence: Optional[float] = None,
+        deadline_sec: Optional[float] = None,
     ):
         self.rule_classifier = rule_classifier or RuleBasedIntentClassifier()
         self._llm_classifier = llm_classifier
@@ -154,6 +156,7 @@ class HybridIntentClassifier:
         self.rule_confidence_threshold = self._read_float_env('INTENT_CLASSIFIER_RULE_CONFIDENCE_THRESHOLD', default=0.72) if rule_confidence_threshold is None else rule_confidence_threshold
         self.confidence_gap_threshold = self._read_float_env('INTENT_CLASSIFIER_CONFIDENCE_GAP_THRESHOLD', default=0.15) if confidence_gap_threshold is None else confidence_gap_threshold
         self.llm_min_confidence = self._read_float_env('INTENT_CLASSIFIER_LLM_MIN_CONFIDENCE', default=0.55) if llm_min_confidence is None else llm_min_confidence
+        self.deadline_sec = self._read_float_env('INTENT_CLASSIFIER_DEADLINE_SEC', default=1.5) if deadline_sec is None else deadline_sec
 
     @staticmethod
     def _read_bool_env(name: str, default: bool = True) -> bool:
@@ -206,7 +209,7 @@ class HybridIntentClassifier:
 
         return True
 
-    def classify(self, user_prompt: str) -> IntentResult:
+    def _rule_stage(self, user_prompt: str) -> Tuple[IntentResult, Intent, float, bool]:
         rule_result = self.rule_classifier.classify(user_prompt)
         rule_intent = _normalize_intent_value(rule_result.get('intent'))
         rule_confidence = _normalize_confidence(rule_result.get('confidence'), default=0.0)
@@ -222,8 +225,33 @@ class HybridIntentClassifier:
             'confidence': round(rule_confidence, 2),
             'source': 'hybrid_rule',
         }
+        use_llm = self._should_use_llm(user_prompt, rule_confidence, confidence_gap)
+        return normalized_rule_result, rule_intent, rule_confidence, use_llm
+
+    def _merge(self, normalized_rule_result: IntentResult, rule_intent: Intent, rule_confidence: float,
+               llm_result: IntentResult) -> IntentResult:
+        llm_intent = _normalize_intent_value(llm_result.get('intent'))
+        llm_confidence = _normalize_confidence(llm_result.get('confidence'), default=0.5)
+        llm_source = str(llm_result.get('source') or 'llm')
+
+        if llm_intent == Intent.GENERAL and rule_intent != Intent.GENERAL:
+            return normalized_rule_result
+
+        if llm_confidence < self.llm_min_confidence and rule_confidence >= llm_confidence:
+            return normalized_rule_result
+
+        if llm_intent != rule_intent and (llm_confidence + 0.05) < rule_confidence:
+            return normalized_rule_result
+
+        return {
+            'intent': llm_intent.value,
+            'confidence': round(max(llm_confidence, rule_confidence), 2),
+            'source': f'hybrid_{llm_source}',
+        }
 
-        if not self._should_use_llm(user_prompt, rule_confidence, confidence_gap):
+    def classify(self, user_prompt: str) -> IntentResult:
+        normalized_rule_result, rule_intent, rule_confidence, use_llm = self._rule_stage(user_prompt)
+        if not use_llm:
             return normalized_rule_result
 
         llm_classifier = self._get_llm_classifier()
@@ -241,21 +269,43 @@ class HybridIntentClassifier:
                 'source': 'hybrid_rule_fallback',
             }
 
-        llm_intent = _normalize_intent_value(llm_result.get('intent'))
-        llm_confidence = _normalize_confidence(llm_result.get('confidence'), default=0.5)
-        llm_source = str(llm_result.get('source') or 'llm')
+        return self._merge(normalized_rule_result, rule_intent, rule_confidence, llm_result)
 
-        if llm_intent == Intent.GENERAL and rule_intent != Intent.GENERAL:
+    async def classify_async(self, user_prompt: str, deadline_sec: Optional[float] = None) -> IntentResult:
+        """
+        Awaitable :meth:`classify`. The LLM fallback is awaited on the caller's
+        loop and bounded by ``deadline_sec`` (``INTENT_CLASSIFIER_DEADLINE_SEC``);
+        past it the rule-based result is returned.
+        """
+        normalized_rule_result, rule_intent, rule_confidence, use_llm = self._rule_stage(user_prompt)
+        if not use_llm:
             return normalized_rule_result
 
-        if llm_confidence < self.llm_min_confidence and rule_confidence >= llm_confidence:
-            return normalized_rule_result
+        llm_classifier = self._get_llm_classifier()
+        if llm_classifier is None:
+            return {
+                **normalized_rule_result,
+                'source': 'hybrid_rule_fallback',
+            }
 
-        if llm_intent != rule_intent and (llm_confidence + 0.05) < rule_confidence:
-            return normalized_rule_result
+        if deadline_sec is None:
+            deadline_sec = self.deadline_sec
+        if hasattr(llm_classifier, 'classify_async'):
+            pending = llm_classifier.classify_async(user_prompt)
+        else:
+            pending = asyncio.to_thread(llm_classifier.classify, user_prompt)
 
-        return {
-            'intent': llm_intent.value,
-            'confidence': round(max(llm_confidence, rule_confidence), 2),
-            'source': f'hybrid_{llm_source}',
-        }
+        try:
+            llm_result = await asyncio.wait_for(pending, timeout=deadline_sec)
+        except asyncio.TimeoutError:
+            return {
+                **normalized_rule_result,
+                'source': 'hybrid_rule_timeout',
+            }
+        except Exception:
+            return {
+                **normalized_rule_result,
+                'source': 'hybrid_rule_fallback',
+            }
+
+        return self._merge(normalized_rule_result, rule_intent, rule_confidence, llm_result)
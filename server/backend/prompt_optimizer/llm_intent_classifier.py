@@ -2,21 +2,69 @@ import asyncio
 import hashlib
 import json
 import os
+import threading
+import time
 import concurrent.futures
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from typing import Optional, Tuple
 from .intent_classifier import Intent, IntentResult
 from ..adapters.dispatcher import AdapterDispatcher
 from ..adapters.base import AdapterConfig
+from utils.concurrency import env_float, env_int
+
+
+class IntentCache:
+    """
+    Bounded LRU cache with a TTL for LLM intent results.
+    Only real classifications are stored, so a provider outage is not remembered.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_sec: Optional[float] = None):
+        self.max_entries = env_int("INTENT_LLM_CACHE_MAX_ENTRIES", 2048, minimum=1) if max_entries is None else max_entries
+        self.ttl_sec = env_float("INTENT_LLM_CACHE_TTL_SEC", 3600.0, minimum=1.0) if ttl_sec is None else ttl_sec
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, IntentResult]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[IntentResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: str, result: IntentResult) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_sec, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Process-wide cache for LLM intent results to prevent redundant calls
+LLM_CACHE = IntentCache()
+
+_FALLBACK_SOURCES = {"llm_error_fallback", "llm_parse_error"}
 
-# Global cache for LLM intent results to prevent redundant calls
-LLM_CACHE: Dict[str, IntentResult] = {}
 
 class LLMIntentClassifier:
     """
     LLM-based intent classifier using Gemma/Gemini.
-    Includes an in-memory caching layer and a safe sync wrapper for async adapter calls.
+    Async-first (:meth:`classify_async`) with a bounded TTL cache; :meth:`classify`
+    is a sync wrapper for callers outside an event loop.
     """
-    
+
     def __init__(self):
         # Initialize dispatcher; it automatically reads API keys from environment variables
         self.dispatcher = AdapterDispatcher()
@@ -28,53 +76,58 @@ class LLMIntentClassifier:
         """Returns a stable SHA-256 hash of the trimmed prompt."""
         return hashlib.sha256(prompt.strip().encode()).hexdigest()
 
-    def classify(self, user_prompt: str) -> IntentResult:
+    async def classify_async(self, user_prompt: str) -> IntentResult:
         """
         Classify intent using LLM with caching and robust error handling.
-        Returns a structured IntentResult.
+        Returns a structured IntentResult; never raises except on cancellation.
         """
         # 1. Check Cache
         cache_key = self._get_cache_key(user_prompt)
-        if cache_key in LLM_CACHE:
-            return LLM_CACHE[cache_key]
+        cached = LLM_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
 
-        # 2. Call LLM with safe sync wrapper
-        result: IntentResult
+        # 2. Call LLM
         try:
-            result = self._call_llm_sync(user_prompt)
-        except Exception as e:
+            result = await asyncio.wait_for(self._call_llm(user_prompt), timeout=self.timeout_sec)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
             # SAFETY REQUIREMENT: Never crash the pipeline
-            result = {
+            return {
                 "intent": "general",
                 "confidence": 0.5,
                 "source": "llm_error_fallback"
             }
-        
+
         # 3. Store in cache and return
-        LLM_CACHE[cache_key] = result
+        if result.get("source") not in _FALLBACK_SOURCES:
+            LLM_CACHE.put(cache_key, result)
         return result
 
-    def _call_llm_sync(self, user_prompt: str) -> IntentResult:
+    def classify(self, user_prompt: str) -> IntentResult:
         """
-        Production-ready sync wrapper for the async GeminiAdapter.
-        Prevents nested event loop issues in Flask/Threading environments.
+        Sync wrapper around :meth:`classify_async`.
+        Inside a running event loop the call is moved to a worker thread; async
+        callers should await :meth:`classify_async` instead.
         """
         try:
-            loop = asyncio.get_event_loop()
+            asyncio.get_running_loop()
         except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        async def _async_classify():
-            # Use 'gemma' alias or 'gemini' (AdapterDispatcher handles both)
-            adapter = self.dispatcher.get("gemini")
-            config = AdapterConfig(
-                model=self.model_name,
-                temperature=0.1,  # Low temperature for deterministic classification
-                max_tokens=64
-            )
-            
-            prompt_template = f"""Classify the intent of the following user request.
+            return asyncio.run(self.classify_async(user_prompt))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self.classify_async(user_prompt)).result(timeout=self.timeout_sec + 1.0)
+
+    async def _call_llm(self, user_prompt: str) -> IntentResult:
+        # Use 'gemma' alias or 'gemini' (AdapterDispatcher handles both)
+        adapter = self.dispatcher.get("gemini")
+        config = AdapterConfig(
+            model=self.model_name,
+            temperature=0.1,  # Low temperature for deterministic classification
+            max_tokens=64
+        )
+
+        prompt_template = f"""Classify the intent of the following user request.
 
 Return ONLY JSON:
 {{
@@ -84,46 +137,36 @@ Return ONLY JSON:
 
 User request:
 {user_prompt}"""
-            
-            response = await asyncio.wait_for(
-                adapter.generate(
-                    messages=[{"role": "user", "content": prompt_template}],
-                    tools=None,
-                    config=config
-                ),
-                timeout=self.timeout_sec,
-            )
-            
-            # Extract and parse JSON
-            try:
-                # Remove markdown formatting if present
-                clean_text = response.text.replace("```json", "").replace("```", "").strip()
-                data = json.loads(clean_text)
-                intent_value = str(data.get("intent", "general")).strip().lower()
-                valid_intents = {
-                    Intent.CODING.value,
-                    Intent.DEBUGGING.value,
-                    Intent.EXPLANATION.value,
-                    Intent.REFACTOR.value,
-                    Intent.GENERAL.value,
-                }
-                if intent_value not in valid_intents:
-                    intent_value = Intent.GENERAL.value
-                return {
-                    "intent": intent_value,
-                    "confidence": float(data.get("confidence", 0.85)),
-                    "source": "llm"
-                }
-            except Exception:
-                return {
-                    "intent": "general",
-                    "confidence": 0.5,
-                    "source": "llm_parse_error"
-                }
-
-        # Safe execution logic
-        if loop.is_running():
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                return pool.submit(lambda: asyncio.run(_async_classify())).result(timeout=self.timeout_sec + 1.0)
-        else:
-            return loop.run_until_complete(_async_classify())
+
+        response = await adapter.generate(
+            messages=[{"role": "user", "content": prompt_template}],
+            tools=None,
+            config=config
+        )
+
+        # Extract and parse JSON
+        try:
+            # Remove markdown formatting if present
+            clean_text = response.text.replace("```json", "").replace("```", "").strip()
+            data = json.loads(clean_text)
+            intent_value = str(data.get("intent", "general")).strip().lower()
+            valid_intents = {
+                Intent.CODING.value,
+                Intent.DEBUGGING.value,
+                Intent.EXPLANATION.value,
+                Intent.REFACTOR.value,
+                Intent.GENERAL.value,
+            }
+            if intent_value not in valid_intents:
+                intent_value = Intent.GENERAL.value
+            return {
+                "intent": intent_value,
+                "confidence": float(data.get("confidence", 0.85)),
+                "source": "llm"
+            }
+        except Exception:
+            return {
+                "intent": "general",
+                "confidence": 0.5,
+                "source": "llm_parse_error"
+            }
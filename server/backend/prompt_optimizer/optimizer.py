@@ -48,3 +48,12 @@ def optimize_prompt(user_prompt: str, model_name: str = "") -> Dict[str, Any]:
     routing = orch.route_request(user_prompt)
     optimizer = PromptOptimizer()
     return optimizer.execute(user_prompt, routing, model_name=model_name)
+
+
+async def optimize_prompt_async(user_prompt: str, model_name: str = "") -> Dict[str, Any]:
+    """Awaitable :func:`optimize_prompt`; intent classification never blocks the event loop."""
+    from .orchestrator import get_orchestrator
+    orch = get_orchestrator()
+    routing = await orch.route_request_async(user_prompt)
+    optimizer = PromptOptimizer()
+    return optimizer.execute(user_prompt, routing, model_name=model_name)
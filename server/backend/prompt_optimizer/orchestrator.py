@@ -37,7 +37,19 @@ class PromptOptimizationOrchestrator:
         from .intent_classifier import HybridIntentClassifier
         classifier = HybridIntentClassifier()
         res = classifier.classify(user_prompt)
-        
+        return self._decision(res)
+
+    async def route_request_async(self, user_prompt: str) -> RoutingDecision:
+        """
+        Awaitable :meth:`route_request` for event-loop callers. A slow LLM
+        fallback is cut off at the classifier deadline and the rule result used.
+        """
+        from .intent_classifier import HybridIntentClassifier
+        classifier = HybridIntentClassifier()
+        res = await classifier.classify_async(user_prompt)
+        return self._decision(res)
+
+    def _decision(self, res: Dict[str, Any]) -> RoutingDecision:
         # Determine strict version based on intent
         # (Version mapping is deterministic)
         version_map = {
@@ -41,9 +41,9 @@ from .sse import (
     tool_result_event,
     advisory_event,
 )
-from ..prompt_optimizer import optimize_prompt
+from ..prompt_optimizer import optimize_prompt_async
 from .limits import ContextHealthAnalyzer
-from utils.concurrency import env_float, env_int
+from utils.provider_governor import get_provider_governor, queue_timeout
 from ..adapters.resolver import ProviderResolver
 
 
@@ -90,12 +90,10 @@ class AgentRuntime:
         self._compressor = ContextCompressor()
         self._seq_counter = 0  # <--- NEW: Track event sequence for frontend ordering
         self._cooldowns: Dict[int, float] = {} # conversation_id -> last_advisory_ts
-        self._provider_semaphores = {
-            "gemini": asyncio.Semaphore(env_int("GEMINI_MAX_CONCURRENCY", 4, minimum=1, maximum=64)),
-            "openai": asyncio.Semaphore(env_int("OPENAI_MAX_CONCURRENCY", 8, minimum=1, maximum=64)),
-            "anthropic": asyncio.Semaphore(env_int("ANTHROPIC_MAX_CONCURRENCY", 4, minimum=1, maximum=64)),
-        }
-        self._model_queue_timeout = env_float("MODEL_QUEUE_TIMEOUT_SEC", 8.0, minimum=0.1, maximum=120.0)
+        # Provider slots are leased from the cross-worker governor so the agent
+        # path and the legacy /api/ask path share one limit per host.
+        self._provider_governor = get_provider_governor()
+        self._model_queue_timeout = queue_timeout()
 
     # ── Public API ────────────────────────────────────────────────────────
 
@@ -108,22 +106,20 @@ class AgentRuntime:
         run_id = request.get("run_id") or f"run_{uuid.uuid4().hex[:8]}"
         self._seq_counter = 0 # Reset for new stream
 
-        # ── Step 0: Optimize Prompt ───────────────────────────────────────
+        # ── Step 0: Optimize Prompt + assemble context (concurrently) ─────
         try:
-            self._run_prompt_optimization(request)
+            ctx = await self._prepare(request, run_id=run_id)
         except ValueError as e:
             yield error_event(str(e), code="VALIDATION_ERROR", seq=self._next_seq())
             return
 
-        ctx = await self._build_context(request, run_id=run_id)
-
         provider = ctx.provider
         user_id = request.get("user_id")
         
         # ── Step 0.5: Resolve User Key ────────────────────────────────────
         override_key = None
         if user_id:
-            override_key = ProviderResolver.get_user_key(user_id, provider)
+            override_key = await ProviderResolver.get_user_key_async(user_id, provider)
             if override_key:
                 print(f"[AgentRuntime] Using user-owned API key for provider: {provider}")
         model = ctx.model
@@ -154,7 +150,7 @@ class AgentRuntime:
             self.registry,
             self._compressor,
             provider=provider,
-            provider_semaphores=self._provider_semaphores,
+            provider_governor=self._provider_governor,
             model_queue_timeout=self._model_queue_timeout,
         )
 
@@ -219,19 +215,18 @@ class AgentRuntime:
         """
         run_id = request.get("run_id") or f"run_{uuid.uuid4().hex[:8]}"
         
-        # ── Step 0: Optimize Prompt ───────────────────────────────────────
+        # ── Step 0: Optimize Prompt + assemble context (concurrently) ─────
         try:
-            self._run_prompt_optimization(request)
+            ctx = await self._prepare(request, run_id=run_id)
         except ValueError as e:
             return AgentResult(text="", error=str(e), finish_reason="error")
 
-        ctx = await self._build_context(request, run_id=run_id)
         provider = ctx.provider
         user_id = request.get("user_id")
 
         override_key = None
         if user_id:
-            override_key = ProviderResolver.get_user_key(user_id, provider)
+            override_key = await ProviderResolver.get_user_key_async(user_id, provider)
 
         try:
             adapter = self._dispatcher.get(provider, override_key=override_key)
@@ -243,7 +238,7 @@ class AgentRuntime:
             self.registry,
             self._compressor,
             provider=ctx.provider,
-            provider_semaphores=self._provider_semaphores,
+            provider_governor=self._provider_governor,
             model_queue_timeout=self._model_queue_timeout,
         )
 
@@ -309,12 +304,33 @@ class AgentRuntime:
     def available_providers(self) -> Dict[str, bool]:
         return self._dispatcher.available_providers()
 
-    def _run_prompt_optimization(self, request: Dict[str, Any]) -> None:
+    async def _prepare(self, request: Dict[str, Any], run_id: str):
+        """
+        Prompt optimization (intent classification) and context assembly run
+        side by side; neither waits for the other.
+
+        Context is assembled from the original question (RAG / memory lookups
+        do not need the optimizer's template), then the optimized prompt is
+        placed on the context. A ValueError from the optimizer propagates.
+        """
+        question = request.get("question") or ""
+        optimization = asyncio.ensure_future(self._run_prompt_optimization(request))
+        try:
+            ctx = await self._build_context(request, run_id=run_id, question=question)
+        except BaseException:
+            optimization.cancel()
+            raise
+        await optimization
+        ctx.question = request.get("question") or question
+        return ctx
+
+    async def _run_prompt_optimization(self, request: Dict[str, Any]) -> None:
         """
         Runs the Prompt Optimizer on the request question.
         
         Failure of the optimizer (other than ValueError) will fall back 
-        to the original question to avoid crashing the runtime.
+        to the original question to avoid crashing the runtime. A slow LLM
+        intent fallback is bounded by the classifier deadline.
         """
         # 1. Prevent double optimization
         if request.get("optimized"):
@@ -326,7 +342,7 @@ class AgentRuntime:
         try:
             # 2. Run optimization
             model_name = request.get("model") or ""
-            result = optimize_prompt(question, model_name=model_name)
+            result = await optimize_prompt_async(question, model_name=model_name)
             
             # 3. Store result
             request["question"] = result["optimized_prompt"]
@@ -345,7 +361,7 @@ class AgentRuntime:
 
     # ── Internal helpers ──────────────────────────────────────────────────
 
-    async def _build_context(self, request: Dict[str, Any], run_id: str):
+    async def _build_context(self, request: Dict[str, Any], run_id: str, question: Optional[str] = None):
         """Delegate context assembly to ContextAssembler."""
         model = request.get("model") or "gpt-4o"
         provider = request.get("provider") or self._dispatcher.infer_provider(model)
@@ -355,7 +371,7 @@ class AgentRuntime:
             user_id=request.get("user_id"),
             conversation_id=request.get("conversation_id"),
             project_id=request.get("project_id"),
-            question=request.get("question") or "",
+            question=question if question is not None else (request.get("question") or ""),
             code=request.get("code") or "",
             provider=provider,
             model=model,
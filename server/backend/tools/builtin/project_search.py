@@ -6,9 +6,46 @@ Delegates to the embedding index built by the existing RAG layer in app.py.
 """
 from __future__ import annotations
 
+import asyncio
+import math
+import re
 from typing import Any, Dict
 
 from ..registry import Tool
+from .workspace_files import run_project_op
+
+
+def _lexical_hits(project, tokens, limit: int) -> Dict[str, Any]:
+    """Token-count ranking over the project's files (runs in a worker thread)."""
+    from models import ProjectFile
+    files = project.files.order_by(ProjectFile.name).all()
+
+    ranked = []
+    for pf in files:
+        path_lc = (pf.name or "").lower()
+        content = pf.content or ""
+        content_lc = content.lower()
+        score = 0.0
+        for tok in tokens:
+            score += 4.0 if tok in path_lc else 0.0
+            score += min(8.0, float(content_lc.count(tok)))
+        if score == 0:
+            continue
+        first_idx = min(
+            [content_lc.find(t) for t in tokens if content_lc.find(t) >= 0] or [-1]
+        )
+        excerpt = ""
+        if first_idx >= 0:
+            start = max(0, first_idx - 120)
+            excerpt = content[start: first_idx + 220]
+        ranked.append({
+            "path": pf.name,
+            "score": round(score / max(1.0, math.log(len(content or " ") + 10, 10)), 4),
+            "excerpt": excerpt[:800],
+        })
+
+    ranked.sort(key=lambda h: (-h["score"], h["path"]))
+    return {"ok": True, "hits": ranked[:limit]}
 
 
 async def _execute(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
@@ -29,7 +66,8 @@ async def _execute(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
 
     if search_cb is not None:
         try:
-            result = search_cb(project, query, top_k=limit)
+            # Embedding search queries the DB and may call the embedding API.
+            result = await asyncio.to_thread(search_cb, project, query, top_k=limit)
             hits = (result or {}).get("hits") or []
             if hits:
                 return {
@@ -51,49 +89,16 @@ async def _execute(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
             pass  # Fall through to lexical
 
     # Lexical fallback
-    import re
-    import math
-
     tokens = [t for t in re.findall(r"[A-Za-z0-9_./-]+", query.lower()) if len(t) > 1]
     if not tokens:
         tokens = [query.lower()]
 
-    # Attempt to read from project files via ORM
-    try:
-        files = list(project.files.order_by(project.files.property.mapper.class_.name).all())
-    except Exception:
-        files = []
-
-    ranked = []
-    for pf in files:
-        path_lc = (pf.name or "").lower()
-        content = pf.content or ""
-        content_lc = content.lower()
-        score = 0.0
-        for tok in tokens:
-            score += 4.0 if tok in path_lc else 0.0
-            score += min(8.0, float(content_lc.count(tok)))
-        if score == 0:
-            continue
-        first_idx = min(
-            [content_lc.find(t) for t in tokens if content_lc.find(t) >= 0] or [-1]
-        )
-        excerpt = ""
-        if first_idx >= 0:
-            start = max(0, first_idx - 120)
-            excerpt = content[start: first_idx + 220]
-        ranked.append({
-            "path": pf.name,
-            "score": round(score / max(1.0, math.log(len(content or " ") + 10, 10)), 4),
-            "excerpt": excerpt[:800],
-        })
-
-    ranked.sort(key=lambda h: (-h["score"], h["path"]))
+    lexical = await run_project_op(ctx, _lexical_hits, tokens, limit)
     return {
         "ok": True,
         "scope": "project",
         "query": query,
-        "hits": ranked[:limit],
+        "hits": lexical.get("hits") or [],
         "search_mode": "lexical",
     }
 
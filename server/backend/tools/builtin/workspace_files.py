@@ -7,9 +7,14 @@ implemented as pluggable Tool objects for the new registry.
 The tools operate on two sources (priority order):
   1. project  — SQLAlchemy ORM (persisted to DB)
   2. workspace_files — in-memory snapshot (client-provided, not persisted)
+
+Project-scope queries, commits and cache-invalidation callbacks block, and the
+Flask bridge runs every agent on one shared event loop, so that work runs in a
+worker thread (:func:`run_project_op`) instead of on the loop.
 """
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import os
 import re
@@ -31,6 +36,34 @@ def _get_project(ctx: Any):
     return getattr(ctx, "project", None)
 
 
+async def run_project_op(ctx: Any, fn, *args):
+    """Run ``fn(project, *args)`` in a worker thread with its own app context.
+
+    ``ctx.project`` may be an id (bridge requests) or an ORM row; either way the
+    project is re-loaded in the worker's session. Errors come back as an
+    ``{"ok": False}`` dict.
+    """
+    ref = _get_project(ctx)
+    project_id = ref if isinstance(ref, (int, str)) else getattr(ref, "id", None)
+
+    def _call():
+        # Import lazily to avoid circular imports at module load time.
+        from app import app as flask_app
+        from models import Project, db
+
+        with flask_app.app_context():
+            try:
+                project = db.session.get(Project, int(project_id))
+                if project is None:
+                    return {"ok": False, "error": f"Project not found: {project_id}"}
+                return fn(project, *args)
+            except Exception as exc:
+                db.session.rollback()
+                return {"ok": False, "error": str(exc)}
+
+    return await asyncio.to_thread(_call)
+
+
 def _get_ws(ctx: Any) -> Dict[str, Any]:
     return getattr(ctx, "workspace_files", {}) or {}
 
@@ -174,29 +207,30 @@ def _clip(text: str) -> str:
 
 # ── list_files ────────────────────────────────────────────────────────────────
 
+def _list_project_files(project, limit: int) -> Dict[str, Any]:
+    from models import ProjectFile
+    files = project.files.order_by(ProjectFile.name).all()
+    payload = [
+        {
+            "path": _norm(f.name),
+            "language": f.language or "plaintext",
+            "size": len(f.content or ""),
+        }
+        for f in files[:limit]
+    ]
+    return {
+        "ok": True, "scope": "project",
+        "project_id": project.id, "project_name": project.name,
+        "count": len(payload), "files": payload,
+    }
+
+
 async def _list_files(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
     limit = max(1, min(1000, int(args.get("limit", 200) or 200)))
     project = _get_project(ctx)
 
     if project is not None:
-        try:
-            from models import ProjectFile
-            files = project.files.order_by(ProjectFile.name).all()
-            payload = [
-                {
-                    "path": _norm(f.name),
-                    "language": f.language or "plaintext",
-                    "size": len(f.content or ""),
-                }
-                for f in files[:limit]
-            ]
-            return {
-                "ok": True, "scope": "project",
-                "project_id": project.id, "project_name": project.name,
-                "count": len(payload), "files": payload,
-            }
-        except Exception as exc:
-            return {"ok": False, "error": str(exc)}
+        return await run_project_op(ctx, _list_project_files, limit)
 
     ws = _get_ws(ctx)
     files = [
@@ -208,6 +242,13 @@ async def _list_files(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
 
 # ── read_file ─────────────────────────────────────────────────────────────────
 
+def _load_project_file(project, path: str):
+    pf = _find_project_file(project, path)
+    if not pf:
+        return {"ok": False, "error": f"File not found: {path}"}
+    return _norm(pf.name), pf.language or "plaintext", pf.content or ""
+
+
 async def _read_file(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
     path = _norm(args.get("path") or "")
     if not path:
@@ -272,11 +313,11 @@ async def _read_file(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
 
     project = _get_project(ctx)
     if project is not None:
-        pf = _find_project_file(project, path)
-        if not pf:
-            return {"ok": False, "error": f"File not found: {path}"}
-        content = pf.content or ""
-        return _cached_response("project", _norm(pf.name), _norm(pf.name), pf.language or "plaintext", content)
+        found = await run_project_op(ctx, _load_project_file, path)
+        if isinstance(found, dict):
+            return found
+        name, language, content = found
+        return _cached_response("project", name, name, language, content)
 
     ws = _get_ws(ctx)
     norm_lower = path.lower()
@@ -310,6 +351,61 @@ def _generate_render_url(path: str) -> str | None:
     return f"{base_url.rstrip('/')}/{_norm(path)}"
 
 
+def _write_project_file(project, path, content, patch_source, language, mode, invalidate) -> Dict[str, Any]:
+    from models import ProjectFile, db
+    pf = _find_project_file(project, path)
+    created = pf is None
+    base_content = pf.content if pf is not None else ""
+    if mode == "patch":
+        next_content, patch_error = _apply_unified_patch(base_content or "", patch_source)
+        if patch_error:
+            return {"ok": False, "error": patch_error}
+        if next_content is None:
+            return {"ok": False, "error": "patch application failed"}
+        if created:
+            pf = ProjectFile(project_id=project.id, name=path, content=next_content, language=language)
+            db.session.add(pf)
+        else:
+            pf.content = next_content
+            pf.name = path
+            if language:
+                pf.language = language
+        content = next_content
+    elif created:
+        pf = ProjectFile(project_id=project.id, name=path, content=content, language=language)
+        db.session.add(pf)
+    else:
+        base = pf.content or ""
+        if mode == "append":
+            pf.content = base + content
+        elif mode == "prepend":
+            pf.content = content + base
+        else:
+            pf.content = content
+        pf.name = path
+        if language:
+            pf.language = language
+
+    if created and mode in {"append", "prepend"}:
+        # For new files, append/prepend are equivalent to replace.
+        pf.content = content
+
+    db.session.commit()
+
+    # Invalidate embedding cache if callback present
+    if callable(invalidate):
+        try: invalidate(project.id, pf.id)
+        except Exception: pass
+
+    return {
+        "ok": True, "scope": "project",
+        "path": _norm(pf.name), "language": pf.language,
+        "size": len(pf.content or ""), "created": created, "persisted": True, "mode": mode,
+        "patched": mode == "patch",
+        "_content": content,
+    }
+
+
 async def _write_file(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
     path = _norm(args.get("path") or "")
     content = str(args.get("content") or "").replace("\x00", "")
@@ -326,72 +422,25 @@ async def _write_file(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
 
     project = _get_project(ctx)
     if project is not None:
-        try:
-            from models import ProjectFile, db
-            pf = _find_project_file(project, path)
-            created = pf is None
-            base_content = pf.content if pf is not None else ""
-            if mode == "patch":
-                next_content, patch_error = _apply_unified_patch(base_content or "", patch_source)
-                if patch_error:
-                    return {"ok": False, "error": patch_error}
-                if next_content is None:
-                    return {"ok": False, "error": "patch application failed"}
-                if created:
-                    pf = ProjectFile(project_id=project.id, name=path, content=next_content, language=language)
-                    db.session.add(pf)
-                else:
-                    pf.content = next_content
-                    pf.name = path
-                    if language:
-                        pf.language = language
-                content = next_content
-            elif created:
-                pf = ProjectFile(project_id=project.id, name=path, content=content, language=language)
-                db.session.add(pf)
-            else:
-                base = pf.content or ""
-                if mode == "append":
-                    pf.content = base + content
-                elif mode == "prepend":
-                    pf.content = content + base
-                else:
-                    pf.content = content
-                pf.name = path
-                if language:
-                    pf.language = language
-
-            if created and mode in {"append", "prepend"}:
-                # For new files, append/prepend are equivalent to replace.
-                pf.content = content
-
-            db.session.commit()
-            _invalidate_read_cache(ctx, path)
-
-            # Invalidate embedding cache if callback present
-            inv = getattr(ctx, "invalidate_project_cache", None)
-            if callable(inv):
-                try: inv(project.id)
-                except Exception: pass
-
-            _register_change(
-                ctx,
-                "create" if created else "update",
-                path,
-                persisted=True,
-                content=content,
-                language=pf.language or language,
-                render_url=render_url,
-            )
-            return {
-                "ok": True, "scope": "project",
-                "path": _norm(pf.name), "language": pf.language,
-                "size": len(pf.content or ""), "created": created, "persisted": True, "mode": mode,
-                "patched": mode == "patch",
-                "render_url": render_url,
-            }
-        except Exception as exc:
-            return {"ok": False, "error": str(exc)}
+        result = await run_project_op(
+            ctx, _write_project_file, path, content, patch_source, language, mode,
+            getattr(ctx, "invalidate_project_cache", None),
+        )
+        if not result.get("ok"):
+            return result
+        written = result.pop("_content")
+        _invalidate_read_cache(ctx, path)
+        _register_change(
+            ctx,
+            "create" if result["created"] else "update",
+            path,
+            persisted=True,
+            content=written,
+            language=result["language"] or language,
+            render_url=render_url,
+        )
+        result["render_url"] = render_url
+        return result
 
     ws = _get_ws(ctx)
     if ws is None:
@@ -446,6 +495,20 @@ async def _write_file(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
 
 # ── delete_file ───────────────────────────────────────────────────────────────
 
+def _delete_project_file(project, path: str, invalidate) -> Dict[str, Any]:
+    from models import db
+    pf = _find_project_file(project, path)
+    if not pf:
+        return {"ok": False, "error": f"File not found: {path}"}
+    file_id = pf.id
+    db.session.delete(pf)
+    db.session.commit()
+    if callable(invalidate):
+        try: invalidate(project.id, file_id)
+        except Exception: pass
+    return {"ok": True, "scope": "project", "path": path, "persisted": True}
+
+
 async def _delete_file(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
     path = _norm(args.get("path") or "")
     if not path:
@@ -453,22 +516,11 @@ async def _delete_file(args: Dict[str, Any], ctx: Any) -> Dict[str, Any]:
 
     project = _get_project(ctx)
     if project is not None:
-        try:
-            from models import ProjectFile, db
-            pf = _find_project_file(project, path)
-            if not pf:
-                return {"ok": False, "error": f"File not found: {path}"}
-            db.session.delete(pf)
-            db.session.commit()
+        result = await run_project_op(ctx, _delete_project_file, path, getattr(ctx, "invalidate_project_cache", None))
+        if result.get("ok"):
             _invalidate_read_cache(ctx, path)
-            inv = getattr(ctx, "invalidate_project_cache", None)
-            if callable(inv):
-                try: inv(project.id)
-                except Exception: pass
             _register_change(ctx, "delete", path, persisted=True)
-            return {"ok": True, "scope": "project", "path": path, "persisted": True}
-        except Exception as exc:
-            return {"ok": False, "error": str(exc)}
+        return result
 
     ws = _get_ws(ctx)
     norm_lower = path.lower()
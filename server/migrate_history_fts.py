@@ -0,0 +1,21 @@
+import sys
+
+from app import app, db
+from utils.history_fts import migrate_postgres_history_fts
+
+
+def migrate(batch_size=1000):
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("Nothing to do: the SQLite full-text index is created at startup.")
+            return
+        try:
+            print("Running migration: history.search_vector (column, trigger, backfill, GIN index)...")
+            rows = migrate_postgres_history_fts(db.engine, batch_size=batch_size)
+            print(f"Migration successful! {rows} rows backfilled.")
+        except Exception as e:
+            print(f"Migration failed: {e}")
+
+
+if __name__ == "__main__":
+    migrate(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
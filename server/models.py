@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timezone
+import json
 
 db = SQLAlchemy()
 
@@ -194,6 +195,25 @@ class MemoryItem(db.Model):
     source_conversation = db.relationship('Conversation', backref=db.backref('memory_items', lazy='dynamic', cascade='all, delete'))
 
 
+class MemoryEmbedding(db.Model):
+    """Write-time embedding of a MemoryItem or ConversationSummary row."""
+    __tablename__ = 'memory_embedding'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    source_type = db.Column(db.String(16), nullable=False)  # 'memory' | 'summary'
+    source_id = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)  # sha256 of the normalized text
+    embedding_model = db.Column(db.String(100), nullable=False)
+    dim = db.Column(db.Integer, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)  # float32 bytes
+    updated_at = db.Column(db.DateTime, default=_utcnow, onupdate=_utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('source_type', 'source_id', name='_memory_embedding_source_uc'),
+    )
+
+
 class MemoryNode(db.Model, SoftDeleteMixin):
     id = db.Column(db.Integer, primary_key=True)
     node_uid = db.Column(db.String(160), unique=True, nullable=False, index=True)
@@ -256,9 +276,36 @@ class History(db.Model, SoftDeleteMixin):
     persona = db.Column(db.String(100)) # Active persona during this turn
     likes = db.Column(db.Integer, default=0)
     image_path = db.Column(db.String(255), nullable=True)
+    # ai_response bir karşılaştırma JSON'u mu? NULL = eski kayıt, bilinmiyor.
+    is_comparison = db.Column(db.Boolean, nullable=True)
 
     conversation = db.relationship('Conversation', backref=db.backref('history_items', lazy='dynamic', cascade="all, delete"))
 
+    @db.validates('ai_response')
+    def _flag_comparison(self, key, value):
+        self.is_comparison = response_is_comparison(value)
+        return value
+
+
+def response_is_comparison(ai_response) -> bool:
+    if not ai_response or not ai_response.lstrip().startswith('{') or 'isComparison' not in ai_response:
+        return False
+    try:
+        parsed = json.loads(ai_response)
+    except ValueError:
+        return False
+    return isinstance(parsed, dict) and bool(parsed.get('isComparison'))
+
+
+class HistoryMemoryCache(db.Model):
+    """extract_memory_candidates() output for one History row, computed once per rules version."""
+    __tablename__ = 'history_memory_cache'
+
+    history_id = db.Column(db.Integer, db.ForeignKey('history.id'), primary_key=True)
+    rules_version = db.Column(db.Integer, nullable=False, default=1)
+    candidates_json = db.Column(db.Text, nullable=False, default='[]')
+    created_at = db.Column(db.DateTime, default=_utcnow)
+
 
 class Answer(db.Model, SoftDeleteMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -435,6 +482,27 @@ class ProjectFile(db.Model):
     updated_at = db.Column(db.DateTime, default=_utcnow, onupdate=_utcnow)
 
 
+class ProjectChunkEmbedding(db.Model):
+    """Persistent embedding of a single project file chunk (shared by all workers)."""
+    __tablename__ = 'project_chunk_embedding'
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False, index=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('project_file.id'), nullable=False, index=True)
+    content_hash = db.Column(db.String(64), nullable=False)  # sha256 of the chunked file content
+    chunk_index = db.Column(db.Integer, nullable=False)
+    embedding_model = db.Column(db.String(100), nullable=False)
+    dim = db.Column(db.Integer, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)  # float32 bytes
+    created_at = db.Column(db.DateTime, default=_utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('file_id', 'content_hash', 'chunk_index', 'embedding_model', name='_project_chunk_embedding_uc'),
+    )
+
+    file = db.relationship('ProjectFile', backref=db.backref('chunk_embeddings', lazy='dynamic', cascade='all, delete-orphan'))
+
+
 # ============================================================
 # 💰 TOKEN EKONOMİSİ MODELLERİ (Hafta 2 — SaaS Dönüşüm)
 # ============================================================
@@ -471,6 +539,26 @@ class TokenBalance(db.Model):
         return f'<TokenBalance user_id={self.user_id} balance={self.balance} weekly_used={self.weekly_used}/{self.weekly_limit} renewal={self.monthly_renewal_enabled}>'
 
 
+class UsageCounter(db.Model):
+    """Plan usage per user and period; rows are only changed with atomic conditional UPDATEs."""
+    __tablename__ = 'usage_counter'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    period = db.Column(db.String(8), nullable=False)       # 'day' | 'month'
+    period_key = db.Column(db.String(10), nullable=False)  # '2026-01-31' | '2026-01'
+    requests = db.Column(db.Integer, default=0, nullable=False)
+    tokens = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=_utcnow, onupdate=_utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'period_key', name='_usage_counter_period_uc'),
+    )
+
+    def __repr__(self):
+        return f'<UsageCounter user_id={self.user_id} {self.period}={self.period_key} requests={self.requests} tokens={self.tokens}>'
+
+
 class TokenTransaction(db.Model):
     """Her token hareketinin değişmez kaydı (audit log)."""
     __tablename__ = 'token_transaction'
@@ -492,6 +580,22 @@ class TokenTransaction(db.Model):
         return f'<TokenTransaction user_id={self.user_id} amount={self.amount} type={self.type}>'
 
 
+class TokenReservation(db.Model):
+    """Tokens held from the balance at request start, settled or refunded once the turn ends."""
+    __tablename__ = 'token_reservation'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    amount = db.Column(db.Integer, nullable=False)
+    model = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='reserved', index=True)  # reserved | settled | refunded
+    created_at = db.Column(db.DateTime, default=_utcnow, index=True)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<TokenReservation user_id={self.user_id} amount={self.amount} status={self.status}>'
+
+
 class TokenPackage(db.Model):
     """Admin tarafından yönetilen satılabilir token paketleri."""
     __tablename__ = 'token_package'
@@ -603,3 +707,30 @@ class SecurityAuditLog(db.Model):
     def __repr__(self):
         return f'<SecurityAuditLog user_id={self.user_id} action={self.action} target={self.target_user_id}>'
 
+
+
+class BackgroundJob(db.Model):
+    """Persistent lifecycle/side-work job, claimed by worker threads across all processes."""
+    __tablename__ = 'background_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False, index=True)  # 'module:qualname' of the handler
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON {'args': [...], 'kwargs': {...}}
+    idempotency_key = db.Column(db.String(200), nullable=True, unique=True)
+    key_persistent = db.Column(db.Boolean, nullable=False, default=False)  # False: key is released once the job starts
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_at = db.Column(db.DateTime, nullable=False, default=_utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=_utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    __table_args__ = (
+        db.Index('ix_background_job_status_run_at', 'status', 'run_at'),
+    )
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.id} {self.name} status={self.status} attempts={self.attempts}>'
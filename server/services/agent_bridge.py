@@ -31,15 +31,37 @@ Usage in app.py::
 from __future__ import annotations
 
 import asyncio
+import os
 import queue
 import threading
+import time
 from typing import Any, Callable, Dict, Iterator, List, Optional
 
+from utils.run_state import is_request_cancelled
+
 
 # Lazy import — AgentRuntime is only created once (singleton)
 _runtime = None
 _runtime_lock = threading.Lock()
 
+# One long-lived event loop per worker process. Every bridge request is
+# scheduled onto it, so async HTTP clients (adapter connection pools),
+# provider semaphores and loop-bound caches survive between turns instead
+# of dying with a per-request loop.
+_bridge_loop: Optional[asyncio.AbstractEventLoop] = None
+_bridge_loop_thread: Optional[threading.Thread] = None
+_bridge_loop_pid: Optional[int] = None
+_bridge_loop_lock = threading.Lock()
+
+# Producer → Flask generator hand-off. Blocking puts give up after this many
+# seconds so an abandoned stream can never pin the loop's executor threads.
+_BRIDGE_QUEUE_SIZE = 64
+_BRIDGE_PUT_TIMEOUT = 60
+# The consumer wakes this often to notice cancels during long tool calls, and
+# gives up after the idle timeout like the old single 60 s get().
+_BRIDGE_CANCEL_POLL_SEC = 0.5
+_BRIDGE_IDLE_TIMEOUT_SEC = 60
+
 
 def _get_runtime():
     """Get the central AgentRuntime singleton for Flask bridge calls."""
@@ -68,20 +90,48 @@ def _get_runtime():
             return _runtime
 
 
+def _get_bridge_loop() -> asyncio.AbstractEventLoop:
+    """Return the worker's shared bridge loop, starting its thread on first use."""
+    global _bridge_loop, _bridge_loop_thread, _bridge_loop_pid
+    pid = os.getpid()
+    loop = _bridge_loop
+    if loop is not None and _bridge_loop_pid == pid and loop.is_running():
+        return loop
+
+    with _bridge_loop_lock:
+        loop = _bridge_loop
+        if loop is not None and _bridge_loop_pid == pid and loop.is_running():
+            return loop
+
+        # A loop inherited through fork() has no thread behind it; build a fresh one.
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def _serve():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            try:
+                loop.run_forever()
+            finally:
+                loop.close()
+
+        thread = threading.Thread(target=_serve, name="agent-bridge-loop", daemon=True)
+        thread.start()
+        started.wait()
+
+        _bridge_loop = loop
+        _bridge_loop_thread = thread
+        _bridge_loop_pid = pid
+        return loop
+
+
 def _run_coroutine(coro):
-    """Run an async coroutine from synchronous code."""
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # In a threaded Flask worker we may already be inside an event loop
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
-                future = pool.submit(asyncio.run, coro)
-                return future.result()
-        else:
-            return loop.run_until_complete(coro)
-    except RuntimeError:
-        return asyncio.run(coro)
+    """Run an async coroutine from synchronous code on the shared bridge loop."""
+    loop = _get_bridge_loop()
+    if threading.current_thread() is _bridge_loop_thread:
+        # Called from inside the loop itself — blocking on it would deadlock.
+        raise RuntimeError("_run_coroutine cannot be called from the bridge loop thread")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
 
 
 def build_runtime_request(
@@ -308,12 +358,15 @@ def stream_agent_bridge(
     db_read_callback: Optional[Callable] = None,
     invalidate_project_cache: Optional[Callable] = None,
     workspace_root: Optional[str] = None,
+    request_id: Optional[str] = None,
 ) -> Iterator[str]:
     """
     Streaming bridge: run the agent and yield SSE strings.
 
     Compatible with Flask's Response(stream_with_context(...)).
     Transforms new Agent Mode events into the format expected by the legacy UI.
+    The user's cancel for *request_id* (recorded on any worker) stops the run at
+    the next event or poll tick.
     """
     import json
 
@@ -343,83 +396,100 @@ def stream_agent_bridge(
         workspace_root=workspace_root,
     )
 
-    q = queue.Queue(maxsize=64)
+    if request_id:
+        # The agent loop checks its run_id between steps.
+        req["run_id"] = str(request_id)
+    cancel_user_id = req["user_id"]
 
-    def _producer():
-        # Inner thread has its own event loop and should have its own app context
-        from app import app
-        import json
+    q = queue.Queue(maxsize=_BRIDGE_QUEUE_SIZE)
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        def is_critical(sse_chunk: str) -> bool:
-            # Quick string check for critical event types
-            return any(t in sse_chunk for t in ['"type": "message"', '"type": "reasoning"', '"type": "tool_call"', '"type": "done"', '"type": "error"'])
+    def is_critical(sse_chunk: str) -> bool:
+        # Quick string check for critical event types
+        return any(t in sse_chunk for t in ['"type": "message"', '"type": "reasoning"', '"type": "tool_call"', '"type": "done"', '"type": "error"'])
 
-        async def _consume():
-            try:
-                async for chunk in runtime.stream(req):
-                    try:
-                        q.put_nowait(chunk)
-                    except queue.Full:
-                        if is_critical(chunk):
-                            # Critical events MUST be delivered; offload blocking put to executor
-                            await loop.run_in_executor(None, q.put, chunk)
-                        else:
-                            # Drop non-critical (status/reasoning) events when congested
-                            print(f"[AgentBridge] Backpressure: Dropping non-critical event: {chunk[:60]}...")
-            except Exception as e:
-                print(f"[AgentBridge] Stream producer error: {e}")
-                err_msg = f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-                await loop.run_in_executor(None, q.put, err_msg)
-            finally:
-                await loop.run_in_executor(None, q.put, StopIteration)
+    def _put_blocking(item) -> None:
+        try:
+            q.put(item, timeout=_BRIDGE_PUT_TIMEOUT)
+        except queue.Full:
+            print("[AgentBridge] Consumer gone; dropping event.")
 
+    async def _consume():
+        loop = asyncio.get_running_loop()
         try:
-            loop.run_until_complete(_consume())
+            async for chunk in runtime.stream(req):
+                try:
+                    q.put_nowait(chunk)
+                except queue.Full:
+                    if is_critical(chunk):
+                        # Critical events MUST be delivered; offload blocking put to executor
+                        await loop.run_in_executor(None, _put_blocking, chunk)
+                    else:
+                        # Drop non-critical (status/reasoning) events when congested
+                        print(f"[AgentBridge] Backpressure: Dropping non-critical event: {chunk[:60]}...")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[AgentBridge] Stream producer error: {e}")
+            err_msg = f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            await loop.run_in_executor(None, _put_blocking, err_msg)
         finally:
-            loop.close()
-
-    thread = threading.Thread(target=_producer, daemon=True)
-    thread.start()
+            try:
+                q.put_nowait(StopIteration)
+            except queue.Full:
+                await loop.run_in_executor(None, _put_blocking, StopIteration)
 
-    while True:
-        try:
-            chunk = q.get(timeout=60)
-            if chunk is StopIteration:
-                break
-            
-            # Legacy UI transformation
-            # New runtime yields: data: {"type": "message", "text": "..."}
-            # Legacy UI expects: data: {"chunk": "..."}
-            if chunk.startswith("data: "):
+    future = asyncio.run_coroutine_threadsafe(_consume(), _get_bridge_loop())
+    try:
+        idle_since = time.monotonic()
+        while True:
+            try:
+                if is_request_cancelled(request_id, cancel_user_id):
+                    print(f"[AgentBridge] Request {request_id} cancelled; stopping run.")
+                    break
                 try:
-                    raw_json = chunk[6:].strip()
-                    data = json.loads(raw_json)
-                    etype = data.get("type")
+                    chunk = q.get(timeout=_BRIDGE_CANCEL_POLL_SEC)
+                except queue.Empty:
+                    if time.monotonic() - idle_since >= _BRIDGE_IDLE_TIMEOUT_SEC:
+                        raise
+                    continue
+                idle_since = time.monotonic()
+                if chunk is StopIteration:
+                    break
+            
+                # Legacy UI transformation
+                # New runtime yields: data: {"type": "message", "text": "..."}
+                # Legacy UI expects: data: {"chunk": "..."}
+                if chunk.startswith("data: "):
+                    try:
+                        raw_json = chunk[6:].strip()
+                        data = json.loads(raw_json)
+                        etype = data.get("type")
                     
-                    if etype == "message":
-                        # Map Agent Mode text to legacy 'chunk' key
-                        data["chunk"] = data.get("text", "")
-                        yield f"data: {json.dumps(data)}\n\n"
-                        continue
-                    elif etype == "done":
-                        # Do NOT yield the done event yet.
-                        # app.py will yield the final combined done event after DB save.
-                        # But we yield it as a special internal data packet if necessary, 
-                        # or just rely on the caller parsing it from the yield.
-                        # Actually, since this is a bridge, we can just return it 
-                        # via a specific mechanism or just let the caller parse.
+                        if etype == "message":
+                            # Map Agent Mode text to legacy 'chunk' key
+                            data["chunk"] = data.get("text", "")
+                            yield f"data: {json.dumps(data)}\n\n"
+                            continue
+                        elif etype == "done":
+                            # Do NOT yield the done event yet.
+                            # app.py will yield the final combined done event after DB save.
+                            # But we yield it as a special internal data packet if necessary, 
+                            # or just rely on the caller parsing it from the yield.
+                            # Actually, since this is a bridge, we can just return it 
+                            # via a specific mechanism or just let the caller parse.
+                            pass
+
+                    except Exception:
+                        # If parsing fails, fall back to raw passthrough
                         pass
 
-                except Exception:
-                    # If parsing fails, fall back to raw passthrough
-                    pass
-
-            yield chunk
-        except queue.Empty:
-            break
+                yield chunk
+            except queue.Empty:
+                break
+    finally:
+        # Client disconnected or stream finished: stop the run on the shared loop.
+        if not future.done():
+            future.cancel()
 
 
 class AgentBridgeResult:
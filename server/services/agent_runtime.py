@@ -16,6 +16,7 @@ class AgentAbortException(Exception):
 from models import ProjectFile, db
 from services.latency_tracker import tracker
 from utils.concurrency import env_float, provider_slot
+from utils.run_state import is_request_cancelled
 from utils.timeout_utils import to_gemini_timeout
 
 
@@ -179,7 +180,7 @@ class AgentToolRuntime:
         workspace_root: Optional[str] = None,
         workspace_files: Optional[List[dict]] = None,
         search_project_callback: Optional[Callable[..., Optional[dict]]] = None,
-        invalidate_project_cache: Optional[Callable[[int], None]] = None,
+        invalidate_project_cache: Optional[Callable[[int, Optional[int]], None]] = None,
         max_file_chars: int = DEFAULT_MAX_FILE_CHARS,
     ):
         # We store the ID to avoid detached instance errors in threads
@@ -604,7 +605,7 @@ class AgentToolRuntime:
             db.session.commit()
             if self.invalidate_project_cache:
                 try:
-                    self.invalidate_project_cache(self.project.id)
+                    self.invalidate_project_cache(self.project.id, pf.id)
                 except Exception:
                     pass
             self._register_change(
@@ -671,11 +672,12 @@ class AgentToolRuntime:
             pf = self._find_project_file(path)
             if not pf:
                 return {"ok": False, "error": f"File not found: {path}"}
+            file_id = pf.id
             db.session.delete(pf)
             db.session.commit()
             if self.invalidate_project_cache:
                 try:
-                    self.invalidate_project_cache(self.project.id)
+                    self.invalidate_project_cache(self.project.id, file_id)
                 except Exception:
                     pass
             self._register_change("delete", path, persisted=True, original_content=pf.content)
@@ -1162,6 +1164,7 @@ def _run_openai_agent(
     on_event: Optional[Callable[[dict], None]] = None,
     on_first_llm_success: Optional[Callable[[], None]] = None,
     request_id: Optional[str] = None,
+    user_id: Any = None,
 ) -> AgentRunResult:
     if not client:
         return AgentRunResult(text="Error: OPENAI_API_KEY missing.", tool_capable=False)
@@ -1178,8 +1181,7 @@ def _run_openai_agent(
     for step in range(max_steps):
         # Check if request was cancelled via /v1/cancel
         if request_id:
-            from app import is_request_cancelled
-            if is_request_cancelled(request_id):
+            if is_request_cancelled(request_id, user_id):
                 print(f"[Agent-OpenAI] Request {request_id} ABORTED by user.")
                 raise AgentAbortException("Request cancelled by user")
 
@@ -1206,8 +1208,7 @@ def _run_openai_agent(
         except Exception as e:
             # Check if this was an intentional abort that happened during the call
             if request_id:
-                from app import is_request_cancelled
-                if is_request_cancelled(request_id):
+                if is_request_cancelled(request_id, user_id):
                     raise AgentAbortException("Request cancelled by user during API call")
             print("OPENAI ERROR:", repr(e))
             raise
@@ -1329,6 +1330,7 @@ def _run_anthropic_agent(
     on_event: Optional[Callable[[dict], None]] = None,
     on_first_llm_success: Optional[Callable[[], None]] = None,
     request_id: Optional[str] = None,
+    user_id: Any = None,
 ) -> AgentRunResult:
     if not client:
         return AgentRunResult(text="Error: ANTHROPIC_API_KEY missing.", tool_capable=False)
@@ -1344,8 +1346,7 @@ def _run_anthropic_agent(
     for step in range(max_steps):
         # Check if request was cancelled via /v1/cancel
         if request_id:
-            from app import is_request_cancelled
-            if is_request_cancelled(request_id):
+            if is_request_cancelled(request_id, user_id):
                 print(f"[Agent-Anthropic] Request {request_id} ABORTED by user.")
                 raise AgentAbortException("Request cancelled by user")
 
@@ -1373,8 +1374,7 @@ def _run_anthropic_agent(
                     print(f"[Agent-Anthropic] Callback error: {cb_err}")
         except Exception as e:
             if request_id:
-                from app import is_request_cancelled
-                if is_request_cancelled(request_id):
+                if is_request_cancelled(request_id, user_id):
                     raise AgentAbortException("Request cancelled by user during API call")
             raise
 
@@ -1515,7 +1515,8 @@ def _run_gemini_agent(
     tool_runtime: Optional[AgentToolRuntime],
     on_event: Optional[Callable[[dict], None]] = None,
     on_first_llm_success: Optional[Callable[[], None]] = None,
-    request_id: Optional[str] = None
+    request_id: Optional[str] = None,
+    user_id: Any = None
 ) -> AgentRunResult:
     gemini_types = _get_gemini_types()
     if gemini_types is None:
@@ -1542,8 +1543,7 @@ def _run_gemini_agent(
     for step in range(max_steps):
         # Check if request was cancelled via /v1/cancel
         if request_id:
-            from app import is_request_cancelled
-            if is_request_cancelled(request_id):
+            if is_request_cancelled(request_id, user_id):
                 print(f"[Agent] Request {request_id} ABORTED by user.")
                 raise AgentAbortException("Request cancelled by user")
 
@@ -1568,8 +1568,7 @@ def _run_gemini_agent(
                     print(f"[Agent-Gemini] Callback error: {cb_err}")
         except Exception as e:
             if request_id:
-                from app import is_request_cancelled
-                if is_request_cancelled(request_id):
+                if is_request_cancelled(request_id, user_id):
                     raise AgentAbortException("Request cancelled by user during API call")
             return AgentRunResult(text=f"Gemini API Error: {str(e)}", trace=trace, tool_capable=True)
 
@@ -1715,7 +1714,8 @@ def run_agent_turn(
     gemini_client=None,
     on_event: Optional[Callable[[dict], None]] = None,
     on_first_llm_success: Optional[Callable[[], None]] = None, # <--- NEW
-    request_id: Optional[str] = None
+    request_id: Optional[str] = None,
+    user_id: Any = None
 ) -> AgentRunResult:
     has_tool_access = bool(tool_runtime and tool_runtime.has_tool_access)
     system_prompt = build_agent_system_prompt(
@@ -1739,6 +1739,7 @@ def run_agent_turn(
             on_event=on_event,
             on_first_llm_success=on_first_llm_success,
             request_id=request_id,
+            user_id=user_id,
         )
     if provider_key == "anthropic":
         return _run_anthropic_agent(
@@ -1750,7 +1751,8 @@ def run_agent_turn(
             tool_runtime=tool_runtime,
             on_event=on_event,
             on_first_llm_success=on_first_llm_success,
-            request_id=request_id
+            request_id=request_id,
+            user_id=user_id,
         )
     if provider_key == "gemini":
         return _run_gemini_agent(
@@ -1763,6 +1765,7 @@ def run_agent_turn(
             on_event=on_event,
             on_first_llm_success=on_first_llm_success,
             request_id=request_id,
+            user_id=user_id,
         )
 
     return AgentRunResult(text=f"Unsupported agent provider: {provider_key}", tool_capable=has_tool_access)
@@ -1,55 +1,356 @@
-import threading
-import queue
+import importlib
+import json
 import logging
-from datetime import datetime, timezone
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from flask import current_app
-from models import db, Conversation, History, Answer, SharedSession, ConversationSummary, MemoryNode, Notification, Favorite
+from sqlalchemy.exc import IntegrityError
+from models import (
+    db, BackgroundJob, Conversation, History, Answer, AnswerLike, PostLike, SharedSession,
+    CollaborationReview, CollaborationComment, ConversationSummary, MemoryItem, MemoryEmbedding,
+    MemoryNode, Notification, Favorite, Feedback, FeedbackDetail, HistoryMemoryCache,
+)
+from utils.concurrency import env_float, env_int
 
 logger = logging.getLogger(__name__)
 
-# Simple background task queue for lifecycle orchestration
-_task_queue = queue.Queue()
+# Jobs are rows in `background_job`, so queued cascades/restores survive restarts and
+# any worker process can pick them up. Every process runs JOB_WORKER_THREADS pollers.
+JOB_WORKER_THREADS = env_int('JOB_WORKER_THREADS', 2, minimum=1, maximum=32)
+JOB_POLL_INTERVAL_SEC = env_float('JOB_POLL_INTERVAL_SEC', 1.0, minimum=0.05, maximum=60.0)
+# A 'running' row whose locked_at is older than the lease is reclaimed; the worker
+# running it pushes locked_at forward every JOB_LEASE_SEC / 3 while the handler runs.
+JOB_LEASE_SEC = env_int('JOB_LEASE_SEC', 900, minimum=30)
+JOB_MAX_ATTEMPTS = env_int('JOB_MAX_ATTEMPTS', 3, minimum=1, maximum=20)
+JOB_RETRY_BASE_SEC = env_float('JOB_RETRY_BASE_SEC', 5.0, minimum=0.0)
+JOB_RETENTION_DAYS = env_int('JOB_RETENTION_DAYS', 7, minimum=1)
+PURGE_BATCH_SIZE = env_int('PURGE_BATCH_SIZE', 500, minimum=1, maximum=10000)
+
+_JOB_REGISTRY = {}
+# Fallback for tasks whose arguments can't be stored as JSON or when the job table is unreachable.
+_local_queue = queue.Queue()
+_wakeup = threading.Event()
+_worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'enqueued': 0,
+    'enqueued_local': 0,
+    'deduplicated': 0,
+    'completed': 0,
+    'retried': 0,
+    'failed': 0,
+    'run_seconds_total': 0.0,
+    'lag_seconds_last': 0.0,
+    'lag_seconds_max': 0.0,
+}
 
 
 def _utcnow():
     return datetime.now(timezone.utc).replace(tzinfo=None)
 
-def _worker_loop(app):
-    """Background worker loop to process lifecycle tasks."""
-    last_purge = _utcnow()
+
+def _bump(**deltas):
+    with _metrics_lock:
+        for name, value in deltas.items():
+            _metrics[name] += value
+
+
+def register_job(func, name=None):
+    """Register a job handler; usable as a decorator. Returns the function unchanged."""
+    _JOB_REGISTRY[name or f"{func.__module__}:{func.__qualname__}"] = func
+    return func
+
+
+def _job_name(func):
+    for name, registered in _JOB_REGISTRY.items():
+        if registered is func:
+            return name
+    name = f"{func.__module__}:{func.__qualname__}"
+    _JOB_REGISTRY[name] = func
+    return name
+
+
+def _resolve_job(name):
+    func = _JOB_REGISTRY.get(name)
+    if func is not None:
+        return func
+    module_name, _, qualname = name.partition(':')
+    target = importlib.import_module(module_name)
+    for attr in qualname.split('.'):
+        target = getattr(target, attr)
+    _JOB_REGISTRY[name] = target
+    return target
+
+
+def enqueue_job(func, args=(), kwargs=None, *, key=None, once=False, delay=0, max_attempts=None):
+    """Persist a job and wake the local workers. Returns the job id (None if queued in-process).
+
+    `key` is an idempotency key. Enqueueing a key that is already queued
+    returns the existing job. The key is released when a worker starts the job,
+    so a later change queues a fresh run. With `once=True` the key is kept,
+    and the job runs at most once for the lifetime of its row.
+    """
+    kwargs = kwargs or {}
+    name = _job_name(func)
+    try:
+        payload = json.dumps({'args': list(args), 'kwargs': kwargs})
+    except (TypeError, ValueError):
+        return _enqueue_local(func, args, kwargs)
+
+    table = BackgroundJob.__table__
+    now = _utcnow()
+    try:
+        with db.engine.begin() as conn:
+            if key:
+                existing = conn.execute(
+                    db.select(table.c.id).where(table.c.idempotency_key == key)
+                ).scalar()
+                if existing:
+                    _bump(deduplicated=1)
+                    return existing
+            result = conn.execute(table.insert().values(
+                name=name,
+                payload=payload,
+                idempotency_key=key,
+                key_persistent=bool(key and once),
+                status='queued',
+                attempts=0,
+                max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+                run_at=now + timedelta(seconds=delay),
+                created_at=now,
+            ))
+            job_id = result.inserted_primary_key[0]
+    except IntegrityError:
+        # Lost the race on the idempotency key.
+        with db.engine.connect() as conn:
+            _bump(deduplicated=1)
+            return conn.execute(db.select(table.c.id).where(table.c.idempotency_key == key)).scalar()
+    except Exception as e:
+        logger.warning(f"Job table unavailable, running {name} in-process: {e}")
+        return _enqueue_local(func, args, kwargs)
+
+    _bump(enqueued=1)
+    _wakeup.set()
+    return job_id
+
+
+def _enqueue_local(func, args, kwargs):
+    _local_queue.put((func, args, kwargs))
+    _bump(enqueued_local=1)
+    _wakeup.set()
+    return None
+
+
+def enqueue_task(func, *args, **kwargs):
+    """Enqueues a task for background processing."""
+    return enqueue_job(func, args, kwargs)
+
+
+def _claimable(table, now):
+    return db.or_(
+        db.and_(table.c.status == 'queued', table.c.run_at <= now),
+        db.and_(table.c.status == 'running', table.c.locked_at < now - timedelta(seconds=JOB_LEASE_SEC)),
+    )
+
+
+def _claim_next_job():
+    """Atomically move one due job to 'running'; the conditional UPDATE arbitrates between workers."""
+    table = BackgroundJob.__table__
+    now = _utcnow()
+    with db.engine.begin() as conn:
+        candidates = conn.execute(
+            db.select(table.c.id).where(_claimable(table, now))
+            .order_by(table.c.run_at, table.c.id).limit(5)
+        ).scalars().all()
+        for job_id in candidates:
+            claimed = conn.execute(
+                table.update()
+                .where(table.c.id == job_id, _claimable(table, now))
+                .values(
+                    status='running',
+                    locked_by=_worker_id,
+                    locked_at=now,
+                    attempts=table.c.attempts + 1,
+                    idempotency_key=db.case((table.c.key_persistent == True, table.c.idempotency_key), else_=None),
+                )
+            ).rowcount
+            if claimed:
+                return conn.execute(db.select(table).where(table.c.id == job_id)).first()
+    return None
+
+
+def _owned(table, job):
+    # attempts is bumped on every claim, so it tells this run apart from a reclaim.
+    return db.and_(table.c.id == job.id, table.c.status == 'running', table.c.attempts == job.attempts)
+
+
+class _LeaseHeartbeat:
+    """Keeps a running job's lease fresh from a side thread until the handler returns."""
+
+    def __init__(self, job):
+        self.job = job
+        self._engine = db.engine
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True, name=f"job-heartbeat-{job.id}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _beat(self):
+        table = BackgroundJob.__table__
+        while not self._stop.wait(JOB_LEASE_SEC / 3):
+            try:
+                with self._engine.begin() as conn:
+                    kept = conn.execute(
+                        table.update().where(_owned(table, self.job)).values(locked_at=_utcnow())
+                    ).rowcount
+            except Exception as e:
+                logger.warning(f"Job {self.job.id} heartbeat failed: {e}")
+                continue
+            if not kept:
+                logger.warning(f"Job {self.job.id} ({self.job.name}) lost its lease while running")
+                return
+
+
+def _finish_job(job, **values):
+    """Record the outcome unless the lease was lost and another worker owns the row now."""
+    table = BackgroundJob.__table__
+    with db.engine.begin() as conn:
+        finished = conn.execute(table.update().where(_owned(table, job)).values(**values)).rowcount
+    if not finished:
+        logger.warning(f"Job {job.id} ({job.name}) was reclaimed by another worker; outcome discarded")
+
+
+def _run_job(job):
+    lag = max(0.0, (job.locked_at - job.run_at).total_seconds())
+    with _metrics_lock:
+        _metrics['lag_seconds_last'] = lag
+        _metrics['lag_seconds_max'] = max(_metrics['lag_seconds_max'], lag)
+
+    started = time.perf_counter()
+    try:
+        if job.attempts > job.max_attempts:
+            raise RuntimeError(f"lease expired after {job.max_attempts} attempts")
+        payload = json.loads(job.payload or '{}')
+        handler = _resolve_job(job.name)
+        with _LeaseHeartbeat(job):
+            handler(*payload.get('args', []), **payload.get('kwargs', {}))
+    except Exception as e:
+        db.session.rollback()
+        error = f"{type(e).__name__}: {e}"[:2000]
+        if job.attempts < job.max_attempts:
+            delay = JOB_RETRY_BASE_SEC * (2 ** (job.attempts - 1))
+            _finish_job(job, status='queued', locked_by=None, locked_at=None, last_error=error,
+                        run_at=_utcnow() + timedelta(seconds=delay))
+            _bump(retried=1)
+            logger.warning(f"Job {job.id} ({job.name}) failed, retry {job.attempts}/{job.max_attempts} in {delay:.0f}s: {error}")
+        else:
+            _finish_job(job, status='failed', last_error=error, finished_at=_utcnow())
+            _bump(failed=1)
+            logger.error(f"Job {job.id} ({job.name}) failed permanently: {error}")
+        return
+    finally:
+        _bump(run_seconds_total=time.perf_counter() - started)
+
+    _finish_job(job, status='done', last_error=None, finished_at=_utcnow())
+    _bump(completed=1)
+
+
+def _run_local_task():
+    try:
+        func, args, kwargs = _local_queue.get_nowait()
+    except queue.Empty:
+        return False
+    try:
+        func(*args, **kwargs)
+        _bump(completed=1)
+    except Exception as e:
+        db.session.rollback()
+        _bump(failed=1)
+        logger.error(f"Error in in-process lifecycle task {getattr(func, '__qualname__', func)}: {e}", exc_info=True)
+    finally:
+        _local_queue.task_done()
+    return True
+
+
+def _schedule_purge():
+    # One purge per UTC day across every worker process, deduplicated by the key.
+    enqueue_job(PurgeService.run_purge, key=f"purge:{_utcnow().date().isoformat()}", once=True, max_attempts=1)
+
+
+def _worker_loop(app, index=0):
+    """Background worker loop: drain in-process tasks, then claim persisted jobs."""
+    last_purge_check = 0.0
     with app.app_context():
         while True:
             try:
-                # Periodic Purge Trigger (Check every hour, run if 24h passed)
-                now = _utcnow()
-                if (now - last_purge).total_seconds() > 86400: # 24 Hours
-                    try:
-                        PurgeService.run_purge()
-                        last_purge = now
-                    except Exception as pe:
-                        logger.error(f"Purge cycle failed: {pe}")
-
-                task = _task_queue.get(timeout=3600) # Wait up to 1h for a task
-                if task is None:
-                    break
-                
-                func, args, kwargs = task
-                func(*args, **kwargs)
-                _task_queue.task_done()
-            except queue.Empty:
-                continue # Just loop back and check for purge
+                if index == 0 and time.monotonic() - last_purge_check > 3600:
+                    last_purge_check = time.monotonic()
+                    _schedule_purge()
+
+                ran = _run_local_task()
+                if not ran:
+                    job = _claim_next_job()
+                    if job is not None:
+                        _run_job(job)
+                        ran = True
+                if not ran:
+                    _wakeup.wait(JOB_POLL_INTERVAL_SEC)
+                    _wakeup.clear()
             except Exception as e:
                 logger.error(f"Error in lifecycle worker: {e}", exc_info=True)
-
-def start_worker(app):
-    """Starts the background worker thread."""
-    thread = threading.Thread(target=_worker_loop, args=(app,), daemon=True)
-    thread.start()
-    return thread
-
-def enqueue_task(func, *args, **kwargs):
-    """Enqueues a task for background processing."""
-    _task_queue.put((func, args, kwargs))
+                time.sleep(JOB_POLL_INTERVAL_SEC)
+            finally:
+                db.session.remove()
+
+
+def start_worker(app, threads=None):
+    """Starts the background worker threads for this process."""
+    workers = []
+    for index in range(threads or JOB_WORKER_THREADS):
+        thread = threading.Thread(target=_worker_loop, args=(app, index), daemon=True, name=f"lifecycle-worker-{index}")
+        thread.start()
+        workers.append(thread)
+    return workers
+
+
+def job_queue_metrics():
+    """Throughput counters for this process plus queue depth and lag from the job table."""
+    table = BackgroundJob.__table__
+    now = _utcnow()
+    with _metrics_lock:
+        process = dict(_metrics)
+    process['local_queue_depth'] = _local_queue.qsize()
+
+    with db.engine.connect() as conn:
+        by_status = dict(conn.execute(
+            db.select(table.c.status, db.func.count()).group_by(table.c.status)
+        ).all())
+        oldest_due = conn.execute(
+            db.select(db.func.min(table.c.run_at)).where(table.c.status == 'queued', table.c.run_at <= now)
+        ).scalar()
+        done_last_hour = conn.execute(
+            db.select(db.func.count()).where(table.c.status == 'done', table.c.finished_at >= now - timedelta(hours=1))
+        ).scalar()
+
+    return {
+        'worker_id': _worker_id,
+        'process': process,
+        'jobs_by_status': by_status,
+        'queue_lag_seconds': round((now - oldest_due).total_seconds(), 3) if oldest_due else 0.0,
+        'completed_last_hour': done_last_hour or 0,
+    }
 
 class LifecycleOrchestrator:
     """SaaS-grade lifecycle orchestration for entity deactivation and restoration."""
@@ -233,42 +534,130 @@ class LifecycleOrchestrator:
 
 
 class PurgeService:
-    """Manages the permanent deletion of soft-deleted records (30-day TTL)."""
+    """Manages the permanent deletion of soft-deleted records (30-day TTL).
 
-    @staticmethod
-    def run_purge(days_ttl: int = 30):
-        """Finds and permanently deletes records soft-deleted more than TTL days ago."""
-        from datetime import timedelta
-        cutoff = _utcnow() - timedelta(days=days_ttl)
+    Rows are removed in id-ordered batches of PURGE_BATCH_SIZE with bulk
+    DELETEs; dependents are deleted (or detached) explicitly first because
+    bulk deletes bypass ORM cascades.
+    """
 
-        logger.info(f"Starting Purge Cycle (TTL: {days_ttl} days, Cutoff: {cutoff})")
-
-        # 1. Purge Conversations (and their cascaded items will be purged too)
-        # Note: In a real distributed system, we'd use a more robust batching approach.
-        deleted_convs = Conversation.query.filter(
-            Conversation.is_deleted == True,
-            Conversation.deleted_at <= cutoff
-        ).all()
-
-        for conv in deleted_convs:
-            # Physical delete from DB
-            db.session.delete(conv)
-            logger.info(f"Permanently purged conversation {conv.id}")
-
-        # 2. Purge orphaned History items (manual deletes)
-        deleted_histories = History.query.filter(
-            History.is_deleted == True,
-            History.deleted_at <= cutoff
-        ).all()
-        for h in deleted_histories:
-            db.session.delete(h)
-
-        # 3. Purge orphaned items from other models
-        for model in [Answer, SharedSession, ConversationSummary, Favorite, Notification]:
-            model.query.filter(
+    @staticmethod
+    def _expired_id_batches(model, cutoff):
+        last_id = 0
+        while True:
+            ids = [row[0] for row in db.session.query(model.id).filter(
                 model.is_deleted == True,
-                model.deleted_at <= cutoff
+                model.deleted_at <= cutoff,
+                model.id > last_id,
+            ).order_by(model.id).limit(PURGE_BATCH_SIZE).all()]
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+    @staticmethod
+    def _delete_answers(answer_ids):
+        if not answer_ids:
+            return
+        AnswerLike.query.filter(AnswerLike.answer_id.in_(answer_ids)).delete(synchronize_session=False)
+        Answer.query.filter(Answer.id.in_(answer_ids)).delete(synchronize_session=False)
+
+    @staticmethod
+    def _delete_histories(history_ids):
+        if not history_ids:
+            return
+        answer_ids = [row[0] for row in db.session.query(Answer.id).filter(Answer.history_id.in_(history_ids)).all()]
+        PurgeService._delete_answers(answer_ids)
+        for model, column in ((PostLike, PostLike.history_id), (Favorite, Favorite.history_id),
+                              (Feedback, Feedback.history_id), (FeedbackDetail, FeedbackDetail.history_id),
+                              (Notification, Notification.related_post_id),
+                              (HistoryMemoryCache, HistoryMemoryCache.history_id)):
+            model.query.filter(column.in_(history_ids)).delete(synchronize_session=False)
+        ConversationSummary.query.filter(ConversationSummary.last_history_id.in_(history_ids)).update(
+            {'last_history_id': None}, synchronize_session=False)
+        MemoryNode.query.filter(MemoryNode.source_history_id.in_(history_ids)).update(
+            {'source_history_id': None}, synchronize_session=False)
+        History.query.filter(History.id.in_(history_ids)).delete(synchronize_session=False)
+
+    @staticmethod
+    def _delete_shared_sessions(session_ids):
+        if not session_ids:
+            return
+        CollaborationComment.query.filter(CollaborationComment.session_id.in_(session_ids)).delete(synchronize_session=False)
+        CollaborationReview.query.filter(CollaborationReview.session_id.in_(session_ids)).delete(synchronize_session=False)
+        SharedSession.query.filter(SharedSession.id.in_(session_ids)).delete(synchronize_session=False)
+
+    @staticmethod
+    def _delete_summaries(summary_ids):
+        if not summary_ids:
+            return
+        MemoryEmbedding.query.filter(
+            MemoryEmbedding.source_type == 'summary', MemoryEmbedding.source_id.in_(summary_ids)
+        ).delete(synchronize_session=False)
+        ConversationSummary.query.filter(ConversationSummary.id.in_(summary_ids)).delete(synchronize_session=False)
+
+    @staticmethod
+    def _delete_conversations(conv_ids):
+        history_ids = [row[0] for row in db.session.query(History.id).filter(History.conversation_id.in_(conv_ids)).all()]
+        for start in range(0, len(history_ids), PURGE_BATCH_SIZE):
+            PurgeService._delete_histories(history_ids[start:start + PURGE_BATCH_SIZE])
+
+        session_ids = [row[0] for row in db.session.query(SharedSession.id).filter(SharedSession.conversation_id.in_(conv_ids)).all()]
+        PurgeService._delete_shared_sessions(session_ids)
+
+        summary_ids = [row[0] for row in db.session.query(ConversationSummary.id).filter(ConversationSummary.conversation_id.in_(conv_ids)).all()]
+        PurgeService._delete_summaries(summary_ids)
+
+        item_ids = [row[0] for row in db.session.query(MemoryItem.id).filter(MemoryItem.source_conversation_id.in_(conv_ids)).all()]
+        if item_ids:
+            MemoryEmbedding.query.filter(
+                MemoryEmbedding.source_type == 'memory', MemoryEmbedding.source_id.in_(item_ids)
             ).delete(synchronize_session=False)
+            MemoryItem.query.filter(MemoryItem.id.in_(item_ids)).delete(synchronize_session=False)
 
-        db.session.commit()
-        logger.info("Purge cycle completed.")
+        # Memory nodes are kept for audit; they were invalidated when the conversation was deleted.
+        MemoryNode.query.filter(MemoryNode.conversation_id.in_(conv_ids)).update(
+            {'conversation_id': None}, synchronize_session=False)
+        Conversation.query.filter(Conversation.id.in_(conv_ids)).delete(synchronize_session=False)
+
+    @staticmethod
+    def run_purge(days_ttl: int = 30):
+        """Permanently deletes records soft-deleted more than TTL days ago, one batch per transaction."""
+        cutoff = _utcnow() - timedelta(days=days_ttl)
+        logger.info(f"Starting Purge Cycle (TTL: {days_ttl} days, Cutoff: {cutoff}, Batch: {PURGE_BATCH_SIZE})")
+        purged = {}
+
+        steps = (
+            (Conversation, PurgeService._delete_conversations),
+            (History, PurgeService._delete_histories),
+            (Answer, PurgeService._delete_answers),
+            (SharedSession, PurgeService._delete_shared_sessions),
+            (ConversationSummary, PurgeService._delete_summaries),
+            (Favorite, lambda ids: Favorite.query.filter(Favorite.id.in_(ids)).delete(synchronize_session=False)),
+            (Notification, lambda ids: Notification.query.filter(Notification.id.in_(ids)).delete(synchronize_session=False)),
+        )
+        for model, delete_batch in steps:
+            for ids in PurgeService._expired_id_batches(model, cutoff):
+                try:
+                    delete_batch(ids)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+                purged[model.__name__] = purged.get(model.__name__, 0) + len(ids)
+
+        # Finished jobs are only kept long enough to hold their idempotency keys.
+        job_cutoff = _utcnow() - timedelta(days=JOB_RETENTION_DAYS)
+        while True:
+            ids = [row[0] for row in db.session.query(BackgroundJob.id).filter(
+                BackgroundJob.status.in_(('done', 'failed')),
+                BackgroundJob.finished_at <= job_cutoff,
+            ).order_by(BackgroundJob.id).limit(PURGE_BATCH_SIZE).all()]
+            if not ids:
+                break
+            BackgroundJob.query.filter(BackgroundJob.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            purged['BackgroundJob'] = purged.get('BackgroundJob', 0) + len(ids)
+
+        logger.info(f"Purge cycle completed: {purged}")
+        return purged
@@ -0,0 +1,102 @@
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+# app.py reads DATABASE_URL at import time, so point it at a throwaway SQLite file first.
+_DB_DIR = tempfile.mkdtemp(prefix="app-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}")
+os.environ.setdefault("PROVIDER_GOVERNOR_DB", "local")
+os.environ.setdefault("RUN_STATE_STORE", "local")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app as app_module
+
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    return app_module
+
+
+@pytest.fixture
+def make_user(app_module):
+    from models import User, db
+
+    def _make_user(**fields):
+        suffix = uuid.uuid4().hex[:10]
+        with app_module.app.app_context():
+            user = User(
+                email=fields.pop("email", f"user-{suffix}@example.com"),
+                display_name=fields.pop("display_name", f"user-{suffix}"),
+                password_hash=fields.pop("password_hash", "x"),
+                **fields,
+            )
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            db.session.remove()
+        return user_id
+
+    return _make_user
+
+
+@pytest.fixture
+def sqlite_foreign_keys(app_module):
+    """Enforce FOREIGN KEY constraints on every pooled SQLite connection for one test."""
+    from sqlalchemy import event
+
+    from models import db
+
+    def _enable(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    with app_module.app.app_context():
+        engine = db.engine
+    engine.dispose()
+    event.listen(engine, "connect", _enable)
+    try:
+        yield engine
+    finally:
+        event.remove(engine, "connect", _enable)
+        engine.dispose()
+
+
+@pytest.fixture
+def count_queries(app_module):
+    """``with count_queries(match) as statements:`` records the SQL this thread runs.
+
+    ``match`` is an optional predicate on the statement text. Statements from
+    other threads (the app's job workers poll the same engine) are ignored.
+    """
+    from sqlalchemy import event
+
+    from models import db
+
+    with app_module.app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def _count(match=None):
+        statements = []
+        thread = threading.get_ident()
+
+        def _record(conn, cursor, statement, *args):
+            if threading.get_ident() == thread and (match is None or match(statement)):
+                statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", _record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", _record)
+
+    return _count
@@ -0,0 +1,78 @@
+from cryptography.fernet import Fernet
+from flask_jwt_extended import create_access_token
+
+from backend.adapters.resolver import ProviderResolver
+from models import (Conversation, History, HistoryMemoryCache, MemoryEmbedding, TokenReservation, UsageCounter,
+                    User, UserExternalApiKey, db)
+from utils.crypto_utils import encrypt_key, mask_key
+
+
+def _seed_account(app_module, user_id):
+    """Rows the newer per-user tables hold for an active account."""
+    with app_module.app.app_context():
+        user = db.session.get(User, user_id)
+        _allowed, _balance, _cost, settled_id = app_module.reserve_tokens(user, "gemini-2.5-flash")
+        app_module.settle_token_reservation(settled_id, description="turn")
+        db.session.commit()
+        app_module.reserve_tokens(user, "gemini-2.5-flash")  # still held
+        db.session.add(UsageCounter(user_id=user_id, period="day", period_key="2026-01-31", requests=1))
+        db.session.add(MemoryEmbedding(user_id=user_id, source_type="memory", source_id=user_id, content_hash="0" * 64,
+                                       embedding_model="test", dim=1, vector=b"\x00" * 4))
+        conversation = Conversation(user_id=user_id, title="chat")
+        db.session.add(conversation)
+        db.session.flush()
+        history = History(conversation_id=conversation.id, user_question="q", ai_response="a", selected_model="m")
+        db.session.add(history)
+        db.session.flush()
+        db.session.add(HistoryMemoryCache(history_id=history.id, candidates_json="[]"))
+        db.session.commit()
+        history_id = history.id
+        db.session.remove()
+    return history_id
+
+
+def test_user_can_delete_account_with_foreign_keys_enforced(app_module, make_user, sqlite_foreign_keys, monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    user_id = make_user()
+    history_id = _seed_account(app_module, user_id)
+    with app_module.app.app_context():
+        db.session.add(UserExternalApiKey(user_id=user_id, provider="openai",
+                                          encrypted_key=encrypt_key("sk-own-key"), key_mask=mask_key("sk-own-key")))
+        db.session.commit()
+        jwt = create_access_token(identity=str(user_id))
+        db.session.remove()
+    assert ProviderResolver.get_user_key(user_id, "openai") == "sk-own-key"  # now cached
+
+    response = app_module.app.test_client().delete(
+        "/api/auth/delete-account", json={}, headers={"Authorization": f"Bearer {jwt}"})
+
+    assert response.status_code == 200, response.get_json()
+    with app_module.app.app_context():
+        assert db.session.get(User, user_id) is None
+        assert TokenReservation.query.filter_by(user_id=user_id).count() == 0
+        assert UsageCounter.query.filter_by(user_id=user_id).count() == 0
+        assert MemoryEmbedding.query.filter_by(user_id=user_id).count() == 0
+        assert db.session.get(HistoryMemoryCache, history_id) is None
+        assert UserExternalApiKey.query.filter_by(user_id=user_id).count() == 0
+        db.session.remove()
+    assert ProviderResolver.get_user_key(user_id, "openai") is None
+
+
+def test_admin_can_delete_user_with_foreign_keys_enforced(app_module, make_user, sqlite_foreign_keys):
+    admin_id = make_user(is_admin=True)
+    user_id = make_user()
+    history_id = _seed_account(app_module, user_id)
+    with app_module.app.app_context():
+        jwt = create_access_token(identity=str(admin_id))
+
+    response = app_module.app.test_client().delete(
+        f"/api/admin/users/{user_id}", headers={"Authorization": f"Bearer {jwt}"})
+
+    assert response.status_code == 200, response.get_json()
+    with app_module.app.app_context():
+        assert db.session.get(User, user_id) is None
+        assert TokenReservation.query.filter_by(user_id=user_id).count() == 0
+        assert UsageCounter.query.filter_by(user_id=user_id).count() == 0
+        assert MemoryEmbedding.query.filter_by(user_id=user_id).count() == 0
+        assert db.session.get(HistoryMemoryCache, history_id) is None
+        db.session.remove()
@@ -0,0 +1,83 @@
+import asyncio
+import time
+import types
+
+from backend.prompt_optimizer.intent_classifier import HybridIntentClassifier
+from backend.prompt_optimizer.llm_intent_classifier import IntentCache, LLMIntentClassifier, LLM_CACHE
+from backend.runtime import core
+
+
+class _SlowLLM:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    async def classify_async(self, user_prompt):
+        await asyncio.sleep(self.seconds)
+        return {"intent": "refactor", "confidence": 0.95, "source": "llm"}
+
+
+AMBIGUOUS = "can you take a look at the payment flow for me"
+
+
+def test_slow_llm_falls_back_to_rule_result_at_the_deadline():
+    classifier = HybridIntentClassifier(llm_classifier=_SlowLLM(5), llm_enabled=True, deadline_sec=0.1)
+
+    started = time.perf_counter()
+    result = asyncio.run(classifier.classify_async(AMBIGUOUS))
+
+    assert time.perf_counter() - started < 1.0
+    assert result["source"] == "hybrid_rule_timeout"
+    assert result["intent"] == "general"
+
+    fast = HybridIntentClassifier(llm_classifier=_SlowLLM(0), llm_enabled=True, deadline_sec=1.0)
+    assert asyncio.run(fast.classify_async(AMBIGUOUS))["intent"] == "refactor"
+
+
+def test_llm_results_are_cached_bounded_and_failures_are_not():
+    cache = IntentCache(max_entries=2, ttl_sec=60)
+    for key in ("a", "b", "c"):
+        cache.put(key, {"intent": "general", "confidence": 1.0, "source": "llm"})
+    assert len(cache) == 2 and cache.get("a") is None and cache.get("c") is not None
+
+    LLM_CACHE.clear()
+    classifier = LLMIntentClassifier()
+    calls = []
+
+    async def answer(prompt):
+        calls.append(prompt)
+        if len(calls) == 1:
+            raise RuntimeError("provider down")
+        return {"intent": "debugging", "confidence": 0.9, "source": "llm"}
+
+    classifier._call_llm = answer
+    assert asyncio.run(classifier.classify_async("why is this slow"))["source"] == "llm_error_fallback"
+    assert asyncio.run(classifier.classify_async("why is this slow"))["intent"] == "debugging"
+    assert asyncio.run(classifier.classify_async("why is this slow"))["intent"] == "debugging"
+    assert len(calls) == 2
+    LLM_CACHE.clear()
+
+
+def test_prompt_optimization_overlaps_context_assembly(monkeypatch):
+    async def slow_optimize(question, model_name=""):
+        await asyncio.sleep(0.3)
+        return {"optimized_prompt": f"[optimized] {question}", "intent": "coding", "optimizer_version": "2.0"}
+
+    seen = {}
+
+    async def slow_context(request, run_id, question=None):
+        seen["question"] = question
+        await asyncio.sleep(0.3)
+        return types.SimpleNamespace(question=question)
+
+    monkeypatch.setattr(core, "optimize_prompt_async", slow_optimize)
+    runtime = core.AgentRuntime.__new__(core.AgentRuntime)
+    runtime._build_context = slow_context
+    request = {"question": "write a parser"}
+
+    started = time.perf_counter()
+    ctx = asyncio.run(runtime._prepare(request, run_id="run_test"))
+
+    assert time.perf_counter() - started < 0.5
+    assert seen["question"] == "write a parser"
+    assert ctx.question == "[optimized] write a parser"
+    assert request["intent"] == "coding"
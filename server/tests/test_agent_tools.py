@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import types
+
+from backend.tools.builtin.project_search import make_project_search_tool
+from backend.tools.builtin.workspace_files import make_workspace_file_tools
+from models import Project, db
+
+
+def test_project_file_tools_keep_the_event_loop_free(app_module, make_user):
+    user_id = make_user()
+    with app_module.app.app_context():
+        project = Project(user_id=user_id, name="demo")
+        db.session.add(project)
+        db.session.commit()
+        project_id = project.id
+        db.session.remove()
+
+    tools = {tool.name: tool for tool in make_workspace_file_tools() + [make_project_search_tool()]}
+    released = threading.Event()
+    seen = {}
+
+    def invalidate(pid, file_id):
+        # Blocks until a coroutine on the loop runs: deadlocks if called on the loop thread.
+        seen["thread"] = threading.get_ident()
+        seen["released"] = released.wait(timeout=2)
+
+    ctx = types.SimpleNamespace(project=project_id, invalidate_project_cache=invalidate,
+                                search_project_callback=None, changed_files=[])
+
+    async def release_soon():
+        await asyncio.sleep(0.05)
+        released.set()
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        written, _ = await asyncio.gather(
+            tools["write_file"].execute({"path": "src/app.py", "content": "print('payment')\n"}, ctx),
+            release_soon(),
+        )
+        assert written["ok"] and written["created"] and written["persisted"]
+        assert seen["released"] and seen["thread"] != loop_thread
+
+        read = await tools["read_file"].execute({"path": "src/app.py"}, ctx)
+        assert read["content"] == "print('payment')\n"
+        listed = await tools["list_files"].execute({}, ctx)
+        assert [f["path"] for f in listed["files"]] == ["src/app.py"]
+        found = await tools["project_search"].execute({"query": "payment"}, ctx)
+        assert found["search_mode"] == "lexical" and found["hits"][0]["path"] == "src/app.py"
+        assert (await tools["delete_file"].execute({"path": "src/app.py"}, ctx))["ok"]
+
+    asyncio.run(scenario())
+    assert [change["operation"] for change in ctx.changed_files] == ["create", "delete"]
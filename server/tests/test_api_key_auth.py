@@ -0,0 +1,77 @@
+import secrets
+
+from flask_jwt_extended import create_access_token
+
+from models import ApiKey, db
+
+
+def _issue_key(app_module, user_id):
+    token = f"ca-vsc-{secrets.token_hex(16)}"
+    with app_module.app.app_context():
+        record = ApiKey(user_id=user_id, name="VS Code Extension", key=app_module._build_stored_api_key(token))
+        db.session.add(record)
+        db.session.commit()
+        key_id = record.id
+        db.session.remove()
+    return token, key_id
+
+
+def _is_api_key_query(statement):
+    return "api_key" in statement and "user_external_api_key" not in statement
+
+
+def test_repeated_lookups_hit_the_cache(app_module, make_user, count_queries):
+    token, key_id = _issue_key(app_module, make_user())
+
+    with app_module.app.test_request_context(), count_queries(_is_api_key_query) as statements:
+        first = app_module._find_api_key_record(token)
+        db.session.remove()
+    assert first.id == key_id and first.client == "vscode"
+    assert len(statements) == 1
+
+    with app_module.app.test_request_context(), count_queries(_is_api_key_query) as statements:
+        second = app_module._find_api_key_record(token)
+        db.session.remove()
+    assert second == first
+    assert statements == []
+
+
+def test_revocation_invalidates_cached_key(app_module, make_user):
+    user_id = make_user()
+    token, key_id = _issue_key(app_module, user_id)
+
+    with app_module.app.test_request_context():
+        assert app_module._find_api_key_record(token).id == key_id
+        jwt = create_access_token(identity=str(user_id))
+        db.session.remove()
+
+    client = app_module.app.test_client()
+    response = client.delete(f"/api/keys/{key_id}", headers={"Authorization": f"Bearer {jwt}"})
+    assert response.status_code == 200
+
+    with app_module.app.test_request_context():
+        assert app_module._find_api_key_record(token) is None
+        db.session.remove()
+
+
+def test_last_used_stamps_are_written_in_one_batch(app_module, make_user, count_queries):
+    user_id = make_user()
+    keys = [_issue_key(app_module, user_id) for _ in range(3)]
+    buffer = app_module._api_key_last_used
+    buffer.flush()
+
+    with app_module.app.test_request_context():
+        for _ in range(5):
+            for token, _key_id in keys:
+                app_module._touch_api_key(app_module._find_api_key_record(token))
+        db.session.remove()
+
+    with count_queries(lambda statement: statement.lstrip().upper().startswith("UPDATE API_KEY")) as statements:
+        assert buffer.flush() == len(keys)
+
+    # One executemany for the whole batch, no per-request commits.
+    assert len(statements) == 1
+    with app_module.app.app_context():
+        stamped = ApiKey.query.filter(ApiKey.id.in_([key_id for _t, key_id in keys])).all()
+        assert all(record.last_used_at is not None for record in stamped)
+        db.session.remove()
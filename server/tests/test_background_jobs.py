@@ -0,0 +1,36 @@
+import time
+
+from models import BackgroundJob, db
+from services import lifecycle_orchestrator as jobs
+
+_runs = []
+
+
+def _slow_job(marker):
+    _runs.append(marker)
+    time.sleep(1.5)
+
+
+jobs.register_job(_slow_job, name="tests:slow_job")
+
+
+def test_job_outliving_its_lease_runs_once(app_module, monkeypatch):
+    # The app's own worker threads poll the job table; any idle one would
+    # reclaim the row once locked_at is older than the lease.
+    monkeypatch.setattr(jobs, "JOB_LEASE_SEC", 0.3)
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL_SEC", 0.05)
+    with app_module.app.app_context():
+        job_id = jobs.enqueue_job(_slow_job, ("lease",))
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            job = db.session.get(BackgroundJob, job_id)
+            if job.status == "done":
+                break
+            db.session.remove()
+            time.sleep(0.05)
+        status, attempts = job.status, job.attempts
+        db.session.remove()
+
+    assert (status, attempts) == ("done", 1)
+    assert _runs.count("lease") == 1
@@ -0,0 +1,131 @@
+import asyncio
+
+from cryptography.fernet import Fernet
+from flask_jwt_extended import create_access_token
+
+from backend.adapters.dispatcher import AdapterDispatcher
+from backend.adapters import resolver
+from backend.adapters.resolver import ProviderResolver
+from models import UserExternalApiKey, db
+from utils.crypto_utils import encrypt_key, mask_key
+
+
+def test_byok_adapters_are_pooled_per_key_with_idle_eviction():
+    dispatcher = AdapterDispatcher(openai_key="sk-env")
+
+    async def scenario():
+        first = dispatcher.get("openai", override_key="sk-user-a")
+        again = dispatcher.get("gpt", override_key="sk-user-a")
+        other = dispatcher.get("openai", override_key="sk-user-b")
+        assert first is again
+        assert other is not first
+        assert dispatcher.byok_pool_size() == 2
+        # Pool keys are fingerprints, never the raw key.
+        assert not any("sk-user" in part for pool in dispatcher._byok_pools.values() for key in pool for part in key)
+
+        dispatcher._byok_idle_sec = 0.05
+        await asyncio.sleep(0.1)
+        assert dispatcher.get("openai", override_key="sk-user-a") is not first
+        assert dispatcher.byok_pool_size() == 1
+
+    asyncio.run(scenario())
+
+
+def test_user_key_lookup_is_cached_and_invalidated_by_key_routes(app_module, make_user, monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    user_id = make_user()
+    with app_module.app.app_context():
+        db.session.add(UserExternalApiKey(user_id=user_id, provider="openai",
+                                          encrypted_key=encrypt_key("sk-own-key"), key_mask=mask_key("sk-own-key")))
+        db.session.commit()
+        jwt = create_access_token(identity=str(user_id))
+        db.session.remove()
+
+    loads = []
+    original = ProviderResolver._load_user_key
+
+    def counting(uid, provider):
+        loads.append((uid, provider))
+        return original(uid, provider)
+
+    ProviderResolver._load_user_key = staticmethod(counting)
+    try:
+        assert asyncio.run(ProviderResolver.get_user_key_async(user_id, "openai")) == "sk-own-key"
+        assert asyncio.run(ProviderResolver.get_user_key_async(user_id, "OpenAI")) == "sk-own-key"
+        assert loads == [(user_id, "openai")]
+
+        client = app_module.app.test_client()
+        response = client.delete("/api/user/keys/openai", headers={"Authorization": f"Bearer {jwt}"})
+        assert response.status_code == 200
+
+        assert asyncio.run(ProviderResolver.get_user_key_async(user_id, "openai")) is None
+        assert len(loads) == 2
+    finally:
+        ProviderResolver._load_user_key = staticmethod(original)
+        ProviderResolver.invalidate_user_key(user_id)
+
+
+def test_failed_decrypts_are_not_cached(app_module, make_user, monkeypatch):
+    encryption_key = Fernet.generate_key().decode()
+    monkeypatch.setenv("ENCRYPTION_KEY", encryption_key)
+    user_id = make_user()
+    with app_module.app.app_context():
+        db.session.add(UserExternalApiKey(user_id=user_id, provider="openai",
+                                          encrypted_key=encrypt_key("sk-own-key"), key_mask=mask_key("sk-own-key")))
+        db.session.commit()
+        db.session.remove()
+
+    try:
+        # Misconfigured key: the stored ciphertext does not decrypt.
+        monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+        assert ProviderResolver.get_user_key(user_id, "openai") is None
+        # Once fixed, the key is served without waiting for the cache TTL.
+        monkeypatch.setenv("ENCRYPTION_KEY", encryption_key)
+        assert ProviderResolver.get_user_key(user_id, "openai") == "sk-own-key"
+    finally:
+        ProviderResolver.invalidate_user_key(user_id)
+
+
+def test_key_cache_is_bounded_and_sheds_expired_entries_on_put(monkeypatch):
+    monkeypatch.setenv("BYOK_KEY_CACHE_MAX_ENTRIES", "3")
+    cache = resolver._UserKeyCache()
+    for user_id in range(5):
+        cache.put(user_id, "openai", f"sk-{user_id}", cache.generation())
+    assert list(cache._entries) == [(2, "openai"), (3, "openai"), (4, "openai")]
+
+    later = resolver.time.monotonic() + 3600
+    monkeypatch.setattr(resolver.time, "monotonic", lambda: later)
+    # Entries nobody asks for again still go once they have expired.
+    cache.put(6, "openai", "sk-6", cache.generation())
+    assert list(cache._entries) == [(6, "openai")]
+
+
+def test_load_racing_an_invalidation_is_not_cached(app_module, make_user, monkeypatch):
+    from utils import crypto_utils
+
+    monkeypatch.setenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    user_id = make_user()
+    with app_module.app.app_context():
+        db.session.add(UserExternalApiKey(user_id=user_id, provider="openai",
+                                          encrypted_key=encrypt_key("sk-own-key"), key_mask=mask_key("sk-own-key")))
+        db.session.commit()
+        db.session.remove()
+
+    decrypt = crypto_utils.decrypt_key
+    decrypts = []
+
+    def revoked_mid_load(ciphertext):
+        decrypts.append(ciphertext)
+        if len(decrypts) == 1:
+            ProviderResolver.invalidate_user_key(user_id, "openai")  # the key route runs meanwhile
+        return decrypt(ciphertext)
+
+    monkeypatch.setattr(crypto_utils, "decrypt_key", revoked_mid_load)
+    try:
+        assert ProviderResolver.get_user_key(user_id, "openai") == "sk-own-key"
+        assert ProviderResolver.get_user_key(user_id, "openai") == "sk-own-key"
+        assert len(decrypts) == 2  # the first answer was not stored
+        assert ProviderResolver.get_user_key(user_id, "openai") == "sk-own-key"
+        assert len(decrypts) == 2
+    finally:
+        ProviderResolver.invalidate_user_key(user_id)
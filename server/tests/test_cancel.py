@@ -0,0 +1,29 @@
+import secrets
+
+from flask_jwt_extended import create_access_token
+
+from models import ApiKey, db
+from utils.run_state import is_request_cancelled
+
+
+def test_cancel_flags_are_scoped_to_the_caller(app_module, make_user):
+    owner_id, other_id = make_user(), make_user()
+    token = f"ca-vsc-{secrets.token_hex(16)}"
+    with app_module.app.app_context():
+        db.session.add(ApiKey(user_id=other_id, name="VS Code Extension", key=app_module._build_stored_api_key(token)))
+        db.session.commit()
+        owner_jwt = create_access_token(identity=str(owner_id))
+        db.session.remove()
+
+    client = app_module.app.test_client()
+    assert client.post("/v1/cancel", json={"request_id": "req-a"}).status_code == 401
+
+    # Another user who learned the request id can't stop the owner's run.
+    assert client.post("/v1/cancel", json={"request_id": "req-a"}, headers={"X-API-Key": token}).status_code == 200
+    assert is_request_cancelled("req-a", other_id)
+    assert not is_request_cancelled("req-a", owner_id)
+
+    response = client.post("/api/cancel", json={"request_id": "req-a"},
+                           headers={"Authorization": f"Bearer {owner_jwt}"})
+    assert response.status_code == 200
+    assert is_request_cancelled("req-a", owner_id)
@@ -0,0 +1,120 @@
+from utils.db_metrics import engine_pool_options
+
+
+def test_pool_is_sized_from_the_worker_model(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.setenv("DB_MAX_CONNECTIONS", "80")
+    monkeypatch.setenv("ASYNC_EXECUTOR_WORKERS", "96")
+    for name in ("DB_POOL_SIZE", "DB_MAX_OVERFLOW"):
+        monkeypatch.delenv(name, raising=False)
+
+    options = engine_pool_options()
+    per_worker = options["pool_size"] + options["max_overflow"]
+    assert per_worker == 20
+    assert per_worker * 4 <= 80
+
+    # A worker never holds more connections than it has threads to use them.
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    monkeypatch.setenv("DB_MAX_CONNECTIONS", "500")
+    monkeypatch.setenv("ASYNC_EXECUTOR_WORKERS", "32")
+    options = engine_pool_options()
+    assert options["pool_size"] + options["max_overflow"] == 32
+
+
+def test_routes_report_query_counts_and_metrics_endpoint(app_module, monkeypatch):
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    client = app_module.app.test_client()
+    checkouts_before = app_module._db_metrics.checkouts
+
+    assert client.get("/api/popular").status_code == 200
+
+    snapshot = app_module._db_metrics.snapshot()
+    route = snapshot["routes"]["GET /api/popular"]
+    assert route["requests"] >= 1 and route["queries"] >= 1
+    assert snapshot["pool"]["checkouts"] > checkouts_before
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'http_route_db_queries_total{method="GET",route="/api/popular"}' in body
+    assert "db_pool_checkout_wait_seconds_total" in body
+
+    monkeypatch.setenv("METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"X-Metrics-Token": "scrape-secret"}).status_code == 200
+
+
+def test_blend_saves_from_ids_after_releasing_its_session(app_module, make_user, monkeypatch):
+    from flask_jwt_extended import create_access_token
+
+    from models import History, db
+
+    user_id = make_user()
+    with app_module.app.app_context():
+        token = create_access_token(identity=str(user_id))
+
+    holding = []
+
+    def fake_fetch(model, question, code="", prefs=None, user_id=None):
+        return model, f"{model} says hi"
+
+    def fake_blender(prompt, code, history, model, *args, **kwargs):
+        holding.append(db.session().in_transaction())
+        yield "blended"
+
+    class _NoReferee:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, prompt):
+            raise RuntimeError("offline")
+
+    monkeypatch.setattr(app_module, "fetch_model_response_sync", fake_fetch)
+    monkeypatch.setattr(app_module, "generate_gemini_answer", fake_blender)
+    monkeypatch.setattr(app_module.genai, "GenerativeModel", _NoReferee)
+
+    response = app_module.app.test_client().post(
+        "/api/blend", json={"question": "q", "models": ["gemini-2.5-flash", "gpt-4o-mini"]},
+        headers={"Authorization": f"Bearer {token}"})
+    body = response.get_data(as_text=True)
+
+    assert holding == [False]
+    assert '"done": true' in body
+    with app_module.app.app_context():
+        assert History.query.filter_by(ai_response="blended").count() == 1
+        db.session.remove()
+
+
+def test_profile_analysis_does_not_hold_a_connection_across_the_model_call(app_module, make_user, monkeypatch):
+    from flask_jwt_extended import create_access_token
+
+    from models import Conversation, History, User, db
+
+    user_id = make_user()
+    with app_module.app.app_context():
+        conversation = Conversation(user_id=user_id, title="q")
+        db.session.add(conversation)
+        db.session.flush()
+        db.session.add(History(conversation_id=conversation.id, user_question="how do I sort?", ai_response="a"))
+        db.session.commit()
+        token = create_access_token(identity=str(user_id))
+        db.session.remove()
+
+    holding = []
+
+    class _Model:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, prompt):
+            holding.append(db.session().in_transaction())
+            return type("Result", (), {"text": '{"expertise": "Beginner", "persona": "Learner"}'})()
+
+    monkeypatch.setattr(app_module.genai, "GenerativeModel", _Model)
+
+    response = app_module.app.test_client().post(
+        "/api/auth/profile/analyze", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert holding == [False]
+    with app_module.app.app_context():
+        assert '"Learner"' in db.session.get(User, user_id).preferences
+        db.session.remove()
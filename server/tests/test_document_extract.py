@@ -0,0 +1,83 @@
+import io
+import time
+
+import pytest
+from docx import Document
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from utils.document_extract import DocumentExtractor, extract_pdf_text
+from utils.process_pool import TimeoutProcessPool
+
+
+def _pdf_bytes(pages, line="Lorem ipsum dolor sit amet "):
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for number in range(pages):
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)}),
+        })
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 12 Tf 72 720 Td ({line}page {number}) Tj ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(stream)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _docx_path(tmp_path, paragraphs):
+    doc = Document()
+    for number in range(paragraphs):
+        doc.add_paragraph(f"Paragraph {number} " + "x" * 60)
+    table = doc.add_table(rows=1, cols=2)
+    table.rows[0].cells[0].text = "tail"
+    table.rows[0].cells[1].text = "cell"
+    path = tmp_path / "doc.docx"
+    doc.save(path)
+    return path
+
+
+def test_pdf_extraction_stops_at_the_character_budget():
+    data = _pdf_bytes(40)
+
+    text = extract_pdf_text(io.BytesIO(data), limit=200)
+    assert len(text) == 200
+    assert "page 0" in text and "page 39" not in text
+
+    assert "page 2" not in extract_pdf_text(io.BytesIO(data), limit=0, max_pages=2)
+
+
+def test_extraction_runs_in_a_worker_and_is_cached_by_content(tmp_path):
+    extractor = DocumentExtractor(workers=1, timeout=30)
+    path = _docx_path(tmp_path, 500)
+
+    text = extractor.extract("docx", str(path), limit=1000)
+    assert len(text) <= 1000 and text.startswith("Paragraph 0")
+    assert "tail" not in text
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("cached document was extracted again")
+
+    extractor.pool.run = _fail
+    assert extractor.extract("docx", str(path), limit=1000) == text
+    # Same bytes under another name (a re-attached upload) hit the same entry.
+    assert extractor.extract("docx", path.read_bytes(), limit=1000) == text
+    assert extractor.hits == 2 and extractor.misses == 1
+
+
+def test_pool_kills_a_worker_that_overruns():
+    pool = TimeoutProcessPool("test-sleep", 1)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.run(time.sleep, 30, timeout=0.5)
+    assert time.monotonic() - started < 10
+    assert pool.timeouts == 1
+
+    # The slot was released and a fresh worker answers.
+    assert pool.run(len, "abc", timeout=30) == 3
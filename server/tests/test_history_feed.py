@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from models import Answer, Conversation, History, db
+
+
+def _seed_posts(app_module, make_user, count):
+    author_ids = [make_user() for _ in range(3)]
+    with app_module.app.app_context():
+        for i in range(count):
+            conversation = Conversation(user_id=author_ids[i % len(author_ids)], title=f"post {i}")
+            db.session.add(conversation)
+            db.session.flush()
+            response = f"answer {i}"
+            if i % 7 == 0:
+                response = json.dumps({'isComparison': True, 'response1': 'a', 'response2': 'b'})
+            post = History(
+                conversation_id=conversation.id,
+                user_question=f"question {i}",
+                ai_response=response,
+                selected_model='Community',
+            )
+            db.session.add(post)
+            db.session.flush()
+            for _ in range(i % 3):
+                db.session.add(Answer(history_id=post.id, author_id=author_ids[0], author='a', body='reply'))
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.mark.parametrize("path", ["/api/community/feed", "/api/history", "/api/popular"])
+def test_feed_query_count_is_constant(app_module, make_user, count_queries, path):
+    client = app_module.app.test_client()
+    _seed_posts(app_module, make_user, 4)
+    with count_queries() as statements:
+        assert client.get(path).status_code == 200
+    small = len(statements)
+
+    _seed_posts(app_module, make_user, 40)
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200
+    large, payload = len(statements), response.get_json()
+
+    assert large == small
+    assert large <= 4
+    items = next(iter(payload.values()))
+    assert len(items) > 4
+    assert all(item['author_id'] for item in items)
+
+
+def test_batch_serializer_matches_single_item(app_module, make_user):
+    _seed_posts(app_module, make_user, 8)
+    with app_module.app.app_context():
+        items = History.query.options(*app_module._HISTORY_FEED_OPTIONS)\
+            .order_by(History.id.desc()).limit(8).all()
+        batch = app_module.serialize_history_batch(items)
+        single = [app_module.serialize_history(h) for h in items]
+        db.session.remove()
+
+    assert batch == single
+    assert any(item.get('isComparison') for item in batch)
@@ -0,0 +1,121 @@
+import datetime
+import types
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+
+from models import Conversation, History, HistoryMemoryCache, db
+from utils import history_fts
+from utils.history_fts import ensure_history_fts, search_history
+
+
+def _turn(user_id, question, answer="", conversation_id=None, **fields):
+    if conversation_id is None:
+        conversation = Conversation(user_id=user_id, title=question[:20])
+        db.session.add(conversation)
+        db.session.flush()
+        conversation_id = conversation.id
+    row = History(conversation_id=conversation_id, user_question=question, ai_response=answer, **fields)
+    db.session.add(row)
+    db.session.commit()
+    return row.id, conversation_id
+
+
+def _ids(user_id, *tokens, **kwargs):
+    return [history_id for history_id, _rank in search_history(db.session, user_id, set(tokens), **kwargs)]
+
+
+def test_triggers_keep_the_index_in_sync(app_module, make_user):
+    user_id = make_user()
+    with app_module.app.app_context():
+        assert history_fts._STATE["ready"] == "sqlite"
+        history_id, _ = _turn(user_id, "flumox setup", "plain answer")
+        assert _ids(user_id, "flumox") == [history_id]
+
+        row = db.session.get(History, history_id)
+        row.user_question = "grindle setup"
+        row.ai_response = "vorpal answer"
+        db.session.commit()
+        assert _ids(user_id, "flumox") == []
+        assert _ids(user_id, "grindle") == [history_id]
+        assert _ids(user_id, "vorpal") == [history_id]
+
+        db.session.delete(row)
+        db.session.commit()
+        assert _ids(user_id, "grindle") == []
+        # External-content FTS5 raises on any drift from the history table.
+        db.session.execute(text("INSERT INTO history_fts(history_fts) VALUES ('integrity-check')"))
+        db.session.remove()
+
+
+def test_index_is_backfilled_when_first_created(app_module, make_user):
+    user_id = make_user()
+    with app_module.app.app_context():
+        for statement in ("DROP TRIGGER history_fts_ai", "DROP TRIGGER history_fts_ad",
+                          "DROP TRIGGER history_fts_au", "DROP TABLE history_fts"):
+            db.session.execute(text(statement))
+        db.session.commit()
+        history_id, _ = _turn(user_id, "quokkafy the config")  # written while no index exists
+
+        assert ensure_history_fts(db.engine) is True
+        assert _ids(user_id, "quokkafy") == [history_id]
+        assert ensure_history_fts(db.engine) is True  # re-running keeps the existing index
+        assert _ids(user_id, "quokkafy") == [history_id]
+        db.session.remove()
+
+
+def test_prefix_matches_skip_deleted_excluded_and_foreign_rows(app_module, make_user):
+    user_id, other_id = make_user(), make_user()
+    with app_module.app.app_context():
+        live_id, _ = _turn(user_id, "how are zorblated widgets built")
+        _turn(user_id, "zorblated but deleted", is_deleted=True)
+        _, current_conversation = _turn(user_id, "zorblated in this conversation")
+        _turn(other_id, "someone else's zorblated widgets")
+
+        # "zorblatting" searches as the prefix "zorbl*".
+        assert _ids(user_id, "zorblatting", exclude_conversation_id=current_conversation) == [live_id]
+        assert len(_ids(user_id, "zorblatting")) == 2
+        assert _ids(user_id, "zor") == []  # short tokens must match exactly
+        db.session.remove()
+
+
+def test_chat_recall_keeps_the_index_ranking(app_module, make_user):
+    user_id = make_user()
+    old = datetime.datetime(2024, 1, 1)
+    with app_module.app.app_context():
+        # Both rows overlap the question equally; the fallback scan would put the
+        # newer one first, the index ranks the one dense in both terms first.
+        strong_id, _ = _turn(user_id, "snarfle blorpus snarfle blorpus", "blorpus snarfle", timestamp=old)
+        weak_id, _ = _turn(user_id, "snarfle " + "filler words " * 40, "and later blorpus",
+                           timestamp=old + datetime.timedelta(days=30))
+
+        ranked = _ids(user_id, "snarfle", "blorpus")
+        assert ranked == [strong_id, weak_id]
+
+        user = types.SimpleNamespace(id=user_id)
+        recall = app_module._load_recent_chat_recall(user, "snarfle blorpus?")
+        assert [hit["source_id"] for hit in recall["hits"]] == [strong_id, weak_id]
+        assert recall["text"].startswith("[Previous Chat Recall]")
+        db.session.remove()
+
+
+def test_editing_a_post_drops_its_cached_memory_candidates(app_module, make_user, count_queries):
+    user_id = make_user()
+    with app_module.app.app_context():
+        history_id, _ = _turn(user_id, "prefer tabs in python files", "noted")
+        first = app_module._history_memory_candidates([history_id])
+        db.session.commit()
+        with count_queries(lambda sql: "FROM history " in sql or "FROM history\n" in sql) as reads:
+            assert app_module._history_memory_candidates([history_id]) == first
+        assert reads == []  # served from history_memory_cache
+        token = create_access_token(identity=str(user_id))
+        db.session.remove()
+
+    response = app_module.app.test_client().put(
+        f"/api/posts/{history_id}", json={"user_question": "prefer spaces in python files"},
+        headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    with app_module.app.app_context():
+        assert db.session.get(HistoryMemoryCache, history_id) is None
+        db.session.remove()
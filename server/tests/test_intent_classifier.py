@@ -0,0 +1,76 @@
+import json
+
+from utils.intent_classifier import RoutingClassifier, load_models, load_samples, save_models, seed_samples, train_models
+
+
+def test_confident_questions_stay_local_and_unsure_ones_escalate_once(tmp_path):
+    log_path = tmp_path / "decisions.jsonl"
+    classifier = RoutingClassifier(model_path="", log_path=str(log_path), min_confidence=0.55, cache_size=16)
+    calls = []
+
+    def llm(question, code):
+        calls.append(question)
+        return "architecture"
+
+    assert classifier.intent("Merhaba", escalate=llm) == "general"
+    assert classifier.intent("Write a poem about rain", escalate=llm) == "creative"
+    assert calls == []
+
+    classifier.min_confidence = 1.0
+    assert classifier.intent("Plan our billing service", escalate=llm) == "architecture"
+    # Same question after normalization: served from the LRU, no second LLM call.
+    assert classifier.intent("  plan our   BILLING service ", escalate=llm) == "architecture"
+    assert calls == ["Plan our billing service"]
+    assert classifier.stats["escalated"] == 1 and classifier.stats["cache_hits"] == 1
+
+    logged = [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()]
+    assert logged[0]["question"] == "Plan our billing service" and logged[0]["intent"] == "architecture"
+
+
+def test_failed_escalation_falls_back_to_local_label_without_caching(tmp_path):
+    classifier = RoutingClassifier(model_path="", log_path="", min_confidence=1.0, cache_size=16)
+    calls = []
+
+    def unavailable(question, code):
+        calls.append(question)
+        return None
+
+    label = classifier.intent("Hello", escalate=unavailable)
+    assert label == classifier.predict("intent", "Hello")[0]
+    classifier.intent("Hello", escalate=unavailable)
+    assert len(calls) == 2
+
+
+def test_decision_log_is_opt_in_and_rotates(tmp_path, monkeypatch):
+    monkeypatch.delenv("ROUTING_DECISIONS_LOG", raising=False)
+    assert RoutingClassifier(model_path="").log_path == ""
+
+    log_path = tmp_path / "decisions.jsonl"
+    classifier = RoutingClassifier(model_path="", log_path=str(log_path), log_max_bytes=4096)
+    for i in range(60):
+        classifier.record(f"question {i} " + "x" * 100, intent="general")
+
+    rotated = tmp_path / "decisions.jsonl.1"
+    assert rotated.exists() and log_path.stat().st_size < 4096 and rotated.stat().st_size < 4096 + 200
+    # Training reads the rotated file then the live one; older rotations are dropped.
+    samples = load_samples(str(log_path))
+    assert 0 < len(samples) < 60 and samples[-1]["question"].startswith("question 59 ")
+
+
+def test_logged_decisions_train_the_next_model(tmp_path):
+    log_path = tmp_path / "decisions.jsonl"
+    question = "zorblax quantum ledger reconciliation"
+    with open(log_path, "w", encoding="utf-8") as f:
+        for _ in range(6):
+            f.write(json.dumps({"question": question, "intent": "debug", "language": "sql"}) + "\n")
+
+    classifier = RoutingClassifier(model_path="", log_path=str(log_path))
+    assert classifier.predict("intent", question)[0] == "debug"
+    assert classifier.predict("language", question)[0] == "sql"
+
+    model_path = tmp_path / "model.npz"
+    save_models(str(model_path), *train_models(seed_samples()))
+    intent_model, language_model = load_models(str(model_path))
+    reloaded = RoutingClassifier(model_path=str(model_path), log_path="")
+    assert reloaded.predict("intent", "Merhaba")[0] == "general"
+    assert intent_model.labels[0] == "simple" and language_model.labels[0] == "unknown"
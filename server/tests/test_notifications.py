@@ -0,0 +1,47 @@
+import datetime
+
+from flask_jwt_extended import create_access_token
+
+from models import Answer, Conversation, History, Notification, db
+
+
+def test_cursor_pages_cover_same_second_rows_across_id_digit_boundaries(app_module, make_user):
+    user_id, commenter_id = make_user(), make_user()
+    stamp = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    with app_module.app.app_context():
+        # 'notif-1000000' < 'notif-999999' as strings; the cursor must not skip or repeat them.
+        for notification_id in range(999_995, 1_000_005):
+            db.session.add(Notification(id=notification_id, user_id=user_id, type='follow',
+                                        message='followed you', created_at=stamp))
+        conversation = Conversation(user_id=user_id, title="question")
+        db.session.add(conversation)
+        db.session.flush()
+        post = History(conversation_id=conversation.id, user_question="q", ai_response="a",
+                       selected_model="gemini-2.5-flash")
+        db.session.add(post)
+        db.session.flush()
+        for _ in range(3):
+            db.session.add(Answer(history_id=post.id, author_id=commenter_id, author='c', body='reply',
+                                  created_at=stamp))
+        db.session.commit()
+        expected = [f"notif-{i}" for i in range(999_995, 1_000_005)]
+        expected += [f"ans-{a.id}" for a in Answer.query.filter_by(history_id=post.id)]
+        token = create_access_token(identity=str(user_id))
+        db.session.remove()
+
+    client = app_module.app.test_client()
+    seen, cursor = [], None
+    while True:
+        query = {'limit': 4, **({'before': cursor} if cursor else {})}
+        response = client.get('/api/notifications', query_string=query,
+                              headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 200
+        seen += [item['id'] for item in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+
+    assert len(seen) == len(set(seen)) == len(expected)
+    assert set(seen) == set(expected)
+    notif_ids = [int(nid.split('-')[1]) for nid in seen if nid.startswith('notif-')]
+    assert notif_ids == sorted(notif_ids, reverse=True)
@@ -0,0 +1,62 @@
+import time
+
+from utils.preflight import Preflight
+
+
+def _slow(value, seconds):
+    time.sleep(seconds)
+    return value
+
+
+def _boom():
+    raise RuntimeError("provider down")
+
+
+def test_stages_overlap_instead_of_adding_up():
+    preflight = Preflight(deadline_sec=5)
+    started = time.perf_counter()
+    for name in ("github_tree", "project_context", "memory", "intent"):
+        preflight.submit(name, _slow, name, 0.3)
+
+    values = [preflight.result(name) for name in ("github_tree", "project_context", "memory", "intent")]
+
+    assert values == ["github_tree", "project_context", "memory", "intent"]
+    assert time.perf_counter() - started < 1.0
+
+
+def test_late_and_failing_stages_fall_back_to_defaults():
+    preflight = Preflight(deadline_sec=0.3)
+    preflight.submit("intent", _slow, "debug", 0.05)
+    preflight.submit("language", _slow, "python", 3)
+    preflight.submit("memory", _boom)
+
+    started = time.perf_counter()
+    assert preflight.result("intent", "general") == "debug"
+    assert preflight.result("language", "unknown") == "unknown"
+    assert preflight.result("memory", {"text": ""}) == {"text": ""}
+    assert preflight.result("github_tree", "") == ""
+    # One shared deadline: the late stage does not get a fresh budget per read.
+    assert time.perf_counter() - started < 1.0
+    assert preflight.result("language", "unknown") == "unknown"
+
+    timings = preflight.timings()
+    assert timings["intent"]["status"] == "ok"
+    assert timings["language"]["status"] == "timeout"
+    assert timings["memory"]["status"] == "error"
+    assert timings["deadline_ms"] == 300
+
+
+def test_stages_run_inside_the_given_context():
+    entered = []
+
+    class _Context:
+        def __enter__(self):
+            entered.append(True)
+
+        def __exit__(self, *exc):
+            return False
+
+    preflight = Preflight(deadline_sec=5, context=_Context)
+    preflight.submit("memory", _slow, "ok", 0)
+    assert preflight.result("memory") == "ok"
+    assert entered == [True]
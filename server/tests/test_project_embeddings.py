@@ -0,0 +1,53 @@
+import pytest
+
+
+@pytest.fixture
+def embed_calls(app_module, monkeypatch):
+    calls = {"batch": [], "single": []}
+    monkeypatch.setattr(app_module, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(app_module.time, "sleep", lambda _seconds: None)
+    monkeypatch.setattr(app_module, "_working_embedding_model", "models/gemini-embedding-001")
+    monkeypatch.setattr(app_module, "PROJECT_EMBED_BATCH_SIZE", 64)
+    return calls
+
+
+def test_rate_limited_batch_is_not_split(app_module, monkeypatch, embed_calls):
+    def throttled(model, contents, task_type=None):
+        embed_calls["batch"].append(len(contents))
+        raise RuntimeError("429 RESOURCE_EXHAUSTED")
+
+    def single(model, content, task_type=None):
+        embed_calls["single"].append(content)
+        raise RuntimeError("429 RESOURCE_EXHAUSTED")
+
+    monkeypatch.setattr(app_module.genai, "embed_contents", throttled)
+    monkeypatch.setattr(app_module.genai, "embed_content", single)
+
+    results = app_module._embed_texts_batched([f"chunk {i}" for i in range(64)])
+
+    assert results == [None] * 64
+    assert embed_calls["batch"] == [64] * 3  # backoff retries, then the batch is left for the indexer
+    assert embed_calls["single"] == []
+    # One throttled call doesn't make the process forget its working model.
+    assert app_module._embed_text_with_fallback("x") == (None, None)
+    assert embed_calls["single"] == ["x"]
+    assert app_module._working_embedding_model == "models/gemini-embedding-001"
+
+
+def test_only_a_partial_response_is_split(app_module, monkeypatch, embed_calls):
+    def partial(model, contents, task_type=None):
+        embed_calls["batch"].append(len(contents))
+        return [[1.0] if text != "chunk 3" else [] for text in contents]
+
+    def single(model, content, task_type=None):
+        embed_calls["single"].append(content)
+        return {"embedding": [2.0]}
+
+    monkeypatch.setattr(app_module.genai, "embed_contents", partial)
+    monkeypatch.setattr(app_module.genai, "embed_content", single)
+
+    results = app_module._embed_texts_batched([f"chunk {i}" for i in range(8)])
+
+    assert [values for values, _model in results] == [[1.0]] * 3 + [[2.0]] + [[1.0]] * 4
+    assert embed_calls["batch"] == [8]
+    assert embed_calls["single"] == ["chunk 3"]
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from utils import provider_governor
+from utils.provider_governor import ProviderGovernor, QueueStatus
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    monkeypatch.setenv("GEMINI_MAX_CONCURRENCY", "2")
+    monkeypatch.delenv("PROVIDER_MAX_PER_USER", raising=False)
+    return ProviderGovernor(path="local")
+
+
+def test_provider_limit_caps_in_flight_calls(governor):
+    first = governor.reserve("gemini", user_id=1)
+    second = governor.reserve("gemini", user_id=1)
+    first.acquire(max_wait=0.5)
+    second.acquire(max_wait=0.5)
+    assert governor.snapshot()["gemini"]["active"] == 2
+
+    third = governor.reserve("gemini", user_id=1)
+    with pytest.raises(TimeoutError):
+        third.acquire(max_wait=0.2)
+    # Other providers have their own limit.
+    governor.reserve("openai", user_id=1).acquire(max_wait=0.2)
+
+    first.release()
+    governor.reserve("gemini", user_id=1).acquire(max_wait=0.5)
+    assert governor.snapshot()["gemini"] == {"limit": 2, "active": 2, "queued": 0}
+
+
+def test_freed_slot_goes_to_the_user_holding_fewer(governor):
+    heavy = [governor.reserve("gemini", user_id="heavy") for _ in range(2)]
+    for reservation in heavy:
+        reservation.acquire(max_wait=0.5)  # a lone user may take every slot
+
+    # The heavy user queued two more before the light user showed up.
+    assert governor.try_acquire("heavy-3", "gemini", "gemini", "u:heavy")[0] is False
+    assert governor.try_acquire("heavy-4", "gemini", "gemini", "u:heavy")[0] is False
+    admitted, position, _ = governor.try_acquire("light-1", "gemini", "gemini", "u:light")
+    assert not admitted and position == 1
+
+    heavy[0].release()
+    assert governor.try_acquire("heavy-3", "gemini", "gemini", "u:heavy")[0] is False
+    assert governor.try_acquire("light-1", "gemini", "gemini", "u:light")[0] is True
+
+
+def test_expired_leases_are_reclaimed(governor, monkeypatch):
+    monkeypatch.setattr(provider_governor, "_LEASE_TTL_SEC", 0.05)
+    for _ in range(2):
+        # Acquired and never released, as when a worker dies mid-call.
+        governor.reserve("gemini", user_id=1).acquire(max_wait=0.5)
+
+    time.sleep(0.1)
+    assert governor.snapshot()["gemini"]["active"] == 0
+    governor.reserve("gemini", user_id=2).acquire(max_wait=0.5)
+
+
+def test_waiters_time_out_after_the_queue_timeout(governor, monkeypatch):
+    monkeypatch.setenv("MODEL_QUEUE_TIMEOUT_SEC", "0.3")
+    for _ in range(2):
+        governor.reserve("gemini", user_id=1).acquire()
+
+    waiting = governor.reserve("gemini", user_id=2)
+    updates = []
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError, match="Concurrency limit \\(2\\)"):
+        for status in waiting.wait():
+            updates.append(status)
+    assert 0.3 <= time.perf_counter() - started < 2.0
+    assert updates and isinstance(updates[0], QueueStatus) and updates[0].position == 1
+
+    with pytest.raises(TimeoutError):
+        with governor.reserve("gemini", user_id=3):
+            pass
+    assert governor.snapshot()["gemini"]["queued"] == 0
+
+
+def test_blend_model_calls_reserve_under_the_user(app_module, monkeypatch):
+    seen = []
+
+    def fake_answer(question, code, history_context, requested_model, *args, **kwargs):
+        seen.append(provider_governor.get_provider_governor().reserve("gemini").user_key)
+        yield "ok"
+
+    monkeypatch.setattr(app_module, "generate_gemini_answer", fake_answer)
+    assert app_module.fetch_model_response_sync("gemini-2.5-flash", "q", user_id=42) == ("gemini-2.5-flash", "ok")
+    assert seen == ["u:42"]
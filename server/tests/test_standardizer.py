@@ -0,0 +1,58 @@
+from utils import standardizer
+from utils.standardizer import CodeStandardizer
+
+
+def test_python_blocks_are_formatted_off_thread_and_memoized(monkeypatch):
+    formatter = standardizer.get_python_formatter()
+    answer = "Here:\n```python\nx=[1,2 ,3]\ndef f( a ):\n    return a*2   \n```\n```js\nlet a = 1;   \n```"
+
+    first = CodeStandardizer.standardize(answer)
+    assert "x = [1, 2, 3]" in first
+    assert "def f(a):" in first
+    assert "let a = 1;\n```" in first
+
+    def fail(*args, **kwargs):
+        raise AssertionError("memoized block was formatted again")
+
+    monkeypatch.setattr(formatter.pool, "run", fail)
+    hits = formatter.hits
+    assert CodeStandardizer.standardize(answer) == first
+    assert formatter.hits == hits + 1
+
+
+def test_oversized_and_slow_blocks_only_get_whitespace_cleanup(monkeypatch):
+    formatter = standardizer.get_python_formatter()
+    monkeypatch.setattr(formatter, "max_block_chars", 10)
+    assert CodeStandardizer.standardize("```python\ny=[4 ,5]   \n```") == "```python\ny=[4 ,5]\n```"
+
+    def slow(*args, **kwargs):
+        raise TimeoutError("code-standardizer timed out after 3s")
+
+    monkeypatch.setattr(formatter, "max_block_chars", 20000)
+    monkeypatch.setattr(formatter.pool, "run", slow)
+    assert CodeStandardizer.standardize("```py\nz=[6 ,7]   \n```") == "```py\nz=[6 ,7]\n```"
+
+
+def test_all_blocks_of_an_answer_share_one_pool_call(monkeypatch):
+    formatter = standardizer.get_python_formatter()
+    calls = []
+
+    def run(fn, codes, timeout):
+        calls.append((len(codes), timeout))
+        return fn(codes)
+
+    monkeypatch.setattr(formatter.pool, "run", run)
+    blocks = [f"```python\nv{i}=[{i} ,1]\n```" for i in range(5)]
+    answer = "\n".join(blocks + ["```python\nv0=[0 ,1]\n```"])
+
+    result = CodeStandardizer.standardize(answer)
+
+    assert calls == [(5, formatter.timeout)]
+    assert result.count("v0 = [0, 1]") == 2 and "v4 = [4, 1]" in result
+
+    def slow(*args, **kwargs):
+        raise TimeoutError("code-standardizer timed out after 3s")
+
+    monkeypatch.setattr(formatter.pool, "run", slow)
+    many = "\n".join(f"```py\nw{i}=[{i} ,2]   \n```" for i in range(4))
+    assert CodeStandardizer.standardize(many) == "\n".join(f"```py\nw{i}=[{i} ,2]\n```" for i in range(4))
@@ -0,0 +1,265 @@
+import json
+import threading
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy.exc import OperationalError
+
+from models import TokenBalance, TokenReservation, TokenTransaction, UsageCounter, User, db
+
+
+def _retry_locked(fn):
+    # SQLite refuses a write-lock upgrade with SQLITE_BUSY instead of waiting;
+    # Postgres just blocks on the row. Retry so the test exercises the ledger, not SQLite.
+    for _ in range(50):
+        try:
+            return fn()
+        except OperationalError:
+            db.session.rollback()
+    raise AssertionError("database stayed locked")
+
+
+def _run_parallel(app_module, user_id, turns_per_thread, threads, turn):
+    results = []
+    lock = threading.Lock()
+
+    def _worker():
+        for _ in range(turns_per_thread):
+            with app_module.app.app_context():
+                user = db.session.get(User, user_id)
+                outcome = _retry_locked(lambda: turn(user))
+                db.session.remove()
+            with lock:
+                results.append(outcome)
+
+    workers = [threading.Thread(target=_worker) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def _ledger(app_module, user_id):
+    with app_module.app.app_context():
+        wallet = TokenBalance.query.filter_by(user_id=user_id).one()
+        spent = db.session.query(db.func.coalesce(db.func.sum(TokenTransaction.amount), 0)).filter(
+            TokenTransaction.user_id == user_id, TokenTransaction.type == "usage"
+        ).scalar()
+        open_holds = TokenReservation.query.filter_by(user_id=user_id, status="reserved").count()
+        snapshot = (wallet.balance, wallet.total_spent, -spent, open_holds)
+        db.session.remove()
+    return snapshot
+
+
+def _usage(app_module, user_id):
+    with app_module.app.app_context():
+        day_key, month_key = app_module._usage_period_keys()
+        rows = {(row.period, row.period_key): row for row in UsageCounter.query.filter_by(user_id=user_id)}
+        snapshot = (rows[("day", day_key)].requests, rows[("month", month_key)].tokens, len(rows))
+        db.session.remove()
+    return snapshot
+
+
+def test_parallel_quota_increments_lose_no_counts(app_module, make_user):
+    user_id = make_user()
+
+    def _turn(user):
+        return app_module.consume_plan_quota(user, 100)["allowed"]
+
+    results = _run_parallel(app_module, user_id, turns_per_thread=3, threads=8, turn=_turn)
+
+    assert len(results) == 24 and all(results)
+    assert _usage(app_module, user_id) == (24, 2400, 2)
+
+
+def test_quota_caps_hold_under_concurrency(app_module, make_user):
+    daily_cap = app_module.PLAN_LIMITS["free"]["daily_requests"]
+    monthly_cap = app_module.PLAN_LIMITS["free"]["monthly_tokens"]
+
+    user_id = make_user()
+    results = _run_parallel(app_module, user_id, turns_per_thread=6, threads=8,
+                            turn=lambda user: app_module.consume_plan_quota(user, 10)["allowed"])
+    assert sum(results) == daily_cap < len(results)
+    assert _usage(app_module, user_id) == (daily_cap, daily_cap * 10, 2)
+
+    # A turn refused by the monthly cap gives its daily request back.
+    user_id = make_user()
+    per_turn = monthly_cap // 10
+    results = _run_parallel(app_module, user_id, turns_per_thread=3, threads=8,
+                            turn=lambda user: app_module.consume_plan_quota(user, per_turn)["allowed"])
+    assert sum(results) == 10
+    assert _usage(app_module, user_id) == (10, monthly_cap, 2)
+
+
+def test_legacy_usage_counts_carry_over_once(app_module, make_user):
+    with app_module.app.app_context():
+        day_key, month_key = app_module._usage_period_keys()
+    legacy = {"usage_limits": {"daily": {"date": day_key, "count": 5},
+                               "monthly": {"month": month_key, "tokens": 1000}}}
+    user_id = make_user(preferences=json.dumps(legacy))
+
+    results = _run_parallel(app_module, user_id, turns_per_thread=2, threads=4,
+                            turn=lambda user: app_module.consume_plan_quota(user, 100)["allowed"])
+    assert all(results)
+    assert _usage(app_module, user_id) == (5 + 8, 1000 + 800, 2)
+
+    with app_module.app.app_context():
+        usage = app_module.consume_plan_quota(db.session.get(User, user_id), 100)["usage"]
+        db.session.remove()
+    assert (usage["daily_requests_used"], usage["monthly_tokens_used"]) == (14, 1900)
+
+
+def test_parallel_reservations_never_overspend(app_module, make_user):
+    user_id = make_user()
+    cost = app_module._resolve_token_cost("gemini-2.5-flash")
+    grant = app_module.SIGNUP_GRANT_TOKENS
+
+    def _turn(user):
+        allowed, _balance, _cost, reservation_id = app_module.reserve_tokens(user, "gemini-2.5-flash")
+        if allowed:
+            app_module.settle_token_reservation(reservation_id, description="test turn")
+            db.session.commit()
+        return allowed
+
+    results = _run_parallel(app_module, user_id, turns_per_thread=6, threads=8, turn=_turn)
+
+    expected = grant // cost
+    assert sum(results) == expected
+    balance, total_spent, logged, open_holds = _ledger(app_module, user_id)
+    assert balance == grant - expected * cost
+    assert balance >= 0
+    assert total_spent == logged == expected * cost
+    assert open_holds == 0
+
+
+def test_refund_returns_hold_once(app_module, make_user):
+    user_id = make_user()
+    with app_module.app.app_context():
+        user = db.session.get(User, user_id)
+        allowed, balance_after_hold, cost, reservation_id = app_module.reserve_tokens(user, "gemini-2.5-flash")
+        assert allowed and reservation_id
+        assert app_module.refund_token_reservation(reservation_id) is True
+        assert app_module.refund_token_reservation(reservation_id) is False
+        assert app_module.settle_token_reservation(reservation_id) is None
+        db.session.commit()
+        db.session.remove()
+
+    balance, total_spent, logged, open_holds = _ledger(app_module, user_id)
+    assert balance == balance_after_hold + cost == app_module.SIGNUP_GRANT_TOKENS
+    assert total_spent == logged == 0
+    assert open_holds == 0
+
+
+def test_parallel_deduct_tokens_loses_no_updates(app_module, make_user):
+    user_id = make_user()
+    cost = app_module._resolve_token_cost("gemini-2.5-flash")
+
+    def _turn(user):
+        ok, _balance = app_module.deduct_tokens(user, "gemini-2.5-flash", description="test deduct")
+        return ok
+
+    results = _run_parallel(app_module, user_id, turns_per_thread=3, threads=8, turn=_turn)
+
+    assert all(results)
+    balance, total_spent, logged, _open = _ledger(app_module, user_id)
+    assert total_spent == logged == len(results) * cost
+    assert balance == app_module.SIGNUP_GRANT_TOKENS - len(results) * cost
+
+
+def test_external_key_lookup_runs_once_per_request(app_module, make_user, count_queries):
+    user_id = make_user()
+
+    with app_module.app.test_request_context(), \
+            count_queries(lambda statement: "user_external_api_key" in statement) as statements:
+        user = app_module.get_request_identity(user_id).user
+        loaded = len(statements)
+        app_module.check_tokens(user, "gpt-4o")
+        app_module.check_tokens(user, "gpt-4o")
+        app_module.reserve_tokens(user, "gpt-4o")
+        db.session.remove()
+
+    # The identity load joins the BYOK providers in; nothing queries them again.
+    assert loaded == 1
+    assert len(statements) == 1
+
+
+def test_request_identity_loads_once_and_writes_preferences_once(app_module, make_user, count_queries):
+    user_id = make_user()
+    with app_module.app.app_context():
+        app_module.get_or_create_token_balance(db.session.get(User, user_id))
+        db.session.remove()
+
+    with app_module.app.test_request_context(), count_queries() as statements:
+        identity = app_module.get_request_identity(user_id)
+        assert app_module.get_request_identity(user_id) is identity
+        app_module.get_user_preferences(identity.user)
+        app_module._wallet_balance(identity.user)
+        assert len(statements) == 1
+
+        app_module.update_user_preferences(identity.user, {"persona": "Backend"})
+        app_module.update_user_preferences(identity.user, {"expertise": "Senior"})
+        assert app_module.get_user_preferences(identity.user)["persona"] == "Backend"
+        db.session.commit()
+        db.session.remove()
+
+    updates = [s for s in statements if s.lstrip().upper().startswith('UPDATE "USER"') or s.lstrip().upper().startswith("UPDATE USER ")]
+    assert len(updates) == 1
+    with app_module.app.app_context():
+        prefs = app_module.get_user_preferences(db.session.get(User, user_id))
+        assert prefs["persona"] == "Backend" and prefs["expertise"] == "Senior"
+
+
+def test_stream_closed_before_settling_refunds_the_hold(app_module, make_user):
+    user_id = make_user()
+    with app_module.app.app_context():
+        user = db.session.get(User, user_id)
+        _, _, cost, disconnected_id = app_module.reserve_tokens(user, "gemini-2.5-flash")
+        _, balance_after_holds, _, finished_id = app_module.reserve_tokens(user, "gemini-2.5-flash")
+
+        def answer_stream(reservation_id):
+            yield "data: {}\n\n"
+            app_module.settle_token_reservation(reservation_id)
+            db.session.commit()
+            yield "data: {}\n\n"
+
+        disconnected = app_module.refund_unsettled_on_close(answer_stream(disconnected_id), disconnected_id)
+        next(disconnected)
+        disconnected.close()  # what the WSGI server does when the client goes away
+
+        assert list(app_module.refund_unsettled_on_close(answer_stream(finished_id), finished_id))
+        statuses = {r.id: r.status for r in TokenReservation.query.filter_by(user_id=user_id)}
+        db.session.remove()
+
+    assert statuses == {disconnected_id: "refunded", finished_id: "settled"}
+    balance, total_spent, logged, open_holds = _ledger(app_module, user_id)
+    assert balance == balance_after_holds + cost
+    assert total_spent == logged == cost
+    assert open_holds == 0
+
+
+def test_error_responses_do_not_commit_pending_changes(app_module, make_user):
+    user_id = make_user(password_hash=app_module.hash_password("right-password"))
+    with app_module.app.app_context():
+        original_name = db.session.get(User, user_id).display_name
+        jwt = create_access_token(identity=str(user_id))
+        db.session.remove()
+
+    client = app_module.app.test_client()
+    edit = {"display_name": f"renamed-{user_id}", "bio": "hello", "new_password": "next-password"}
+    response = client.put("/api/auth/profile", json={**edit, "current_password": "wrong"},
+                          headers={"Authorization": f"Bearer {jwt}"})
+    assert response.status_code == 401
+    with app_module.app.app_context():
+        user = db.session.get(User, user_id)
+        assert user.display_name == original_name
+        assert "bio" not in app_module.get_user_preferences(user)
+        db.session.remove()
+
+    response = client.put("/api/auth/profile", json={**edit, "current_password": "right-password"},
+                          headers={"Authorization": f"Bearer {jwt}"})
+    assert response.status_code == 200
+    with app_module.app.app_context():
+        user = db.session.get(User, user_id)
+        assert user.display_name == f"renamed-{user_id}"
+        assert app_module.get_user_preferences(user)["bio"] == "hello"
+        db.session.remove()
@@ -0,0 +1,146 @@
+"""
+In-process API-key lookup cache and write-behind ``last_used_at`` stamps.
+
+The VS Code extension sends many small ``/v1`` requests with the same key, and
+each one used to cost a key lookup plus a commit just to move ``last_used_at``.
+
+* :class:`ApiKeyCache` maps the stored (hashed) key to a :class:`CachedApiKey`
+  snapshot for ``API_KEY_CACHE_TTL_SEC`` (default 30 s, ``0`` disables).
+  Revoking or deleting a key invalidates it in this worker at once; other
+  workers drop it when the entry expires, so keep the TTL short.
+* :class:`LastUsedBuffer` keeps the newest stamp per key id and hands the batch
+  to a writer every ``API_KEY_LAST_USED_FLUSH_SEC`` (default 5 s). A failed
+  write is merged back and retried on the next tick.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Callable, Dict, Optional
+
+from utils.concurrency import env_float, env_int
+
+CachedApiKey = namedtuple('CachedApiKey', 'id user_id key client is_active')
+
+
+class ApiKeyCache:
+    """TTL + LRU cache of active API keys keyed by their stored value."""
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None) -> None:
+        if ttl is None:
+            ttl = env_float('API_KEY_CACHE_TTL_SEC', 30.0, minimum=0.0, maximum=600.0)
+        if max_entries is None:
+            max_entries = env_int('API_KEY_CACHE_MAX_ENTRIES', 10000, minimum=1)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()  # stored key -> (expires_at, CachedApiKey)
+
+    def get(self, stored_key: str) -> Optional[CachedApiKey]:
+        if self.ttl <= 0 or not stored_key:
+            return None
+        with self._lock:
+            entry = self._entries.get(stored_key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[stored_key]
+                return None
+            self._entries.move_to_end(stored_key)
+            return entry[1]
+
+    def put(self, record, client: str) -> CachedApiKey:
+        """Snapshot an ``ApiKey`` row; only active keys are remembered."""
+        snapshot = CachedApiKey(record.id, record.user_id, record.key, client, bool(record.is_active))
+        if self.ttl > 0 and snapshot.is_active and snapshot.key:
+            with self._lock:
+                self._entries[snapshot.key] = (time.monotonic() + self.ttl, snapshot)
+                self._entries.move_to_end(snapshot.key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, stored_key: Optional[str] = None, *, key_id=None, user_id=None) -> int:
+        """Drop entries matching the stored key, the key id or the owning user."""
+        with self._lock:
+            doomed = [
+                stored for stored, (_expires_at, snapshot) in self._entries.items()
+                if stored == stored_key
+                or (key_id is not None and snapshot.id == key_id)
+                or (user_id is not None and snapshot.user_id == user_id)
+            ]
+            for stored in doomed:
+                del self._entries[stored]
+        return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class LastUsedBuffer:
+    """Collects ``last_used_at`` stamps and writes them in periodic batches.
+
+    ``writer`` receives ``{key_id: datetime}`` and runs on the flush thread (or
+    the caller of :meth:`flush`); it must open whatever context it needs.
+    """
+
+    def __init__(self, writer: Callable[[Dict[int, object]], None], interval: Optional[float] = None) -> None:
+        if interval is None:
+            interval = env_float('API_KEY_LAST_USED_FLUSH_SEC', 5.0, minimum=0.05, maximum=300.0)
+        self.writer = writer
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[int, object] = {}
+        self._ticker = None
+        self._ticker_pid = None
+        self.flushes = 0
+
+    def touch(self, key_id, used_at) -> None:
+        if key_id is None:
+            return
+        with self._lock:
+            current = self._pending.get(key_id)
+            if current is None or used_at > current:
+                self._pending[key_id] = used_at
+            self._ensure_ticker()
+
+    def pending(self, key_id):
+        """The not-yet-written stamp for ``key_id``, if any."""
+        with self._lock:
+            return self._pending.get(key_id)
+
+    def flush(self) -> int:
+        """Write everything buffered now; returns the number of keys written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self.writer(batch)
+            except Exception as e:
+                print(f"WARN: API key last_used_at flush failed ({len(batch)} keys): {e}")
+                with self._lock:
+                    for key_id, used_at in batch.items():
+                        current = self._pending.get(key_id)
+                        if current is None or used_at > current:
+                            self._pending[key_id] = used_at
+                return 0
+            self.flushes += 1
+            return len(batch)
+
+    def _ensure_ticker(self) -> None:
+        pid = os.getpid()
+        if self._ticker is None or self._ticker_pid != pid or not self._ticker.is_alive():
+            self._ticker = threading.Thread(target=self._tick, name='api-key-last-used', daemon=True)
+            self._ticker_pid = pid
+            self._ticker.start()
+
+    def _tick(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
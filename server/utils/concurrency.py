@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import os
-import threading
 from contextlib import contextmanager
 
 
@@ -29,42 +28,26 @@ def env_float(name: str, default: float, *, minimum: float = 0.0, maximum: float
     return value
 
 
-_provider_limits = {
-    "gemini": env_int("GEMINI_MAX_CONCURRENCY", 4, minimum=1, maximum=64),
-    "openai": env_int("OPENAI_MAX_CONCURRENCY", 8, minimum=1, maximum=64),
-    "anthropic": env_int("ANTHROPIC_MAX_CONCURRENCY", 4, minimum=1, maximum=64),
-}
-_provider_semaphores = {
-    provider: threading.BoundedSemaphore(limit)
-    for provider, limit in _provider_limits.items()
-}
-
-
 def provider_limit(provider: str) -> int:
-    return _provider_limits.get((provider or "").lower(), 4)
-
+    from utils.provider_governor import get_provider_governor
 
-@contextmanager
-def provider_slot(provider: str, *, wait_seconds: float | None = None):
-    key = (provider or "").lower()
-    semaphore = _provider_semaphores.get(key)
-    if semaphore is None:
-        yield
-        return
-
-    timeout = env_float("MODEL_QUEUE_TIMEOUT_SEC", 8.0, minimum=0.1, maximum=120.0)
-    if wait_seconds is not None:
-        timeout = wait_seconds
+    return get_provider_governor().limit(provider)
 
-    acquired = semaphore.acquire(timeout=timeout)
-    if not acquired:
-        limit = provider_limit(key)
-        raise TimeoutError(
-            f"{key or 'model'} provider is busy. "
-            f"Concurrency limit ({limit}) reached; please retry shortly."
-        )
 
+@contextmanager
+def provider_slot(provider: str, *, wait_seconds: float | None = None, model: str | None = None, user_id=None):
+    """
+    Hold one of the provider's slots for the duration of the block.
+
+    Slots are leased from the cross-worker governor, so the limit applies to
+    the whole host rather than to each worker. Callers that can stream queue
+    updates should use ``get_provider_governor().reserve()`` + ``wait()``.
+    """
+    from utils.provider_governor import get_provider_governor
+
+    reservation = get_provider_governor().reserve(provider, model=model, user_id=user_id)
+    reservation.acquire(max_wait=wait_seconds)
     try:
-        yield
+        yield reservation
     finally:
-        semaphore.release()
+        reservation.release()
@@ -0,0 +1,228 @@
+"""
+Connection-pool sizing and per-worker database instrumentation.
+
+Pool sizing
+    Every uvicorn worker (``WEB_CONCURRENCY``) has its own engine and pool, and
+    runs Flask requests on an executor of ``ASYNC_EXECUTOR_WORKERS`` threads.
+    :func:`engine_pool_options` splits a host-wide connection budget
+    (``DB_MAX_CONNECTIONS``, default 80 – leave headroom under Postgres'
+    ``max_connections``) across the workers, never more than the worker has
+    threads: two thirds as the steady pool, the rest as overflow.
+    ``DB_POOL_SIZE`` / ``DB_MAX_OVERFLOW`` / ``DB_POOL_TIMEOUT_SEC`` override it.
+    The pool is sized for short checkouts: endpoints that wait on model calls
+    (ask, blend, profile analysis, PR audit) hand their connection back first
+    with ``release_request_session()``.
+
+Instrumentation
+    :class:`DbMetrics` counts pool checkouts and how long callers waited for a
+    connection (via :func:`instrumented_pool_class`), slow statements
+    (``DB_SLOW_QUERY_MS``, default 500) and, per route, requests, queries, query
+    time and request latency. Numbers are per worker process; scrape every
+    worker or aggregate downstream.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from utils.concurrency import env_float, env_int
+
+
+def executor_workers() -> int:
+    """Threads in the ASGI default executor that runs the Flask app (see backend.app_factory)."""
+    return env_int('ASYNC_EXECUTOR_WORKERS', 96, minimum=16, maximum=256)
+
+
+def engine_pool_options(metrics: Optional['DbMetrics'] = None) -> dict:
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for one worker process."""
+    web_workers = env_int('WEB_CONCURRENCY', 4, minimum=1, maximum=64)
+    budget = env_int('DB_MAX_CONNECTIONS', 80, minimum=2)
+    per_worker = max(2, min(executor_workers(), budget // web_workers))
+    pool_size = env_int('DB_POOL_SIZE', max(1, per_worker * 2 // 3), minimum=1)
+    max_overflow = env_int('DB_MAX_OVERFLOW', max(0, per_worker - pool_size), minimum=0)
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': env_float('DB_POOL_TIMEOUT_SEC', 10.0, minimum=0.5, maximum=120.0),
+        'pool_recycle': 1800,
+        'pool_pre_ping': True,
+    }
+    if metrics is not None:
+        options['poolclass'] = instrumented_pool_class(metrics)
+    return options
+
+
+def instrumented_pool_class(metrics: 'DbMetrics'):
+    """A ``QueuePool`` that reports how long each checkout waited for a connection."""
+
+    class InstrumentedQueuePool(QueuePool):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                metrics.record_checkout_wait(time.perf_counter() - started)
+
+    return InstrumentedQueuePool
+
+
+class _RouteStats:
+    __slots__ = ('requests', 'queries', 'query_seconds', 'latency_seconds', 'latency_max', 'errors')
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.latency_seconds = 0.0
+        self.latency_max = 0.0
+        self.errors = 0
+
+
+class DbMetrics:
+    """Process-wide pool, statement and per-route counters."""
+
+    def __init__(self, slow_query_ms: Optional[float] = None) -> None:
+        if slow_query_ms is None:
+            slow_query_ms = env_float('DB_SLOW_QUERY_MS', 500.0, minimum=1.0)
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._engine = None
+        self.checkouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.checkout_wait_max = 0.0
+        self.slow_queries = 0
+        self._routes: Dict[tuple, _RouteStats] = {}
+
+    # ── Wiring ────────────────────────────────────────────────────────────
+
+    def instrument(self, engine) -> None:
+        self._engine = engine
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('_metrics_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        local = self._local
+        if getattr(local, 'active', False):
+            local.queries += 1
+            local.query_seconds += elapsed
+        if elapsed >= self.slow_query_seconds:
+            with self._lock:
+                self.slow_queries += 1
+            print(f"WARN: slow query ({elapsed * 1000:.0f} ms): {' '.join(statement.split())[:300]}")
+
+    def record_checkout_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_wait_seconds += seconds
+            if seconds > self.checkout_wait_max:
+                self.checkout_wait_max = seconds
+
+    # ── Per-request accounting ────────────────────────────────────────────
+
+    def begin_request(self) -> None:
+        local = self._local
+        local.active = True
+        local.started = time.perf_counter()
+        local.queries = 0
+        local.query_seconds = 0.0
+
+    def end_request(self, method: str, route: str, failed: bool = False) -> None:
+        local = self._local
+        if not getattr(local, 'active', False):
+            return
+        local.active = False
+        latency = time.perf_counter() - local.started
+        with self._lock:
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = _RouteStats()
+            stats.requests += 1
+            stats.queries += local.queries
+            stats.query_seconds += local.query_seconds
+            stats.latency_seconds += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            if failed:
+                stats.errors += 1
+
+    # ── Reporting ─────────────────────────────────────────────────────────
+
+    def _pool_state(self) -> dict:
+        pool = getattr(self._engine, 'pool', None)
+        state = {}
+        for name in ('size', 'checkedout', 'overflow', 'checkedin'):
+            getter = getattr(pool, name, None)
+            if callable(getter):
+                try:
+                    state[name] = getter()
+                except Exception:
+                    pass
+        return state
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {
+                f"{method} {route}": {
+                    'requests': stats.requests,
+                    'errors': stats.errors,
+                    'queries': stats.queries,
+                    'queries_avg': round(stats.queries / stats.requests, 2) if stats.requests else 0,
+                    'query_ms_total': round(stats.query_seconds * 1000, 1),
+                    'latency_ms_avg': round(stats.latency_seconds * 1000 / stats.requests, 1) if stats.requests else 0,
+                    'latency_ms_max': round(stats.latency_max * 1000, 1),
+                }
+                for (method, route), stats in sorted(self._routes.items())
+            }
+            pool = {
+                'checkouts': self.checkouts,
+                'checkout_wait_ms_total': round(self.checkout_wait_seconds * 1000, 1),
+                'checkout_wait_ms_max': round(self.checkout_wait_max * 1000, 1),
+                'slow_queries': self.slow_queries,
+            }
+        pool.update(self._pool_state())
+        return {'pool': pool, 'routes': routes}
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of :meth:`snapshot`."""
+        with self._lock:
+            lines = [
+                '# TYPE db_pool_checkouts_total counter',
+                f'db_pool_checkouts_total {self.checkouts}',
+                '# TYPE db_pool_checkout_wait_seconds_total counter',
+                f'db_pool_checkout_wait_seconds_total {self.checkout_wait_seconds:.6f}',
+                '# TYPE db_pool_checkout_wait_seconds_max gauge',
+                f'db_pool_checkout_wait_seconds_max {self.checkout_wait_max:.6f}',
+                '# TYPE db_slow_queries_total counter',
+                f'db_slow_queries_total {self.slow_queries}',
+            ]
+            routes = [(key, (s.requests, s.errors, s.queries, s.query_seconds, s.latency_seconds, s.latency_max))
+                      for key, s in sorted(self._routes.items())]
+        for name, value in self._pool_state().items():
+            lines.append(f'# TYPE db_pool_{name} gauge')
+            lines.append(f'db_pool_{name} {value}')
+
+        series = (
+            ('http_route_requests_total', 'counter', 0, '{}'),
+            ('http_route_errors_total', 'counter', 1, '{}'),
+            ('http_route_db_queries_total', 'counter', 2, '{}'),
+            ('http_route_db_seconds_total', 'counter', 3, '{:.6f}'),
+            ('http_route_latency_seconds_total', 'counter', 4, '{:.6f}'),
+            ('http_route_latency_seconds_max', 'gauge', 5, '{:.6f}'),
+        )
+        for name, kind, index, fmt in series:
+            lines.append(f'# TYPE {name} {kind}')
+            for (method, route), values in routes:
+                label = route.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{name}{{method="{method}",route="{label}"}} {fmt.format(values[index])}')
+        return '\n'.join(lines) + '\n'
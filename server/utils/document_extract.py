@@ -0,0 +1,180 @@
+"""
+Uploaded document text extraction with a character budget, a worker process and a cache.
+
+* The PDF / DOCX extractors stop as soon as ``limit`` characters are collected
+  (PDFs also stop after ``DOCUMENT_MAX_PAGES`` pages), instead of reading the
+  whole file and truncating afterwards.
+* :class:`DocumentExtractor` runs them in a :class:`TimeoutProcessPool`
+  (``DOCUMENT_EXTRACT_WORKERS``, default 2; ``DOCUMENT_EXTRACT_TIMEOUT_SEC``,
+  default 20 s), so a large or hostile file cannot pin a request thread.
+* Results are cached by content hash (plus kind and budget) in an LRU bounded
+  by ``DOCUMENT_CACHE_MAX_CHARS``. Files on disk are also remembered by
+  ``(path, size, mtime)``, so re-attaching an upload in a later turn skips even
+  the hashing.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+from utils.concurrency import env_float, env_int
+from utils.process_pool import TimeoutProcessPool
+
+MAX_PAGES = env_int('DOCUMENT_MAX_PAGES', 200, minimum=1, maximum=5000)
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def extract_pdf_text(source, limit=10000, max_pages=MAX_PAGES):
+    """Page-by-page PDF text; stops at ``limit`` chars or ``max_pages`` pages."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(source)
+    parts = []
+    total_chars = 0
+    for index, page in enumerate(reader.pages):
+        if max_pages and index >= max_pages:
+            break
+        txt = (page.extract_text() or '').replace('\x00', '')
+        if not txt:
+            continue
+        if limit:
+            remaining = limit - total_chars
+            if remaining <= 0:
+                break
+            txt = txt[:remaining]
+        parts.append(txt)
+        total_chars += len(txt)
+        if limit and total_chars >= limit:
+            break
+    text = '\n'.join(parts)
+    return text[:limit] if limit else text
+
+
+def _docx_blocks(doc):
+    """Paragraph and table-row texts in document order."""
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            text = Paragraph(child, doc).text
+            if text and text.strip():
+                yield text
+        elif tag == 'tbl':
+            for row in Table(child, doc).rows:
+                cells = [cell.text.strip() for cell in row.cells if cell.text and cell.text.strip()]
+                if cells:
+                    yield '\t'.join(cells)
+
+
+def extract_docx_text(source, limit=10000):
+    """DOCX paragraphs and table rows in body order; stops once ``limit`` chars are collected."""
+    from docx import Document
+
+    doc = Document(source)
+    parts = []
+    total_chars = 0
+    for block in _docx_blocks(doc):
+        parts.append(block)
+        total_chars += len(block) + 1
+        if limit and total_chars >= limit:
+            break
+
+    text = '\n'.join(parts).replace('\x00', '')
+    return text[:limit] if limit and len(text) > limit else text
+
+
+_EXTRACTORS = {
+    'pdf': extract_pdf_text,
+    'docx': extract_docx_text,
+}
+
+
+def _extract_in_worker(kind, source, limit):
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return _EXTRACTORS[kind](source, limit=limit)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentExtractor:
+    """Budgeted extraction off the request thread, cached by content hash."""
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 max_cache_chars: Optional[int] = None) -> None:
+        if workers is None:
+            workers = env_int('DOCUMENT_EXTRACT_WORKERS', 2, minimum=0, maximum=32)
+        if timeout is None:
+            timeout = env_float('DOCUMENT_EXTRACT_TIMEOUT_SEC', 20.0, minimum=1.0, maximum=300.0)
+        if max_cache_chars is None:
+            max_cache_chars = env_int('DOCUMENT_CACHE_MAX_CHARS', 8_000_000, minimum=0)
+        self.timeout = timeout
+        self.max_cache_chars = max_cache_chars
+        self.pool = TimeoutProcessPool('document-extract', workers, preload=('utils.document_extract',))
+        self._lock = threading.Lock()
+        self._texts: 'OrderedDict[tuple, str]' = OrderedDict()  # (digest, kind, limit) -> text
+        self._cached_chars = 0
+        self._digests: 'OrderedDict[tuple, str]' = OrderedDict()  # (path, size, mtime_ns) -> digest
+        self.hits = 0
+        self.misses = 0
+
+    def extract(self, kind: str, source: Union[str, bytes], limit: int = 10000) -> str:
+        """Text of a ``'pdf'`` / ``'docx'`` file path or byte string, at most ``limit`` chars."""
+        if kind not in _EXTRACTORS:
+            raise ValueError(f'Unsupported document kind: {kind}')
+        digest = self._digest(source)
+        key = (digest, kind, limit)
+        with self._lock:
+            text = self._texts.get(key)
+            if text is not None:
+                self._texts.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+
+        text = self.pool.run(_extract_in_worker, kind, source, limit, timeout=self.timeout)
+        self._remember(key, text)
+        return text
+
+    def _digest(self, source) -> str:
+        if isinstance(source, bytes):
+            return hashlib.sha256(source).hexdigest()
+        st = os.stat(source)
+        stat_key = (os.path.abspath(source), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(stat_key)
+            if digest is not None:
+                self._digests.move_to_end(stat_key)
+                return digest
+        digest = _file_digest(source)
+        with self._lock:
+            self._digests[stat_key] = digest
+            while len(self._digests) > 4096:
+                self._digests.popitem(last=False)
+        return digest
+
+    def _remember(self, key, text) -> None:
+        if len(text) > self.max_cache_chars:
+            return
+        with self._lock:
+            previous = self._texts.pop(key, None)
+            if previous is not None:
+                self._cached_chars -= len(previous)
+            self._texts[key] = text
+            self._cached_chars += len(text)
+            while self._cached_chars > self.max_cache_chars and self._texts:
+                _key, evicted = self._texts.popitem(last=False)
+                self._cached_chars -= len(evicted)
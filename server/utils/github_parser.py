@@ -1,7 +1,81 @@
 import requests
 import json
 import base64
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+
+
+# Shared, pooled HTTP session: every GitHubParser reuses the same keep-alive
+# connections to api.github.com / raw.githubusercontent.com.
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+GITHUB_TREE_TTL_SEC = int(os.getenv('GITHUB_TREE_TTL_SEC', '300'))
+GITHUB_TREE_NEGATIVE_TTL_SEC = int(os.getenv('GITHUB_TREE_NEGATIVE_TTL_SEC', '60'))
+GITHUB_TREE_CACHE_SIZE = int(os.getenv('GITHUB_TREE_CACHE_SIZE', '64'))
+GITHUB_FILE_CACHE_SIZE = int(os.getenv('GITHUB_FILE_CACHE_SIZE', '256'))
+GITHUB_FILE_CACHE_MAX_BYTES = 256 * 1024
+
+
+class RepoTree(list):
+    """Filtered tree items plus the tree SHA and the precomputed prompt listing."""
+
+    def __init__(self, items=(), tree_sha=None, branch=None):
+        super().__init__(items)
+        self.tree_sha = tree_sha
+        self.branch = branch
+        self.prompt_text = None
+        self.blob_shas = {item['path']: item.get('sha') for item in self if item.get('type') == 'blob'}
+
+
+class _LRUCache:
+    """Small thread-safe LRU used for trees, branch refs and file contents."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max(1, max_entries)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# (token_fp, repo, branch) -> {'branch', 'tree_sha', 'etag', 'checked_at'} or {'missing': True, 'checked_at'}
+_REF_CACHE = _LRUCache(GITHUB_TREE_CACHE_SIZE * 2)
+# (token_fp, repo, branch, tree_sha) -> RepoTree
+_TREE_CACHE = _LRUCache(GITHUB_TREE_CACHE_SIZE)
+# (token_fp, repo, blob_sha) -> str
+_FILE_CACHE = _LRUCache(GITHUB_FILE_CACHE_SIZE)
+
+
+def clear_github_cache():
+    _REF_CACHE.clear()
+    _TREE_CACHE.clear()
+    _FILE_CACHE.clear()
+
 
 class GitHubParser:
     """
@@ -26,12 +100,14 @@ class GitHubParser:
         self.headers = {}
         if self.github_token:
             self.headers['Authorization'] = f"token {self.github_token}"
+        # Cache entries are partitioned per token so private trees never leak across credentials.
+        self._token_fp = hashlib.sha256((self.github_token or '').encode('utf-8')).hexdigest()[:12]
 
     def _get_default_branch(self, repo_name: str) -> str:
         """Fetches the default branch name from the GitHub API."""
         url = f"https://api.github.com/repos/{repo_name}"
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = _SESSION.get(url, headers=self.headers, timeout=10)
             if response.status_code == 200:
                 return response.json().get('default_branch', 'main')
         except Exception:
@@ -48,16 +124,125 @@ class GitHubParser:
             repo_name = repo_name[:-4]
         return repo_name.strip()
 
+    def _filter_tree(self, tree: list, branch: str) -> list:
+        filtered_tree = []
+        for item in tree:
+            path = item.get('path', '')
+            item_type = item.get('type', '')
+
+            # Check ignores
+            skip = False
+            for ignored_dir in self.IGNORED_DIRECTORIES:
+                if path.startswith(f"{ignored_dir}/") or f"/{ignored_dir}/" in path or path == ignored_dir:
+                    skip = True
+                    break
+
+            if not skip and item_type == 'blob':
+                ext = os.path.splitext(path)[1].lower()
+                if ext in self.IGNORED_EXTENSIONS:
+                    skip = True
+
+            if not skip:
+                filtered_tree.append({
+                    'path': path,
+                    'type': item_type,
+                    'url': item.get('url'),  # blob url
+                    'sha': item.get('sha'),
+                    'branch': branch
+                })
+        return filtered_tree
+
+    def _fetch_tree(self, repo_name: str, branch: str, ref: dict = None):
+        """
+        One (conditional) tree request. Returns (status, RepoTree|None, etag).
+        status is 'ok', 'not_modified', 'missing' or 'error'.
+        """
+        url = f"https://api.github.com/repos/{repo_name}/git/trees/{branch}?recursive=1"
+        headers = dict(self.headers)
+        if ref and ref.get('etag'):
+            headers['If-None-Match'] = ref['etag']
+        response = _SESSION.get(url, headers=headers, timeout=10)
+        if response.status_code == 304:
+            return 'not_modified', None, ref.get('etag')
+        if response.status_code == 404:
+            return 'missing', None, None
+        if response.status_code != 200:
+            print(f"Failed to fetch repo tree for branch '{branch}': {response.text}")
+            return 'error', None, None
+
+        data = response.json()
+        # If tree is truncated, GitHub returns truncated=True — we still proceed with what we have
+        tree = data.get('tree', [])
+        if not tree:
+            return 'missing', None, None
+        repo_tree = RepoTree(self._filter_tree(tree, branch), tree_sha=data.get('sha'), branch=branch)
+        return 'ok', repo_tree, response.headers.get('ETag')
+
+    def _cached_tree(self, repo_name: str, branch: str):
+        """
+        Resolve (repo, branch) through the ref/tree caches.
+
+        Fresh entries cost no GitHub round trip; stale ones are revalidated with
+        If-None-Match (a 304 keeps the cached tree). Returns a RepoTree, None for
+        a known-missing branch, or False when nothing is cached and we must fetch.
+        """
+        ref_key = (self._token_fp, repo_name, branch)
+        ref = _REF_CACHE.get(ref_key)
+        if not ref:
+            return False
+        age = time.time() - ref['checked_at']
+        if ref.get('missing'):
+            return None if age < GITHUB_TREE_NEGATIVE_TTL_SEC else False
+
+        tree_key = (self._token_fp, repo_name, ref['branch'], ref['tree_sha'])
+        cached = _TREE_CACHE.get(tree_key)
+        if cached is None:
+            return False
+        if age < GITHUB_TREE_TTL_SEC:
+            return cached
+
+        try:
+            status, repo_tree, etag = self._fetch_tree(repo_name, ref['branch'], ref)
+        except Exception as e:
+            print(f"GitHub tree revalidation failed for '{repo_name}@{ref['branch']}': {e}")
+            return cached
+        if status == 'not_modified':
+            _REF_CACHE.set(ref_key, dict(ref, checked_at=time.time()))
+            return cached
+        if status == 'ok':
+            self._store_tree(repo_name, branch, repo_tree, etag)
+            return repo_tree
+        if status == 'missing':
+            _REF_CACHE.pop(ref_key)
+            return False
+        return cached
+
+    def _store_tree(self, repo_name: str, requested_branch: str, repo_tree: RepoTree, etag: str):
+        repo_tree.prompt_text = self._render_tree(repo_tree)
+        now = time.time()
+        _TREE_CACHE.set((self._token_fp, repo_name, repo_tree.branch, repo_tree.tree_sha), repo_tree)
+        ref = {'branch': repo_tree.branch, 'tree_sha': repo_tree.tree_sha, 'etag': etag, 'checked_at': now}
+        _REF_CACHE.set((self._token_fp, repo_name, requested_branch), ref)
+        if repo_tree.branch != requested_branch:
+            _REF_CACHE.set((self._token_fp, repo_name, repo_tree.branch), dict(ref))
+
     def get_repo_tree(self, repo_name: str, branch: str = 'main') -> dict:
         """
         Fetches the complete repository tree.
         repo_name format: 'owner/repo' or full URL
         Tries multiple branches (main, master, HEAD) before failing.
+
+        Results are cached per (repo, branch, tree SHA); the branch that finally
+        resolved is remembered so fallbacks are only walked once.
         """
         # Clean up URL if user pasted full github link
         repo_name = self._clean_repo_name(repo_name)
         branch = branch.strip() if branch and branch.strip() else 'main'
 
+        cached = self._cached_tree(repo_name, branch)
+        if cached is not False:
+            return cached
+
         # Build list of branches to try: user-specified first, then common defaults
         branches_to_try = [branch]
         for fallback in ['main', 'master', 'HEAD']:
@@ -65,88 +250,87 @@ class GitHubParser:
                 branches_to_try.append(fallback)
 
         for current_branch in branches_to_try:
-            url = f"https://api.github.com/repos/{repo_name}/git/trees/{current_branch}?recursive=1"
+            if current_branch != branch:
+                cached = self._cached_tree(repo_name, current_branch)
+                if cached:
+                    _REF_CACHE.set((self._token_fp, repo_name, branch), dict(
+                        _REF_CACHE.get((self._token_fp, repo_name, current_branch)) or {},
+                    ))
+                    return cached
             try:
-                response = requests.get(url, headers=self.headers, timeout=10)
-                if response.status_code == 404:
+                status, repo_tree, etag = self._fetch_tree(repo_name, current_branch)
+                if status == 'missing':
                     print(f"Branch '{current_branch}' not found, trying next...")
                     continue
-                if response.status_code != 200:
-                    print(f"Failed to fetch repo tree for branch '{current_branch}': {response.text}")
-                    continue
-                
-                data = response.json()
-                # If tree is truncated, GitHub returns truncated=True — we still proceed with what we have
-                tree = data.get('tree', [])
-                if not tree:
+                if status != 'ok':
                     continue
-                
-                # Filter and structure the tree
-                filtered_tree = []
-                for item in tree:
-                    path = item.get('path', '')
-                    item_type = item.get('type', '')
-                    
-                    # Check ignores
-                    skip = False
-                    for ignored_dir in self.IGNORED_DIRECTORIES:
-                        if path.startswith(f"{ignored_dir}/") or f"/{ignored_dir}/" in path or path == ignored_dir:
-                            skip = True
-                            break
-                    
-                    if not skip and item_type == 'blob':
-                        ext = os.path.splitext(path)[1].lower()
-                        if ext in self.IGNORED_EXTENSIONS:
-                            skip = True
-                    
-                    if not skip:
-                        filtered_tree.append({
-                            'path': path,
-                            'type': item_type,
-                            'url': item.get('url'),  # blob url
-                            'branch': current_branch
-                        })
-                        
-                print(f"Successfully fetched repo tree for '{repo_name}' on branch '{current_branch}' ({len(filtered_tree)} items)")
-                return filtered_tree
+
+                self._store_tree(repo_name, branch, repo_tree, etag)
+                print(f"Successfully fetched repo tree for '{repo_name}' on branch '{current_branch}' ({len(repo_tree)} items)")
+                return repo_tree
 
             except Exception as e:
                 print(f"Error fetching repo tree for branch '{current_branch}': {e}")
                 continue
 
         print(f"All branch attempts failed for repo '{repo_name}'")
+        _REF_CACHE.set((self._token_fp, repo_name, branch), {'missing': True, 'checked_at': time.time()})
         return None
 
     def get_file_content(self, repo_name: str, path: str, branch: str = 'main') -> str:
         """
         Fetches the raw content of a specific file.
+
+        When the branch tree is cached, the file's blob SHA is known and the
+        content is served from (or stored in) the blob cache.
         """
         repo_name = self._clean_repo_name(repo_name)
+        branch = branch.strip() if branch and branch.strip() else 'main'
+
+        blob_sha = None
+        cached_tree = self._cached_tree(repo_name, branch)
+        if cached_tree:
+            blob_sha = cached_tree.blob_shas.get(path)
+            if blob_sha:
+                content = _FILE_CACHE.get((self._token_fp, repo_name, blob_sha))
+                if content is not None:
+                    return content
+
         url = f"https://raw.githubusercontent.com/{repo_name}/{branch}/{path}"
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = _SESSION.get(url, headers=self.headers, timeout=10)
             if response.status_code == 200:
-                return response.text
+                content = response.text
+                if blob_sha and len(response.content) <= GITHUB_FILE_CACHE_MAX_BYTES:
+                    _FILE_CACHE.set((self._token_fp, repo_name, blob_sha), content)
+                return content
             return f"[Error fetching file: HTTP {response.status_code}]"
         except Exception as e:
             return f"[Error fetching file: {e}]"
 
-    def format_tree_for_prompt(self, tree: list) -> str:
-        """
-        Formats the tree into a readable string representation for the LLM.
-        """
-        if not tree:
-            return ""
-        
+    @staticmethod
+    def _render_tree(tree: list) -> str:
         output = []
         for item in tree:
             if item['type'] == 'blob':
                 output.append(f"- {item['path']}")
             else:
                 output.append(f"📁 {item['path']}/")
-                
+
         return "\n".join(output)
 
+    def format_tree_for_prompt(self, tree: list) -> str:
+        """
+        Formats the tree into a readable string representation for the LLM.
+        """
+        if not tree:
+            return ""
+        if isinstance(tree, RepoTree):
+            if tree.prompt_text is None:
+                tree.prompt_text = self._render_tree(tree)
+            return tree.prompt_text
+        return self._render_tree(tree)
+
     def create_pull_request(self, repo_name: str, base_branch: str, new_branch: str, title: str, body: str, file_changes: list) -> dict:
         """
         Creates a new branch, commits file changes, and opens a Pull Request.
@@ -160,7 +344,7 @@ class GitHubParser:
         try:
             # 1. Get the SHA of the base branch
             ref_url = f"https://api.github.com/repos/{repo_name}/git/ref/heads/{base_branch}"
-            ref_res = requests.get(ref_url, headers=self.headers)
+            ref_res = _SESSION.get(ref_url, headers=self.headers)
             if ref_res.status_code != 200:
                 print(f"Failed to get base branch SHA: {ref_res.text}")
                 return {'error': f"Could not find base branch '{base_branch}'"}
@@ -172,14 +356,14 @@ class GitHubParser:
                 "ref": f"refs/heads/{new_branch}",
                 "sha": base_sha
             }
-            new_ref_res = requests.post(create_ref_url, headers=self.headers, json=create_ref_data)
+            new_ref_res = _SESSION.post(create_ref_url, headers=self.headers, json=create_ref_data)
             
             # 422 usually means branch already exists, we'll try to append a random number
             if new_ref_res.status_code == 422:
                 import random
                 new_branch = f"{new_branch}-{random.randint(100, 999)}"
                 create_ref_data["ref"] = f"refs/heads/{new_branch}"
-                new_ref_res = requests.post(create_ref_url, headers=self.headers, json=create_ref_data)
+                new_ref_res = _SESSION.post(create_ref_url, headers=self.headers, json=create_ref_data)
                 
             if new_ref_res.status_code != 201:
                 return {'error': f"Failed to create new branch: {new_ref_res.text}"}
@@ -191,7 +375,7 @@ class GitHubParser:
                 
                 # Check if file exists to get its SHA (needed for updates, not creations)
                 file_url = f"https://api.github.com/repos/{repo_name}/contents/{path}?ref={new_branch}"
-                file_res = requests.get(file_url, headers=self.headers)
+                file_res = _SESSION.get(file_url, headers=self.headers)
                 
                 commit_data = {
                     "message": f"🤖 Code Alchemist: Update {path}",
@@ -204,7 +388,7 @@ class GitHubParser:
                     commit_data["sha"] = file_res.json()['sha']
                 
                 put_url = f"https://api.github.com/repos/{repo_name}/contents/{path}"
-                put_res = requests.put(put_url, headers=self.headers, json=commit_data)
+                put_res = _SESSION.put(put_url, headers=self.headers, json=commit_data)
                 if put_res.status_code not in [200, 201]:
                     return {'error': f"Failed to commit {path}: {put_res.text}"}
 
@@ -216,7 +400,7 @@ class GitHubParser:
                 "head": new_branch,
                 "base": base_branch
             }
-            pr_res = requests.post(pr_url, headers=self.headers, json=pr_data)
+            pr_res = _SESSION.post(pr_url, headers=self.headers, json=pr_data)
             
             if pr_res.status_code == 201:
                 return {'success': True, 'pr_url': pr_res.json()['html_url']}
@@ -0,0 +1,213 @@
+"""
+Full-text index over ``History`` (question + answer) for cross-conversation recall.
+
+* SQLite – an external-content FTS5 table ``history_fts`` kept in sync by
+  triggers, ranked with ``bm25()``.
+* PostgreSQL – a ``history.search_vector`` tsvector column kept current by a
+  trigger, with a GIN index, ranked with ``ts_rank_cd`` (Postgres has no
+  built-in BM25). Adding and backfilling it on a large table is not something
+  to do during app startup, so it is an explicit migration
+  (``python migrate_history_fts.py``, see :func:`migrate_postgres_history_fts`);
+  startup only checks that it has been run. Each column is indexed only up to
+  ``HISTORY_FTS_MAX_CHARS`` (default 100000) so very long answers stay under
+  the 1 MB tsvector limit.
+
+Both use language-neutral tokenization (``unicode61`` / the ``simple`` config)
+because conversations mix Turkish and English. On any other backend, or an
+SQLite build without FTS5, :func:`ensure_history_fts` returns False and
+:func:`search_history` returns None so callers keep their fallback path.
+"""
+from __future__ import annotations
+
+import time
+
+from sqlalchemy import text
+
+from utils.concurrency import env_int
+
+_PREFIX_MIN_LEN = 5
+HISTORY_FTS_MAX_CHARS = env_int('HISTORY_FTS_MAX_CHARS', 100000, minimum=1000)
+_STATE = {'ready': None}
+
+_SQLITE_SCHEMA = (
+    """CREATE VIRTUAL TABLE history_fts USING fts5(
+        user_question, ai_response,
+        content='history', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS history_fts_ai AFTER INSERT ON history BEGIN
+        INSERT INTO history_fts(rowid, user_question, ai_response)
+        VALUES (new.id, new.user_question, new.ai_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS history_fts_ad AFTER DELETE ON history BEGIN
+        INSERT INTO history_fts(history_fts, rowid, user_question, ai_response)
+        VALUES ('delete', old.id, old.user_question, old.ai_response);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS history_fts_au AFTER UPDATE OF user_question, ai_response ON history BEGIN
+        INSERT INTO history_fts(history_fts, rowid, user_question, ai_response)
+        VALUES ('delete', old.id, old.user_question, old.ai_response);
+        INSERT INTO history_fts(rowid, user_question, ai_response)
+        VALUES (new.id, new.user_question, new.ai_response);
+    END""",
+)
+
+_POSTGRES_VECTOR = (
+    f"to_tsvector('simple', left(coalesce({{row}}user_question, ''), {HISTORY_FTS_MAX_CHARS}) || ' ' || "
+    f"left(coalesce({{row}}ai_response, ''), {HISTORY_FTS_MAX_CHARS}))"
+)
+
+_POSTGRES_SCHEMA = (
+    # Nullable, no default: a catalog-only change, the table is not rewritten.
+    "ALTER TABLE history ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""CREATE OR REPLACE FUNCTION history_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {_POSTGRES_VECTOR.format(row='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS history_search_vector_tg ON history",
+    """CREATE TRIGGER history_search_vector_tg BEFORE INSERT OR UPDATE OF user_question, ai_response
+        ON history FOR EACH ROW EXECUTE FUNCTION history_search_vector_update()""",
+)
+
+_POSTGRES_BACKFILL = f"""
+    UPDATE history SET search_vector = {_POSTGRES_VECTOR.format(row='')}
+    WHERE id IN (SELECT id FROM history WHERE search_vector IS NULL ORDER BY id LIMIT :batch)
+"""
+
+
+def _postgres_fts_installed(conn) -> bool:
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_trigger WHERE tgname = 'history_search_vector_tg' AND NOT tgisinternal"
+    )).first())
+
+
+def migrate_postgres_history_fts(engine, batch_size=1000) -> int:
+    """Add, backfill and index ``history.search_vector``; safe to re-run.
+
+    Every step keeps locks short: the column add is catalog-only, the backfill
+    commits every ``batch_size`` rows and the GIN index is built
+    ``CONCURRENTLY``. A ``search_vector`` left by the old startup code as a
+    ``GENERATED ... STORED`` column is turned into a plain one (keeping its
+    values) so the trigger can own it. Returns the number of rows backfilled.
+    """
+    with engine.begin() as conn:
+        generated = conn.execute(text(
+            "SELECT is_generated FROM information_schema.columns "
+            "WHERE table_name = 'history' AND column_name = 'search_vector'"
+        )).scalar()
+        if generated == 'ALWAYS':
+            conn.execute(text("ALTER TABLE history ALTER COLUMN search_vector DROP EXPRESSION"))
+        for statement in _POSTGRES_SCHEMA:
+            conn.execute(text(statement))
+
+    backfilled = 0
+    while True:
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            updated = conn.execute(text(_POSTGRES_BACKFILL), {'batch': int(batch_size)}).rowcount
+        if not updated:
+            break
+        backfilled += updated
+        print(f"history.search_vector: {backfilled} rows backfilled ({time.perf_counter() - started:.2f}s/batch)")
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_history_search_vector ON history USING GIN (search_vector)"
+        ))
+    return backfilled
+
+
+def ensure_history_fts(engine) -> bool:
+    """Enable search if the index is usable.
+
+    On SQLite the FTS5 table is cheap to build, so it is created (and backfilled
+    once) here. On PostgreSQL this only checks that
+    :func:`migrate_postgres_history_fts` has been run.
+    """
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == 'sqlite':
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_fts'"
+                )).first()
+                if not exists:
+                    conn.execute(text(_SQLITE_SCHEMA[0]))
+                for statement in _SQLITE_SCHEMA[1:]:
+                    conn.execute(text(statement))
+                if not exists:
+                    conn.execute(text("INSERT INTO history_fts(history_fts) VALUES ('rebuild')"))
+            elif dialect == 'postgresql':
+                if not _postgres_fts_installed(conn):
+                    print("WARN: history.search_vector is not set up; run `python migrate_history_fts.py` "
+                          "to enable full-text recall.")
+                    _STATE['ready'] = False
+                    return False
+            else:
+                _STATE['ready'] = False
+                return False
+    except Exception as e:
+        print(f"WARN: History full-text index unavailable ({dialect}): {e}")
+        _STATE['ready'] = False
+        return False
+    _STATE['ready'] = dialect
+    return True
+
+
+def _match_terms(tokens):
+    """Tokens of 5+ chars become prefix terms, mirroring the recall scorer's fuzzy match."""
+    terms = []
+    for token in sorted(set(tokens)):
+        cleaned = ''.join(ch for ch in token if ch.isalnum() or ch == '_')
+        if not cleaned:
+            continue
+        if len(cleaned) >= _PREFIX_MIN_LEN:
+            terms.append((cleaned[:_PREFIX_MIN_LEN], True))
+        else:
+            terms.append((cleaned, False))
+    return terms
+
+
+def search_history(session, user_id, tokens, exclude_conversation_id=None, limit=10):
+    """Best-matching live History ids for ``user_id`` as ``[(history_id, rank)]``.
+
+    Lower rank is better on SQLite (bm25), higher on Postgres; rows come back
+    already ordered best-first. Returns None when no index is available.
+    """
+    backend = _STATE['ready']
+    if not backend:
+        return None
+    terms = _match_terms(tokens)
+    if not terms:
+        return []
+
+    params = {'uid': user_id, 'limit': int(limit)}
+    exclude = ''
+    if exclude_conversation_id:
+        exclude = 'AND h.conversation_id != :cid'
+        params['cid'] = exclude_conversation_id
+
+    if backend == 'sqlite':
+        params['q'] = ' OR '.join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+        sql = f"""
+            SELECT h.id, bm25(history_fts) AS rank
+            FROM history_fts
+            JOIN history h ON h.id = history_fts.rowid
+            JOIN conversation c ON c.id = h.conversation_id
+            WHERE history_fts MATCH :q AND c.user_id = :uid AND h.is_deleted = 0 {exclude}
+            ORDER BY rank
+            LIMIT :limit
+        """
+    else:
+        params['q'] = ' | '.join(f'{term}:*' if prefix else term for term, prefix in terms)
+        sql = f"""
+            SELECT h.id, ts_rank_cd(h.search_vector, query) AS rank
+            FROM history h
+            JOIN conversation c ON c.id = h.conversation_id,
+                 to_tsquery('simple', :q) AS query
+            WHERE h.search_vector @@ query AND c.user_id = :uid AND h.is_deleted = false {exclude}
+            ORDER BY rank DESC
+            LIMIT :limit
+        """
+    return [(row[0], float(row[1])) for row in session.execute(text(sql), params)]
@@ -0,0 +1,497 @@
+"""
+Local intent / language classifier for ``model == 'auto'`` routing.
+
+Picking one of eight intents used to cost a Gemini round trip (falling back to
+GPT-4o-mini and Haiku), and :class:`LanguageDetector` made another whenever its
+keyword pass scored below 2 – i.e. for almost every plain-language question.
+:class:`RoutingClassifier` answers both locally with a small multinomial
+logistic model over hashed word, word-bigram and character n-gram features;
+a prediction takes a fraction of a millisecond.
+
+* Only predictions below ``ROUTING_CLASSIFIER_MIN_CONFIDENCE`` (default 0.55)
+  escalate to the LLM path.
+* Escalated labels can be appended to a decision log, which is the training data
+  for the next model. It holds raw questions and code, so it is off unless
+  ``ROUTING_DECISIONS_LOG`` names a file; it rotates to ``<file>.1`` at
+  ``ROUTING_DECISIONS_LOG_MAX_BYTES`` (default 5 MB).
+* Final decisions are kept in an LRU (``ROUTING_CACHE_SIZE``, default 4096)
+  keyed by the normalized question and a digest of the attached code.
+* Without a trained model file (``ROUTING_CLASSIFIER_MODEL``) the model is fit
+  from the seed examples (hand-written plus :mod:`utils.routing_seed`) and the
+  most recent ``ROUTING_CLASSIFIER_LOG_SAMPLES`` logged decisions, in the
+  background at startup (:meth:`RoutingClassifier.warm_up`).
+
+Offline training and the accuracy / latency benchmark against the LLM path
+(without logged decisions, ``bench`` trains on the generated seed and scores
+the hand-written examples)::
+
+    python -m utils.intent_classifier train --data instance/routing_decisions.jsonl --out instance/routing_classifier.npz
+    python -m utils.intent_classifier bench --data instance/routing_decisions.jsonl [--llm] [--limit 200]
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.concurrency import env_float, env_int
+from utils.routing_seed import generated_samples
+
+INTENTS = ('simple', 'simple_code', 'debug', 'explain', 'architecture', 'creative', 'general', 'image_generation')
+LANGUAGES = ('unknown', 'python', 'javascript', 'typescript', 'java', 'csharp', 'cpp', 'c', 'html', 'css', 'sql',
+             'bash', 'go', 'rust', 'php', 'ruby', 'swift', 'kotlin')
+
+FEATURE_DIM = 1 << 15
+_QUESTION_CHARS = 600
+_CODE_CHARS = 1500
+_WORD_RE = re.compile(r"[^\W_]+|[#+]{1,2}|[{}()\[\];:=<>$@!.]", re.UNICODE)
+
+
+def normalize_question(text: str) -> str:
+    return ' '.join((text or '').lower().split())
+
+
+def _code_digest(code: str) -> str:
+    if not code:
+        return ''
+    return hashlib.blake2b(code.encode('utf-8', 'ignore'), digest_size=8).hexdigest()
+
+
+def extract_features(question: str, code: str = '', dim: int = FEATURE_DIM) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed, L2-normalized binary features as ``(indices, values)``."""
+    text = normalize_question(question)[:_QUESTION_CHARS]
+    words = _WORD_RE.findall(text)
+    names = ['bias']
+    names.extend('w:' + w for w in words)
+    names.extend('b:' + a + ' ' + b for a, b in zip(words, words[1:]))
+    if words:
+        names.append('first:' + words[0])
+    names.append('len:%d' % min(len(words) // 4, 12))
+    padded = ' ' + text + ' '
+    for n in (3, 4):
+        names.extend('c%d:' % n + padded[i:i + n] for i in range(len(padded) - n + 1))
+    code = (code or '')[:_CODE_CHARS].lower()
+    if code.strip():
+        names.append('has_code')
+        names.extend('k:' + w for w in _WORD_RE.findall(code)[:400])
+
+    indices = np.unique(np.fromiter((zlib.crc32(name.encode('utf-8')) % dim for name in names),
+                                    dtype=np.int64, count=len(names)))
+    values = np.full(len(indices), 1.0 / np.sqrt(len(indices)), dtype=np.float32)
+    return indices, values
+
+
+class LinearModel:
+    """Multinomial logistic regression over sparse hashed features."""
+
+    def __init__(self, labels: Sequence[str], dim: int = FEATURE_DIM) -> None:
+        self.labels = tuple(labels)
+        self.dim = dim
+        self.weights = np.zeros((dim, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+    def probabilities(self, indices: np.ndarray, values: np.ndarray) -> np.ndarray:
+        scores = values @ self.weights[indices] + self.bias
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+
+    def predict(self, indices: np.ndarray, values: np.ndarray) -> Tuple[str, float]:
+        probs = self.probabilities(indices, values)
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def fit(self, examples: Sequence[Tuple[np.ndarray, np.ndarray, str]], epochs: int = 12,
+            learning_rate: float = 1.5, seed: int = 0) -> 'LinearModel':
+        positions = {label: i for i, label in enumerate(self.labels)}
+        rows = [(idx, val, positions[label]) for idx, val, label in examples if label in positions]
+        order = list(range(len(rows)))
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            rate = learning_rate / (1.0 + epoch * 0.3)
+            for i in order:
+                idx, val, target = rows[i]
+                gradient = self.probabilities(idx, val)
+                gradient[target] -= 1.0
+                self.weights[idx] -= rate * np.outer(val, gradient)
+                self.bias -= rate * 0.1 * gradient
+        return self
+
+    def state(self, prefix: str) -> dict:
+        return {prefix + '_weights': self.weights, prefix + '_bias': self.bias,
+                prefix + '_labels': np.array(self.labels)}
+
+    @classmethod
+    def from_state(cls, data, prefix: str) -> 'LinearModel':
+        weights = data[prefix + '_weights']
+        model = cls([str(label) for label in data[prefix + '_labels']], dim=weights.shape[0])
+        model.weights = weights.astype(np.float32)
+        model.bias = data[prefix + '_bias'].astype(np.float32)
+        return model
+
+
+# ── Training data ─────────────────────────────────────────────────────────
+
+SEED_INTENTS = {
+    'simple': [
+        'What is REST?', 'What does API stand for?', 'Summarize this text', 'What is a CPU?',
+        'REST nedir?', 'API ne demek?', 'Bu metni özetle', 'kısaca HTTP nedir', 'What is the capital of France?',
+        'How many bytes in a kilobyte?', 'What year was Python released?', 'Define latency in one sentence',
+        'JSON nedir kısaca', 'What is an IP address?', 'Özetle: bulut bilişim nedir',
+        'In short, what is Docker?', 'What is the difference between GET and POST in one line?',
+    ],
+    'simple_code': [
+        'Write a loop to print 1-10', 'Reverse a string', 'Sort a list', 'Write a function that adds two numbers',
+        '1den 10a kadar yazdıran döngü yaz', 'Bir stringi ters çeviren fonksiyon yaz', 'Listeyi sırala',
+        'How do I read a file line by line?', 'Write a fizzbuzz', 'Check if a number is prime',
+        'Convert a list to a set', 'Find the max of an array', 'İki sayıyı toplayan fonksiyon yaz',
+        'Write a hello world program', 'Create a simple counter with a for loop', 'Remove duplicates from a list',
+        'Faktöriyel hesaplayan fonksiyon yaz',
+    ],
+    'debug': [
+        'Why does my code crash?', 'Fix this error: TypeError', 'Debug this', 'I get a KeyError when I run this',
+        'Traceback (most recent call last): File "app.py", line 10', 'Bu hatayı düzelt', 'Kodum neden çalışmıyor?',
+        'Hata alıyorum: undefined is not a function', 'Segmentation fault in my C program',
+        'NullPointerException at line 42, why?', 'My React component does not re-render, what is wrong?',
+        'ModuleNotFoundError: No module named requests', 'Bu kod neden hata veriyor', 'Fix the bug in this function',
+        'Cannot read properties of undefined (reading map)', 'Uncaught SyntaxError: Unexpected token',
+        'The query returns duplicate rows, what did I do wrong?',
+    ],
+    'explain': [
+        'Explain SOLID principles', 'How does JWT work?', 'What is polymorphism?', 'Explain how garbage collection works',
+        'SOLID prensiplerini açıkla', 'JWT nasıl çalışır?', 'Polimorfizm nedir, açıklar mısın?',
+        'How does the event loop work in Node.js?', 'Explain the difference between a process and a thread',
+        'Recursion mantığını anlat', 'Can you explain dependency injection?', 'What is a closure and how does it work?',
+        'Explain big O notation with examples', 'Bu kod ne yapıyor, açıklar mısın?', 'How do database indexes work?',
+        'Async await nasıl çalışır anlat', 'Explain what this function does',
+    ],
+    'architecture': [
+        'Design a microservice architecture for an e-commerce site', 'How to structure a clean architecture project',
+        'Mikroservis mimarisi tasarla', 'How should I split my monolith into services?',
+        'Design a scalable chat system with millions of users', 'Plan the backend architecture for a SaaS platform',
+        'Büyük ölçekli bir sistem tasarımı yap', 'Refactor this large codebase into modules with clear boundaries',
+        'Design an event-driven architecture with Kafka and CQRS', 'How would you architect a multi-tenant database?',
+        'Set up a hexagonal architecture for this project', 'Design the system for a ride sharing app',
+        'Katmanlı mimari ile proje yapısı öner', 'Propose a caching and sharding strategy for our platform',
+    ],
+    'creative': [
+        'Write a story about a dragon', 'Generate a tagline for my coffee shop', 'Write a poem about the sea',
+        'Bir hikaye yaz', 'Deniz hakkında bir şiir yaz', 'Brainstorm names for my startup',
+        'Write song lyrics about summer', 'Kahve dükkanım için slogan bul', 'Write a short fairy tale for kids',
+        'Come up with ideas for a birthday party', 'Write a funny limerick about programmers',
+        'Bana bir masal anlat', 'Draft a creative product description for headphones', 'Write a haiku about autumn',
+    ],
+    'general': [
+        'Hello', 'Hi there', 'How are you?', "What's the weather?", 'Merhaba', 'Selam', 'Nasılsın?',
+        'Thanks!', 'Teşekkürler', 'Good morning', 'Who are you?', 'Sen kimsin?', 'What can you do?',
+        'Bugün hava nasıl?', 'Tell me something interesting', 'Günaydın', 'ok', 'Let us chat',
+    ],
+    'image_generation': [
+        'Generate an image of a cat', 'Draw a picture of a sunset', 'Create an image of a futuristic city',
+        'Bir kedi resmi çiz', 'Görsel oluştur: dağlarda gün batımı', 'Resim yap: uzayda bir astronot',
+        'Make a logo for my company', 'Bana bir logo yap', 'Create a picture of a dog wearing sunglasses',
+        'Draw an illustration of a castle', 'Generate artwork of a dragon', 'Fotoğraf oluştur: sahilde bir ev',
+        'Render an image of a red sports car', 'Bir ikon yap',
+    ],
+}
+
+SEED_LANGUAGES = {
+    'unknown': [
+        'Hello', 'How are you?', 'Merhaba nasılsın', 'Write a story about a dragon', 'What is the capital of France?',
+        'Explain SOLID principles', 'Design a microservice architecture', 'Bana bir masal anlat',
+        'Generate an image of a cat', 'Summarize this text', 'What is polymorphism?', 'Brainstorm names for my startup',
+        'How does JWT work?', 'Thanks!', 'Bu metni özetle', 'Deniz hakkında bir şiir yaz', 'Who are you?',
+        'Reverse a string', 'Sort a list', 'Why does my code crash?', 'Explain big O notation',
+        'Mikroservis mimarisi tasarla', 'What can you do?', 'Write a poem about the sea',
+    ],
+    'python': ['def main():', 'print("hi")', 'import os', 'self.value = 1', 'pip install requests',
+               'How do I use list comprehensions in python?', 'Django model field', 'pandas dataframe groupby'],
+    'javascript': ['console.log(x)', 'const x = 1;', 'npm install express', 'document.querySelector',
+                   'React useState hook', 'node.js stream', 'array.map(x => x * 2)'],
+    'typescript': ['interface User { id: number }', 'type Props = {}', 'tsc compile error', 'function f(x: string): void',
+                   'typescript generics', 'Record<string, number>'],
+    'java': ['public class Main', 'System.out.println', 'spring boot controller', 'maven build fails',
+             'java stream api', '@Autowired service'],
+    'csharp': ['Console.WriteLine', 'using System;', 'dotnet build', 'c# linq query', 'async Task method'],
+    'cpp': ['#include <iostream>', 'std::cout << x', 'c++ vector', 'std::vector<int> v', 'cpp template'],
+    'c': ['printf("%d", x);', 'malloc and free', 'c dili pointer', '#include <stdio.h>', 'scanf usage'],
+    'html': ['<div class="box">', '<html>', 'html form input', '<!doctype html>', '<ul><li>item</li></ul>'],
+    'css': ['display: flex', 'margin: 0 auto', 'css grid layout', 'background-color: red', '@media query'],
+    'sql': ['SELECT * FROM users', 'INSERT INTO orders', 'sql join query', 'GROUP BY count', 'create table users'],
+    'bash': ['ls -la', 'chmod +x script.sh', 'bash script loop', 'sudo apt-get install', 'docker run -it'],
+    'go': ['package main', 'fmt.Println', 'golang goroutine', 'go func() {}', 'defer file.Close()'],
+    'rust': ['fn main() {}', 'let mut x = 5;', 'cargo build', 'rust borrow checker', 'println!("{}", x)'],
+    'php': ['<?php echo', 'laravel route', '$user->name', 'composer require', 'php array'],
+    'ruby': ['puts "hi"', 'rails generate model', 'gem install', 'ruby block each do', 'attr_accessor :name'],
+    'swift': ['import SwiftUI', 'guard let x', 'swift optional', '@State var count', 'iOS UIKit view'],
+    'kotlin': ['fun main()', 'data class User', 'kotlin coroutine', 'val x = 1', 'suspend fun load()'],
+}
+
+
+def hand_written_samples() -> List[dict]:
+    samples = [{'question': q, 'intent': label} for label, questions in SEED_INTENTS.items() for q in questions]
+    samples.extend({'question': q, 'language': label} for label, questions in SEED_LANGUAGES.items() for q in questions)
+    return samples
+
+
+def seed_samples() -> List[dict]:
+    return hand_written_samples() + generated_samples()
+
+
+def load_samples(path: Optional[str], limit: Optional[int] = None) -> List[dict]:
+    """Logged decisions (JSON lines, rotated file first), most recent ``limit`` kept."""
+    if not path:
+        return []
+    samples = deque(maxlen=limit) if limit else []
+    for name in (path + '.1', path):
+        if not os.path.exists(name):
+            continue
+        with open(name, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get('question') is not None:
+                    samples.append(record)
+    return list(samples)
+
+
+def train_models(samples: Iterable[dict], dim: int = FEATURE_DIM) -> Tuple[LinearModel, LinearModel]:
+    intent_rows, language_rows = [], []
+    for sample in samples:
+        indices, values = extract_features(sample.get('question') or '', sample.get('code') or '', dim)
+        if sample.get('intent') in INTENTS:
+            intent_rows.append((indices, values, sample['intent']))
+        if sample.get('language') in LANGUAGES:
+            language_rows.append((indices, values, sample['language']))
+    return LinearModel(INTENTS, dim).fit(intent_rows), LinearModel(LANGUAGES, dim).fit(language_rows)
+
+
+@lru_cache(maxsize=1)
+def _seed_models() -> Tuple[LinearModel, LinearModel]:
+    # Deterministic, and fit once per process however many classifiers are built.
+    return train_models(seed_samples())
+
+
+def save_models(path: str, intent_model: LinearModel, language_model: LinearModel) -> None:
+    np.savez_compressed(path, **intent_model.state('intent'), **language_model.state('language'))
+
+
+def load_models(path: str) -> Tuple[LinearModel, LinearModel]:
+    with np.load(path, allow_pickle=False) as data:
+        return LinearModel.from_state(data, 'intent'), LinearModel.from_state(data, 'language')
+
+
+# ── Runtime ───────────────────────────────────────────────────────────────
+
+class RoutingClassifier:
+    """Local intent / language decisions, escalating low-confidence ones to an LLM callback."""
+
+    def __init__(self, model_path: Optional[str] = None, log_path: Optional[str] = None,
+                 min_confidence: Optional[float] = None, cache_size: Optional[int] = None,
+                 log_max_bytes: Optional[int] = None) -> None:
+        if model_path is None:
+            model_path = os.getenv('ROUTING_CLASSIFIER_MODEL', '')
+        if log_path is None:
+            log_path = os.getenv('ROUTING_DECISIONS_LOG', '')
+        if log_max_bytes is None:
+            log_max_bytes = env_int('ROUTING_DECISIONS_LOG_MAX_BYTES', 5 * 1024 * 1024, minimum=4096)
+        if min_confidence is None:
+            min_confidence = env_float('ROUTING_CLASSIFIER_MIN_CONFIDENCE', 0.55, minimum=0.0, maximum=1.0)
+        if cache_size is None:
+            cache_size = env_int('ROUTING_CACHE_SIZE', 4096, minimum=0)
+        self.model_path = model_path
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.min_confidence = min_confidence
+        self.cache_size = cache_size
+        self._models = None
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._cache: 'OrderedDict[tuple, str]' = OrderedDict()
+        self.stats = {'cache_hits': 0, 'local': 0, 'escalated': 0}
+
+    def _get_models(self) -> Tuple[LinearModel, LinearModel]:
+        if self._models is None:
+            with self._lock:
+                if self._models is None:
+                    self._models = self._build_models()
+        return self._models
+
+    def warm_up(self) -> None:
+        """Load or fit the models on a background thread so the first request does not pay for it."""
+        threading.Thread(target=self._get_models, name='routing-classifier-warmup', daemon=True).start()
+
+    def _build_models(self) -> Tuple[LinearModel, LinearModel]:
+        if self.model_path and os.path.exists(self.model_path):
+            try:
+                return load_models(self.model_path)
+            except Exception as e:
+                print(f"WARN: routing classifier model {self.model_path} unreadable ({e}); training from seed.")
+        limit = env_int('ROUTING_CLASSIFIER_LOG_SAMPLES', 2000, minimum=0)
+        logged = load_samples(self.log_path, limit) if limit else []
+        if not logged:
+            return _seed_models()
+        return train_models(seed_samples() + logged)
+
+    def predict(self, head: str, question: str, code: str = '') -> Tuple[str, float]:
+        """``(label, confidence)`` from the local model alone; ``head`` is ``'intent'`` or ``'language'``."""
+        intent_model, language_model = self._get_models()
+        model = intent_model if head == 'intent' else language_model
+        return model.predict(*extract_features(question, code, model.dim))
+
+    def intent(self, question: str, code: str = '', escalate: Optional[Callable] = None) -> str:
+        return self._decide('intent', question, code, escalate, 'general')
+
+    def language(self, question: str, code: str = '', escalate: Optional[Callable] = None) -> str:
+        return self._decide('language', question, code, escalate, 'unknown')
+
+    def _decide(self, head, question, code, escalate, fallback) -> str:
+        key = (head, normalize_question(question), _code_digest(code))
+        with self._lock:
+            label = self._cache.get(key)
+            if label is not None:
+                self._cache.move_to_end(key)
+                self.stats['cache_hits'] += 1
+                return label
+
+        label, confidence = self.predict(head, question, code)
+        if confidence < self.min_confidence and escalate is not None:
+            escalated = escalate(question, code)
+            if not escalated:
+                # Provider unavailable: answer locally but let the next ask retry.
+                return label or fallback
+            label = escalated
+            self.stats['escalated'] += 1
+            self.record(question, code, **{head: label})
+        else:
+            self.stats['local'] += 1
+
+        if self.cache_size:
+            with self._lock:
+                self._cache[key] = label
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return label
+
+    def record(self, question: str, code: str = '', **labels) -> None:
+        """Append a decision to the log the next model is trained from."""
+        if not self.log_path:
+            return
+        record = {'ts': time.time(), 'question': (question or '')[:2000], 'code': (code or '')[:_CODE_CHARS]}
+        record.update(labels)
+        try:
+            with self._log_lock:
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.log_max_bytes:
+                    os.replace(self.log_path, self.log_path + '.1')
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f"WARN: routing decision log write failed: {e}")
+
+
+# ── Offline training / benchmark ──────────────────────────────────────────
+
+def _split(samples: List[dict], every: int = 5) -> Tuple[List[dict], List[dict]]:
+    train = [s for i, s in enumerate(samples) if i % every]
+    held_out = [s for i, s in enumerate(samples) if not i % every]
+    return train, held_out
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _report(name: str, outcomes: List[Tuple[bool, float]]) -> None:
+    if not outcomes:
+        print(f"  {name:<22} no samples")
+        return
+    correct = sum(1 for ok, _ in outcomes if ok)
+    latencies = [seconds * 1000 for _, seconds in outcomes]
+    print(f"  {name:<22} accuracy {correct / len(outcomes):6.1%} ({correct}/{len(outcomes)})  "
+          f"p50 {_percentile(latencies, 50):8.3f} ms  p95 {_percentile(latencies, 95):8.3f} ms")
+
+
+def benchmark(train: List[dict], held_out: List[dict], min_confidence: float, llm: bool = False,
+              limit: Optional[int] = None) -> None:
+    """Held-out accuracy and latency of the local model (and optionally the LLM path) per head."""
+    if limit:
+        held_out = held_out[:limit]
+    intent_model, language_model = train_models(train)
+    llm_paths = {}
+    if llm:
+        from app import _detect_intent_with_llm, language_detector
+        llm_paths = {
+            'intent': _detect_intent_with_llm,
+            'language': language_detector._escalate,
+        }
+
+    for head, model in (('intent', intent_model), ('language', language_model)):
+        rows = [s for s in held_out if s.get(head)]
+        print(f"{head}: {len(rows)} held-out samples")
+        local, confident, llm_rows = [], [], []
+        for sample in rows:
+            question, code = sample.get('question') or '', sample.get('code') or ''
+            started = time.perf_counter()
+            label, confidence = model.predict(*extract_features(question, code, model.dim))
+            elapsed = time.perf_counter() - started
+            local.append((label == sample[head], elapsed))
+            if confidence >= min_confidence:
+                confident.append((label == sample[head], elapsed))
+            if head in llm_paths:
+                started = time.perf_counter()
+                answer = llm_paths[head](question, code)
+                llm_rows.append((answer == sample[head], time.perf_counter() - started))
+        _report('local (all)', local)
+        _report(f'local (conf>={min_confidence:g})', confident)
+        if rows:
+            print(f"  escalation rate        {1 - len(confident) / len(rows):6.1%}")
+        if head in llm_paths:
+            _report('llm', llm_rows)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+    train_cmd = sub.add_parser('train', help='fit both heads on seed + logged decisions and save them')
+    train_cmd.add_argument('--data', default=os.getenv('ROUTING_DECISIONS_LOG', ''))
+    train_cmd.add_argument('--out', required=True)
+    bench_cmd = sub.add_parser('bench', help='held-out accuracy / latency, optionally against the LLM path')
+    bench_cmd.add_argument('--data', default=os.getenv('ROUTING_DECISIONS_LOG', ''))
+    bench_cmd.add_argument('--llm', action='store_true', help='also time the current LLM path (needs API keys)')
+    bench_cmd.add_argument('--limit', type=int, default=None)
+    bench_cmd.add_argument('--min-confidence', type=float,
+                           default=env_float('ROUTING_CLASSIFIER_MIN_CONFIDENCE', 0.55, minimum=0.0, maximum=1.0))
+    args = parser.parse_args(argv)
+
+    samples = load_samples(args.data)
+    if args.command == 'train':
+        started = time.perf_counter()
+        save_models(args.out, *train_models(seed_samples() + samples))
+        print(f"trained on {len(samples)} logged decisions + seed in {time.perf_counter() - started:.1f}s -> {args.out}")
+    elif samples:
+        train, held_out = _split(samples)
+        benchmark(seed_samples() + train, held_out, args.min_confidence, llm=args.llm, limit=args.limit)
+    else:
+        print('no logged decisions; training on the generated seed, scoring the hand-written examples')
+        benchmark(generated_samples(), hand_written_samples(), args.min_confidence, llm=args.llm, limit=args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,8 +6,8 @@ from .timeout_utils import to_gemini_timeout
 class LanguageDetector:
     """
     Detects the programming language of a given text or code snippet.
-    Uses keyword matching as a fast first pass, and falls back to Gemini
-    if the confidence is low or for ambiguity.
+    Uses keyword matching as a fast first pass, then the local routing
+    classifier (if given), and falls back to Gemini only when both are unsure.
     """
     
     # Static list of language keywords for fast detection
@@ -31,8 +31,12 @@ class LanguageDetector:
         'kotlin': ['fun ', 'val ', 'var ', 'class ', 'data class', 'import kotlin', 'suspend fun', 'lateinit var']
     }
 
-    def __init__(self, gemini_api_key=None):
+    # LLM answers that mean "no programming language"
+    NON_CODE_LABELS = {'natural', 'pseudo', 'none', 'text', 'unknown'}
+
+    def __init__(self, gemini_api_key=None, classifier=None):
         self.gemini_api_key = gemini_api_key
+        self.classifier = classifier
         self.client = None
         if self.gemini_api_key:
             self.client = google_genai.Client(
@@ -71,12 +75,24 @@ class LanguageDetector:
         if max_score >= 2:
             return best_lang
             
-        # 2. Fallback to Gemini (Smart)
+        # 2. Local classifier, escalating to Gemini when unsure
+        if self.classifier is not None:
+            return self.classifier.language(text, code, escalate=self._escalate)
+
+        # 3. Fallback to Gemini (Smart)
         return self._detect_with_llm(content)
 
-    def _detect_with_llm(self, content: str) -> str:
+    def _escalate(self, text: str, code: str = ""):
         if not self.gemini_api_key or not self.client:
+            return None
+        detected = self._detect_with_llm((text + "\n" + code).lower(), default=None)
+        if detected in self.NON_CODE_LABELS:
             return "unknown"
+        return detected
+
+    def _detect_with_llm(self, content: str, default="unknown"):
+        if not self.gemini_api_key or not self.client:
+            return default
             
         prompt = f"""
         Identify the programming language of the following text/code. 
@@ -124,4 +140,4 @@ class LanguageDetector:
                 # Try next model anyway if possible
                 continue
 
-        return "unknown"
+        return default
@@ -2,10 +2,13 @@ import hashlib
 import heapq
 import os
 import re
+import threading
 import time
+from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Any, Iterable
-import concurrent.futures
+
+import numpy as np
 
 try:
     from google import genai as google_genai
@@ -13,10 +16,13 @@ except Exception:
     google_genai = None
 from .timeout_utils import to_gemini_timeout
 
+# Bump when TOPIC_RULES change so cached history candidates are re-extracted.
+MEMORY_EXTRACTION_VERSION = 1
 MEMORY_ITEM_LIMIT = 3
 MEMORY_CHAR_BUDGET = 2000
 EMBEDDING_CANDIDATE_LIMIT = 12
 EMBEDDING_CACHE_TTL = 1800
+EMBEDDING_CACHE_MAX_ENTRIES = 512
 SEMANTIC_WEIGHT = 0.6
 LEXICAL_WEIGHT = 0.3
 RECENCY_WEIGHT = 0.1
@@ -38,7 +44,9 @@ RELATION_TYPE_ALIASES = {
 }
 
 _EMBEDDING_CLIENT = None
-_EMBEDDING_CACHE: dict[str, dict[str, Any]] = {}
+# Query embeddings only; document vectors live in the memory_embedding table.
+_EMBEDDING_CACHE: 'OrderedDict[str, dict[str, Any]]' = OrderedDict()
+_EMBEDDING_CACHE_LOCK = threading.Lock()
 
 
 def _utcnow():
@@ -247,24 +255,30 @@ def _embedding_cache_key(text: str, task_type: str) -> str:
 
 def _get_cached_embedding(text: str, task_type: str) -> tuple[list[float] | None, str | None]:
     cache_key = _embedding_cache_key(text, task_type)
-    cached = _EMBEDDING_CACHE.get(cache_key)
-    if not cached:
-        return None, None
+    with _EMBEDDING_CACHE_LOCK:
+        cached = _EMBEDDING_CACHE.get(cache_key)
+        if not cached:
+            return None, None
 
-    if time.time() - cached.get('timestamp', 0) > EMBEDDING_CACHE_TTL:
-        _EMBEDDING_CACHE.pop(cache_key, None)
-        return None, None
+        if time.time() - cached.get('timestamp', 0) > EMBEDDING_CACHE_TTL:
+            _EMBEDDING_CACHE.pop(cache_key, None)
+            return None, None
 
+        _EMBEDDING_CACHE.move_to_end(cache_key)
     return cached.get('embedding'), cached.get('model_name')
 
 
 def _store_embedding_cache(text: str, task_type: str, embedding: list[float], model_name: str | None) -> None:
     cache_key = _embedding_cache_key(text, task_type)
-    _EMBEDDING_CACHE[cache_key] = {
-        'timestamp': time.time(),
-        'embedding': embedding,
-        'model_name': model_name,
-    }
+    with _EMBEDDING_CACHE_LOCK:
+        _EMBEDDING_CACHE[cache_key] = {
+            'timestamp': time.time(),
+            'embedding': embedding,
+            'model_name': model_name,
+        }
+        _EMBEDDING_CACHE.move_to_end(cache_key)
+        while len(_EMBEDDING_CACHE) > EMBEDDING_CACHE_MAX_ENTRIES:
+            _EMBEDDING_CACHE.popitem(last=False)
 
 
 def _extract_embedding_values(resp):
@@ -328,6 +342,55 @@ def _embed_text_with_fallback(text, task_type='RETRIEVAL_DOCUMENT'):
     return None, None
 
 
+def memory_text_hash(text: str) -> str:
+    """Stable hash used to decide whether a stored memory embedding is stale."""
+    return hashlib.sha256(_normalize_text(text or '').encode('utf-8')).hexdigest()
+
+
+def embed_memory_text(text: str) -> tuple[list[float] | None, str | None]:
+    """Document embedding for a memory/summary row; called at write time, not per turn."""
+    return _embed_text_with_fallback(text, task_type='RETRIEVAL_DOCUMENT')
+
+
+def _same_embedding_model(a: str | None, b: str | None) -> bool:
+    return (a or '').replace('models/', '') == (b or '').replace('models/', '')
+
+
+def _apply_stored_semantic_scores(candidates, embeddings, query_embedding, query_model) -> None:
+    """Score candidates against their precomputed vectors with one matrix product."""
+    if not embeddings or not query_embedding:
+        return
+
+    query_vec = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = float(np.linalg.norm(query_vec))
+    if query_norm <= 0.0:
+        return
+    query_vec = query_vec / query_norm
+
+    scored = []
+    vectors = []
+    for candidate in candidates:
+        stored = embeddings.get((candidate.get('source_type'), candidate.get('source_id')))
+        if not stored:
+            continue
+        vector, model_name = stored
+        if vector is None or len(vector) != len(query_vec) or not _same_embedding_model(model_name, query_model):
+            continue
+        scored.append((candidate, model_name))
+        vectors.append(vector)
+
+    if not vectors:
+        return
+
+    matrix = np.vstack(vectors).astype(np.float32, copy=False)
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0.0] = 1.0
+    similarities = (matrix @ query_vec) / norms
+    for (candidate, model_name), similarity in zip(scored, similarities.tolist()):
+        candidate['semantic_score'] = max(0.0, float(similarity))
+        candidate['embedding_model'] = model_name
+
+
 def _recency_score(item: Any) -> float:
     item_datetime = _candidate_datetime(item)
     if item_datetime == datetime.min:
@@ -344,24 +407,6 @@ def _normalize_score(value: float, ceiling: float = 10.0) -> float:
     return max(0.0, min(1.0, value / ceiling))
 
 
-def _cosine_similarity(v1, v2):
-    if not v1 or not v2 or len(v1) != len(v2):
-        return -1.0
-
-    dot = 0.0
-    norm_1 = 0.0
-    norm_2 = 0.0
-    for a, b in zip(v1, v2):
-        dot += a * b
-        norm_1 += a * a
-        norm_2 += b * b
-
-    if norm_1 <= 0.0 or norm_2 <= 0.0:
-        return -1.0
-
-    return dot / ((norm_1 ** 0.5) * (norm_2 ** 0.5))
-
-
 def _candidate_rule_for_module(module_key: str) -> dict[str, Any]:
     return next((rule for rule in TOPIC_RULES if rule['module_key'] == module_key), {'keywords': ()})
 
@@ -566,7 +611,16 @@ def build_memory_context(
     summaries: Iterable[Any] | None = None,
     char_budget: int = MEMORY_CHAR_BUDGET,
     max_items: int = MEMORY_ITEM_LIMIT,
+    embeddings: dict[tuple[str, Any], tuple[Any, str]] | None = None,
 ) -> dict[str, Any]:
+    """
+    Rank memory items and summaries for *question*.
+
+    ``embeddings`` maps ``(source_type, source_id)`` to the precomputed
+    ``(vector, model_name)`` of each row, so the only embedding call made here
+    is for the query itself. Candidates without a stored vector are ranked
+    lexically.
+    """
     question = question or ''
     memory_candidates = []
     summary_candidates = []
@@ -622,26 +676,13 @@ def build_memory_context(
     shortlisted = list(memory_candidates[:EMBEDDING_CANDIDATE_LIMIT])
     shortlisted.extend(summary_candidates)
 
-    query_embedding, query_model = _embed_text_with_fallback(question, task_type='RETRIEVAL_QUERY')
-    if query_embedding:
-        def _embed_and_score(candidate):
-            text = candidate.get('candidate_text', candidate.get('content', ''))
-            candidate_embedding, candidate_model = _embed_text_with_fallback(
-                text,
-                task_type='RETRIEVAL_DOCUMENT',
-            )
-            if candidate_embedding:
-                candidate['semantic_score'] = max(0.0, _cosine_similarity(query_embedding, candidate_embedding))
-                candidate['embedding_model'] = candidate_model
-            candidate['score'] = _memory_reasoning_score(candidate)
-            return candidate
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-            # Parallelize embedding calls for the shortlisted candidates
-            list(executor.map(_embed_and_score, shortlisted))
-    else:
-        for candidate in shortlisted:
-            candidate['score'] = _memory_reasoning_score(candidate)
+    query_embedding, query_model = None, None
+    if embeddings:
+        query_embedding, query_model = _embed_text_with_fallback(question, task_type='RETRIEVAL_QUERY')
+        _apply_stored_semantic_scores(shortlisted, embeddings, query_embedding, query_model)
+
+    for candidate in shortlisted:
+        candidate['score'] = _memory_reasoning_score(candidate)
 
     shortlisted.sort(key=lambda item: (item['score'], item['importance'], item['updated_at']), reverse=True)
     selected = _select_diverse_candidates(shortlisted, max_items)
@@ -715,6 +756,7 @@ def build_minimum_continuation_capsule(
     char_budget: int = 420,
     max_lines: int = DEFAULT_CAPSULE_MAX_LINES,
     min_confidence: float = DEFAULT_CAPSULE_MIN_CONFIDENCE,
+    embeddings: dict[tuple[str, Any], tuple[Any, str]] | None = None,
 ) -> dict[str, Any]:
     base_context = build_memory_context(
         question,
@@ -722,6 +764,7 @@ def build_minimum_continuation_capsule(
         summaries=summaries,
         char_budget=max(char_budget, 320),
         max_items=max(max_lines, 3),
+        embeddings=embeddings,
     )
 
     hits = base_context.get('hits', [])
@@ -798,6 +841,7 @@ def build_structured_memory_capsule(
     summaries: Iterable[Any] | None = None,
     top_k: int = 5,
     min_confidence: float = DEFAULT_CAPSULE_MIN_CONFIDENCE,
+    embeddings: dict[tuple[str, Any], tuple[Any, str]] | None = None,
 ) -> dict[str, Any]:
     base_capsule = build_minimum_continuation_capsule(
         question,
@@ -806,6 +850,7 @@ def build_structured_memory_capsule(
         char_budget=640,
         max_lines=top_k,
         min_confidence=min_confidence,
+        embeddings=embeddings,
     )
 
     entries = []
@@ -1247,6 +1292,7 @@ def build_memory_retrieval_plan(
     summaries: Iterable[Any] | None = None,
     top_k: int = 5,
     min_confidence: float = DEFAULT_CAPSULE_MIN_CONFIDENCE,
+    embeddings: dict[tuple[str, Any], tuple[Any, str]] | None = None,
 ) -> dict[str, Any]:
     structured_capsule = build_structured_memory_capsule(
         question,
@@ -1254,6 +1300,7 @@ def build_memory_retrieval_plan(
         summaries=summaries,
         top_k=top_k,
         min_confidence=min_confidence,
+        embeddings=embeddings,
     )
     graph = build_memory_graph(structured_capsule)
     compaction = compact_memory_graph(graph)
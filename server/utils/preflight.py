@@ -0,0 +1,112 @@
+"""
+Concurrent pre-flight stages for a chat turn under one shared deadline.
+
+``/api/ask`` gathers several independent pieces before the model can answer –
+the GitHub tree, project RAG context, cross-session memory, intent and
+language detection. Run one after another, time-to-first-token is their sum.
+:class:`Preflight` starts them together on a shared thread pool
+(``ASK_PREFLIGHT_WORKERS``, default 32). Every :meth:`Preflight.result` waits
+at most until the common deadline (``ASK_PREFLIGHT_DEADLINE_SEC``, default
+4 s, counted from construction). A stage that misses it – or raises – yields
+its default and is reported, so slow context is dropped instead of holding
+up the answer. Overrunning stages finish in the background; their results
+are discarded.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from utils.concurrency import env_float, env_int
+
+DEFAULT_DEADLINE_SEC = env_float('ASK_PREFLIGHT_DEADLINE_SEC', 4.0, minimum=0.1, maximum=60.0)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=env_int('ASK_PREFLIGHT_WORKERS', 32, minimum=2, maximum=256),
+                    thread_name_prefix='ask-preflight',
+                )
+    return _executor
+
+
+class _Stage:
+    __slots__ = ('future', 'started', 'elapsed', 'status', 'value', 'resolved')
+
+    def __init__(self):
+        self.future = None
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.status = 'running'
+        self.value = None
+        self.resolved = False
+
+
+class Preflight:
+    """Named stages running concurrently; results are read against one deadline.
+
+    ``context`` (e.g. ``app.app_context``) is entered around every stage, since
+    stages run on pool threads without the request's context.
+    """
+
+    def __init__(self, deadline_sec: Optional[float] = None, context: Optional[Callable] = None) -> None:
+        self.deadline_sec = DEFAULT_DEADLINE_SEC if deadline_sec is None else deadline_sec
+        self.started = time.perf_counter()
+        self.deadline = self.started + self.deadline_sec
+        self.context = context
+        self._stages: Dict[str, _Stage] = {}
+
+    def _run(self, stage, fn, args, kwargs):
+        try:
+            if self.context is None:
+                return fn(*args, **kwargs)
+            with self.context():
+                return fn(*args, **kwargs)
+        finally:
+            stage.elapsed = time.perf_counter() - stage.started
+
+    def submit(self, name: str, fn: Callable, *args: Any, **kwargs: Any) -> None:
+        stage = _Stage()
+        self._stages[name] = stage
+        stage.future = _get_executor().submit(self._run, stage, fn, args, kwargs)
+
+    def submitted(self, name: str) -> bool:
+        return name in self._stages
+
+    def result(self, name: str, default: Any = None) -> Any:
+        """The stage's value, or ``default`` if it failed, was never submitted or missed the deadline."""
+        stage = self._stages.get(name)
+        if stage is None:
+            return default
+        if not stage.resolved:
+            stage.resolved = True
+            try:
+                stage.value = stage.future.result(timeout=max(0.0, self.deadline - time.perf_counter()))
+                stage.status = 'ok'
+            except concurrent.futures.TimeoutError:
+                stage.status = 'timeout'
+                print(f"WARN: preflight stage '{name}' missed the {self.deadline_sec:g}s deadline; dropped.")
+            except Exception as e:
+                stage.status = 'error'
+                print(f"WARN: preflight stage '{name}' failed: {e}")
+        return stage.value if stage.status == 'ok' else default
+
+    def timings(self) -> dict:
+        """``{stage: {'ms': ..., 'status': ...}}`` for the ``done`` payload."""
+        report = {}
+        for name, stage in self._stages.items():
+            elapsed = stage.elapsed
+            if elapsed is None:
+                elapsed = time.perf_counter() - stage.started
+            report[name] = {'ms': round(elapsed * 1000, 1), 'status': stage.status}
+        report['deadline_ms'] = round(self.deadline_sec * 1000)
+        return report
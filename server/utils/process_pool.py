@@ -0,0 +1,106 @@
+"""
+Bounded, killable worker processes for CPU-heavy work that must not pin a request thread.
+
+:class:`TimeoutProcessPool` runs each call in its own short-lived child process,
+with at most ``workers`` children alive at once and a hard timeout per call. A
+call that overruns has only its own child killed, so one pathological input
+costs one timeout and never stalls the other callers (a classic
+``multiprocessing.Pool`` can only be terminated as a whole).
+
+Children are started with ``forkserver`` where available: they fork from a
+clean single-threaded server that has pre-imported the pool's ``preload``
+modules, which keeps a call to a few milliseconds and never forks the threaded
+web worker. Elsewhere ``spawn`` is used; ``PROCESS_POOL_START_METHOD``
+overrides the choice. A pool with zero workers runs calls inline (no timeout).
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from typing import Any, Callable
+
+_PRELOAD: set = set()
+_PRELOAD_LOCK = threading.Lock()
+
+
+def _start_context():
+    method = (os.getenv('PROCESS_POOL_START_METHOD') or '').strip()
+    available = multiprocessing.get_all_start_methods()
+    if not method:
+        method = 'forkserver' if 'forkserver' in available else 'spawn'
+    if method not in available:
+        print(f"WARN: PROCESS_POOL_START_METHOD '{method}' unavailable; using spawn.")
+        method = 'spawn'
+    return multiprocessing.get_context(method)
+
+
+def _invoke(conn, fn, args):
+    try:
+        conn.send((True, fn(*args)))
+    except BaseException as exc:
+        try:
+            conn.send((False, exc))
+        except Exception:
+            conn.send((False, RuntimeError(repr(exc))))
+    finally:
+        conn.close()
+
+
+class TimeoutProcessPool:
+    """At most ``workers`` concurrent child processes; each call has a hard timeout."""
+
+    def __init__(self, name: str, workers: int, *, preload: tuple = ()) -> None:
+        self.name = name
+        self.workers = max(0, int(workers))
+        self._slots = threading.BoundedSemaphore(max(1, self.workers))
+        self._ctx = None
+        self.timeouts = 0
+        with _PRELOAD_LOCK:
+            _PRELOAD.update(preload)
+
+    def _context(self):
+        if self._ctx is None:
+            ctx = _start_context()
+            if ctx.get_start_method() == 'forkserver':
+                # Only takes effect before the fork server starts; it then imports
+                # these instead of the web app's __main__.
+                with _PRELOAD_LOCK:
+                    ctx.set_forkserver_preload(sorted(_PRELOAD))
+            self._ctx = ctx
+        return self._ctx
+
+    def run(self, fn: Callable, *args: Any, timeout: float) -> Any:
+        """Run top-level ``fn(*args)`` in a child; raises ``TimeoutError`` after ``timeout`` seconds.
+
+        Waiting for a free slot counts against the same timeout. Exceptions raised
+        by ``fn`` are re-raised here.
+        """
+        if self.workers == 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=timeout):
+            self.timeouts += 1
+            raise TimeoutError(f"{self.name}: all {self.workers} workers busy for {timeout:g}s")
+        try:
+            ctx = self._context()
+            reader, writer = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_invoke, args=(writer, fn, args), name=self.name, daemon=True)
+            proc.start()
+            writer.close()
+            try:
+                if not reader.poll(timeout):
+                    self.timeouts += 1
+                    proc.kill()
+                    raise TimeoutError(f"{self.name} timed out after {timeout:g}s")
+                try:
+                    ok, value = reader.recv()
+                except EOFError:
+                    raise RuntimeError(f"{self.name} worker exited without a result") from None
+            finally:
+                reader.close()
+                proc.join(1.0)
+        finally:
+            self._slots.release()
+        if not ok:
+            raise value
+        return value
@@ -0,0 +1,527 @@
+"""
+Cross-worker provider concurrency governor.
+
+Every uvicorn worker used to keep its own semaphores, so the real number of
+in-flight provider calls was ``workers × *_MAX_CONCURRENCY``. The governor
+keeps leases, waiters and rate buckets in one small SQLite file shared by all
+workers on the host (``PROVIDER_GOVERNOR_DB``). ``PROVIDER_GOVERNOR_DB=local``
+(or an unusable path) falls back to a private in-memory database, which gives
+the same behaviour for a single process.
+
+Admission rules, evaluated atomically inside ``BEGIN IMMEDIATE``:
+
+* per-provider concurrency limit (``GEMINI/OPENAI/ANTHROPIC_MAX_CONCURRENCY``)
+* per-provider and per-model request-per-minute token buckets
+  (``GEMINI_RPM``…, ``MODEL_RPM_LIMITS="gemini-2.5-flash=60,gpt-4o=120"``)
+* per-user fairness: waiters are served round-robin across users, ordered by
+  how many slots the user already holds, and a single user can hold at most
+  ``PROVIDER_MAX_PER_USER`` slots of a provider.
+
+Callers that can stream get :class:`QueueStatus` updates (position + ETA)
+while they wait instead of failing fast with ``TimeoutError``. Every caller
+gives up after ``MODEL_QUEUE_TIMEOUT_SEC`` (default 120 s) in the queue.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.concurrency import env_float, env_int
+
+
+_LEASE_TTL_SEC = env_float("PROVIDER_LEASE_TTL_SEC", 900.0, minimum=30.0, maximum=7200.0)
+_WAITER_STALE_SEC = 10.0
+_DEFAULT_HOLD_SEC = 20.0
+_NOTICE_INTERVAL_SEC = 2.0
+
+_current_user: ContextVar[Optional[Any]] = ContextVar("provider_governor_user", default=None)
+
+
+def queue_timeout() -> float:
+    """Seconds a request may wait for a provider slot before ``TimeoutError``."""
+    return env_float("MODEL_QUEUE_TIMEOUT_SEC", 120.0, minimum=0.1, maximum=900.0)
+
+
+def _parse_model_rpm(raw: str) -> Dict[str, float]:
+    limits: Dict[str, float] = {}
+    for part in (raw or "").split(","):
+        name, _, value = part.partition("=")
+        name = name.strip().lower().replace("models/", "")
+        try:
+            rpm = float(value)
+        except (TypeError, ValueError):
+            continue
+        if name and rpm > 0:
+            limits[name] = rpm
+    return limits
+
+
+@dataclass
+class QueueStatus:
+    provider: str
+    model: str
+    position: int
+    eta_seconds: int
+    waited_seconds: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "position": self.position,
+            "eta_seconds": self.eta_seconds,
+            "waited_seconds": round(self.waited_seconds, 1),
+        }
+
+
+class QueueNotice(str):
+    """
+    Empty-string marker carrying a QueueStatus.
+
+    Answer generators yield text; yielding one of these keeps naive
+    ``full_answer += chunk`` consumers unaffected while SSE endpoints can
+    turn it into a ``{"type": "queue"}`` event.
+    """
+
+    status: QueueStatus
+
+    def __new__(cls, status: QueueStatus):
+        obj = super().__new__(cls, "")
+        obj.status = status
+        return obj
+
+
+class ProviderGovernor:
+    """Shared lease table + fair queue; one instance per process."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._lock = threading.Lock()
+        self._limits = {
+            "gemini": env_int("GEMINI_MAX_CONCURRENCY", 4, minimum=1, maximum=64),
+            "openai": env_int("OPENAI_MAX_CONCURRENCY", 8, minimum=1, maximum=64),
+            "anthropic": env_int("ANTHROPIC_MAX_CONCURRENCY", 4, minimum=1, maximum=64),
+        }
+        self._provider_rpm = {
+            name: env_float(f"{name.upper()}_RPM", 0.0, minimum=0.0)
+            for name in self._limits
+        }
+        self._model_rpm = _parse_model_rpm(os.getenv("MODEL_RPM_LIMITS", ""))
+        self._per_user_env = os.getenv("PROVIDER_MAX_PER_USER")
+        self.path = self._open(path)
+
+    # ── Storage ───────────────────────────────────────────────────────────
+
+    def _open(self, path: Optional[str]) -> str:
+        path = path or os.getenv("PROVIDER_GOVERNOR_DB") or os.path.join(
+            tempfile.gettempdir(), "codealchemist_provider_governor.sqlite3"
+        )
+        if path != "local":
+            try:
+                self._conn = self._connect(path)
+                return path
+            except sqlite3.Error as exc:
+                print(f"WARN: provider governor store unavailable ({path}): {exc}; using local stand-in")
+        self._conn = self._connect(":memory:")
+        return "local"
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        if path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                id TEXT PRIMARY KEY, provider TEXT NOT NULL, model TEXT NOT NULL,
+                user_key TEXT NOT NULL, acquired_at REAL NOT NULL, expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_leases_provider ON leases(provider);
+            CREATE TABLE IF NOT EXISTS waiters (
+                id TEXT PRIMARY KEY, provider TEXT NOT NULL, model TEXT NOT NULL,
+                user_key TEXT NOT NULL, enqueued_at REAL NOT NULL, seen_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_waiters_provider ON waiters(provider);
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS hold_stats (
+                provider TEXT PRIMARY KEY, avg_hold REAL NOT NULL, samples INTEGER NOT NULL
+            );
+            """
+        )
+        return conn
+
+    @contextmanager
+    def _txn(self) -> Iterator[sqlite3.Connection]:
+        # The lock serialises threads of this process; BEGIN IMMEDIATE takes the
+        # SQLite write lock so admission is atomic across worker processes.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._conn.execute("COMMIT")
+
+    # ── Limits ────────────────────────────────────────────────────────────
+
+    def limit(self, provider: str) -> int:
+        return self._limits.get((provider or "").lower(), 4)
+
+    def governs(self, provider: str) -> bool:
+        return (provider or "").lower() in self._limits
+
+    def per_user_limit(self, provider: str) -> int:
+        limit = self.limit(provider)
+        try:
+            value = int(self._per_user_env) if self._per_user_env else max(1, (limit + 1) // 2)
+        except ValueError:
+            value = max(1, (limit + 1) // 2)
+        return max(1, min(limit, value))
+
+    def _bucket_specs(self, provider: str, model: str) -> List[Tuple[str, float]]:
+        specs = []
+        rpm = self._provider_rpm.get(provider) or 0.0
+        if rpm > 0:
+            specs.append((f"p:{provider}", rpm))
+        model_rpm = self._model_rpm.get(model)
+        if model_rpm:
+            specs.append((f"m:{model}", model_rpm))
+        return specs
+
+    @staticmethod
+    def _bucket_capacity(rpm: float) -> float:
+        # Allow a short burst (~10 s worth) but never less than one request.
+        return max(1.0, rpm / 6.0)
+
+    # ── Admission ─────────────────────────────────────────────────────────
+
+    def try_acquire(self, waiter_id: str, provider: str, model: str, user_key: str) -> Tuple[bool, int, float]:
+        """
+        One admission attempt. Returns ``(acquired, position, eta_seconds)``.
+        The waiter row is created on first call and refreshed on every poll.
+        """
+        now = time.time()
+        limit = self.limit(provider)
+        per_user = self.per_user_limit(provider)
+
+        with self._txn() as conn:
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+            conn.execute("DELETE FROM waiters WHERE seen_at < ?", (now - _WAITER_STALE_SEC,))
+            conn.execute(
+                "INSERT INTO waiters (id, provider, model, user_key, enqueued_at, seen_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET seen_at = excluded.seen_at",
+                (waiter_id, provider, model, user_key, now, now),
+            )
+
+            held: Dict[str, int] = {}
+            for lease_user, count in conn.execute(
+                "SELECT user_key, COUNT(*) FROM leases WHERE provider = ? GROUP BY user_key", (provider,)
+            ):
+                held[lease_user] = int(count)
+            active = sum(held.values())
+
+            waiters = conn.execute(
+                "SELECT id, user_key, enqueued_at FROM waiters WHERE provider = ? ORDER BY enqueued_at, id",
+                (provider,),
+            ).fetchall()
+
+            # Round-robin across users: the n-th queued request of a user that
+            # already holds k slots takes turn k + n; ties go to the oldest.
+            per_user_seen: Dict[str, int] = {}
+            ordered = []
+            for wid, wuser, enq in waiters:
+                rank = per_user_seen.get(wuser, 0)
+                per_user_seen[wuser] = rank + 1
+                ordered.append((held.get(wuser, 0) + rank, enq, wid, wuser))
+            ordered.sort()
+
+            # The per-user cap only bites when someone else is waiting; a lone
+            # user may still use every free slot.
+            contended = len({wuser for _wid, wuser, _enq in waiters} | set(held)) > 1
+            if not contended:
+                per_user = limit
+
+            free = max(0, limit - active)
+            position = 0
+            granted_users: Dict[str, int] = {}
+            admitted = False
+            for turn, _enq, wid, wuser in ordered:
+                user_total = held.get(wuser, 0) + granted_users.get(wuser, 0)
+                if user_total >= per_user:
+                    if wid == waiter_id:
+                        position = len(ordered)
+                        break
+                    continue
+                position += 1
+                if position <= free:
+                    granted_users[wuser] = granted_users.get(wuser, 0) + 1
+                if wid == waiter_id:
+                    admitted = position <= free
+                    break
+
+            bucket_wait = 0.0
+            if admitted:
+                bucket_wait = self._bucket_wait(conn, provider, model, now)
+                admitted = bucket_wait <= 0.0
+
+            if admitted:
+                conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+                conn.execute(
+                    "INSERT INTO leases (id, provider, model, user_key, acquired_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (waiter_id, provider, model, user_key, now, now + _LEASE_TTL_SEC),
+                )
+                self._take_tokens(conn, provider, model, now)
+                return True, 0, 0.0
+
+            row = conn.execute("SELECT avg_hold FROM hold_stats WHERE provider = ?", (provider,)).fetchone()
+            avg_hold = float(row[0]) if row else _DEFAULT_HOLD_SEC
+            ahead = max(0, position - free)
+            eta = (ahead + 1) * avg_hold / max(1, limit) if position > free else 0.0
+            return False, max(1, position), max(eta, bucket_wait)
+
+    def _bucket_state(self, conn: sqlite3.Connection, key: str, rpm: float, now: float) -> float:
+        capacity = self._bucket_capacity(rpm)
+        row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return capacity
+        tokens, updated_at = float(row[0]), float(row[1])
+        return min(capacity, tokens + max(0.0, now - updated_at) * rpm / 60.0)
+
+    def _bucket_wait(self, conn: sqlite3.Connection, provider: str, model: str, now: float) -> float:
+        wait = 0.0
+        for key, rpm in self._bucket_specs(provider, model):
+            tokens = self._bucket_state(conn, key, rpm, now)
+            if tokens < 1.0:
+                wait = max(wait, (1.0 - tokens) * 60.0 / rpm)
+        return wait
+
+    def _take_tokens(self, conn: sqlite3.Connection, provider: str, model: str, now: float) -> None:
+        for key, rpm in self._bucket_specs(provider, model):
+            tokens = self._bucket_state(conn, key, rpm, now) - 1.0
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now),
+            )
+
+    def release(self, lease_id: str, provider: str) -> None:
+        now = time.time()
+        with self._txn() as conn:
+            row = conn.execute("SELECT acquired_at FROM leases WHERE id = ?", (lease_id,)).fetchone()
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+            if row:
+                held = max(0.0, now - float(row[0]))
+                conn.execute(
+                    "INSERT INTO hold_stats (provider, avg_hold, samples) VALUES (?, ?, 1) "
+                    "ON CONFLICT(provider) DO UPDATE SET "
+                    "avg_hold = avg_hold * 0.8 + excluded.avg_hold * 0.2, samples = samples + 1",
+                    (provider, held),
+                )
+
+    def abandon(self, waiter_id: str) -> None:
+        with self._txn() as conn:
+            conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Active leases and queued waiters per provider (for /metrics and tests)."""
+        now = time.time()
+        with self._txn() as conn:
+            out: Dict[str, Dict[str, int]] = {
+                name: {"limit": limit, "active": 0, "queued": 0} for name, limit in self._limits.items()
+            }
+            for provider, count in conn.execute(
+                "SELECT provider, COUNT(*) FROM leases WHERE expires_at >= ? GROUP BY provider", (now,)
+            ):
+                out.setdefault(provider, {"limit": self.limit(provider), "active": 0, "queued": 0})["active"] = int(count)
+            for provider, count in conn.execute(
+                "SELECT provider, COUNT(*) FROM waiters WHERE seen_at >= ? GROUP BY provider",
+                (now - _WAITER_STALE_SEC,),
+            ):
+                out.setdefault(provider, {"limit": self.limit(provider), "active": 0, "queued": 0})["queued"] = int(count)
+            return out
+
+    # ── Reservations ──────────────────────────────────────────────────────
+
+    def reserve(self, provider: str, model: Optional[str] = None, user_id: Any = None) -> "ProviderReservation":
+        if user_id is None:
+            user_id = _current_user.get()
+        return ProviderReservation(self, provider, model, user_id)
+
+
+class ProviderReservation:
+    """
+    A single request for a provider slot.
+
+    Sync callers either ``with reservation:`` (blocks silently) or
+    ``yield from reservation.wait()`` first to stream QueueStatus updates.
+    Async callers use ``await reservation.acquire_async(on_wait=...)``.
+    """
+
+    def __init__(self, governor: ProviderGovernor, provider: str, model: Optional[str], user_id: Any) -> None:
+        self.governor = governor
+        self.provider = (provider or "").lower()
+        self.model = (model or self.provider or "").lower().replace("models/", "")
+        self.user_key = f"u:{user_id}" if user_id not in (None, "") else "anon"
+        self.id = uuid.uuid4().hex
+        self.acquired = not governor.governs(self.provider)
+        self._lease_held = False
+        self._started = time.time()
+
+    def _poll(self) -> Tuple[bool, int, float]:
+        ok, position, eta = self.governor.try_acquire(self.id, self.provider, self.model, self.user_key)
+        if ok:
+            self.acquired = True
+            self._lease_held = True
+        return ok, position, eta
+
+    def _status(self, position: int, eta: float) -> QueueStatus:
+        return QueueStatus(
+            provider=self.provider,
+            model=self.model,
+            position=position,
+            eta_seconds=int(round(eta)),
+            waited_seconds=time.time() - self._started,
+        )
+
+    def _timeout_error(self) -> TimeoutError:
+        limit = self.governor.limit(self.provider)
+        return TimeoutError(
+            f"{self.provider or 'model'} provider is busy. "
+            f"Concurrency limit ({limit}) reached; please retry shortly."
+        )
+
+    def wait(self, max_wait: Optional[float] = None) -> Iterator[QueueStatus]:
+        """Poll until admitted, yielding a QueueStatus on change or every few seconds."""
+        if self.acquired:
+            return
+        if max_wait is None:
+            max_wait = queue_timeout()
+        deadline = self._started + max_wait
+        delay = 0.05
+        last_sent: Optional[Tuple[int, int]] = None
+        last_sent_at = 0.0
+        try:
+            while True:
+                ok, position, eta = self._poll()
+                if ok:
+                    return
+                now = time.time()
+                if now >= deadline:
+                    raise self._timeout_error()
+                key = (position, int(round(eta)))
+                if key != last_sent or now - last_sent_at >= _NOTICE_INTERVAL_SEC:
+                    last_sent, last_sent_at = key, now
+                    yield self._status(position, eta)
+                time.sleep(min(delay, max(0.0, deadline - now)))
+                delay = min(0.5, delay * 1.5)
+        finally:
+            if not self.acquired:
+                self.governor.abandon(self.id)
+
+    def acquire(self, max_wait: Optional[float] = None, on_wait: Optional[Callable[[QueueStatus], None]] = None) -> None:
+        for status in self.wait(max_wait=max_wait):
+            if on_wait:
+                on_wait(status)
+
+    async def acquire_async(self, max_wait: Optional[float] = None, on_wait: Optional[Callable] = None) -> None:
+        if self.acquired:
+            return
+        if max_wait is None:
+            max_wait = queue_timeout()
+        loop = asyncio.get_running_loop()
+        deadline = self._started + max_wait
+        delay = 0.05
+        last_sent: Optional[Tuple[int, int]] = None
+        last_sent_at = 0.0
+        try:
+            while True:
+                ok, position, eta = await loop.run_in_executor(None, self._poll)
+                if ok:
+                    return
+                now = time.time()
+                if now >= deadline:
+                    raise self._timeout_error()
+                key = (position, int(round(eta)))
+                if on_wait and (key != last_sent or now - last_sent_at >= _NOTICE_INTERVAL_SEC):
+                    last_sent, last_sent_at = key, now
+                    result = on_wait(self._status(position, eta))
+                    if asyncio.iscoroutine(result):
+                        await result
+                await asyncio.sleep(min(delay, max(0.0, deadline - now)))
+                delay = min(0.5, delay * 1.5)
+        finally:
+            if not self.acquired:
+                await loop.run_in_executor(None, self.governor.abandon, self.id)
+
+    def release(self) -> None:
+        if self._lease_held:
+            self._lease_held = False
+            try:
+                self.governor.release(self.id, self.provider)
+            except Exception as exc:
+                print(f"WARN: provider lease release failed ({self.provider}): {exc}")
+
+    def __enter__(self) -> "ProviderReservation":
+        if not self.acquired:
+            self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.release()
+        return False
+
+    async def __aenter__(self) -> "ProviderReservation":
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        await asyncio.get_running_loop().run_in_executor(None, self.release)
+        return False
+
+
+_governor: Optional[ProviderGovernor] = None
+_governor_pid: Optional[int] = None
+_governor_lock = threading.Lock()
+
+
+def get_provider_governor() -> ProviderGovernor:
+    """Process-wide governor (re-opened after fork so connections are not shared)."""
+    global _governor, _governor_pid
+    pid = os.getpid()
+    if _governor is not None and _governor_pid == pid:
+        return _governor
+    with _governor_lock:
+        if _governor is None or _governor_pid != pid:
+            _governor = ProviderGovernor()
+            _governor_pid = pid
+        return _governor
+
+
+def iter_as_provider_user(iterable, user_id: Any):
+    """
+    Re-yield *iterable* with *user_id* bound as the fairness key for any
+    provider reservation made while producing each item.
+    """
+    iterator = iter(iterable)
+    while True:
+        token = _current_user.set(user_id)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _current_user.reset(token)
+        yield item
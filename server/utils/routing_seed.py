@@ -0,0 +1,367 @@
+"""
+Generated seed examples for :mod:`utils.intent_classifier`.
+
+The hand-written ``SEED_INTENTS`` / ``SEED_LANGUAGES`` lists are a few dozen
+questions, far too few for the model to be confident about anything, so this
+module expands English and Turkish phrase templates over topic lists into a few
+thousand labelled questions. :func:`generated_samples` is deterministic. With
+no logged decisions, the benchmark trains on these and scores the hand-written
+lists. Those lists were written separately, but they share vocabulary with
+these templates, so logged traffic remains the real test.
+"""
+from __future__ import annotations
+
+import itertools
+import random
+from typing import Dict, List, Sequence
+
+_PER_INTENT = 260
+_PER_LANGUAGE = 140
+
+# ── Intent templates ──────────────────────────────────────────────────────
+
+_TERMS = [
+    'REST', 'an API', 'a CPU', 'RAM', 'DNS', 'HTTP', 'HTTPS', 'JSON', 'YAML', 'a VPN', 'Docker', 'Kubernetes',
+    'Git', 'a firewall', 'TCP', 'UDP', 'an IP address', 'a kernel', 'a URL', 'SaaS', 'a CDN', 'OAuth', 'an SSD',
+    'Linux', 'a compiler', 'a framework', 'a database', 'a server', 'a cookie', 'a browser', 'bandwidth', 'a GPU',
+    'an SDK', 'an IDE', 'open source', 'the cloud', 'a hash', 'a port', 'a subnet', 'SSH', 'FTP', 'an LLM',
+]
+_TERMS_TR = [
+    'REST', 'API', 'CPU', 'RAM', 'DNS', 'HTTP', 'JSON', 'YAML', 'VPN', 'Docker', 'Kubernetes', 'Git',
+    'güvenlik duvarı', 'TCP', 'UDP', 'IP adresi', 'çekirdek', 'URL', 'SaaS', 'CDN', 'OAuth', 'SSD', 'Linux',
+    'derleyici', 'framework', 'veritabanı', 'sunucu', 'çerez', 'tarayıcı', 'bant genişliği', 'GPU', 'SDK',
+    'IDE', 'açık kaynak', 'bulut', 'hash', 'port', 'SSH', 'yapay zeka',
+]
+_ACRONYMS = ['API', 'CPU', 'RAM', 'DNS', 'HTTP', 'JSON', 'SQL', 'URL', 'CSS', 'HTML', 'SSD', 'CDN', 'IDE', 'SDK',
+             'JWT', 'ORM', 'CLI', 'GUI', 'OOP', 'TDD', 'CI/CD', 'AWS', 'VPN', 'LAN', 'NAT']
+_FACTS = [
+    'the capital of Germany', 'the speed of light', 'the tallest mountain in the world', 'the largest planet',
+    'the boiling point of water', 'the population of Tokyo', 'the inventor of the telephone',
+    'the latest Python version', 'the default port for HTTPS', 'the size of a kilobyte in bytes',
+]
+_FACTS_TR = [
+    "Almanya'nın başkenti", 'ışık hızı', 'dünyanın en yüksek dağı', 'en büyük gezegen', 'suyun kaynama noktası',
+    "Tokyo'nun nüfusu", 'HTTPS varsayılan portu', 'bir kilobaytta kaç bayt olduğu',
+]
+_SIMPLE = {
+    'en': ['What is {term}?', 'What is {term} in one sentence?', 'Define {term}', 'In short, what is {term}?',
+           'Quick question: what is {term}?', 'What is {term} in a nutshell?', 'Briefly, what is {term}?',
+           'What does {acronym} stand for?', '{acronym} stands for what?', 'What is {fact}?', 'Tell me {fact}',
+           'Summarize this text', 'Summarize this paragraph in two lines', 'Give me a one-line summary of this',
+           'TL;DR of this article please', 'One-line definition of {term}'],
+    'tr': ['{term_tr} nedir?', '{term_tr} ne demek?', 'Kısaca {term_tr} nedir', '{term_tr} nedir kısaca',
+           'Tek cümleyle {term_tr} nedir?', '{acronym} açılımı nedir?', '{acronym} neyin kısaltması?',
+           '{fact_tr} nedir?', '{fact_tr} ne kadar?', 'Bu metni özetle', 'Şu paragrafı özetle',
+           'Kısaca özetler misin', 'Bu yazının özetini çıkar', 'Özetle: {term_tr} nedir'],
+}
+
+_TASKS = [
+    'reverse a string', 'sort a list', 'find the max of an array', 'check if a number is prime',
+    'remove duplicates from a list', 'count the vowels in a word', 'sum the numbers in a list',
+    'convert celsius to fahrenheit', 'print the numbers from 1 to 100', 'read a file line by line',
+    'merge two dictionaries', 'check if a string is a palindrome', 'calculate a factorial',
+    'print the fibonacci sequence', 'swap two variables', 'capitalize every word in a sentence',
+    'generate a random number', 'flatten a nested list', 'get the current date', 'split a string by commas',
+    'write a fizzbuzz', 'add two numbers', 'find the length of a string', 'convert a list to a set',
+]
+_TASKS_TR = [
+    'bir stringi ters çeviren', 'listeyi sıralayan', 'dizideki en büyük sayıyı bulan', 'asal sayı kontrolü yapan',
+    'listedeki tekrarları silen', 'sesli harfleri sayan', 'listedeki sayıları toplayan',
+    'santigratı fahrenhayta çeviren', "1'den 100'e kadar yazdıran", 'dosyayı satır satır okuyan',
+    'iki sözlüğü birleştiren', 'palindrom kontrolü yapan', 'faktöriyel hesaplayan', 'fibonacci dizisini yazdıran',
+    'rastgele sayı üreten', 'iki sayıyı toplayan', 'kelimelerin ilk harfini büyüten',
+]
+_SIMPLE_CODE = {
+    'en': ['Write a function to {task}', 'How do I {task}?', 'Write code to {task}', 'Show me how to {task}',
+           'Give me a snippet to {task}', 'Simple program to {task}', 'Write a loop to {task}',
+           'Write a one-liner to {task}', 'Quick code: {task}', 'Can you write a small function that can {task}?'],
+    'tr': ['{task_tr} fonksiyon yaz', '{task_tr} bir kod yaz', '{task_tr} döngü yaz', '{task_tr} program yazar mısın',
+           '{task_tr} kısa bir kod örneği ver', '{task_tr} basit bir fonksiyon'],
+}
+
+_ERRORS = [
+    'TypeError', 'KeyError', 'IndexError: list index out of range', 'NullPointerException',
+    'undefined is not a function', "Cannot read properties of undefined (reading 'map')",
+    'ModuleNotFoundError', 'Segmentation fault', 'SyntaxError: Unexpected token', 'a 500 Internal Server Error',
+    'CORS error', 'a memory leak', 'an infinite loop', 'a deadlock', 'a race condition',
+    'ImportError: cannot import name', 'AttributeError: NoneType object has no attribute',
+    'ECONNREFUSED', 'a stack overflow', 'a 404 on my API route', 'merge conflict', 'UnicodeDecodeError',
+    'permission denied', 'a timeout', 'ZeroDivisionError', 'ValueError: invalid literal for int()',
+]
+_THINGS = [
+    'my code', 'this function', 'my script', 'the login page', 'my React component', 'the build',
+    'my unit test', 'the API endpoint', 'my loop', 'the migration', 'the Docker container', 'my query',
+    'the checkout flow', 'the app on startup', 'my recursive function',
+]
+_THINGS_TR = ['kodum', 'bu fonksiyon', 'scriptim', 'giriş sayfası', 'React bileşenim', 'build', 'testim',
+              'API endpointi', 'döngüm', 'uygulama', 'sorgum', 'Docker konteyneri']
+_DEBUG = {
+    'en': ['Why does {thing} crash?', 'Fix this error: {error}', 'I get {error} when I run {thing}',
+           'Why am I getting {error}?', 'Debug {thing}, it throws {error}', '{thing} fails with {error}',
+           'How do I fix {error} in {thing}?', '{thing} is not working, what is wrong?',
+           'Traceback (most recent call last): {error}', "{thing} returns the wrong result, where's the bug?",
+           'Help, {thing} keeps throwing {error}', 'Find the bug in {thing}', 'Why is {thing} so slow?',
+           'Tests fail with {error}, any idea?'],
+    'tr': ['{thing_tr} neden çalışmıyor?', '{error} hatası alıyorum', '{thing_tr} {error} hatası veriyor',
+           'Bu hatayı düzelt: {error}', '{thing_tr} neden hata veriyor?', "{thing_tr} çöküyor, sorun ne?",
+           "{error} hatasını nasıl çözerim?", 'Bu koddaki hatayı bul', '{thing_tr} yanlış sonuç döndürüyor',
+           'Hata alıyorum: {error}'],
+}
+
+_CONCEPTS = [
+    'SOLID principles', 'JWT authentication', 'polymorphism', 'garbage collection', 'the event loop',
+    'dependency injection', 'closures', 'recursion', 'big O notation', 'database indexing', 'async/await',
+    'virtual memory', 'the CAP theorem', 'OAuth flows', 'React hooks', 'the virtual DOM', 'hash tables',
+    'public key cryptography', 'TCP handshakes', 'Git rebase', 'inheritance', 'generators', 'decorators',
+    'memoization', 'database transactions', 'binary search', 'dynamic programming', 'multithreading',
+    'the difference between a process and a thread', 'how HTTPS encryption works', 'consistent hashing',
+]
+_CONCEPTS_TR = [
+    'SOLID prensipleri', 'JWT kimlik doğrulama', 'polimorfizm', 'çöp toplama', 'event loop',
+    'bağımlılık enjeksiyonu', 'closure', 'özyineleme', 'big O notasyonu', 'veritabanı indeksleri', 'async await',
+    'sanal bellek', 'CAP teoremi', 'React hookları', 'hash tablosu', 'kalıtım', 'dekoratörler',
+    'dinamik programlama', 'çoklu iş parçacığı', 'ikili arama',
+]
+_EXPLAIN = {
+    'en': ['Explain {concept}', 'How does {concept} work?', 'Can you explain {concept}?',
+           'Explain {concept} with examples', 'Help me understand {concept}', 'Explain {concept} like I am five',
+           'What is the idea behind {concept}?', 'Walk me through {concept}', 'Why do we use {concept}?',
+           'Explain what this function does', 'Explain this code line by line', 'What does this code do?',
+           'Give me an overview of {concept}', 'How is {concept} implemented under the hood?'],
+    'tr': ['{concept_tr} açıkla', '{concept_tr} nasıl çalışır?', '{concept_tr} nedir, açıklar mısın?',
+           '{concept_tr} mantığını anlat', '{concept_tr} örneklerle anlat', '{concept_tr} konusunu detaylı açıkla',
+           'Bu kod ne yapıyor, açıklar mısın?', 'Bu fonksiyonu satır satır açıkla', '{concept_tr} neden kullanılır?'],
+}
+
+_SYSTEMS = [
+    'an e-commerce site', 'a chat app with millions of users', 'a ride sharing app', 'a SaaS platform',
+    'a video streaming service', 'a payment system', 'a social network', 'a URL shortener', 'a booking platform',
+    'a multi-tenant CRM', 'an online game backend', 'a logistics tracking system', 'a news feed',
+    'a banking core system', 'an IoT data pipeline', 'a food delivery app', 'a search engine',
+]
+_SYSTEMS_TR = ['bir e-ticaret sitesi', 'milyonlarca kullanıcılı bir sohbet uygulaması', 'bir ödeme sistemi',
+               'bir SaaS platformu', 'bir video yayın servisi', 'bir sosyal ağ', 'bir rezervasyon platformu',
+               'bir yemek siparişi uygulaması', 'bir lojistik takip sistemi', 'bir bankacılık sistemi']
+_PATTERNS = ['microservices', 'event sourcing and CQRS', 'hexagonal architecture', 'clean architecture',
+             'a message queue with Kafka', 'sharding and replication', 'serverless functions', 'a service mesh',
+             'domain-driven design', 'a layered architecture']
+_ARCHITECTURE = {
+    'en': ['Design the architecture for {system}', 'Design a scalable backend for {system}',
+           'How should I architect {system}?', 'System design for {system}', 'Plan the services for {system}',
+           'Design {system} using {pattern}', 'How would you split {system} into microservices?',
+           'Propose a database and caching strategy for {system}', 'Refactor our monolith into {pattern}',
+           'Set up {pattern} for {system}', 'What architecture fits {system} at scale?',
+           'Design a high-availability deployment for {system}'],
+    'tr': ['{system_tr} için mimari tasarla', '{system_tr} için ölçeklenebilir bir backend tasarla',
+           '{system_tr} nasıl bir mimariyle kurulmalı?', '{system_tr} için sistem tasarımı yap',
+           '{system_tr} için mikroservis mimarisi öner', 'Monoliti servislere nasıl bölmeliyim?',
+           '{system_tr} için katmanlı proje yapısı öner'],
+}
+
+_SUBJECTS = ['a dragon', 'the sea', 'autumn', 'a lonely robot', 'summer', 'friendship', 'the moon', 'a lost cat',
+             'programmers', 'coffee', 'rain', 'a haunted house', 'space travel', 'a brave knight', 'the city']
+_SUBJECTS_TR = ['bir ejderha', 'deniz', 'sonbahar', 'yalnız bir robot', 'yaz', 'dostluk', 'ay', 'kayıp bir kedi',
+                'kahve', 'yağmur', 'uzay yolculuğu', 'cesur bir şövalye']
+_BRANDS = ['my coffee shop', 'my startup', 'a bakery', 'a fitness app', 'my podcast', 'a travel agency',
+           'my YouTube channel', 'a bookstore']
+_CREATIVE = {
+    'en': ['Write a story about {subject}', 'Write a poem about {subject}', 'Write a haiku about {subject}',
+           'Write song lyrics about {subject}', 'Write a short fairy tale about {subject}',
+           'Write a funny limerick about {subject}', 'Generate a tagline for {brand}',
+           'Brainstorm names for {brand}', 'Come up with a slogan for {brand}',
+           'Write a creative product description for {brand}', 'Write a birthday message for my friend',
+           'Give me ideas for a party theme', 'Write a bedtime story for kids about {subject}'],
+    'tr': ['{subject_tr} hakkında bir hikaye yaz', '{subject_tr} hakkında bir şiir yaz',
+           '{subject_tr} üzerine kısa bir masal yaz', 'Bana {subject_tr} ile ilgili bir masal anlat',
+           'Kahve dükkanım için slogan bul', 'Girişimim için isim önerileri ver',
+           '{subject_tr} hakkında şarkı sözü yaz', 'Arkadaşım için doğum günü mesajı yaz'],
+}
+
+_GENERAL = {
+    'en': ['Hello', 'Hi', 'Hi there', 'Hey', 'Good morning', 'Good evening', 'How are you?', "How's it going?",
+           'Thanks!', 'Thank you so much', 'Who are you?', 'What can you do?', 'What is your name?',
+           "What's the weather like today?", 'Tell me something interesting', "Let's chat", 'ok', 'cool',
+           'Nice, thanks', 'Bye', 'See you later', 'Are you a robot?', 'Do you like music?',
+           'What should I eat tonight?', 'Any plans for the weekend?', "I'm bored", 'Tell me a fun fact'],
+    'tr': ['Merhaba', 'Selam', 'Selamlar', 'Günaydın', 'İyi akşamlar', 'Nasılsın?', 'Naber?', 'Teşekkürler',
+           'Çok teşekkür ederim', 'Sen kimsin?', 'Neler yapabilirsin?', 'Adın ne?', 'Bugün hava nasıl?',
+           'Bana ilginç bir şey söyle', 'Sohbet edelim', 'Tamam', 'Süper', 'Görüşürüz', 'Canım sıkılıyor',
+           'Akşam ne yesem?', 'Hafta sonu planın var mı?'],
+}
+
+_IMAGES = ['a cat', 'a sunset over the mountains', 'a futuristic city', 'a dog wearing sunglasses', 'a castle',
+           'a dragon', 'a red sports car', 'an astronaut in space', 'a cozy cabin in the snow', 'a robot chef',
+           'a fantasy forest', 'a beach house', 'a cyberpunk street', 'a cute owl']
+_IMAGES_TR = ['bir kedi', 'dağlarda gün batımı', 'fütüristik bir şehir', 'uzayda bir astronot', 'bir kale',
+              'sahilde bir ev', 'kırmızı bir spor araba', 'sevimli bir baykuş', 'karlı bir kulübe']
+_IMAGE_GENERATION = {
+    'en': ['Generate an image of {image}', 'Draw a picture of {image}', 'Create an image of {image}',
+           'Make a picture of {image}', 'Render an image of {image}', 'Draw an illustration of {image}',
+           'Generate artwork of {image}', 'Paint {image}', 'Make a logo for {brand}', 'Design an icon for {brand}',
+           'Create a wallpaper with {image}', 'I want an image of {image}'],
+    'tr': ['{image_tr} resmi çiz', 'Görsel oluştur: {image_tr}', 'Resim yap: {image_tr}',
+           '{image_tr} görseli oluştur', '{image_tr} çizer misin?', 'Bana bir logo yap', 'Bir ikon tasarla',
+           'Fotoğraf oluştur: {image_tr}'],
+}
+
+_INTENT_TEMPLATES = {
+    'simple': _SIMPLE, 'simple_code': _SIMPLE_CODE, 'debug': _DEBUG, 'explain': _EXPLAIN,
+    'architecture': _ARCHITECTURE, 'creative': _CREATIVE, 'general': _GENERAL, 'image_generation': _IMAGE_GENERATION,
+}
+
+_SLOTS: Dict[str, Sequence[str]] = {
+    'term': _TERMS, 'term_tr': _TERMS_TR, 'acronym': _ACRONYMS, 'fact': _FACTS, 'fact_tr': _FACTS_TR,
+    'task': _TASKS, 'task_tr': _TASKS_TR, 'error': _ERRORS, 'thing': _THINGS, 'thing_tr': _THINGS_TR,
+    'concept': _CONCEPTS, 'concept_tr': _CONCEPTS_TR, 'system': _SYSTEMS, 'system_tr': _SYSTEMS_TR,
+    'pattern': _PATTERNS, 'subject': _SUBJECTS, 'subject_tr': _SUBJECTS_TR, 'brand': _BRANDS,
+    'image': _IMAGES, 'image_tr': _IMAGES_TR,
+}
+
+# ── Language templates ────────────────────────────────────────────────────
+
+# Names users type for each language; the keyword pass in LanguageDetector
+# already catches code-heavy input, so these lean on prose mentions.
+_LANGUAGE_NAMES = {
+    'python': ['python', 'python3', 'django', 'flask', 'pandas', 'numpy'],
+    'javascript': ['javascript', 'js', 'node', 'nodejs', 'react', 'vue', 'jquery'],
+    'typescript': ['typescript', 'ts', 'angular', 'a tsx component', 'deno'],
+    'java': ['java', 'spring', 'spring boot', 'jvm', 'android java'],
+    'csharp': ['c#', 'csharp', '.net', 'dotnet', 'asp.net', 'unity c#'],
+    'cpp': ['c++', 'cpp', 'stl', 'qt', 'unreal c++'],
+    'c': ['c', 'ansi c', 'c99', 'embedded c', 'c dilinde'],
+    'html': ['html', 'html5', 'a web page', 'markup'],
+    'css': ['css', 'tailwind', 'sass', 'scss', 'flexbox', 'css grid'],
+    'sql': ['sql', 'postgres', 'mysql', 'sqlite', 'a database query', 't-sql'],
+    'bash': ['bash', 'shell', 'a shell script', 'the terminal', 'zsh', 'linux command line'],
+    'go': ['go', 'golang', 'goroutines'],
+    'rust': ['rust', 'cargo', 'tokio'],
+    'php': ['php', 'laravel', 'symfony', 'wordpress'],
+    'ruby': ['ruby', 'rails', 'ruby on rails'],
+    'swift': ['swift', 'swiftui', 'ios', 'uikit'],
+    'kotlin': ['kotlin', 'android kotlin', 'ktor', 'jetpack compose'],
+}
+_LANGUAGE_QUESTIONS = {
+    'en': ['How do I {task} in {lang}?', '{task} in {lang}', 'Write {lang} code to {task}',
+           'Best way to {task} with {lang}', 'My {lang} app crashes on startup', '{lang} error when I deploy',
+           'Explain async in {lang}', 'How do I install packages for {lang}?', '{lang} best practices',
+           'Is {lang} good for beginners?', 'Help with my {lang} project', '{lang} performance tips'],
+    'tr': ['{lang} ile {task_tr} kod yaz', "{lang}'da nasıl yaparım: {task}", '{lang} projemde hata var',
+           '{lang} öğrenmek istiyorum', '{lang} ile ilgili bir sorum var', '{lang} kodum çalışmıyor'],
+}
+_LANGUAGE_CODE = {
+    'python': ['for item in items:\n    total += item', 'with open(path) as f:\n    data = f.read()',
+               'class Cart:\n    def add(self, item):\n        self.items.append(item)',
+               'result = [x * 2 for x in values if x]', 'except ValueError as exc:\n    log(exc)'],
+    'javascript': ['items.forEach(item => total += item);', "fetch(url).then(res => res.json())",
+                   'module.exports = { start };', "app.get('/', (req, res) => res.send('ok'));",
+                   'setTimeout(() => render(), 100);'],
+    'typescript': ['const total: number = items.reduce((a, b) => a + b, 0);',
+                   'export interface Order { id: string; total: number }', 'function load<T>(key: string): T',
+                   'type State = { loading: boolean }', 'private readonly repo: UserRepo'],
+    'java': ['List<String> names = new ArrayList<>();', 'public void save(User user) throws IOException {',
+             '@Override\npublic String toString() {', 'for (int i = 0; i < n; i++) { sum += arr[i]; }',
+             'Optional<User> user = repo.findById(id);'],
+    'csharp': ['var users = db.Users.Where(u => u.Active).ToList();', 'public async Task<IActionResult> Get()',
+               'foreach (var item in items) { total += item; }', 'public string Name { get; set; }',
+               'catch (Exception ex) { logger.LogError(ex, "failed"); }'],
+    'cpp': ['for (auto& item : items) { total += item; }', 'std::map<std::string, int> counts;',
+            'template <typename T> T max(T a, T b)', 'auto ptr = std::make_unique<Node>();', 'cin >> n;'],
+    'c': ['int *arr = malloc(n * sizeof(int));', 'for (int i = 0; i < n; i++) sum += arr[i];',
+          'typedef struct { int x; int y; } Point;', 'char buf[256];\nfgets(buf, sizeof buf, stdin);',
+          'free(arr);'],
+    'html': ['<form action="/login"><input name="email"></form>', '<nav><a href="/">Home</a></nav>',
+             '<table><tr><td>1</td></tr></table>', '<button type="submit">Save</button>',
+             '<section id="hero"><h1>Title</h1></section>'],
+    'css': ['.card { border-radius: 8px; }', 'h1 { font-weight: 700; }', '.row { justify-content: center; }',
+            '.btn:hover { opacity: 0.8; }', 'grid-template-columns: repeat(3, 1fr);'],
+    'sql': ['SELECT name FROM users WHERE active = 1', 'UPDATE orders SET status = \'paid\' WHERE id = 5',
+            'LEFT JOIN payments p ON p.order_id = o.id', 'DELETE FROM sessions WHERE expires_at < NOW()',
+            'ALTER TABLE users ADD COLUMN age INT'],
+    'bash': ['for f in *.log; do gzip "$f"; done', 'export PATH=$HOME/bin:$PATH', 'grep -r "TODO" src/ | wc -l',
+             'if [ -f .env ]; then source .env; fi', 'tar -czf backup.tar.gz data/'],
+    'go': ['if err != nil {\n    return err\n}', 'ch := make(chan int)', 'type Server struct { addr string }',
+           'for _, v := range values {', 'http.HandleFunc("/", handler)'],
+    'rust': ['let v: Vec<i32> = Vec::new();', 'match result {\n    Ok(v) => v,\n    Err(e) => panic!()\n}',
+             'impl Display for Point {', 'pub fn parse(input: &str) -> Result<Config, Error>',
+             'let s = String::from("hi");'],
+    'php': ['$users = User::where(\'active\', 1)->get();', 'foreach ($items as $item) {',
+            'function save($data) { return $this->db->insert($data); }', 'echo json_encode($result);',
+            '$_POST[\'email\']'],
+    'ruby': ['items.each do |item|\n  total += item\nend', 'def full_name\n  "#{first} #{last}"\nend',
+             'has_many :comments', 'users.map(&:email)', 'require \'json\''],
+    'swift': ['let label = UILabel()', 'func fetch() async throws -> [Item]', 'struct ContentView: View {',
+              'if let user = currentUser {', 'DispatchQueue.main.async {'],
+    'kotlin': ['val users = listOf("a", "b")', 'fun load(): Flow<List<Item>> = flow {', 'viewModelScope.launch {',
+               'when (state) { is Loading -> show() }', 'class Repo(private val api: Api)'],
+}
+# Ecosystem words and one-line idioms users paste into the question itself.
+_LANGUAGE_TOOLS = {
+    'python': ['pip', 'virtualenv', 'pytest', 'def', 'self', 'import', 'print()', '__init__', 'list comprehension'],
+    'javascript': ['npm', 'yarn', 'console.log', 'document.getElementById', 'const', '=>', 'useEffect', 'express'],
+    'typescript': ['tsc', 'tsconfig.json', 'interface', 'generics', 'type alias', ': string', 'Partial<T>'],
+    'java': ['maven', 'gradle', 'System.out', 'public class', 'public static void main', '@Autowired', 'JUnit'],
+    'csharp': ['Console.WriteLine', 'using System', 'Task', 'LINQ', 'NuGet', 'Entity Framework'],
+    'cpp': ['std::', '#include <iostream>', 'cout', 'std::vector', 'g++', 'CMake', 'templates'],
+    'c': ['printf', 'malloc', 'scanf', 'stdio.h', 'gcc', 'pointers', 'struct', 'free()'],
+    'html': ['<div>', '<ul>', '<form>', 'tags', 'doctype', 'semantic tags', '<a href>'],
+    'css': ['margin', 'padding', 'display flex', 'media query', 'z-index', 'selectors', 'background-color'],
+    'sql': ['SELECT', 'JOIN', 'GROUP BY', 'INSERT INTO', 'WHERE clause', 'primary key', 'create table'],
+    'bash': ['ls', 'chmod', 'apt-get', 'sudo', 'grep', 'cron job', 'docker run', 'ssh'],
+    'go': ['fmt', 'goroutine', 'defer', 'package main', 'go mod', 'channels'],
+    'rust': ['fn', 'let mut', 'println!', 'borrow checker', 'cargo', 'lifetimes', 'Option<T>'],
+    'php': ['$variable', 'echo', 'composer', '<?php', 'artisan', '$_GET'],
+    'ruby': ['puts', 'gem', 'attr_accessor', 'bundler', 'rake', 'do |x| end'],
+    'swift': ['guard let', '@State', 'optionals', 'xcode', 'cocoapods', 'UIViewController'],
+    'kotlin': ['fun', 'val', 'data class', 'suspend', 'coroutines', 'gradle kts'],
+}
+_TOOL_QUESTIONS = ['{tool} not working', '{tool} usage', 'How to use {tool}?', '{tool} error', '{tool} example',
+                   '{tool} örneği', '{tool} kullanımı', 'Problem with {tool}', '{tool} hatası']
+_CODE_QUESTIONS = ['What does this do?', 'Fix this', 'Is this correct?', 'Why does this fail?', 'Review this',
+                   'Bu kod ne yapıyor?', 'Bunu düzelt', 'Can you optimize this?', 'Explain this snippet']
+
+
+def _expand(template: str, rng: random.Random) -> str:
+    values = {name: rng.choice(options) for name, options in _SLOTS.items() if '{' + name + '}' in template}
+    return template.format(**values)
+
+
+def _fill(templates: Sequence[str], count: int, rng: random.Random, expand) -> List[str]:
+    """Up to ``count`` distinct strings, cycling through templates so each gets used."""
+    seen, out = set(), []
+    for template in itertools.islice(itertools.cycle(templates), count * 6):
+        text = expand(template, rng)
+        key = ' '.join(text.lower().split())
+        if key not in seen:
+            seen.add(key)
+            out.append(text)
+            if len(out) >= count:
+                break
+    return out
+
+
+def generated_samples(seed: int = 0) -> List[dict]:
+    """Labelled questions for both heads; plain intent questions double as ``language='unknown'``."""
+    rng = random.Random(seed)
+    samples = []
+    for intent, templates in _INTENT_TEMPLATES.items():
+        mixed = [t for pair in itertools.zip_longest(templates['en'], templates['tr']) for t in pair if t]
+        for question in _fill(mixed, _PER_INTENT, rng, _expand):
+            samples.append({'question': question, 'intent': intent, 'language': 'unknown'})
+
+    prose = _LANGUAGE_QUESTIONS['en'] + _LANGUAGE_QUESTIONS['tr']
+    for language, names in _LANGUAGE_NAMES.items():
+        def expand(template, rng, names=names):
+            return _expand(template.replace('{lang}', rng.choice(names)), rng)
+
+        for question in _fill(prose, _PER_LANGUAGE, rng, expand):
+            samples.append({'question': question, 'language': language})
+        tools = _LANGUAGE_TOOLS[language]
+        for template, tool in itertools.product(_TOOL_QUESTIONS, tools):
+            samples.append({'question': template.format(tool=tool), 'language': language})
+        for snippet in _LANGUAGE_CODE[language]:
+            # Code arrives both in the code field and pasted into the question.
+            samples.append({'question': snippet, 'language': language})
+            for question in rng.sample(_CODE_QUESTIONS, 3):
+                samples.append({'question': question, 'code': snippet, 'language': language})
+                samples.append({'question': question + '\n' + snippet, 'language': language})
+    return samples
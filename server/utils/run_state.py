@@ -0,0 +1,223 @@
+"""
+Cross-worker request cancellation and short-lived conversation state.
+
+A ``/v1/cancel`` or ``/api/cancel`` can land on a different uvicorn worker than
+the stream it targets, so the cancel flag (and the small per-conversation
+state the VS Code path carries between turns) lives in a store every worker
+can see. ``RUN_STATE_STORE`` selects it:
+
+* unset – a SQLite file in the temp dir shared by all workers on the host
+* a filesystem path – the same, at that path
+* ``redis://`` / ``rediss://`` – Redis keys with native expiry (multi-host)
+* ``local`` – in-process only (single worker, tests)
+
+Every entry has a TTL (``RUN_CANCEL_TTL_SEC``, ``RUN_SESSION_TTL_SEC``) so
+abandoned cancel flags and idle conversations are evicted instead of growing
+forever. An unusable backend falls back to in-process with a warning.
+
+Cancel flags are keyed by ``<user_id>:<request_id>``: a request id alone is
+client-supplied, so one user can only ever stop their own runs.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.concurrency import env_int
+
+CANCEL_TTL_SEC = env_int("RUN_CANCEL_TTL_SEC", 600, minimum=30, maximum=86400)
+SESSION_TTL_SEC = env_int("RUN_SESSION_TTL_SEC", 6 * 3600, minimum=60, maximum=7 * 86400)
+_PURGE_INTERVAL_SEC = 60.0
+
+_CANCEL = "cancel"
+_SESSION = "session"
+
+
+def cancel_key(request_id: Any, user_id: Any) -> str:
+    return f"{user_id if user_id not in (None, '') else 'anon'}:{request_id}"
+
+
+class LocalRunState:
+    """In-process store; same interface as the shared backends."""
+
+    backend = "local"
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[tuple, tuple] = {}  # (ns, key) -> (expires_at, value)
+        self._last_purge = time.monotonic()
+
+    def _set(self, ns: str, key: str, value: str, ttl: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[(ns, key)] = (now + ttl, value)
+            if now - self._last_purge >= _PURGE_INTERVAL_SEC:
+                self._last_purge = now
+                for entry_key in [k for k, (expires_at, _v) in self._entries.items() if expires_at <= now]:
+                    del self._entries[entry_key]
+
+    def _get(self, ns: str, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get((ns, key))
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[(ns, key)]
+                return None
+            return entry[1]
+
+    def _delete(self, ns: str, key: str) -> None:
+        with self._lock:
+            self._entries.pop((ns, key), None)
+
+    # ── Public API ────────────────────────────────────────────────────────
+
+    def cancel(self, request_id: Any, user_id: Any, ttl: Optional[int] = None) -> None:
+        self._set(_CANCEL, cancel_key(request_id, user_id), "1", ttl or CANCEL_TTL_SEC)
+
+    def is_cancelled(self, request_id: Any, user_id: Any) -> bool:
+        if not request_id:
+            return False
+        return self._get(_CANCEL, cancel_key(request_id, user_id)) is not None
+
+    def clear_cancel(self, request_id: Any, user_id: Any) -> None:
+        if request_id:
+            self._delete(_CANCEL, cancel_key(request_id, user_id))
+
+    def get_session(self, key: str) -> Dict[str, Any]:
+        raw = self._get(_SESSION, key)
+        if not raw:
+            return {}
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return {}
+        return value if isinstance(value, dict) else {}
+
+    def put_session(self, key: str, state: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        self._set(_SESSION, key, json.dumps(state, default=str), ttl or SESSION_TTL_SEC)
+
+
+class SQLiteRunState(LocalRunState):
+    """Shared SQLite file; every worker on the host sees the same flags."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS run_state (
+                ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,
+                PRIMARY KEY (ns, key)
+            )
+            """
+        )
+
+    def _set(self, ns: str, key: str, value: str, ttl: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO run_state (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (ns, key, value, now + ttl),
+            )
+            if time.monotonic() - self._last_purge >= _PURGE_INTERVAL_SEC:
+                self._last_purge = time.monotonic()
+                self._conn.execute("DELETE FROM run_state WHERE expires_at <= ?", (now,))
+
+    def _get(self, ns: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM run_state WHERE ns = ? AND key = ? AND expires_at > ?",
+                (ns, key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _delete(self, ns: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM run_state WHERE ns = ? AND key = ?", (ns, key))
+
+
+class RedisRunState(LocalRunState):
+    """Redis keys with native expiry; works across hosts."""
+
+    backend = "redis"
+
+    def __init__(self, url: str) -> None:
+        super().__init__()
+        import redis
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=2.0, socket_connect_timeout=2.0)
+        self._redis.ping()
+        self._prefix = os.getenv("RUN_STATE_PREFIX", "codealchemist:run")
+
+    def _key(self, ns: str, key: str) -> str:
+        return f"{self._prefix}:{ns}:{key}"
+
+    def _set(self, ns: str, key: str, value: str, ttl: int) -> None:
+        self._redis.set(self._key(ns, key), value, ex=int(ttl))
+
+    def _get(self, ns: str, key: str) -> Optional[str]:
+        value = self._redis.get(self._key(ns, key))
+        if value is None:
+            return None
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def _delete(self, ns: str, key: str) -> None:
+        self._redis.delete(self._key(ns, key))
+
+
+def _open_store() -> LocalRunState:
+    target = (os.getenv("RUN_STATE_STORE") or "").strip()
+    if target == "local":
+        return LocalRunState()
+    if target.startswith(("redis://", "rediss://")):
+        try:
+            return RedisRunState(target)
+        except Exception as exc:
+            print(f"WARN: RUN_STATE_STORE redis unavailable ({exc}); cancellation stays per-worker.")
+            return LocalRunState()
+    path = target or os.path.join(tempfile.gettempdir(), "codealchemist_run_state.sqlite3")
+    try:
+        return SQLiteRunState(path)
+    except sqlite3.Error as exc:
+        print(f"WARN: run state store unavailable ({path}): {exc}; cancellation stays per-worker.")
+        return LocalRunState()
+
+
+_store: Optional[LocalRunState] = None
+_store_pid: Optional[int] = None
+_store_lock = threading.Lock()
+
+
+def get_run_state() -> LocalRunState:
+    """Process-wide store (re-opened after fork so connections are not shared)."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store is not None and _store_pid == pid:
+        return _store
+    with _store_lock:
+        if _store is None or _store_pid != pid:
+            _store = _open_store()
+            _store_pid = pid
+        return _store
+
+
+def is_request_cancelled(request_id: Any, user_id: Any) -> bool:
+    """True once any worker has recorded *user_id*'s cancel for *request_id*. Never raises."""
+    if not request_id:
+        return False
+    try:
+        return get_run_state().is_cancelled(request_id, user_id)
+    except Exception as exc:
+        print(f"WARN: cancellation check failed for {request_id}: {exc}")
+        return False
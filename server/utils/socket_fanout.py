@@ -0,0 +1,156 @@
+"""
+Socket.IO fan-out across workers and chunk coalescing for streamed rooms.
+
+With several uvicorn workers each process has its own Socket.IO server, so a
+room only contains the sockets that happened to connect to that worker.
+``SOCKETIO_MESSAGE_QUEUE`` selects the pub/sub backend that joins them:
+
+* unset / ``local://`` – in-process only (single worker, dev)
+* ``redis://`` / ``rediss://`` / ``valkey://`` – Redis-compatible pub/sub
+* ``kafka://``, ``zmq://``, ``amqp://`` – passed through to python-socketio
+
+A backend whose client library is missing falls back to in-process with a
+warning instead of failing boot.
+
+:class:`ChunkCoalescer` batches stream chunks per (room, event, stream) into
+frames of ``SOCKETIO_COALESCE_MS`` (default 40 ms), so a model emitting dozens
+of tiny deltas per second costs a handful of emits and websocket frames.
+"""
+from __future__ import annotations
+
+import importlib.util
+import os
+import threading
+import time
+
+from utils.concurrency import env_int
+
+_BACKEND_MODULES = {
+    'redis': 'redis',
+    'rediss': 'redis',
+    'valkey': 'redis',
+    'kafka': 'kafka',
+    'zmq': 'zmq',
+    'amqp': 'kombu',
+}
+
+
+def socketio_queue_options() -> dict:
+    """Keyword arguments for ``SocketIO(...)`` selecting the cross-worker backend."""
+    url = (os.getenv('SOCKETIO_MESSAGE_QUEUE') or '').strip()
+    if not url or url.startswith('local://'):
+        if env_int('WEB_CONCURRENCY', 1) > 1:
+            print("WARN: WEB_CONCURRENCY > 1 without SOCKETIO_MESSAGE_QUEUE; Socket.IO events emitted "
+                  "on one worker (e.g. history_enriched) miss sockets connected to the others.")
+        return {}
+
+    scheme = url.split('://', 1)[0].lower()
+    module = _BACKEND_MODULES.get(scheme)
+    if module is None:
+        print(f"WARN: Unsupported SOCKETIO_MESSAGE_QUEUE scheme '{scheme}'; Socket.IO rooms stay per-worker.")
+        return {}
+    if importlib.util.find_spec(module) is None:
+        print(f"WARN: SOCKETIO_MESSAGE_QUEUE needs the '{module}' package; Socket.IO rooms stay per-worker.")
+        return {}
+    if scheme == 'valkey':
+        url = 'redis://' + url.split('://', 1)[1]
+    return {
+        'message_queue': url,
+        'channel': os.getenv('SOCKETIO_CHANNEL', 'flask-socketio'),
+    }
+
+
+class _Stream:
+    __slots__ = ('lock', 'parts', 'payload', 'first_at')
+
+    def __init__(self, payload):
+        self.lock = threading.Lock()
+        self.parts = []
+        self.payload = payload
+        self.first_at = None
+
+
+class ChunkCoalescer:
+    """Buffers text chunks per stream and emits them as one frame per interval.
+
+    ``push`` appends and emits inline once the oldest buffered chunk is older
+    than the interval; a background ticker flushes streams that went quiet.
+    Call ``flush`` before the stream's terminal event so ordering is kept.
+    """
+
+    def __init__(self, socketio, interval_ms=None):
+        if interval_ms is None:
+            interval_ms = env_int('SOCKETIO_COALESCE_MS', 40, minimum=0, maximum=500)
+        self.socketio = socketio
+        self.interval = interval_ms / 1000.0
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._ticker = None
+        self.frames = 0
+        self.chunks = 0
+
+    def push(self, event, room, chunk, key=None, **payload):
+        """Queue ``chunk`` for ``payload | {'chunk': ...}`` on ``event`` in ``room``."""
+        if not chunk:
+            return
+        if self.interval <= 0:
+            self.chunks += 1
+            self._emit(event, room, dict(payload, chunk=chunk))
+            return
+
+        stream_key = (event, room, key)
+        with self._lock:
+            stream = self._streams.get(stream_key)
+            if stream is None:
+                stream = self._streams[stream_key] = _Stream(payload)
+            self._ensure_ticker()
+
+        with stream.lock:
+            if stream.first_at is None:
+                stream.first_at = time.monotonic()
+            stream.parts.append(chunk)
+            self.chunks += 1
+            if time.monotonic() - stream.first_at >= self.interval:
+                self._flush_locked(stream_key, stream)
+
+    def flush(self, event, room, key=None):
+        """Emit whatever is buffered for the stream and forget it."""
+        with self._lock:
+            stream = self._streams.pop((event, room, key), None)
+        if stream is not None:
+            with stream.lock:
+                self._flush_locked((event, room, key), stream)
+
+    def _flush_locked(self, stream_key, stream):
+        if not stream.parts:
+            return
+        text = ''.join(stream.parts)
+        stream.parts = []
+        stream.first_at = None
+        event, room, _key = stream_key
+        self._emit(event, room, dict(stream.payload, chunk=text))
+
+    def _emit(self, event, room, data):
+        self.frames += 1
+        try:
+            self.socketio.emit(event, data, room=room)
+        except Exception as e:
+            print(f"WARN: Socket.IO emit '{event}' to {room} failed: {e}")
+
+    def _ensure_ticker(self):
+        if self._ticker is None or not self._ticker.is_alive():
+            self._ticker = threading.Thread(target=self._tick, name='socket-coalescer', daemon=True)
+            self._ticker.start()
+
+    def _tick(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                due = [(k, s) for k, s in self._streams.items() if s.first_at is not None and now - s.first_at >= self.interval]
+            for stream_key, stream in due:
+                if stream.lock.acquire(blocking=False):
+                    try:
+                        self._flush_locked(stream_key, stream)
+                    finally:
+                        stream.lock.release()
@@ -1,6 +1,120 @@
+"""
+Code block formatting for final answers.
+
+autopep8 is pure-Python and CPU-bound, so Python blocks are formatted in a
+:class:`TimeoutProcessPool` (``STANDARDIZER_WORKERS``, default 2) instead of on
+the request thread. All of an answer's blocks go to the pool in one call under
+one deadline (``STANDARDIZER_TIMEOUT_SEC``, default 3 s, slot wait included),
+so many blocks never add up to many timeouts. Blocks over ``STANDARDIZER_MAX_BLOCK_CHARS`` (default 20000) only
+get whitespace cleanup. Formatted blocks are memoized by content hash
+(``STANDARDIZER_CACHE_ENTRIES``, default 1024), so re-sent and regenerated
+answers skip the formatter.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
 
 import autopep8
 
+from utils.concurrency import env_float, env_int
+from utils.process_pool import TimeoutProcessPool
+
+# Regex: ```(\w+)?\n(.*?)``` (dotall)
+_BLOCK_PATTERN = re.compile(r"```([a-zA-Z0-9+\-#]*)\n(.*?)```", re.DOTALL)
+
+
+def format_python(code: str) -> str:
+    return autopep8.fix_code(code, options={'aggressive': 1})
+
+
+def format_python_blocks(codes: list) -> list:
+    """``format_python`` over several blocks in one worker; None where a block fails."""
+    formatted = []
+    for code in codes:
+        try:
+            formatted.append(format_python(code))
+        except Exception:
+            formatted.append(None)
+    return formatted
+
+
+def _cleanup(code: str) -> str:
+    # Trim trailing spaces and ensure clean newlines
+    return '\n'.join(line.rstrip() for line in code.split('\n')).strip()
+
+
+class _PythonFormatter:
+    """Offloaded, size-capped, memoized autopep8."""
+
+    def __init__(self):
+        self.max_block_chars = env_int('STANDARDIZER_MAX_BLOCK_CHARS', 20000, minimum=0)
+        self.timeout = env_float('STANDARDIZER_TIMEOUT_SEC', 3.0, minimum=0.1, maximum=60.0)
+        self.max_entries = env_int('STANDARDIZER_CACHE_ENTRIES', 1024, minimum=0)
+        self.pool = TimeoutProcessPool('code-standardizer', env_int('STANDARDIZER_WORKERS', 2, minimum=0, maximum=16),
+                                       preload=('utils.standardizer',))
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()  # sha256(code) -> formatted code, None if it could not be formatted
+        self.hits = 0
+        self.misses = 0
+
+    def format_many(self, codes: list) -> list:
+        """Each of ``codes`` formatted, or None where a block is too large, times out or fails.
+
+        Uncached blocks share one pool call and one timeout.
+        """
+        results = [None] * len(codes)
+        pending = OrderedDict()  # key -> (code, indexes into results)
+        for index, code in enumerate(codes):
+            if len(code) > self.max_block_chars:
+                continue
+            key = hashlib.sha256(code.encode('utf-8', 'surrogatepass')).hexdigest()
+            with self._lock:
+                if key in self._memo:
+                    self._memo.move_to_end(key)
+                    self.hits += 1
+                    results[index] = self._memo[key]
+                    continue
+                self.misses += 1
+            pending.setdefault(key, (code, []))[1].append(index)
+        if not pending:
+            return results
+
+        try:
+            formatted = self.pool.run(format_python_blocks, [code for code, _ in pending.values()],
+                                      timeout=self.timeout)
+        except TimeoutError as e:
+            # Not memoized: the pool may just have been busy.
+            print(f"WARN: {e}; {len(pending)} block(s) left unformatted.")
+            return results
+        except Exception:
+            formatted = [None] * len(pending)
+
+        for (key, (_code, indexes)), value in zip(pending.items(), formatted):
+            for index in indexes:
+                results[index] = value
+        if self.max_entries:
+            with self._lock:
+                for key, value in zip(pending, formatted):
+                    self._memo[key] = value
+                while len(self._memo) > self.max_entries:
+                    self._memo.popitem(last=False)
+        return results
+
+
+_formatter = None
+_formatter_lock = threading.Lock()
+
+
+def get_python_formatter() -> _PythonFormatter:
+    global _formatter
+    if _formatter is None:
+        with _formatter_lock:
+            if _formatter is None:
+                _formatter = _PythonFormatter()
+    return _formatter
+
+
 class CodeStandardizer:
     """
     Standardizes code formatting.
@@ -18,35 +132,23 @@ class CodeStandardizer:
         if not text or "```" not in text:
             return text
 
-        import re
-        
-        # Regex to find code blocks: ```(lang)?\n(code)```
-        # We use a replacement function to format the content
-        
+        python_blocks = [match.group(2) for match in _BLOCK_PATTERN.finditer(text)
+                         if (match.group(1) or "").strip().lower() in ('python', 'py')]
+        formatted_blocks = iter(get_python_formatter().format_many(python_blocks) if python_blocks else ())
+
         def replace_block(match):
-            full_match = match.group(0)
             lang_tag = match.group(1) or ""
             code_content = match.group(2)
-            
+
             lang = lang_tag.strip().lower()
-            
+
             # Format based on language
             if lang in ['python', 'py']:
-                try:
-                    formatted = autopep8.fix_code(code_content, options={'aggressive': 1})
+                formatted = next(formatted_blocks)
+                if formatted is not None:
                     return f"```{lang_tag}\n{formatted.rstrip()}\n```"
-                except:
-                    pass
-            
+
             # Default cleanup for other languages (or if python format fails)
-            # Trim trailing spaces and ensure clean newlines
-            lines = code_content.split('\n')
-            cleaned_lines = [line.rstrip() for line in lines]
-            new_code = '\n'.join(cleaned_lines).strip()
-            
-            return f"```{lang_tag}\n{new_code}\n```"
-
-        # Regex: ```(\w+)?\n(.*?)``` (dotall)
-        pattern = re.compile(r"```([a-zA-Z0-9+\-#]*)\n(.*?)```", re.DOTALL)
-        
-        return pattern.sub(replace_block, text)
+            return f"```{lang_tag}\n{_cleanup(code_content)}\n```"
+
+        return _BLOCK_PATTERN.sub(replace_block, text)